@@ -10,8 +10,9 @@ from django import forms
 from django.contrib import admin
 
 from .models import (
-    Appointment, AppointmentRequest, AppointmentRescheduleHistory, Config, DayOff, EmailVerificationCode,
-    PasswordResetToken, Service, StaffMember, WorkingHours
+    Appointment, AppointmentRequest, AppointmentRescheduleHistory, ArchivedAppointment, ArchivedAppointmentRequest,
+    ArchivedAppointmentRescheduleHistory, Config, DayOff, EmailVerificationCode, PasswordResetToken, Service,
+    StaffDayAvailability, StaffMember, WorkingHours
 )
 
 
@@ -104,3 +105,50 @@ class PasswordResetTokenAdmin(admin.ModelAdmin):
     list_filter = ('status', 'expires_at')
     date_hierarchy = 'expires_at'
     ordering = ('-expires_at',)
+
+
+class ReadOnlyArchiveAdmin(admin.ModelAdmin):
+    """Archived rows are only written by the archive_appointments command."""
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(ArchivedAppointmentRequest)
+class ArchivedAppointmentRequestAdmin(ReadOnlyArchiveAdmin):
+    list_display = ('date', 'start_time', 'end_time', 'service', 'staff_member', 'archived_at',)
+    search_fields = ('id_request', 'service__name',)
+    list_filter = ('date',)
+    date_hierarchy = 'date'
+
+
+@admin.register(ArchivedAppointment)
+class ArchivedAppointmentAdmin(ReadOnlyArchiveAdmin):
+    list_display = ('client', 'appointment_request', 'paid', 'amount_to_pay', 'archived_at',)
+    search_fields = ('id_request', 'client__email',)
+    list_filter = ('paid',)
+
+
+@admin.register(ArchivedAppointmentRescheduleHistory)
+class ArchivedAppointmentRescheduleHistoryAdmin(ReadOnlyArchiveAdmin):
+    list_display = ('appointment_request', 'date', 'start_time', 'end_time', 'reschedule_status', 'archived_at',)
+    search_fields = ('appointment_request__id_request',)
+    list_filter = ('reschedule_status',)
+
+
+@admin.register(StaffDayAvailability)
+class StaffDayAvailabilityAdmin(admin.ModelAdmin):
+    """The rows are maintained by the signal handlers and the rebuild_availability_table command."""
+    list_display = ('staff_member', 'date', 'start_time', 'end_time', 'free_minutes', 'longest_free_minutes',
+                    'updated_at',)
+    list_filter = ('is_day_off', 'staff_member',)
+    date_hierarchy = 'date'
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -20,9 +20,12 @@ class AppointmentConfig(AppConfig):
 
     def ready(self):
         """
-        Schedule the cleanup task when the app is ready.
+        Connect the signal handlers and schedule the cleanup, digest, cache warmup and availability table tasks when
+        the app is ready.
         This method is called when Django starts up.
         """
+        from appointment import signals  # noqa: F401
+
         # Only schedule if Django-Q is available
         if 'django_q' in settings.INSTALLED_APPS:
             try:
@@ -44,6 +47,10 @@ class AppointmentConfig(AppConfig):
                     )
                 else:
                     logger.debug(f"Cleanup task schedule '{schedule_name}' already exists")
+
+                self.schedule_digests(Schedule, schedule_task)
+                self.schedule_cache_warmup(Schedule, schedule_task)
+                self.schedule_availability_table(Schedule, schedule_task)
             except ImportError:
                 logger.warning(
                     "Django-Q is in INSTALLED_APPS but not properly installed. "
@@ -51,3 +58,53 @@ class AppointmentConfig(AppConfig):
                 )
             except Exception as e:
                 logger.error(f"Error scheduling cleanup task: {e}", exc_info=True)
+
+    @staticmethod
+    def schedule_digests(schedule_model, schedule_task):
+        """Schedule the staff agenda digest and the admin digest when they are enabled in the settings."""
+        import datetime
+
+        from django.utils import timezone
+
+        from appointment.utils.digest import get_admin_digest_minutes, get_staff_digest_time
+
+        digest_time = get_staff_digest_time()
+        schedule_name = 'send_staff_agenda_digests'
+        if digest_time and not schedule_model.objects.filter(name=schedule_name).exists():
+            next_run = timezone.make_aware(datetime.datetime.combine(
+                    timezone.localdate(), datetime.time.fromisoformat(digest_time)))
+            if next_run <= timezone.now():
+                next_run += datetime.timedelta(days=1)
+            schedule_task('appointment.tasks.send_staff_agenda_digests_task', name=schedule_name,
+                          schedule_type=schedule_model.DAILY, next_run=next_run, repeats=-1)
+            logger.info(f"Scheduled the daily staff agenda digests at {digest_time}")
+
+        minutes = get_admin_digest_minutes()
+        schedule_name = 'send_admin_digest'
+        if minutes and not schedule_model.objects.filter(name=schedule_name).exists():
+            schedule_task('appointment.tasks.send_admin_digest_task', name=schedule_name,
+                          schedule_type=schedule_model.MINUTES, minutes=minutes, repeats=-1)
+            logger.info(f"Scheduled the admin digest every {minutes} minutes")
+
+    @staticmethod
+    def schedule_cache_warmup(schedule_model, schedule_task):
+        """Schedule the availability cache warmup when it is enabled in the settings."""
+        from appointment.utils.availability_cache import get_cache_warmup_minutes
+
+        minutes = get_cache_warmup_minutes()
+        schedule_name = 'warm_availability_cache'
+        if minutes and not schedule_model.objects.filter(name=schedule_name).exists():
+            schedule_task('appointment.tasks.warm_availability_cache_task', name=schedule_name,
+                          schedule_type=schedule_model.MINUTES, minutes=minutes, repeats=-1)
+            logger.info(f"Scheduled the availability cache warmup every {minutes} minutes")
+
+    @staticmethod
+    def schedule_availability_table(schedule_model, schedule_task):
+        """Schedule the daily rebuild of the availability table when it is enabled in the settings."""
+        from appointment.utils.availability_table import get_availability_table_enabled
+
+        schedule_name = 'rebuild_availability_table'
+        if get_availability_table_enabled() and not schedule_model.objects.filter(name=schedule_name).exists():
+            schedule_task('appointment.tasks.rebuild_availability_table_task', name=schedule_name,
+                          schedule_type=schedule_model.DAILY, repeats=-1)
+            logger.info("Scheduled the daily rebuild of the availability table")
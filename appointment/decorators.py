@@ -7,6 +7,7 @@ Since: 2.0.0
 """
 
 from functools import wraps
+from inspect import iscoroutinefunction
 
 from appointment.utils.error_codes import ErrorCode
 from appointment.utils.json_context import json_response
@@ -58,8 +59,19 @@ def require_superuser(func):
 def require_ajax(func):
     """Decorator to require a request to be AJAX.
     Usage: @require_ajax
+    Works on both sync and async views.
     """
 
+    if iscoroutinefunction(func):
+        @wraps(func)
+        async def async_wrapper(request, *args, **kwargs):
+            if not is_ajax(request):
+                return json_response("Not an AJAX request.", status=400, success=False,
+                                     error_code=ErrorCode.INVALID_DATA)
+            return await func(request, *args, **kwargs)
+
+        return async_wrapper
+
     @wraps(func)
     def wrapper(request, *args, **kwargs):
         if not is_ajax(request):
@@ -1 +1,2 @@
-from .email_sender import send_email, notify_admin
+from .background import get_email_dispatcher, shutdown_email_dispatcher
+from .email_sender import deliver_emails, notify_admin, send_email, send_emails
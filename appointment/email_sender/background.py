@@ -0,0 +1,164 @@
+# background.py
+# Path: appointment/email_sender/background.py
+
+"""
+Author: Adams Pierre David
+Since: 3.11.0
+
+In-process background sending of e-mails, for deployments without a Django-Q cluster.
+
+With `APPOINTMENT_EMAIL_DISPATCH = 'thread'`, the e-mail functions hand their rendered messages to a small pool of
+worker threads instead of talking to the mail backend in the request. The pool is bounded: at most
+`APPOINTMENT_EMAIL_QUEUE_SIZE` batches wait or run at once. When it is full, the caller waits up to
+`APPOINTMENT_EMAIL_QUEUE_TIMEOUT` seconds for room and then sends the batch itself, so a slow mail server slows the
+requests down instead of piling up messages in memory. Every worker keeps its connection to the mail backend open
+between batches. Pending batches are sent before the process exits.
+
+Messages still waiting when the process is killed are lost; use Django-Q (`USE_DJANGO_Q_FOR_EMAILS`) when e-mails
+must survive a restart.
+"""
+
+import atexit
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.mail import get_connection
+
+from appointment.logger_config import get_logger
+from appointment.utils.metrics import EMAILS, SMTP_SECONDS
+
+logger = get_logger(__name__)
+
+
+def get_email_dispatch_mode() -> str:
+    """Get the value of the APPOINTMENT_EMAIL_DISPATCH setting: 'sync' (default) or 'thread'."""
+    return getattr(settings, 'APPOINTMENT_EMAIL_DISPATCH', 'sync')
+
+
+def get_email_threads() -> int:
+    """Get the value of the APPOINTMENT_EMAIL_THREADS setting, the number of worker threads."""
+    return getattr(settings, 'APPOINTMENT_EMAIL_THREADS', 2)
+
+
+def get_email_queue_size() -> int:
+    """Get the value of the APPOINTMENT_EMAIL_QUEUE_SIZE setting, the number of batches waiting or being sent."""
+    return getattr(settings, 'APPOINTMENT_EMAIL_QUEUE_SIZE', 100)
+
+
+def get_email_queue_timeout() -> float:
+    """Get the value of the APPOINTMENT_EMAIL_QUEUE_TIMEOUT setting, in seconds."""
+    return getattr(settings, 'APPOINTMENT_EMAIL_QUEUE_TIMEOUT', 5.0)
+
+
+class EmailDispatcher:
+    """A bounded pool of threads sending e-mail batches, each over the connection of its worker thread."""
+
+    def __init__(self, max_workers: int, queue_size: int, queue_timeout: float):
+        self.queue_timeout = queue_timeout
+        # Failures of the last batches, newest last: (function, recipients, subject, error).
+        self.errors = deque(maxlen=100)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='appointment-email')
+        self._slots = threading.BoundedSemaphore(queue_size)
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def submit(self, messages: list, function: str):
+        """Send the messages in the background.
+
+        :param messages: `EmailMessage` instances, without connection.
+        :param function: The `function` label under which the messages are counted in the metrics.
+        :return: The future of the batch, or None when it was sent by the caller because the queue stayed full.
+        """
+        if not messages:
+            return None
+        if self._closed or not self._slots.acquire(timeout=self.queue_timeout):
+            logger.warning(f"E-mail queue full, sending {len(messages)} e-mails in the request")
+            self._send_now(messages, function)
+            return None
+        try:
+            return self._executor.submit(self._run, messages, function)
+        except RuntimeError:
+            # The executor shut down in between.
+            self._slots.release()
+            self._send_now(messages, function)
+            return None
+
+    def _run(self, messages, function):
+        try:
+            self._send(messages, function, self._worker_connection())
+        finally:
+            self._slots.release()
+
+    def _worker_connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = self._local.connection = get_connection(fail_silently=False)
+            with self._lock:
+                self._connections.append(connection)
+        return connection
+
+    def _send_now(self, messages, function):
+        connection = get_connection(fail_silently=False)
+        try:
+            self._send(messages, function, connection)
+        finally:
+            self._close(connection)
+
+    def _send(self, messages, function, connection):
+        sent = 0
+        for message in messages:
+            try:
+                with SMTP_SECONDS.time(function=function):
+                    connection.open()
+                    sent += connection.send_messages([message]) or 0
+            except Exception as e:
+                # The connection may be broken: close it so that the next message reconnects.
+                self._close(connection)
+                self.errors.append((function, list(message.to), message.subject, repr(e)))
+                logger.error(f"Error sending email to {', '.join(message.to)}: {e}")
+        EMAILS.inc(sent, function=function, result='sent')
+        EMAILS.inc(len(messages) - sent, function=function, result='failed')
+        return sent
+
+    @staticmethod
+    def _close(connection):
+        try:
+            connection.close()
+        except Exception as e:
+            logger.warning(f"Error closing the mail connection: {e}")
+
+    def shutdown(self, wait: bool = True):
+        """Stop accepting batches, send the pending ones when `wait` is true, and close the connections."""
+        self._closed = True
+        self._executor.shutdown(wait=wait)
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for connection in connections:
+            self._close(connection)
+
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_email_dispatcher() -> EmailDispatcher:
+    """Return the process-wide dispatcher, starting it on first use."""
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is None or _dispatcher._closed:
+            _dispatcher = EmailDispatcher(get_email_threads(), get_email_queue_size(), get_email_queue_timeout())
+            atexit.register(_dispatcher.shutdown)
+        return _dispatcher
+
+
+def shutdown_email_dispatcher(wait: bool = True):
+    """Send the pending e-mails and stop the worker threads, e.g. from a worker shutdown hook."""
+    global _dispatcher
+    with _dispatcher_lock:
+        dispatcher, _dispatcher = _dispatcher, None
+    if dispatcher is not None:
+        dispatcher.shutdown(wait=wait)
@@ -5,12 +5,15 @@ from datetime import datetime, timedelta
 from typing import Any, Optional, Tuple
 
 from django.conf import settings
-from django.core.mail import send_mail
+from django.core.mail import EmailMessage, EmailMultiAlternatives, get_connection, send_mail
 from django.template import loader
 from django.utils import timezone
 
+from appointment.email_sender.background import get_email_dispatch_mode, get_email_dispatcher
 from appointment.logger_config import get_logger
 from appointment.settings import APP_DEFAULT_FROM_EMAIL, check_q_cluster
+from appointment.utils.metrics import EMAILS, SMTP_SECONDS
+from appointment.utils.profiler import profile_section
 
 logger = get_logger(__name__)
 
@@ -61,9 +64,19 @@ def render_email_template(template_url, context):
     return ""
 
 
+def build_email_message(recipient_list, subject, message, html_message, from_email):
+    """Build the message `send_mail` would send, for the background dispatcher."""
+    email = EmailMultiAlternatives(subject=subject, body=message or "", from_email=from_email, to=recipient_list)
+    if html_message:
+        email.attach_alternative(html_message, "text/html")
+    return email
+
+
+@profile_section('email')
 def send_email(recipient_list, subject: str, template_url: str = None, context: dict = None, from_email=None,
                message: str = None, attachments=None):
     if not has_required_email_settings():
+        EMAILS.inc(function='send_email', result='skipped')
         return
 
     from_email = from_email or APP_DEFAULT_FROM_EMAIL
@@ -80,21 +93,113 @@ def send_email(recipient_list, subject: str, template_url: str = None, context:
                 from_email=from_email,
                 attachments=attachments
         )
+        EMAILS.inc(function='send_email', result='queued')
+    elif get_email_dispatch_mode() == 'thread':
+        get_email_dispatcher().submit([build_email_message(
+                recipient_list, subject, message if not template_url else "",
+                html_message if template_url else None, from_email)], 'send_email')
     else:
         # Synchronously send the email
         try:
-            send_mail(
-                    subject=subject,
-                    message=message if not template_url else "",
-                    html_message=html_message if template_url else None,
-                    from_email=from_email,
-                    recipient_list=recipient_list,
-                    fail_silently=False,
-            )
+            with SMTP_SECONDS.time(function='send_email'):
+                send_mail(
+                        subject=subject,
+                        message=message if not template_url else "",
+                        html_message=html_message if template_url else None,
+                        from_email=from_email,
+                        recipient_list=recipient_list,
+                        fail_silently=False,
+                )
+            EMAILS.inc(function='send_email', result='sent')
         except Exception as e:
+            EMAILS.inc(function='send_email', result='failed')
             logger.error(f"Error sending email: {e}")
 
 
+def build_email_messages(emails: list, from_email) -> list:
+    """Build the messages of already rendered e-mails, see `deliver_emails`."""
+    messages = []
+    for email in emails:
+        message = EmailMessage(subject=email['subject'], body=email['html_message'] or email['message'],
+                               from_email=from_email, to=email['recipient_list'])
+        if email['html_message']:
+            message.content_subtype = "html"
+        for attachment in email.get('attachments') or ():
+            message.attach(*attachment)
+        messages.append(message)
+    return messages
+
+
+def _close_connection(connection):
+    try:
+        connection.close()
+    except Exception as e:
+        logger.warning(f"Error closing the mail connection: {e}")
+
+
+def deliver_emails(emails: list, from_email, function: str):
+    """Send already rendered e-mails over a single connection to the mail backend.
+
+    Messages are sent one by one, so that a failing one is the only one counted as failed; the connection is reopened
+    after a failure.
+
+    :param emails: A list of dictionaries with the `recipient_list`, `subject`, `message` and `html_message` keys,
+        and optionally `attachments`, a list of (filename, content, mimetype) tuples.
+    :param from_email: The sender address.
+    :param function: The `function` label under which the e-mails are counted in the metrics.
+    :return: The number of e-mails sent.
+    """
+    messages = build_email_messages(emails, from_email)
+    connection = get_connection(fail_silently=False)
+    sent = 0
+    with SMTP_SECONDS.time(function=function):
+        for message in messages:
+            try:
+                connection.open()
+                sent += connection.send_messages([message]) or 0
+            except Exception as e:
+                logger.error(f"Error sending email to {', '.join(message.to)}: {e}")
+                _close_connection(connection)
+        _close_connection(connection)
+    EMAILS.inc(sent, function=function, result='sent')
+    EMAILS.inc(len(messages) - sent, function=function, result='failed')
+    return sent
+
+
+@profile_section('email')
+def send_emails(emails: list, from_email=None):
+    """Send several e-mails as one batch: a single Django-Q task, or a single SMTP connection.
+
+    :param emails: A list of dictionaries taking the `recipient_list`, `subject`, `message`, `template_url`,
+        `context` and `attachments` arguments of `send_email`. An `html_message` key, already rendered, replaces
+        `template_url` and `context`.
+    :param from_email: The sender address, APP_DEFAULT_FROM_EMAIL by default.
+    """
+    if not emails:
+        return
+    if not has_required_email_settings():
+        EMAILS.inc(len(emails), function='send_emails', result='skipped')
+        return
+
+    from_email = from_email or APP_DEFAULT_FROM_EMAIL
+    rendered = [{
+        'recipient_list': email['recipient_list'],
+        'subject': str(email['subject']),
+        'message': str(email.get('message') or ""),
+        'html_message': (email['html_message'] if 'html_message' in email
+                         else render_email_template(email.get('template_url'), email.get('context'))),
+        'attachments': email.get('attachments') or [],
+    } for email in emails]
+
+    if get_use_django_q_for_emails() and check_q_cluster() and DJANGO_Q_AVAILABLE:
+        async_task('appointment.tasks.send_emails_task', emails=rendered, from_email=from_email)
+        EMAILS.inc(len(rendered), function='send_emails', result='queued')
+    elif get_email_dispatch_mode() == 'thread':
+        get_email_dispatcher().submit(build_email_messages(rendered, from_email), 'send_emails')
+    else:
+        deliver_emails(rendered, from_email, 'send_emails')
+
+
 def validate_required_fields(recipient_list: list, subject: str) -> Tuple[bool, str]:
     if not recipient_list or not subject:
         return False, "Recipient list and subject are required."
@@ -235,9 +340,11 @@ def schedule_email_sending(
     )
 
 
+@profile_section('email')
 def notify_admin(subject: str, template_url: str = None, context: dict = None, message: str = None,
                  recipient_email: str = None, attachments=None):
     if not has_required_email_settings():
+        EMAILS.inc(function='notify_admin', result='skipped')
         return
 
     html_message = render_email_template(template_url, context)
@@ -253,18 +360,26 @@ def notify_admin(subject: str, template_url: str = None, context: dict = None, m
                    from_email=settings.DEFAULT_FROM_EMAIL,
                    recipient_list=recipients,
                    attachments=attachments)
+        EMAILS.inc(function='notify_admin', result='queued')
+    elif get_email_dispatch_mode() == 'thread':
+        get_email_dispatcher().submit([build_email_message(
+                recipients, subject, message if not template_url else "",
+                html_message if template_url else None, settings.DEFAULT_FROM_EMAIL)], 'notify_admin')
     else:
         # Synchronously send the email
         try:
-            send_mail(
-                    subject=subject,
-                    message=message if not template_url else "",
-                    html_message=html_message if template_url else None,
-                    from_email=settings.DEFAULT_FROM_EMAIL,
-                    recipient_list=recipients,
-                    fail_silently=False,
-            )
+            with SMTP_SECONDS.time(function='notify_admin'):
+                send_mail(
+                        subject=subject,
+                        message=message if not template_url else "",
+                        html_message=html_message if template_url else None,
+                        from_email=settings.DEFAULT_FROM_EMAIL,
+                        recipient_list=recipients,
+                        fail_silently=False,
+                )
+            EMAILS.inc(function='notify_admin', result='sent')
         except Exception as e:
+            EMAILS.inc(function='notify_admin', result='failed')
             logger.error(f"Error sending email: {e}")
 
 
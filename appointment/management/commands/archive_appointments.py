@@ -0,0 +1,58 @@
+# archive_appointments.py
+# Path: appointment/management/commands/archive_appointments.py
+
+"""
+Management command to move past appointments to the archive tables, keeping the hot tables small.
+
+Usage:
+    python manage.py archive_appointments
+    python manage.py archive_appointments --months 6 --batch-size 500
+    python manage.py archive_appointments --before 2024-01-01 --dry-run
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from appointment.settings import APPOINTMENT_ARCHIVE_MONTHS, APPOINTMENT_CLEANUP_BATCH_SIZE
+from appointment.utils.archive import archive_appointments, subtract_months
+from appointment.utils.date_time import convert_str_to_date
+
+
+class Command(BaseCommand):
+    help = 'Move appointment requests, appointments and reschedule histories older than N months to the archive'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months', type=int, default=APPOINTMENT_ARCHIVE_MONTHS,
+                            help=f'Archive appointments dated more than this many months ago '
+                                 f'(default: {APPOINTMENT_ARCHIVE_MONTHS}).')
+        parser.add_argument('--before', help='Archive appointments dated before this date (YYYY-MM-DD); '
+                                             'overrides --months.')
+        parser.add_argument('--batch-size', type=int, default=APPOINTMENT_CLEANUP_BATCH_SIZE,
+                            help=f'Appointment requests moved per transaction '
+                                 f'(default: {APPOINTMENT_CLEANUP_BATCH_SIZE}).')
+        parser.add_argument('--dry-run', action='store_true', help='Only count the rows that would be moved.')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1.')
+        if options['before']:
+            try:
+                before = convert_str_to_date(options['before'])
+            except ValueError as e:
+                raise CommandError(str(e))
+        else:
+            if options['months'] < 1:
+                raise CommandError('--months must be at least 1.')
+            before = subtract_months(timezone.now().date(), options['months'])
+        if before > timezone.now().date():
+            raise CommandError('Only past appointments can be archived.')
+
+        def progress(counts):
+            self.stdout.write(f"  batch {counts['batches']}: {counts['appointment_requests']} appointment requests")
+
+        result = archive_appointments(before, batch_size=options['batch_size'], dry_run=options['dry_run'],
+                                      progress=progress if options['verbosity'] > 1 else None)
+        verb = 'Would archive' if options['dry_run'] else f"Archived in {result['seconds']}s"
+        self.stdout.write(self.style.SUCCESS(f"{verb} (dated before {before}):"))
+        for name in ('appointment_requests', 'appointments', 'reschedule_histories'):
+            self.stdout.write(f"  {name.replace('_', ' ')}: {result[name]}")
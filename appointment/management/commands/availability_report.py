@@ -0,0 +1,74 @@
+# availability_report.py
+# Path: appointment/management/commands/availability_report.py
+
+"""
+Management command to report free capacity for all staff members over the coming weeks.
+
+Usage:
+    python manage.py availability_report
+    python manage.py availability_report --start 2025-01-06 --days 84 --staff 1 --staff 2
+    python manage.py availability_report --engine python --output report.json
+"""
+
+import json
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from appointment.models import Service, StaffMember
+from appointment.utils.availability import ENGINES, build_availability_report
+from appointment.utils.date_time import convert_str_to_date
+
+
+class Command(BaseCommand):
+    help = 'Report free slots, booked minutes and utilization per staff member and per day'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', help='First date of the report (YYYY-MM-DD). Defaults to today.')
+        parser.add_argument('--days', type=int, default=28, help='Number of days to cover (default: 28).')
+        parser.add_argument('--staff', type=int, action='append', dest='staff_ids',
+                            help='Staff member ID to include. Repeat to include several; defaults to all.')
+        parser.add_argument('--service', type=int, dest='service_id',
+                            help='Service ID whose duration is used to check slots.')
+        parser.add_argument('--engine', choices=ENGINES, default='auto',
+                            help='Computation engine (default: numpy when installed, python otherwise).')
+        parser.add_argument('--output', help='Write the JSON report to this file instead of the standard output.')
+        parser.add_argument('--summary', action='store_true', help='Only print per staff member totals.')
+
+    def handle(self, *args, **options):
+        try:
+            start_date = convert_str_to_date(options['start']) if options['start'] else timezone.now().date()
+        except ValueError as e:
+            raise CommandError(str(e))
+        if options['days'] < 1:
+            raise CommandError('--days must be at least 1.')
+        end_date = start_date + timedelta(days=options['days'] - 1)
+
+        staff_members = StaffMember.objects.select_related('user').order_by('id')
+        if options['staff_ids']:
+            staff_members = staff_members.filter(id__in=options['staff_ids'])
+        service = None
+        if options['service_id']:
+            service = Service.objects.filter(id=options['service_id']).first()
+            if service is None:
+                raise CommandError(f"Service {options['service_id']} does not exist.")
+
+        started = time.perf_counter()
+        report = build_availability_report(start_date, end_date, staff_members=list(staff_members),
+                                           service=service, engine=options['engine'])
+        report['elapsed_ms'] = round((time.perf_counter() - started) * 1000, 2)
+        if options['summary']:
+            report.pop('days')
+
+        payload = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as output:
+                output.write(payload)
+            self.stdout.write(self.style.SUCCESS(
+                    f"Report for {len(report['staff'])} staff member(s) from {report['start_date']} to "
+                    f"{report['end_date']} written to {options['output']} ({report['engine']} engine, "
+                    f"{report['elapsed_ms']} ms)."))
+        else:
+            self.stdout.write(payload)
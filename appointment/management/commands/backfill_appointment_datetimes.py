@@ -0,0 +1,53 @@
+# backfill_appointment_datetimes.py
+# Path: appointment/management/commands/backfill_appointment_datetimes.py
+
+"""
+Management command to fill `AppointmentRequest.start_at` and `end_at` for the rows saved before these columns
+existed, or written without `save()` (queryset updates, bulk operations).
+
+Usage:
+    python manage.py backfill_appointment_datetimes
+    python manage.py backfill_appointment_datetimes --all --batch-size 500
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Q
+
+from appointment.models import AppointmentRequest
+from appointment.settings import APPOINTMENT_CLEANUP_BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = 'Fill the start_at and end_at columns of appointment requests from their date, start and end times'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=APPOINTMENT_CLEANUP_BATCH_SIZE,
+                            help=f'Appointment requests updated per transaction '
+                                 f'(default: {APPOINTMENT_CLEANUP_BATCH_SIZE}).')
+        parser.add_argument('--all', action='store_true',
+                            help='Recompute every row, not only the missing ones (e.g. after changing TIME_ZONE).')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('--batch-size must be at least 1.')
+        queryset = AppointmentRequest.objects.all()
+        if not options['all']:
+            queryset = queryset.filter(Q(start_at__isnull=True) | Q(end_at__isnull=True))
+        queryset = queryset.only('id', 'date', 'start_time', 'end_time').order_by('pk')
+
+        updated = last_pk = 0
+        while True:
+            batch = list(queryset.filter(pk__gt=last_pk)[:batch_size])
+            if not batch:
+                break
+            last_pk = batch[-1].pk
+            for appointment_request in batch:
+                appointment_request.set_start_and_end_at()
+            with transaction.atomic():
+                AppointmentRequest.objects.bulk_update(batch, ['start_at', 'end_at'])
+            updated += len(batch)
+            if options['verbosity'] > 1:
+                self.stdout.write(f"  {updated} appointment requests updated")
+        self.stdout.write(self.style.SUCCESS(f"Filled start_at and end_at for {updated} appointment requests."))
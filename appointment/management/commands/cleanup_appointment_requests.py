@@ -7,19 +7,22 @@ Management command to manually run the cleanup_old_appointment_requests task.
 Usage:
     python manage.py cleanup_appointment_requests
     python manage.py cleanup_appointment_requests --dry-run
+    python manage.py cleanup_appointment_requests --batch-size 500 --sleep 0.2
 """
 
-from django.core.management.base import BaseCommand
-from django.utils import timezone
 from datetime import timedelta
 
-from appointment.models import AppointmentRequest
-from appointment.tasks import cleanup_old_appointment_requests
-from appointment.settings import APPOINTMENT_CLEANUP_DAYS
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from appointment.settings import (
+    APPOINTMENT_CLEANUP_BATCH_SIZE, APPOINTMENT_CLEANUP_BATCH_SLEEP, APPOINTMENT_CLEANUP_DAYS
+)
+from appointment.tasks import cleanup_old_appointment_requests, get_expired_querysets
 
 
 class Command(BaseCommand):
-    help = 'Manually run cleanup of old unassociated AppointmentRequests'
+    help = 'Manually run cleanup of old unassociated AppointmentRequests and other expired rows'
 
     def add_arguments(self, parser):
         parser.add_argument(
@@ -27,9 +30,25 @@ class Command(BaseCommand):
             action='store_true',
             help='Show what would be deleted without actually deleting',
         )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=APPOINTMENT_CLEANUP_BATCH_SIZE,
+            help=f'Rows deleted per batch (default: {APPOINTMENT_CLEANUP_BATCH_SIZE})',
+        )
+        parser.add_argument(
+            '--sleep',
+            type=float,
+            default=APPOINTMENT_CLEANUP_BATCH_SLEEP,
+            help=f'Seconds to pause between batches (default: {APPOINTMENT_CLEANUP_BATCH_SLEEP})',
+        )
 
     def handle(self, *args, **options):
         dry_run = options['dry_run']
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1.')
+        if options['sleep'] < 0:
+            raise CommandError('--sleep cannot be negative.')
 
         self.stdout.write(self.style.SUCCESS('=' * 60))
         self.stdout.write(self.style.SUCCESS('Cleanup Appointment Requests'))
@@ -41,52 +60,28 @@ class Command(BaseCommand):
         self.stdout.write(f'  - Cleanup Days: {APPOINTMENT_CLEANUP_DAYS}')
         cutoff_str = cutoff_date.strftime("%Y-%m-%d %H:%M:%S")
         self.stdout.write(f'  - Cutoff Date: {cutoff_str}')
-
-        # Count all appointment requests
-        total_requests = AppointmentRequest.objects.count()
-        msg = f'\nTotal AppointmentRequests in database: {total_requests}'
-        self.stdout.write(msg)
-
-        # Count requests with appointments
-        requests_with_appointments = AppointmentRequest.objects.exclude(
-            appointment__isnull=True
-        ).count()
-        msg = f'  - With associated Appointment: {requests_with_appointments}'
-        self.stdout.write(msg)
-
-        # Count requests without appointments
-        requests_without_appointments = AppointmentRequest.objects.filter(
-            appointment__isnull=True
-        ).count()
-        msg = (
-            f'  - Without associated Appointment: '
-            f'{requests_without_appointments}'
-        )
-        self.stdout.write(msg)
-
-        # Find old unassociated requests
-        old_unassociated = AppointmentRequest.objects.filter(
-            created_at__lt=cutoff_date,
-            appointment__isnull=True
-        )
-        count_to_delete = old_unassociated.count()
-
-        msg = f'\nOld Unassociated Requests (to be cleaned): {count_to_delete}'
-        self.stdout.write(msg)
-
-        if count_to_delete > 0:
-            self.stdout.write('\nDetails of requests that would be deleted:')
-            for req in old_unassociated[:10]:  # Show first 10
-                created_str = req.created_at.strftime("%Y-%m-%d %H:%M:%S")
-                msg = (
-                    f'  - ID: {req.id}, Created: {created_str}, '
-                    f'Service: {req.service.name}, Date: {req.date}'
-                )
-                self.stdout.write(msg)
-            if count_to_delete > 10:
-                self.stdout.write(f'  ... and {count_to_delete - 10} more')
+        self.stdout.write(f'  - Batch Size: {options["batch_size"]}')
+        self.stdout.write(f'  - Sleep Between Batches: {options["sleep"]}s')
 
         if dry_run:
+            self.stdout.write('\nExpired rows (to be cleaned):')
+            querysets = get_expired_querysets(cutoff_date)
+            for table, queryset in querysets.items():
+                self.stdout.write(f'  - {table}: {queryset.count()}')
+
+            old_unassociated = querysets['appointment_request'].select_related('service').order_by('pk')[:11]
+            if old_unassociated:
+                self.stdout.write('\nDetails of requests that would be deleted:')
+                for req in old_unassociated[:10]:  # Show first 10
+                    created_str = req.created_at.strftime("%Y-%m-%d %H:%M:%S")
+                    msg = (
+                        f'  - ID: {req.id}, Created: {created_str}, '
+                        f'Service: {req.service.name}, Date: {req.date}'
+                    )
+                    self.stdout.write(msg)
+                if len(old_unassociated) > 10:
+                    self.stdout.write('  ... and more')
+
             self.stdout.write(
                 self.style.WARNING('\n[DRY RUN] No items were deleted.')
             )
@@ -95,12 +90,17 @@ class Command(BaseCommand):
         else:
             self.stdout.write('\nRunning cleanup task...')
             try:
-                result = cleanup_old_appointment_requests()
+                result = cleanup_old_appointment_requests(batch_size=options['batch_size'], sleep=options['sleep'])
                 msg = '\n✓ Cleanup task completed successfully!'
                 self.stdout.write(self.style.SUCCESS(msg))
                 deleted = result["deleted_count"]
                 msg = f'  - Deleted: {deleted} AppointmentRequest(s)'
                 self.stdout.write(msg)
+                for table, stats in result['tables'].items():
+                    self.stdout.write(
+                        f'  - {table}: {stats["deleted"]} deleted in {stats["batches"]} batch(es), '
+                        f'{stats["seconds"]}s ({stats["rows_per_second"]} rows/s)'
+                    )
                 self.stdout.write(f'  - Cutoff Date: {result["cutoff_date"]}')
             except Exception as e:
                 msg = f'\n✗ Error during cleanup: {e}'
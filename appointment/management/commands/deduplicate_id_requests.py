@@ -0,0 +1,67 @@
+# deduplicate_id_requests.py
+# Path: appointment/management/commands/deduplicate_id_requests.py
+
+"""
+Management command to give a distinct `id_request` to every appointment request, reschedule history and appointment.
+
+`id_request` is unique since these tokens identify the rows in public links. Run this command before migrating a
+database created with earlier versions, where two rows could share a token or have none: for every duplicated value,
+the oldest row keeps it and the others get a new token; empty tokens are filled. The reminders of re-keyed
+appointments are renamed after their new token.
+
+Usage:
+    python manage.py deduplicate_id_requests --dry-run
+    python manage.py deduplicate_id_requests
+"""
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Q
+
+from appointment.models import Appointment, AppointmentRequest, AppointmentRescheduleHistory
+from appointment.utils.db_helpers import rename_appointment_reminder
+from appointment.utils.view_helpers import generate_id_request
+
+MODELS = (AppointmentRequest, AppointmentRescheduleHistory, Appointment)
+
+
+def deduplicate_id_requests(model, dry_run=False) -> int:
+    """Give a new `id_request` to the rows of `model` sharing one with an older row or having none.
+
+    :return: The number of rows re-keyed.
+    """
+    duplicated = (model.objects.exclude(Q(id_request__isnull=True) | Q(id_request=''))
+                  .values('id_request').annotate(rows=Count('pk')).filter(rows__gt=1).values('id_request'))
+    to_rekey = []
+    kept = set()
+    queryset = model.objects.filter(Q(id_request__in=duplicated) | Q(id_request__isnull=True) | Q(id_request=''))
+    for pk, id_request in queryset.order_by('pk').values_list('pk', 'id_request'):
+        if id_request and id_request not in kept:
+            kept.add(id_request)
+        else:
+            to_rekey.append((pk, id_request))
+    if dry_run or not to_rekey:
+        return len(to_rekey)
+
+    with transaction.atomic():
+        rows = [model(pk=pk, id_request=generate_id_request()) for pk, _old in to_rekey]
+        model.objects.bulk_update(rows, ['id_request'], batch_size=1000)
+        if model is Appointment:
+            for (pk, old_id_request), row in zip(to_rekey, rows):
+                if old_id_request:
+                    rename_appointment_reminder(pk, old_id_request, row.id_request)
+    return len(to_rekey)
+
+
+class Command(BaseCommand):
+    help = 'Give a distinct id_request to every appointment request, reschedule history and appointment'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only count the rows that would be re-keyed.')
+
+    def handle(self, *args, **options):
+        verb = 'Would re-key' if options['dry_run'] else 'Re-keyed'
+        for model in MODELS:
+            count = deduplicate_id_requests(model, dry_run=options['dry_run'])
+            self.stdout.write(f"{verb} {count} {model._meta.verbose_name_plural.lower()}.")
+        self.stdout.write(self.style.SUCCESS("Every id_request is now unique." if not options['dry_run'] else "Done."))
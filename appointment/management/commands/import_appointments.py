@@ -0,0 +1,83 @@
+# import_appointments.py
+# Path: appointment/management/commands/import_appointments.py
+
+"""
+Management command to import appointments from another booking tool, as CSV or ICS.
+
+The CSV header names the columns among: date, start_time, end_time, service (name), staff_member (e-mail),
+client_email, client_name, phone, address, want_reminder, paid, additional_info. The end time defaults to the start
+time plus the service's duration.
+
+Usage:
+    python manage.py import_appointments appointments.csv --rejects rejects.csv
+    python manage.py import_appointments calendar.ics --batch-size 5000 --notify
+    python manage.py import_appointments appointments.csv --dry-run
+"""
+
+import csv
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from appointment.settings import APPOINTMENT_CLEANUP_BATCH_SIZE
+from appointment.utils.importer import FIELDS, import_appointments, read_csv_rows, read_ics_rows
+
+
+class Command(BaseCommand):
+    help = 'Import appointments from a CSV or ICS file with bulk inserts, rejecting the conflicting rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="The file to import, or '-' to read the standard input.")
+        parser.add_argument('--format', choices=('csv', 'ics'),
+                            help='The file format (default: guessed from the file extension, csv for the standard '
+                                 'input).')
+        parser.add_argument('--batch-size', type=int, default=APPOINTMENT_CLEANUP_BATCH_SIZE,
+                            help=f'Rows checked and inserted per transaction '
+                                 f'(default: {APPOINTMENT_CLEANUP_BATCH_SIZE}).')
+        parser.add_argument('--rejects', help='Write the rejected rows, with the reason, to this CSV file.')
+        parser.add_argument('--notify', action='store_true',
+                            help='E-mail the clients of the imported appointments (queued when django-q is used).')
+        parser.add_argument('--encoding', default='utf-8', help='The file encoding (default: utf-8).')
+        parser.add_argument('--dry-run', action='store_true', help='Check the rows without importing them.')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1.')
+        path = options['path']
+        file_format = options['format'] or ('ics' if path.lower().endswith(('.ics', '.ical')) else 'csv')
+        try:
+            stream = sys.stdin if path == '-' else open(path, newline='', encoding=options['encoding'])
+        except OSError as e:
+            raise CommandError(str(e))
+
+        rejects_file = writer = None
+        if options['rejects']:
+            rejects_file = open(options['rejects'], 'w', newline='', encoding='utf-8')
+            writer = csv.writer(rejects_file)
+            writer.writerow(('source', 'error') + FIELDS)
+
+        def on_reject(source, row, reason):
+            if writer:
+                writer.writerow((source, reason) + tuple(row.get(field, '') for field in FIELDS))
+            if options['verbosity'] > 1:
+                self.stderr.write(f"  {source}: {reason}")
+
+        def progress(counts):
+            self.stdout.write(f"  batch {counts['batches']}: {counts['imported']} imported, "
+                              f"{counts['rejected']} rejected")
+
+        try:
+            rows = read_ics_rows(stream) if file_format == 'ics' else read_csv_rows(stream)
+            result = import_appointments(rows, batch_size=options['batch_size'], dry_run=options['dry_run'],
+                                         notify=options['notify'] and not options['dry_run'], on_reject=on_reject,
+                                         progress=progress if options['verbosity'] > 1 else None)
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+            if rejects_file:
+                rejects_file.close()
+
+        verb = 'Would import' if options['dry_run'] else f"Imported in {result['seconds']}s"
+        self.stdout.write(self.style.SUCCESS(f"{verb}: {result['imported']} of {result['read']} rows."))
+        for name in ('rejected', 'clients_created', 'notified'):
+            self.stdout.write(f"  {name.replace('_', ' ')}: {result[name]}")
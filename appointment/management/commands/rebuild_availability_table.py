@@ -0,0 +1,54 @@
+# rebuild_availability_table.py
+# Path: appointment/management/commands/rebuild_availability_table.py
+
+"""
+Management command to build the availability table (`StaffDayAvailability`) in bulk, e.g. when enabling
+APPOINTMENT_AVAILABILITY_TABLE or from cron when Django-Q is not used. Afterwards, the rows are kept up to date by the
+signal handlers.
+
+Usage:
+    python manage.py rebuild_availability_table
+    python manage.py rebuild_availability_table --days 90 --prune
+    python manage.py rebuild_availability_table --start-date 2030-01-15 --staff 1 --staff 2
+"""
+
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from appointment.utils.availability_table import get_availability_table_days, rebuild_availability_table
+
+
+class Command(BaseCommand):
+    help = "Build the availability rows of every staff member over the next days"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=get_availability_table_days(),
+                            help='Number of days to build (default: APPOINTMENT_AVAILABILITY_TABLE_DAYS).')
+        parser.add_argument('--start-date', help='The first day, as YYYY-MM-DD (default: today).')
+        parser.add_argument('--staff', type=int, action='append', dest='staff_member_ids',
+                            help='Only build this staff member ID (repeatable).')
+        parser.add_argument('--chunk-size', type=int, default=50, help='Staff members loaded per chunk.')
+        parser.add_argument('--prune', action='store_true', help='Also delete the rows dated before the first day.')
+
+    def handle(self, *args, **options):
+        start_date = None
+        if options['start_date']:
+            try:
+                start_date = datetime.date.fromisoformat(options['start_date'])
+            except ValueError:
+                raise CommandError('--start-date must be formatted as YYYY-MM-DD.')
+        for option in ('days', 'chunk_size'):
+            if options[option] < 1:
+                raise CommandError(f"--{option.replace('_', '-')} must be a positive integer.")
+
+        def progress(done, total, rows):
+            self.stdout.write(f"{done}/{total} staff member(s), {rows} rows")
+
+        stats = rebuild_availability_table(options['days'], start_date=start_date,
+                                           staff_member_ids=options['staff_member_ids'],
+                                           chunk_size=options['chunk_size'], prune=options['prune'],
+                                           progress=progress)
+        self.stdout.write(self.style.SUCCESS(
+                f"Built {stats['rows']} rows for {stats['staff_members']} staff member(s) over {stats['days']} "
+                f"day(s) in {stats['seconds']}s ({stats['rows_per_second']} rows/s), pruned {stats['pruned']}."))
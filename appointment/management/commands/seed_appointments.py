@@ -0,0 +1,81 @@
+# seed_appointments.py
+# Path: appointment/management/commands/seed_appointments.py
+
+"""
+Management command to fill the database with realistic volumes of staff members, schedules and appointments, for
+load and capacity testing. Never run it against a production database.
+
+Usage:
+    python manage.py seed_appointments
+    python manage.py seed_appointments --staff 500 --appointments 2000000 --clients 50000
+    python manage.py seed_appointments --staff 20 --days 56 --per-day 10 --seed 7 --prefix load
+"""
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from appointment.utils.date_time import convert_str_to_date
+from appointment.utils.db_helpers import get_user_model
+from appointment.utils.seed import seed_appointments
+
+
+class Command(BaseCommand):
+    help = 'Generate staff members, schedules, clients and appointments with bulk inserts (deterministic per seed)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--staff', type=int, default=50, help='Number of staff members (default: 50).')
+        parser.add_argument('--services', type=int, default=10, help='Number of services (default: 10).')
+        parser.add_argument('--clients', type=int, default=1000, help='Number of clients (default: 1000).')
+        parser.add_argument('--per-day', type=int, default=8, dest='appointments_per_day',
+                            help='Maximum appointments per staff member and working day (default: 8).')
+        parser.add_argument('--days', type=int, default=28, help='Number of days covered (default: 28).')
+        parser.add_argument('--appointments', type=int,
+                            help='Exact number of appointments to generate, spread evenly over the staff members; '
+                                 'overrides --days.')
+        parser.add_argument('--start', help='First date covered (YYYY-MM-DD). Defaults to today.')
+        parser.add_argument('--days-off-ratio', type=float, default=0.1,
+                            help='Share of staff members taking days off every four weeks (default: 0.1).')
+        parser.add_argument('--reschedule-ratio', type=float, default=0.05,
+                            help='Share of appointments rescheduled once (default: 0.05).')
+        parser.add_argument('--reminder-ratio', type=float, default=0.3,
+                            help='Share of appointments with a reminder requested (default: 0.3).')
+        parser.add_argument('--saturday-ratio', type=float, default=0.2,
+                            help='Share of staff members working on Saturdays (default: 0.2).')
+        parser.add_argument('--prefix', default='seed',
+                            help='Prefix of the generated usernames, e-mails and service names (default: seed).')
+        parser.add_argument('--seed', type=int, default=42, help='Seed of the random generator (default: 42).')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows per INSERT (default: 5000).')
+
+    def handle(self, *args, **options):
+        try:
+            start_date = convert_str_to_date(options['start']) if options['start'] else timezone.now().date()
+        except ValueError as e:
+            raise CommandError(str(e))
+        for option in ('staff', 'services', 'clients', 'appointments_per_day', 'days', 'batch_size'):
+            if options[option] < 1:
+                raise CommandError(f"--{option.replace('_', '-')} must be at least 1.")
+        if get_user_model().objects.filter(email__startswith=f"{options['prefix']}.").exists():
+            raise CommandError(f"Users prefixed with '{options['prefix']}.' already exist. Use another --prefix.")
+
+        started = time.perf_counter()
+
+        def progress(counts):
+            self.stdout.write(f"  {counts['staff_done']}/{counts['staff_members']} staff members, "
+                              f"{counts['appointments']} appointments ({time.perf_counter() - started:.1f}s)")
+
+        result = seed_appointments(
+                staff=options['staff'], services=options['services'], clients=options['clients'],
+                appointments_per_day=options['appointments_per_day'], days=options['days'],
+                appointments=options['appointments'], start_date=start_date,
+                days_off_ratio=options['days_off_ratio'], reschedule_ratio=options['reschedule_ratio'],
+                reminder_ratio=options['reminder_ratio'], saturday_ratio=options['saturday_ratio'],
+                prefix=options['prefix'], seed=options['seed'], batch_size=options['batch_size'],
+                progress=progress if options['verbosity'] > 1 else None)
+
+        counts = result['counts']
+        self.stdout.write(self.style.SUCCESS(
+                f"Seeded {result['start_date']} to {result['end_date']} in {time.perf_counter() - started:.1f}s:"))
+        for name, count in counts.items():
+            self.stdout.write(f"  {name.replace('_', ' ')}: {count}")
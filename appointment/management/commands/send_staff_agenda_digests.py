@@ -0,0 +1,37 @@
+# send_staff_agenda_digests.py
+# Path: appointment/management/commands/send_staff_agenda_digests.py
+
+"""
+Management command to e-mail every staff member their appointments of a day, e.g. from cron when Django-Q is not used.
+
+Usage:
+    python manage.py send_staff_agenda_digests
+    python manage.py send_staff_agenda_digests --date 2030-01-15 --dry-run
+"""
+
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from appointment.utils.digest import send_staff_agenda_digests
+
+
+class Command(BaseCommand):
+    help = "E-mail every staff member their appointments of a day (tomorrow by default)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help='The day, as YYYY-MM-DD (default: tomorrow).')
+        parser.add_argument('--dry-run', action='store_true', help='Only count the e-mails that would be sent.')
+
+    def handle(self, *args, **options):
+        date = None
+        if options['date']:
+            try:
+                date = datetime.date.fromisoformat(options['date'])
+            except ValueError:
+                raise CommandError('--date must be formatted as YYYY-MM-DD.')
+        result = send_staff_agenda_digests(date, dry_run=options['dry_run'])
+        verb = 'Would e-mail' if options['dry_run'] else 'E-mailed'
+        self.stdout.write(self.style.SUCCESS(
+                f"{verb} {result['staff_members']} staff member(s) about {result['appointments']} appointment(s) "
+                f"on {result['date']}."))
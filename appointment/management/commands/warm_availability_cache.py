@@ -0,0 +1,53 @@
+# warm_availability_cache.py
+# Path: appointment/management/commands/warm_availability_cache.py
+
+"""
+Management command to compute the available slots of every staff member ahead of the requests, e.g. after a deploy
+or from cron when Django-Q is not used (see APPOINTMENT_CACHE_WARMUP_MINUTES otherwise).
+
+Usage:
+    python manage.py warm_availability_cache
+    python manage.py warm_availability_cache --days 30 --processes 4
+    python manage.py warm_availability_cache --start-date 2030-01-15 --staff 1 --staff 2
+"""
+
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from appointment.utils.availability_cache import get_cache_warmup_days, warm_slots_cache
+
+
+class Command(BaseCommand):
+    help = "Compute and cache the available slots of every staff member and service over the next days"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=get_cache_warmup_days(),
+                            help='Number of days to warm (default: APPOINTMENT_CACHE_WARMUP_DAYS).')
+        parser.add_argument('--start-date', help='The first day, as YYYY-MM-DD (default: today).')
+        parser.add_argument('--staff', type=int, action='append', dest='staff_member_ids',
+                            help='Only warm this staff member ID (repeatable).')
+        parser.add_argument('--processes', type=int, default=1,
+                            help='Worker processes computing the slots (default: 1, in this process).')
+        parser.add_argument('--chunk-size', type=int, default=50, help='Staff members loaded per chunk.')
+
+    def handle(self, *args, **options):
+        start_date = None
+        if options['start_date']:
+            try:
+                start_date = datetime.date.fromisoformat(options['start_date'])
+            except ValueError:
+                raise CommandError('--start-date must be formatted as YYYY-MM-DD.')
+        for option in ('days', 'processes', 'chunk_size'):
+            if options[option] < 1:
+                raise CommandError(f"--{option.replace('_', '-')} must be a positive integer.")
+
+        def progress(done, total, entries):
+            self.stdout.write(f"{done}/{total} staff member(s), {entries} entries")
+
+        stats = warm_slots_cache(options['days'], start_date=start_date,
+                                 staff_member_ids=options['staff_member_ids'], chunk_size=options['chunk_size'],
+                                 processes=options['processes'], progress=progress)
+        self.stdout.write(self.style.SUCCESS(
+                f"Warmed {stats['entries']} entries for {stats['staff_members']} staff member(s) over "
+                f"{stats['days']} day(s) in {stats['seconds']}s ({stats['entries_per_second']} entries/s)."))
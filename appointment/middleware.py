@@ -0,0 +1,54 @@
+# middleware.py
+# Path: appointment/middleware.py
+
+"""
+Author: Adams Pierre David
+Since: 3.11.0
+"""
+
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from appointment.utils.profiler import (
+    format_server_timing, get_profiler_enabled, patch_template_render, start_profile, stop_profile
+)
+
+
+class AppointmentProfilerMiddleware:
+    """Profile the requests routed to `appointment.urls`: query count, SQL time, slowest queries and wall time split
+    into view, template render and e-mail send.
+
+    Opt-in with `APPOINTMENT_PROFILER_ENABLED = True` and by adding
+    `'appointment.middleware.AppointmentProfilerMiddleware'` to `MIDDLEWARE`. Each profiled response carries a
+    `Server-Timing` header; the last `APPOINTMENT_PROFILER_BUFFER_SIZE` profiles are listed to superusers at
+    `app-admin/profiler/`.
+    """
+
+    def __init__(self, get_response):
+        if not get_profiler_enabled():
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        patch_template_render()
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        profiling = getattr(request, '_appointment_profile', None)
+        if profiling is None:
+            return response
+        profile, token = profiling
+        for alias in connections:
+            if profile.execute_wrapper in connections[alias].execute_wrappers:
+                connections[alias].execute_wrappers.remove(profile.execute_wrapper)
+        data = stop_profile(token, response.status_code)
+        response.headers['Server-Timing'] = format_server_timing(data)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        match = request.resolver_match
+        if match is None or 'appointment' not in match.app_names:
+            return None
+        profile, token = start_profile(request.method, request.path, match.view_name)
+        for alias in connections:
+            connections[alias].execute_wrappers.append(profile.execute_wrapper)
+        request._appointment_profile = (profile, token)
+        return None
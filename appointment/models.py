@@ -21,9 +21,9 @@ from django.utils import timezone
 from django.utils.translation import gettext_lazy as _, ngettext
 from phonenumber_field.modelfields import PhoneNumberField
 
-from appointment.utils.date_time import convert_minutes_in_human_readable_format, get_timestamp, get_weekday_num, \
-    time_difference
-from appointment.utils.view_helpers import generate_random_id, get_locale
+from appointment.utils.date_time import convert_minutes_in_human_readable_format, get_weekday_num, \
+    make_appointment_datetime, time_difference
+from appointment.utils.view_helpers import generate_id_request, get_locale
 
 PAYMENT_TYPES = (
     ('full', _('Full payment')),
@@ -408,12 +408,15 @@ class AppointmentRequest(models.Model):
         default='full',
         verbose_name=_("Payment Type")
     )
-    id_request = models.CharField(max_length=100, blank=True, null=True, verbose_name=_("Request ID"))
+    id_request = models.CharField(max_length=100, blank=True, null=True, unique=True, verbose_name=_("Request ID"))
     reschedule_attempts = models.PositiveIntegerField(
         default=0,
         verbose_name=_("Reschedule Attempts"),
         help_text=_("Number of times this appointment has been rescheduled.")
     )
+    # date + start_time and date + end_time, kept in sync by save() so that overlaps are one range predicate
+    start_at = models.DateTimeField(null=True, blank=True, editable=False, verbose_name=_("Starts At"))
+    end_at = models.DateTimeField(null=True, blank=True, editable=False, verbose_name=_("Ends At"))
 
     # meta data
     created_at = models.DateTimeField(auto_now_add=True, verbose_name=_("Created At"))
@@ -426,6 +429,8 @@ class AppointmentRequest(models.Model):
         indexes = [
             models.Index(fields=['date', 'start_time']),
             models.Index(fields=['staff_member', 'date']),
+            models.Index(fields=['created_at']),
+            models.Index(fields=['staff_member', 'start_at', 'end_at']),
         ]
 
     def __str__(self):
@@ -444,8 +449,8 @@ class AppointmentRequest(models.Model):
 
     def save(self, *args, **kwargs):
         # if no id_request is provided, generate one
-        if self.id_request is None:
-            self.id_request = f"{get_timestamp()}{self.service.id}{generate_random_id()}"
+        if not self.id_request:
+            self.id_request = generate_id_request()
         # start time should not be equal to end time
         if self.start_time == self.end_time:
             raise ValidationError(_("Start time and end time cannot be the same"))
@@ -455,8 +460,17 @@ class AppointmentRequest(models.Model):
         # duration should not exceed the service duration
         if time_difference(self.start_time, self.end_time) > self.service.duration:
             raise ValidationError(_("Duration cannot exceed the service duration"))
+        self.set_start_and_end_at()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'date', 'start_time', 'end_time'} & set(update_fields):
+            kwargs['update_fields'] = {*update_fields, 'start_at', 'end_at'}
         return super().save(*args, **kwargs)
 
+    def set_start_and_end_at(self):
+        """Set `start_at` and `end_at` from the date, start time and end time."""
+        self.start_at = make_appointment_datetime(self.date, self.start_time)
+        self.end_at = make_appointment_datetime(self.date, self.end_time)
+
     def get_service_name(self):
         return self.service.name
 
@@ -531,7 +545,7 @@ class AppointmentRescheduleHistory(models.Model):
         verbose_name=_("Reschedule Status"),
         help_text=_("Indicates the status of the reschedule action.")
     )
-    id_request = models.CharField(max_length=100, blank=True, null=True, verbose_name=_("Request ID"),)
+    id_request = models.CharField(max_length=100, blank=True, null=True, unique=True, verbose_name=_("Request ID"))
 
     # meta data
     created_at = models.DateTimeField(
@@ -549,14 +563,17 @@ class AppointmentRescheduleHistory(models.Model):
         verbose_name = _("Appointment Reschedule History")
         verbose_name_plural = _("Appointment Reschedule Histories")
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['reschedule_status', 'created_at']),
+        ]
 
     def __str__(self):
         return f"Reschedule history for {self.appointment_request} from {self.date}"
 
     def save(self, *args, **kwargs):
         # if no id_request is provided, generate one
-        if self.id_request is None:
-            self.id_request = f"{get_timestamp()}{generate_random_id()}"
+        if not self.id_request:
+            self.id_request = generate_id_request()
         # date should not be in the past
         if self.date < datetime.date.today():
             raise ValidationError(_("Date cannot be in the past"))
@@ -625,7 +642,7 @@ class Appointment(models.Model):
         help_text=_("The amount to be paid for the appointment. "
                     "If 0, it means the appointment is free or already paid.")
     )
-    id_request = models.CharField(max_length=100, blank=True, null=True, verbose_name=_("Request ID"))
+    id_request = models.CharField(max_length=100, blank=True, null=True, unique=True, verbose_name=_("Request ID"))
 
     # meta datas
     created_at = models.DateTimeField(auto_now_add=True, verbose_name=_("Created At"))
@@ -654,8 +671,8 @@ class Appointment(models.Model):
         if not hasattr(self, 'appointment_request'):
             raise ValidationError("Appointment request is required")
 
-        if self.id_request is None:
-            self.id_request = f"{get_timestamp()}{self.appointment_request.id}{generate_random_id()}"
+        if not self.id_request:
+            self.id_request = generate_id_request()
         if self.amount_to_pay is None or self.amount_to_pay == 0:
             payment_type = self.appointment_request.payment_type
             if payment_type == 'full':
@@ -761,14 +778,43 @@ class Appointment(models.Model):
         return self.appointment_request.service.background_color
 
     @staticmethod
-    def is_valid_date(appt_date, start_time, staff_member, current_appointment_id, weekday: str):
-        weekday_num = get_weekday_num(weekday)
+    def is_valid_date(appt_date, start_time, staff_member, current_appointment_id, weekday: str, duration=None,
+                      ignored_appointment_ids=()):
+        """Check whether an appointment can be moved to the given date and start time.
+
+        The working hours, the day offs and the overlapping appointments are read in a single query. An existing
+        appointment conflicts when it overlaps [start, start + duration), widened on both sides by the staff
+        member's gap time.
+
+        :param appt_date: The new date.
+        :param start_time: A datetime whose time is the new start time.
+        :param staff_member: The staff member of the appointment.
+        :param current_appointment_id: The appointment being moved, ignored in the overlap test.
+        :param weekday: The name of the weekday of `appt_date`.
+        :param duration: The length of the appointment (timedelta); without it only the start time is checked.
+        :param ignored_appointment_ids: Other appointments left out of the overlap test (e.g. moved in the same batch).
+        :return: A tuple (is_valid, message).
+        """
+        from appointment.utils.db_helpers import appointment_overlap_q, get_staff_member_slot_gap_time
+
         sm_name = staff_member.get_staff_member_name()
+        new_start = datetime.datetime.combine(appt_date, start_time.time())
+        new_end = new_start + (duration or datetime.timedelta(0))
+        gap = datetime.timedelta(minutes=get_staff_member_slot_gap_time(staff_member, appt_date))
+        overlap = appointment_overlap_q(new_start - gap, new_end + gap, inclusive=not duration)
+
+        working_hours = WorkingHours.objects.filter(
+                staff_member=staff_member, day_of_week=get_weekday_num(weekday)
+        ).annotate(
+                has_conflict=models.Exists(Appointment.objects.filter(
+                        overlap, appointment_request__staff_member=staff_member).exclude(
+                        id=current_appointment_id).exclude(id__in=ignored_appointment_ids)),
+                has_day_off=models.Exists(DayOff.objects.filter(
+                        staff_member=staff_member, start_date__lte=appt_date, end_date__gte=appt_date))
+        ).first()
 
         # Check if the staff member works on the given day
-        try:
-            working_hours = WorkingHours.objects.get(staff_member=staff_member, day_of_week=weekday_num)
-        except WorkingHours.DoesNotExist:
+        if working_hours is None:
             message = _("{staff_member} does not work on this day.").format(staff_member=sm_name)
             return False, message
 
@@ -779,18 +825,12 @@ class Appointment(models.Model):
             return False, message
 
         # Check if the staff member already has an appointment on the given date and time
-        # Using prefetch_related to reduce DB hits when accessing related objects
-        appt_list = Appointment.objects.filter(appointment_request__staff_member=staff_member,
-                                               appointment_request__date=appt_date).exclude(
-            id=current_appointment_id).prefetch_related('appointment_request')
-        for appt in appt_list:
-            if appt.appointment_request.start_time <= start_time.time() <= appt.appointment_request.end_time:
-                message = _("{staff_member} already has an appointment at this time.").format(staff_member=sm_name)
-                return False, message
+        if working_hours.has_conflict:
+            message = _("{staff_member} already has an appointment at this time.").format(staff_member=sm_name)
+            return False, message
 
         # Check if the staff member has a day off on the appointment's date
-        days_off = DayOff.objects.filter(staff_member=staff_member, start_date__lte=appt_date, end_date__gte=appt_date)
-        if days_off.exists():
+        if working_hours.has_day_off:
             message = _("{staff_member} has a day off on this date.").format(staff_member=sm_name)
             return False, message
 
@@ -994,6 +1034,9 @@ class EmailVerificationCode(models.Model):
         verbose_name = _("Email Verification Code")
         verbose_name_plural = _("Email Verification Codes")
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['created_at']),
+        ]
 
     def __str__(self):
         return f"{self.code}"
@@ -1046,6 +1089,9 @@ class PasswordResetToken(models.Model):
         verbose_name = _("Password Reset Token")
         verbose_name_plural = _("Password Reset Tokens")
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['expires_at']),
+        ]
 
     def __str__(self):
         return f"Password reset token for {self.user} [{self.token} status: {self.status} expires at {self.expires_at}]"
@@ -1181,3 +1227,166 @@ class WorkingHours(models.Model):
 
     def is_owner(self, user_id):
         return self.staff_member.user.id == user_id
+
+
+class StaffDayAvailability(models.Model):
+    """
+    The working hours, booked and free time of a staff member on one day, maintained from the appointments and
+    schedules when APPOINTMENT_AVAILABILITY_TABLE is enabled (see `appointment.utils.availability_table`).
+
+    Intervals are lists of [start, end] in minutes since midnight. Slot settings (duration, buffer, gap) are applied
+    when the slots are read, so a change of the configuration, a service or a staff member does not touch the rows.
+
+    Author: Adams Pierre David
+    Since: 3.11.0
+    """
+    staff_member = models.ForeignKey(StaffMember, on_delete=models.CASCADE, related_name='day_availabilities',
+                                     verbose_name=_("Staff Member"))
+    date = models.DateField(verbose_name=_("Date"))
+    is_day_off = models.BooleanField(default=False, verbose_name=_("Is Day Off"))
+    # Null when the staff member does not work that day
+    start_time = models.TimeField(null=True, blank=True, verbose_name=_("Start Time"))
+    end_time = models.TimeField(null=True, blank=True, verbose_name=_("End Time"))
+    booked_intervals = models.JSONField(default=list, verbose_name=_("Booked Intervals"))
+    # Times held by pending reschedules, until `refresh_after`
+    held_intervals = models.JSONField(default=list, verbose_name=_("Held Intervals"))
+    free_intervals = models.JSONField(default=list, verbose_name=_("Free Intervals"))
+    free_minutes = models.PositiveIntegerField(default=0, verbose_name=_("Free Minutes"))
+    longest_free_minutes = models.PositiveIntegerField(default=0, verbose_name=_("Longest Free Minutes"))
+    refresh_after = models.DateTimeField(null=True, blank=True, verbose_name=_("Refresh After"))
+
+    # meta data
+    updated_at = models.DateTimeField(auto_now=True, verbose_name=_("Updated At"))
+
+    class Meta:
+        verbose_name = _("Staff Day Availability")
+        verbose_name_plural = _("Staff Day Availabilities")
+        ordering = ['date', 'staff_member']
+        constraints = [
+            models.UniqueConstraint(fields=['staff_member', 'date'], name='unique_staff_day_availability'),
+        ]
+        indexes = [
+            models.Index(fields=['date', 'longest_free_minutes']),
+        ]
+
+    def __str__(self):
+        return f"{self.staff_member_id} - {self.date} ({self.free_minutes} free minutes)"
+
+    def is_stale(self, now=None) -> bool:
+        """Tell whether a pending reschedule held some of the day's time and has expired since the row was built."""
+        return self.refresh_after is not None and self.refresh_after <= (now or timezone.now())
+
+
+class ArchivedAppointmentRequest(models.Model):
+    """
+    An appointment request moved out of `AppointmentRequest` by the `archive_appointments` command, keeping its
+    primary key and columns.
+
+    Author: Adams Pierre David
+    Since: 3.11.0
+    """
+    id = models.BigIntegerField(primary_key=True, verbose_name=_("ID"))
+    date = models.DateField(verbose_name=_("Date"))
+    start_time = models.TimeField(verbose_name=_("Start Time"))
+    end_time = models.TimeField(verbose_name=_("End Time"))
+    service = models.ForeignKey(Service, on_delete=models.SET_NULL, null=True, related_name='+',
+                                verbose_name=_("Service"))
+    staff_member = models.ForeignKey(StaffMember, on_delete=models.SET_NULL, null=True, related_name='+',
+                                     verbose_name=_("Staff Member"))
+    payment_type = models.CharField(max_length=4, choices=PAYMENT_TYPES, default='full',
+                                    verbose_name=_("Payment Type"))
+    id_request = models.CharField(max_length=100, blank=True, null=True, verbose_name=_("Request ID"))
+    reschedule_attempts = models.PositiveIntegerField(default=0, verbose_name=_("Reschedule Attempts"))
+    start_at = models.DateTimeField(null=True, blank=True, verbose_name=_("Starts At"))
+    end_at = models.DateTimeField(null=True, blank=True, verbose_name=_("Ends At"))
+
+    # meta data
+    created_at = models.DateTimeField(verbose_name=_("Created At"))
+    updated_at = models.DateTimeField(verbose_name=_("Updated At"))
+    archived_at = models.DateTimeField(auto_now_add=True, verbose_name=_("Archived At"))
+
+    class Meta:
+        verbose_name = _("Archived Appointment Request")
+        verbose_name_plural = _("Archived Appointment Requests")
+        ordering = ['-date', '-start_time']
+        indexes = [
+            models.Index(fields=['staff_member', 'date']),
+        ]
+
+    def __str__(self):
+        return f"{self.date} - {self.start_time} to {self.end_time} (archived)"
+
+
+class ArchivedAppointment(models.Model):
+    """
+    An appointment moved out of `Appointment` by the `archive_appointments` command, keeping its primary key and
+    columns.
+
+    Author: Adams Pierre David
+    Since: 3.11.0
+    """
+    id = models.BigIntegerField(primary_key=True, verbose_name=_("ID"))
+    client = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, related_name='+',
+                               verbose_name=_("Client"))
+    appointment_request = models.OneToOneField(ArchivedAppointmentRequest, on_delete=models.CASCADE,
+                                               related_name='appointment', verbose_name=_("Appointment Request"))
+    phone = PhoneNumberField(blank=True, verbose_name=_("Phone Number"))
+    address = models.CharField(max_length=255, blank=True, null=True, default="", verbose_name=_("Address"))
+    want_reminder = models.BooleanField(default=False, verbose_name=_("Want Reminder"))
+    additional_info = models.TextField(blank=True, null=True, verbose_name=_("Additional Info"))
+    paid = models.BooleanField(default=False, verbose_name=_("Paid"))
+    amount_to_pay = models.DecimalField(max_digits=10, decimal_places=2, blank=True, null=True,
+                                        verbose_name=_("Amount to Pay"))
+    id_request = models.CharField(max_length=100, blank=True, null=True, verbose_name=_("Request ID"))
+
+    # meta data
+    created_at = models.DateTimeField(verbose_name=_("Created At"))
+    updated_at = models.DateTimeField(verbose_name=_("Updated At"))
+    archived_at = models.DateTimeField(auto_now_add=True, verbose_name=_("Archived At"))
+
+    class Meta:
+        verbose_name = _("Archived Appointment")
+        verbose_name_plural = _("Archived Appointments")
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['client', '-created_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.client} - {self.appointment_request} (archived)"
+
+
+class ArchivedAppointmentRescheduleHistory(models.Model):
+    """
+    A reschedule history moved out of `AppointmentRescheduleHistory` together with its appointment request.
+
+    Author: Adams Pierre David
+    Since: 3.11.0
+    """
+    id = models.BigIntegerField(primary_key=True, verbose_name=_("ID"))
+    appointment_request = models.ForeignKey(ArchivedAppointmentRequest, on_delete=models.CASCADE,
+                                            related_name='reschedule_histories',
+                                            verbose_name=_("Appointment Request"))
+    date = models.DateField(verbose_name=_("Date"))
+    start_time = models.TimeField(verbose_name=_("Start Time"))
+    end_time = models.TimeField(verbose_name=_("End Time"))
+    staff_member = models.ForeignKey(StaffMember, on_delete=models.SET_NULL, null=True, related_name='+',
+                                     verbose_name=_("Staff Member"))
+    reason_for_rescheduling = models.TextField(blank=True, null=True, verbose_name=_("Reason for Rescheduling"))
+    reschedule_status = models.CharField(max_length=10, choices=[('pending', _('Pending')),
+                                                                 ('confirmed', _('Confirmed'))],
+                                         default='pending', verbose_name=_("Reschedule Status"))
+    id_request = models.CharField(max_length=100, blank=True, null=True, verbose_name=_("Request ID"))
+
+    # meta data
+    created_at = models.DateTimeField(verbose_name=_("Created At"))
+    updated_at = models.DateTimeField(verbose_name=_("Updated At"))
+    archived_at = models.DateTimeField(auto_now_add=True, verbose_name=_("Archived At"))
+
+    class Meta:
+        verbose_name = _("Archived Appointment Reschedule History")
+        verbose_name_plural = _("Archived Appointment Reschedule Histories")
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"Reschedule history for {self.appointment_request} from {self.date}"
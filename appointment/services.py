@@ -7,32 +7,38 @@ Since: 2.0.0
 """
 
 import datetime
+from collections import defaultdict
 
 from django.contrib.auth import get_user_model
-from django.core.exceptions import ObjectDoesNotExist
+from django.core.exceptions import ObjectDoesNotExist, ValidationError
+from django.db import transaction
 from django.shortcuts import render
 from django.urls import reverse
 from django.utils import timezone
 from django.utils.translation import gettext as _, gettext_lazy as _
 
+from appointment.email_sender import send_emails
 from appointment.forms import PersonalInformationForm, ServiceForm, StaffDaysOffForm, StaffWorkingHoursForm
 from appointment.messages_ import appt_updated_successfully
-from appointment.settings import APPOINTMENT_PAYMENT_URL
+from appointment.settings import APPOINTMENT_BULK_MAX_OPERATIONS, APPOINTMENT_PAYMENT_URL
+from appointment.utils.availability_cache import invalidate_staff_day_availability
 from appointment.utils.date_time import (
-    convert_12_hour_time_to_24_hour_time, convert_str_to_date, convert_str_to_time, get_ar_end_time)
+    convert_12_hour_time_to_24_hour_time, convert_str_to_date, convert_str_to_time, get_ar_end_time,
+    make_appointment_datetime)
 from appointment.utils.db_helpers import (
     Appointment, AppointmentRequest, EmailVerificationCode, Service, StaffMember, WorkingHours, calculate_slots,
-    calculate_staff_slots, check_day_off_for_staff, create_and_save_appointment, create_new_user,
-    day_off_exists_for_date_range, exclude_booked_slots, exclude_pending_reschedules, get_all_appointments,
-    get_all_staff_members,
+    calculate_staff_slots, cancel_existing_reminders, check_day_off_for_staff, create_and_save_appointment,
+    create_new_user, day_off_exists_for_date_range, exclude_booked_slots, exclude_pending_reschedules,
+    get_all_appointments, get_all_staff_members,
     get_appointment_by_id, get_appointments_for_date_and_time, get_config, get_staff_member_appointment_list,
     get_staff_member_from_user_id_or_logged_in, get_staff_member_slot_gap_time, get_times_from_config,
     get_user_by_email, get_weekday_num_from_date, get_working_hours_for_staff_and_day, parse_name,
-    update_appointment_reminder, working_hours_exist)
+    schedule_email_reminder, update_appointment_reminder, working_hours_exist)
 from appointment.utils.email_ops import send_reset_link_to_staff_member
 from appointment.utils.error_codes import ErrorCode
 from appointment.utils.json_context import convert_appointment_to_json, get_generic_context, json_response
-from appointment.utils.permissions import check_entity_ownership
+from appointment.utils.metrics import SLOTS_RETURNED, SLOT_COMPUTATION_SECONDS
+from appointment.utils.permissions import check_entity_ownership, has_permission_to_delete_appointment
 from appointment.utils.session import handle_email_change
 
 
@@ -42,11 +48,13 @@ def fetch_user_appointments(user):
     :param user: The user instance.
     :return: A list of appointments.
     """
+    # Everything `convert_appointment_to_json` reads, so that listing appointments costs one query
+    related = ('client', 'appointment_request__service', 'appointment_request__staff_member__user')
     if user.is_superuser:
-        return get_all_appointments()
+        return get_all_appointments().select_related(*related)
     try:
         staff_member_instance = user.staffmember
-        return get_staff_member_appointment_list(staff_member_instance)
+        return get_staff_member_appointment_list(staff_member_instance).select_related(*related)
     except ObjectDoesNotExist:
         if user.is_staff:
             return []
@@ -87,7 +95,7 @@ def prepare_user_profile_data(user, staff_user_id):
     :return: A dictionary containing the data for the user profile page.
     """
     if user.is_superuser and staff_user_id is None:
-        staff_members = get_all_staff_members()
+        staff_members = get_all_staff_members().select_related('user')
         btn_staff_me = _("Staff me")
         btn_staff_me_link = reverse('appointment:make_superuser_staff_member')
         if StaffMember.objects.filter(user=user).exists():
@@ -362,6 +370,18 @@ def save_appt_date_time(appt_start_time, appt_date, appt_id, request):
     :return: The modified appointment.
     """
     appt = Appointment.objects.get(id=appt_id)
+    return set_appt_date_time(appt, appt_start_time, appt_date, request)
+
+
+def set_appt_date_time(appt, appt_start_time, appt_date, request):
+    """Move an appointment to a new date and start time, keeping the duration of its service.
+
+    :param appt: The appointment to modify.
+    :param appt_start_time: The new start time, as a time object or a string like "09:00:00.000Z".
+    :param appt_date: The new date, as a date object or a string like "2024-01-31".
+    :param request: The request object.
+    :return: The modified appointment.
+    """
     service = appt.get_service()
 
     # Convert start time to a time object if it is a string
@@ -395,6 +415,216 @@ def save_appt_date_time(appt_start_time, appt_date, appt_id, request):
     return appt
 
 
+BULK_ACTIONS = ('delete', 'move', 'reassign', 'mark_paid')
+
+
+def _parse_bulk_operations(operations) -> dict:
+    """Check the operations of `apply_bulk_operations` and return them by appointment ID."""
+    if not isinstance(operations, list) or not operations:
+        raise ValidationError(_("No operation to apply."), code='invalid')
+    if len(operations) > APPOINTMENT_BULK_MAX_OPERATIONS:
+        raise ValidationError(_("At most {count} operations can be applied at once.").format(
+                count=APPOINTMENT_BULK_MAX_OPERATIONS), code='invalid')
+    parsed = {}
+    for operation in operations:
+        try:
+            action, appointment_id = operation['action'], int(operation['appointment_id'])
+        except (KeyError, TypeError, ValueError):
+            raise ValidationError(_("Each operation needs an action and an appointment_id."), code='invalid')
+        if action not in BULK_ACTIONS:
+            raise ValidationError(_("Unknown action: {action}.").format(action=action), code='invalid')
+        if appointment_id in parsed:
+            raise ValidationError(_("Appointment {id} appears in more than one operation.").format(
+                    id=appointment_id), code='invalid')
+        parsed_operation = {'action': action, 'staff_member': None}
+        try:
+            if action == 'move':
+                parsed_operation['date'] = convert_str_to_date(operation['date'])
+                parsed_operation['start_time'] = convert_str_to_time(operation['start_time'])
+            if action == 'reassign' or (action == 'move' and operation.get('staff_member')):
+                parsed_operation['staff_member'] = int(operation['staff_member'])
+        except (KeyError, TypeError, ValueError) as e:
+            raise ValidationError(_("Invalid operation on appointment {id}: {error}").format(
+                    id=appointment_id, error=e), code='invalid')
+        if action == 'mark_paid':
+            parsed_operation['paid'] = bool(operation.get('paid', True))
+        parsed[appointment_id] = parsed_operation
+    return parsed
+
+
+def _check_bulk_overlaps(new_slots, gap_times):
+    """Raise a ValidationError when two appointments of the batch end up overlapping."""
+    by_staff_member = defaultdict(list)
+    for appointment_id, (staff_member_id, start_at, end_at) in new_slots.items():
+        by_staff_member[staff_member_id].append((start_at, end_at, appointment_id))
+    for staff_member_id, slots in by_staff_member.items():
+        gap = datetime.timedelta(minutes=gap_times[staff_member_id])
+        slots.sort()
+        for (_start, previous_end, previous_id), (start_at, _end, appointment_id) in zip(slots, slots[1:]):
+            if start_at < previous_end + gap:
+                raise ValidationError(_("Appointments {first} and {second} would overlap.").format(
+                        first=previous_id, second=appointment_id), code='conflict')
+
+
+def _bulk_notification(appointment, subject, message):
+    """Return the e-mail telling the client of an appointment about a bulk change, or None without an address."""
+    client = appointment.client
+    if client is None or not client.email:
+        return None
+    appointment_request = appointment.appointment_request
+    return {'recipient_list': [client.email], 'subject': subject, 'message': message.format(
+            first_name=client.first_name, service=appointment.get_service_name(), date=appointment_request.date,
+            time=appointment_request.start_time.strftime('%H:%M'),
+            staff_member=appointment_request.staff_member.get_staff_member_name())}
+
+
+def apply_bulk_operations(operations, user, request, notify_clients=True) -> dict:
+    """Apply a batch of operations on appointments in a single transaction.
+
+    Each operation is a dictionary with an `action` and an `appointment_id`:
+
+    - `delete`;
+    - `move`, with the new `date` and `start_time` and optionally a new `staff_member`;
+    - `reassign`, with the new `staff_member`;
+    - `mark_paid`, with `paid` (true by default).
+
+    The batch is applied entirely or not at all. Deletions and payment statuses are applied with one query each,
+    moved and reassigned requests with a single `bulk_update()`; every new slot is checked against the appointments
+    left in place and against the other moves of the batch. Reminders are cancelled with one query, and the clients
+    are notified with one batch of e-mails once the transaction is committed.
+
+    :param operations: The list of operations.
+    :param user: The user applying them; staff members can only change their own appointments, and only a superuser
+        can move or reassign an appointment to another staff member.
+    :param request: The request object, used to build the links of the rescheduled reminders.
+    :param notify_clients: Send an e-mail to the clients of the deleted, moved and reassigned appointments.
+    :return: The number of appointments per action and the serialized moved, reassigned and paid appointments.
+    :raises ValidationError: With the code `invalid`, `not_found`, `not_authorized` or `conflict`.
+    """
+    parsed = _parse_bulk_operations(operations)
+    appointments = Appointment.objects.select_related(
+            'client', 'appointment_request__service', 'appointment_request__staff_member__user').in_bulk(list(parsed))
+    missing = sorted(set(parsed) - set(appointments))
+    if missing:
+        raise ValidationError(_("Appointments not found: {ids}.").format(ids=", ".join(map(str, missing))),
+                              code='not_found')
+    for appointment_id, appointment in appointments.items():
+        if parsed[appointment_id]['action'] == 'delete':
+            allowed = has_permission_to_delete_appointment(user, appointment)
+        else:
+            allowed = check_entity_ownership(user, appointment)
+        if not allowed:
+            raise ValidationError(_("You can only update your own appointments."), code='not_authorized')
+
+    target_ids = {operation['staff_member'] for operation in parsed.values() if operation['staff_member']}
+    targets = StaffMember.objects.select_related('user').prefetch_related('services_offered').in_bulk(target_ids)
+    if set(targets) != target_ids:
+        raise ValidationError(_("Staff member not found."), code='not_found')
+    if not user.is_superuser and any(target.user_id != user.pk for target in targets.values()):
+        raise ValidationError(_("Only a superuser can assign appointments to another staff member."),
+                              code='not_authorized')
+
+    by_action = defaultdict(list)
+    for appointment_id, operation in parsed.items():
+        by_action[operation['action']].append(appointment_id)
+    changed_ids = by_action['move'] + by_action['reassign']
+    now = timezone.now()
+    emails = []
+
+    with transaction.atomic():
+        # Same lock as `move_appointment`, taken in a stable order
+        locked_ids = target_ids | {appointments[i].appointment_request.staff_member_id for i in changed_ids}
+        list(StaffMember.objects.select_for_update().filter(pk__in=locked_ids).order_by('pk').values_list('pk'))
+
+        deleted = [appointments[i] for i in by_action['delete']]
+        if deleted:
+            Appointment.objects.filter(pk__in=by_action['delete']).delete()
+            if notify_clients:
+                emails += [_bulk_notification(
+                        appointment, _("Your appointment has been cancelled"),
+                        _("Hello {first_name},\n\nYour {service} appointment on {date} at {time} has been "
+                          "cancelled.")) for appointment in deleted]
+
+        for paid in (True, False):
+            ids = [i for i in by_action['mark_paid'] if parsed[i]['paid'] is paid]
+            if ids:
+                Appointment.objects.filter(pk__in=ids).update(paid=paid, updated_at=now)
+
+        new_slots, gap_times, requests_to_update, rescheduled = {}, {}, [], []
+        for appointment_id in changed_ids:
+            appointment, operation = appointments[appointment_id], parsed[appointment_id]
+            appointment_request = appointment.appointment_request
+            staff_member = targets.get(operation['staff_member']) or appointment_request.staff_member
+            service = appointment_request.service
+            if operation['staff_member'] and service not in staff_member.services_offered.all():
+                raise ValidationError(_("{staff_member} does not offer {service}.").format(
+                        staff_member=staff_member.get_staff_member_name(), service=service.name), code='invalid')
+            if operation['action'] == 'move':
+                date, start_time = operation['date'], operation['start_time']
+                end_time = get_ar_end_time(start_time, service.duration)
+            else:
+                date, start_time, end_time = (appointment_request.date, appointment_request.start_time,
+                                              appointment_request.end_time)
+            start = datetime.datetime.combine(date, start_time)
+            is_valid, message = Appointment.is_valid_date(
+                    date, start, staff_member, appointment_id, date.strftime("%A"),
+                    duration=datetime.datetime.combine(date, end_time) - start, ignored_appointment_ids=changed_ids)
+            if not is_valid:
+                raise ValidationError(_("Appointment {id}: {message}").format(id=appointment_id, message=message),
+                                      code='conflict')
+            gap_times.setdefault(staff_member.id, get_staff_member_slot_gap_time(staff_member, date))
+
+            previous_slot = (appointment_request.staff_member_id, appointment_request.date)
+            if (date, start_time) != (appointment_request.date, appointment_request.start_time):
+                rescheduled.append(appointment)
+            appointment_request.date, appointment_request.start_time = date, start_time
+            appointment_request.end_time, appointment_request.staff_member = end_time, staff_member
+            appointment_request.set_start_and_end_at()
+            appointment_request.updated_at = appointment.updated_at = now
+            requests_to_update.append((appointment_request, previous_slot))
+            new_slots[appointment_id] = (staff_member.id, appointment_request.start_at, appointment_request.end_at)
+        _check_bulk_overlaps(new_slots, gap_times)
+
+        if requests_to_update:
+            AppointmentRequest.objects.bulk_update(
+                    [appointment_request for appointment_request, _previous in requests_to_update],
+                    ['date', 'start_time', 'end_time', 'staff_member', 'start_at', 'end_at', 'updated_at'])
+            Appointment.objects.filter(pk__in=changed_ids).update(updated_at=now)
+            # bulk_update() does not send the signals keeping the availability cache in sync
+            for appointment_request, previous_slot in requests_to_update:
+                invalidate_staff_day_availability(*previous_slot)
+                invalidate_staff_day_availability(appointment_request.staff_member_id, appointment_request.date)
+
+        with_reminder = [appointment for appointment in deleted + rescheduled if appointment.want_reminder]
+        if with_reminder:
+            cancel_existing_reminders([appointment.id_request for appointment in with_reminder])
+        for appointment in rescheduled:
+            if appointment.want_reminder:
+                schedule_email_reminder(appointment, request, make_appointment_datetime(
+                        appointment.appointment_request.date, appointment.appointment_request.start_time))
+        if notify_clients:
+            emails += [_bulk_notification(
+                    appointments[i], _("Your appointment has been changed"),
+                    _("Hello {first_name},\n\nYour {service} appointment is now on {date} at {time} with "
+                      "{staff_member}.")) for i in changed_ids]
+
+        emails = [email for email in emails if email]
+        transaction.on_commit(lambda: send_emails(emails))
+
+    for appointment_id in by_action['mark_paid']:
+        appointments[appointment_id].paid = parsed[appointment_id]['paid']
+        appointments[appointment_id].updated_at = now
+    updated = [appointments[i] for i in changed_ids + by_action['mark_paid']]
+    return {
+        'deleted': len(by_action['delete']),
+        'moved': len(by_action['move']),
+        'reassigned': len(by_action['reassign']),
+        'marked_paid': len(by_action['mark_paid']),
+        'notified': len(emails),
+        'appointments': convert_appointment_to_json(request, updated),
+    }
+
+
 def get_available_slots(date, appointments):
     """Calculate the available time slots for a given date and a list of appointments.
 
@@ -423,6 +653,13 @@ def get_available_slots_for_staff(date, staff_member, day_of_week: int, service=
         configured slot step.
     :return: A list of available time slots as strings in the format '%I:%M %p' like ['10:00 AM', '10:30 AM']
     """
+    with SLOT_COMPUTATION_SECONDS.time():
+        slots = _get_available_slots_for_staff(date, staff_member, day_of_week, service)
+    SLOTS_RETURNED.observe(len(slots))
+    return slots
+
+
+def _get_available_slots_for_staff(date, staff_member, day_of_week: int, service=None):
     # Check if the provided date is a day off for the staff member
     days_off_exist = check_day_off_for_staff(staff_member=staff_member, date=date)
     if days_off_exist:
@@ -487,6 +724,7 @@ def get_appointments_and_slots(date_, service=None):
                                                   appointment_request__date=date_)
     else:
         appointments = Appointment.objects.filter(appointment_request__date=date_)
+    appointments = appointments.select_related('appointment_request')
     available_slots = get_available_slots(date_, appointments)
     return appointments, available_slots
 
@@ -23,6 +23,11 @@ APPOINTMENT_BUFFER_TIME = getattr(settings, 'APPOINTMENT_BUFFER_TIME', 0)
 APPOINTMENT_LEAD_TIME = getattr(settings, 'APPOINTMENT_LEAD_TIME', (9, 0))
 APPOINTMENT_FINISH_TIME = getattr(settings, 'APPOINTMENT_FINISH_TIME', (18, 30))
 APPOINTMENT_CLEANUP_DAYS = getattr(settings, 'APPOINTMENT_CLEANUP_DAYS', 7)
+APPOINTMENT_CLEANUP_BATCH_SIZE = getattr(settings, 'APPOINTMENT_CLEANUP_BATCH_SIZE', 1000)
+APPOINTMENT_CLEANUP_BATCH_SLEEP = getattr(settings, 'APPOINTMENT_CLEANUP_BATCH_SLEEP', 0.0)
+APPOINTMENT_ARCHIVE_MONTHS = getattr(settings, 'APPOINTMENT_ARCHIVE_MONTHS', 12)
+APPOINTMENT_BULK_MAX_OPERATIONS = getattr(settings, 'APPOINTMENT_BULK_MAX_OPERATIONS', 500)
+APPOINTMENT_ASYNC_AVAILABILITY_VIEWS = getattr(settings, 'APPOINTMENT_ASYNC_AVAILABILITY_VIEWS', False)
 APP_DEFAULT_FROM_EMAIL = getattr(settings, 'DEFAULT_FROM_EMAIL', DEFAULT_FROM_EMAIL)
 
 
@@ -0,0 +1,133 @@
+# signals.py
+# Path: appointment/signals.py
+
+"""
+Author: Adams Pierre David
+Since: 3.11.0
+
+Keeps the cached availability (see `appointment.utils.availability_cache`), the availability table when it is enabled
+(see `appointment.utils.availability_table`) and the cached configuration in sync with the database. Connected in
+`AppointmentConfig.ready()`.
+"""
+
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from appointment.models import (
+    Appointment, AppointmentRequest, AppointmentRescheduleHistory, Config, DayOff, Service, StaffMember, WorkingHours
+)
+from appointment.utils.availability_cache import (
+    invalidate_all_availability, invalidate_staff_availability, invalidate_staff_day_availability
+)
+from appointment.utils.availability_table import (
+    get_availability_table_enabled, refresh_request_days_on_commit, refresh_staff_days_on_commit,
+    refresh_staff_member_on_commit
+)
+from appointment.utils.db_helpers import WEBSITE_NAME_CACHE_KEY
+
+
+def _appointment_request_slot(instance):
+    """Return the (staff member ID, date) of an appointment's request, without a query when it is already loaded."""
+    field = instance._meta.get_field('appointment_request')
+    appointment_request = field.get_cached_value(instance, None)
+    if appointment_request is not None:
+        return appointment_request.staff_member_id, appointment_request.date
+    return AppointmentRequest.objects.filter(pk=instance.appointment_request_id).values_list(
+            'staff_member_id', 'date').first() or (None, None)
+
+
+def _is_bulk_deletion(instance, origin):
+    """Tell whether `instance` is deleted as part of a cascade or a queryset deletion with its request not loaded.
+
+    Looking the request up for every such row would cost one query per deleted row, so the whole availability cache
+    is invalidated instead, once per deletion.
+    """
+    if origin is None or origin is instance:
+        return False
+    if instance._meta.get_field('appointment_request').is_cached(instance):
+        return False
+    if not getattr(origin, '_availability_invalidated', False):
+        invalidate_all_availability()
+        origin._availability_invalidated = True
+    return True
+
+
+@receiver(post_init, sender=AppointmentRequest)
+def remember_appointment_request_slot(sender, instance, **kwargs):
+    # Remember where the request was when it was loaded, so that moving it frees the previous day.
+    # Read from __dict__ so that deferred fields are not loaded one query at a time.
+    instance._availability_origin = (instance.__dict__.get('staff_member_id'), instance.__dict__.get('date'))
+
+
+@receiver(post_save, sender=AppointmentRequest)
+@receiver(post_delete, sender=AppointmentRequest)
+def appointment_request_changed(sender, instance, **kwargs):
+    origin = getattr(instance, '_availability_origin', (None, None))
+    current = (instance.staff_member_id, instance.date)
+    invalidate_staff_day_availability(*current)
+    if origin != current:
+        invalidate_staff_day_availability(*origin)
+    if get_availability_table_enabled():
+        refresh_staff_days_on_commit(current, origin)
+    instance._availability_origin = current
+
+
+@receiver(post_save, sender=Appointment)
+@receiver(post_delete, sender=Appointment)
+def appointment_changed(sender, instance, origin=None, **kwargs):
+    if _is_bulk_deletion(instance, origin):
+        if get_availability_table_enabled():
+            refresh_request_days_on_commit(origin, instance.appointment_request_id)
+        return
+    slot = _appointment_request_slot(instance)
+    invalidate_staff_day_availability(*slot)
+    if get_availability_table_enabled():
+        refresh_staff_days_on_commit(slot)
+
+
+@receiver(post_save, sender=AppointmentRescheduleHistory)
+@receiver(post_delete, sender=AppointmentRescheduleHistory)
+def reschedule_changed(sender, instance, origin=None, **kwargs):
+    if _is_bulk_deletion(instance, origin):
+        if get_availability_table_enabled():
+            refresh_request_days_on_commit(origin, instance.appointment_request_id, instance.date)
+        return
+    staff_member_id, _ = _appointment_request_slot(instance)
+    invalidate_staff_day_availability(staff_member_id, instance.date)
+    if get_availability_table_enabled():
+        refresh_staff_days_on_commit((staff_member_id, instance.date))
+
+
+@receiver(post_save, sender=DayOff)
+@receiver(post_delete, sender=DayOff)
+@receiver(post_save, sender=WorkingHours)
+@receiver(post_delete, sender=WorkingHours)
+def staff_schedule_changed(sender, instance, **kwargs):
+    invalidate_staff_availability(instance.staff_member_id)
+    if get_availability_table_enabled():
+        refresh_staff_member_on_commit(instance.staff_member_id)
+
+
+@receiver(post_save, sender=StaffMember)
+def staff_member_changed(sender, instance, **kwargs):
+    invalidate_staff_availability(instance.id)
+
+
+@receiver(post_save, sender=Config)
+def config_saved(sender, instance, **kwargs):
+    # The availability computed next must not read the configuration cached by `get_config` before the change.
+    cache.delete_many(['config', WEBSITE_NAME_CACHE_KEY])
+    invalidate_all_availability()
+
+
+@receiver(post_delete, sender=Config)
+def config_deleted(sender, instance, **kwargs):
+    cache.delete(WEBSITE_NAME_CACHE_KEY)
+    invalidate_all_availability()
+
+
+@receiver(post_save, sender=Service)
+@receiver(post_delete, sender=Service)
+def service_changed(sender, instance, **kwargs):
+    invalidate_all_availability()
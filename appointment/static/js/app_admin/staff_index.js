@@ -88,6 +88,46 @@ function initializeCalendar() {
     AppState.calendar.render();
 }
 
+// Colour each day cell according to how booked the day is, from green (free) to red (full).
+function availabilityHeatmapSource() {
+    return {
+        id: 'availabilityHeatmap',
+        events: function (fetchInfo, successCallback, failureCallback) {
+            const params = new URLSearchParams({start: fetchInfo.startStr, end: fetchInfo.endStr});
+            fetch(`${availabilityHeatmapURL}?${params.toString()}`)
+                .then(response => {
+                    if (!response.ok) throw new Error('Network response was not ok');
+                    return response.json();
+                })
+                .then(data => successCallback(data.days
+                    .filter(day => day.working_staff > 0)
+                    .map(day => ({
+                        start: day.date,
+                        allDay: true,
+                        display: 'background',
+                        backgroundColor: getHeatmapColor(day.utilization),
+                        description: `${day.free_slots} ${freeSlotsTxt}`,
+                    }))))
+                .catch(error => {
+                    console.error('Error fetching availability heatmap:', error);
+                    failureCallback(error);
+                });
+        },
+    };
+}
+
+function refreshAvailabilityHeatmap() {
+    const source = AppState.calendar && AppState.calendar.getEventSourceById('availabilityHeatmap');
+    if (source) {
+        source.refetch();
+    }
+}
+
+function getHeatmapColor(utilization) {
+    const hue = Math.round(120 * (1 - Math.min(Math.max(utilization, 0), 1)));
+    return `hsl(${hue}, 70%, 80%)`;
+}
+
 function formatAppointmentsForCalendar(appointments) {
     return appointments.map(appointment => ({
         id: appointment.id,
@@ -96,6 +136,7 @@ function formatAppointmentsForCalendar(appointments) {
         end: appointment.end_time,
         client_name: appointment.client_name,
         backgroundColor: appointment.background_color,
+        updated_at: appointment.updated_at,
     }));
 }
 
@@ -147,6 +188,7 @@ function getCalendarConfig(events) {
         defaultView: mobileCheck() ? "basicDay" : "dayGridMonth",
         selectable: true,
         events: events,
+        eventSources: [availabilityHeatmapSource()],
         eventDisplay: getEventDisplayedStyle(),
         timeZone: timezone,
         eventClick: async function (info) {
@@ -173,9 +215,13 @@ function getCalendarConfig(events) {
             return ''; // Return empty string for regular days
         },
         eventDrop: async function (info) {
-            await validateAndUpdateAppointmentDate(info.event, info.revert);
+            await moveAppointment(info.event, info.revert);
         },
         eventDidMount: function (info) {
+            if (info.event.display === 'background') {
+                info.el.title = info.event.extendedProps.description || '';
+                return;
+            }
             // If it is a mobile view, we change the event to a dot
             if (mobileCheck()) {
                 // Find the fc-daygrid-event-dot class within the event element
@@ -390,6 +436,7 @@ function confirmDeleteAppointment(appointmentId) {
             if (event) {
                 event.remove();
             }
+            refreshAvailabilityHeatmap();
             showErrorModal(data.message, successTxt);
             closeConfirmModal();  // Close the confirmation modal
 
@@ -502,45 +549,17 @@ function getCSRFToken() {
     }
 }
 
-async function validateAndUpdateAppointmentDate(event, revertFunction) {
-    const updatedStartTime = event.start.toISOString();
-    const updatedEndTime = event.end ? event.end.toISOString() : null;
-
-    const data = {
-        appointment_id: event.id, start_time: updatedStartTime, date: event.start.toISOString().split('T')[0]
-    };
-
-    try {
-        const validationResponse = await fetch(validateApptDateURL, {
-            method: 'POST', headers: {
-                'Content-Type': 'application/json', 'X-Requested-With': 'XMLHttpRequest', 'X-CSRFToken': getCSRFToken(),
-            }, body: JSON.stringify(data)
-        });
-
-        if (validationResponse.ok) {
-            await updateAppointmentDate(event, revertFunction);
-        } else {
-            const responseData = await validationResponse.json();
-            showErrorModal(responseData.message);
-
-            revertFunction();
-        }
-    } catch (error) {
-        console.error('Failed to validate data:', error);
-        revertFunction();
-    }
-}
-
-async function updateAppointmentDate(event, revertFunction) {
-    const updatedStartTime = event.start.toISOString().split('T')[1];
-    const updatedDate = event.start.toISOString().split('T')[0];
-
+async function moveAppointment(event, revertFunction) {
+    // Validated and applied in one request; `updated_at` is the version the calendar knows (409 when outdated)
     const data = {
-        appointment_id: event.id, start_time: updatedStartTime, date: updatedDate,
+        appointment_id: event.id,
+        start_time: event.start.toISOString(),
+        date: event.start.toISOString().split('T')[0],
+        updated_at: event.extendedProps.updated_at,
     };
 
     try {
-        const response = await fetch(updateApptDateURL, {
+        const response = await fetch(moveApptURL, {
             method: 'POST', headers: {
                 'Content-Type': 'application/json', 'X-Requested-With': 'XMLHttpRequest', 'X-CSRFToken': getCSRFToken(),
             }, body: JSON.stringify(data)
@@ -548,14 +567,20 @@ async function updateAppointmentDate(event, revertFunction) {
 
         const responseData = await response.json();
         if (response.ok) {
+            updateEventProperties(event, responseData.appt);
+            const index = appointments.findIndex(app => Number(app.id) === Number(event.id));
+            if (index !== -1) {
+                appointments[index] = responseData.appt;
+            }
+            refreshAvailabilityHeatmap();
             showErrorModal(responseData.message, successTxt)
         } else {
-            console.error('Failed to update appointment date. Server responded with:', response.statusText);
-            showErrorModal(responseData.message, updateApptErrorTitleTxt);
+            const title = response.status === 403 ? undefined : updateApptErrorTitleTxt;
+            showErrorModal(responseData.message, title);
             revertFunction();
         }
     } catch (error) {
-        console.error('Failed to send data:', error);
+        console.error('Failed to move appointment:', error);
         revertFunction();
     }
 }
@@ -756,6 +781,7 @@ async function submitChanges() {
             updateExistingAppointmentInCalendar(responseData.appt);
         }
 
+        refreshAvailabilityHeatmap();
         AppState.calendar.render();
     } else {
         const responseData = await response.json();
@@ -874,4 +900,5 @@ function updateEventProperties(event, appointment) {
     event.setEnd(appointment.end_time);
     event.setExtendedProp('client_name', appointment.client_name);
     event.setProp('backgroundColor', appointment.background_color);
+    event.setExtendedProp('updated_at', appointment.updated_at);
 }
@@ -57,6 +57,7 @@ const calendar = new FullCalendar.Calendar(calendarEl, {
     },
     datesSet: function (info) {
         highlightSelectedDate();
+        revalidateVisibleSlots(info.start, info.end);
     },
     selectAllow: function (info) {
         const day = info.start.getDay();  // Get the day of the week (0 for Sunday, 6 for Saturday)
@@ -219,7 +220,6 @@ function formatTime(date) {
 function getAvailableSlots(selectedDate, staffId = null) {
     // Update the slot list with the available slots for the selected date
     const slotList = $('#slot-list');
-    const slotContainer = $('.slot-container');
     const errorMessageContainer = $('.error-message');
 
     // Clear previous error messages and slots
@@ -245,6 +245,7 @@ function getAvailableSlots(selectedDate, staffId = null) {
         'selected_date': selectedDate,
         'staff_member': staffId,
         'service_id': serviceId,
+        'slot_format': 'runs',
     };
     fetchNonWorkingDays(staffId, function (nonWorkingDays) {
         // Check if nonWorkingDays is an array
@@ -258,6 +259,27 @@ function getAvailableSlots(selectedDate, staffId = null) {
         }
     });
 
+    const cached = slotCache.get(staffId, selectedDate);
+    if (cached && Date.now() - cached.checkedAt < SLOT_CACHE_CHECK_INTERVAL) {
+        renderAvailableSlots(cached.data, selectedDate);
+        return;
+    }
+    if (cached) {
+        // Ask whether the cached slots are still current, which costs the server a few cache reads.
+        revalidateSlotCache(staffId, [selectedDate], function () {
+            const current = slotCache.get(staffId, selectedDate);
+            if (current) {
+                renderAvailableSlots(current.data, selectedDate);
+            } else {
+                fetchAvailableSlots(ajaxData, selectedDate);
+            }
+        });
+        return;
+    }
+    fetchAvailableSlots(ajaxData, selectedDate);
+}
+
+function fetchAvailableSlots(ajaxData, selectedDate) {
     // Send an AJAX request to get the available slots for the selected date
     if (isRequestInProgress) {
         return; // Exit the function if a request is already in progress
@@ -268,71 +290,216 @@ function getAvailableSlots(selectedDate, staffId = null) {
         data: ajaxData,
         dataType: 'json',
         success: function (data) {
-            if (data.available_slots.length === 0) {
-                const selectedDateObj = moment.tz(selectedDate, timezone);
-                const selectedD = selectedDateObj.toDate();
-                const today = new Date();
-                today.setHours(0, 0, 0, 0);
-
-                if (selectedD < today) {
-                    // Show an error message
-                    errorMessageContainer.append('<p class="djangoAppt_no-availability-text">' + dateInPastErrorTxt + '</p>');
-                    if (slotContainer.find('.djangoAppt_btn-request-next-slot').length === 0) {
-                        slotContainer.append(`<button class="btn btn-danger djangoAppt_btn-request-next-slot" data-service-id="${serviceId}">` + requestNonAvailableSlotBtnTxt + `</button>`);
-                    }
-                    // Disable the 'submit' button
-                    $('.btn-submit-appointment').attr('disabled', 'disabled');
-                } else {
-                    errorMessageContainer.find('.djangoAppt_no-availability-text').remove();
-                    if (errorMessageContainer.find('.djangoAppt_no-availability-text').length === 0) {
-                        errorMessageContainer.append(`<p class="djangoAppt_no-availability-text">${data.message}</p>`);
-                    }
-                    // Check if the returned message is 'No availability'
-                    if (data.message.toLowerCase() === 'no availability') {
-                        if (slotContainer.find('.djangoAppt_btn-request-next-slot').length === 0) {
-                            slotContainer.append(`<button class="btn btn-danger djangoAppt_btn-request-next-slot" data-service-id="${serviceId}">` + requestNonAvailableSlotBtnTxt + `</button>`);
-                        }
-                    } else {
-                        $('.djangoAppt_btn-request-next-slot').remove();
-                    }
+            slotCache.set(ajaxData.staff_member, selectedDate, data);
+            renderAvailableSlots(data, selectedDate);
+            isRequestInProgress = false;
+        },
+        error: function() {
+            isRequestInProgress = false; // Ensure the flag is reset even if the request fails
+        }
+    });
+}
+
+function renderAvailableSlots(data, selectedDate) {
+    const slotList = $('#slot-list');
+    const slotContainer = $('.slot-container');
+    const errorMessageContainer = $('.error-message');
+    const availableSlots = data.slot_runs ? expandSlotRuns(data.slot_runs) : data.available_slots;
+
+    if (availableSlots.length === 0) {
+        const selectedDateObj = moment.tz(selectedDate, timezone);
+        const selectedD = selectedDateObj.toDate();
+        const today = new Date();
+        today.setHours(0, 0, 0, 0);
+
+        if (selectedD < today) {
+            // Show an error message
+            errorMessageContainer.append('<p class="djangoAppt_no-availability-text">' + dateInPastErrorTxt + '</p>');
+            if (slotContainer.find('.djangoAppt_btn-request-next-slot').length === 0) {
+                slotContainer.append(`<button class="btn btn-danger djangoAppt_btn-request-next-slot" data-service-id="${serviceId}">` + requestNonAvailableSlotBtnTxt + `</button>`);
+            }
+            // Disable the 'submit' button
+            $('.btn-submit-appointment').attr('disabled', 'disabled');
+        } else {
+            errorMessageContainer.find('.djangoAppt_no-availability-text').remove();
+            if (errorMessageContainer.find('.djangoAppt_no-availability-text').length === 0) {
+                errorMessageContainer.append(`<p class="djangoAppt_no-availability-text">${data.message}</p>`);
+            }
+            // Check if the returned message is 'No availability'
+            if (data.message.toLowerCase() === 'no availability') {
+                if (slotContainer.find('.djangoAppt_btn-request-next-slot').length === 0) {
+                    slotContainer.append(`<button class="btn btn-danger djangoAppt_btn-request-next-slot" data-service-id="${serviceId}">` + requestNonAvailableSlotBtnTxt + `</button>`);
                 }
             } else {
-                // remove the button to request for next available slot
-                $('.djangoAppt_no-availability-text').remove();
                 $('.djangoAppt_btn-request-next-slot').remove();
-                const uniqueSlots = [...new Set(data.available_slots)]; // remove duplicates
-                for (let i = 0; i < uniqueSlots.length; i++) {
-                    slotList.append('<li class="djangoAppt_appointment-slot">' + uniqueSlots[i] + '</li>');
-                }
+            }
+        }
+    } else {
+        // remove the button to request for next available slot
+        $('.djangoAppt_no-availability-text').remove();
+        $('.djangoAppt_btn-request-next-slot').remove();
+        const uniqueSlots = [...new Set(availableSlots)]; // remove duplicates
+        for (let i = 0; i < uniqueSlots.length; i++) {
+            slotList.append('<li class="djangoAppt_appointment-slot">' + uniqueSlots[i] + '</li>');
+        }
+
+        // Attach click event to the slots
+        $('.djangoAppt_appointment-slot').on('click', function () {
+            // Remove the 'selected' class from all other appointment slots
+            $('.djangoAppt_appointment-slot').removeClass('selected');
+
+            // Add the 'selected' class to the clicked appointment slot
+            $(this).addClass('selected');
 
-                // Attach click event to the slots
-                $('.djangoAppt_appointment-slot').on('click', function () {
-                    // Remove the 'selected' class from all other appointment slots
-                    $('.djangoAppt_appointment-slot').removeClass('selected');
+            // Enable the submit button
+            $('.btn-submit-appointment').removeAttr('disabled');
 
-                    // Add the 'selected' class to the clicked appointment slot
-                    $(this).addClass('selected');
+            // Continue with the existing logic
+            const selectedSlot = $(this).text();
+            $('#service-datetime-chosen').text(data.date_chosen + ' ' + selectedSlot);
+        });
+    }
+    // Update the date chosen
+    selectedDateIso = data.date_iso;
+    $('.djangoAppt_date_chosen').text(data.date_chosen);
+    $('#service-datetime-chosen').text(data.date_chosen);
+}
+
+// Expand the [first minute, step, count] runs of a compact slot list into '09:30 AM' labels.
+function expandSlotRuns(runs) {
+    const slots = [];
+    for (const [start, step, count] of runs) {
+        for (let i = 0; i < count; i++) {
+            slots.push(formatSlotMinute(start + step * i));
+        }
+    }
+    return slots;
+}
+
+function formatSlotMinute(minuteOfDay) {
+    const hours = Math.floor(minuteOfDay / 60);
+    const minutes = minuteOfDay % 60;
+    const hours12 = hours % 12 === 0 ? 12 : hours % 12;
+    return `${String(hours12).padStart(2, '0')}:${String(minutes).padStart(2, '0')} ${hours < 12 ? 'AM' : 'PM'}`;
+}
 
-                    // Enable the submit button
-                    $('.btn-submit-appointment').removeAttr('disabled');
+// Slots already fetched, by staff member, service and date, with the version token they came with. Entries are kept
+// in memory and in sessionStorage, and reused for as long as the server reports the same token for their date.
+// Today's slots narrow down as time passes, so they are never cached.
+const SLOT_CACHE_CHECK_INTERVAL = 30 * 1000;  // Entries checked this recently are used without asking the server
+const SLOT_CACHE_MAX_AGE = 5 * 60 * 1000;  // Pending reschedules free their slots without changing the token
+const SLOT_CACHE_STORAGE_KEY = 'djangoAppt_slots';
 
-                    // Continue with the existing logic
-                    const selectedSlot = $(this).text();
-                    $('#service-datetime-chosen').text(data.date_chosen + ' ' + selectedSlot);
-                });
+const slotCache = {
+    entries: null,
+
+    enabled: function () {
+        // The page only defines the URL when the server keeps the tokens in a cache shared by its workers.
+        return typeof availabilityVersionsURL !== 'undefined';
+    },
+
+    load: function () {
+        if (this.entries === null) {
+            try {
+                this.entries = JSON.parse(sessionStorage.getItem(SLOT_CACHE_STORAGE_KEY)) || {};
+            } catch (e) {
+                this.entries = {};
             }
-            // Update the date chosen
-            selectedDateIso = data.date_iso;
-            $('.djangoAppt_date_chosen').text(data.date_chosen);
-            $('#service-datetime-chosen').text(data.date_chosen);
-            isRequestInProgress = false;
+        }
+        return this.entries;
+    },
+
+    save: function () {
+        try {
+            sessionStorage.setItem(SLOT_CACHE_STORAGE_KEY, JSON.stringify(this.entries));
+        } catch (e) {
+            // Storage full or disabled: the in-memory entries still work for this page.
+        }
+    },
+
+    key: function (staffId, date) {
+        return `${staffId}:${serviceId}:${date}`;
+    },
+
+    get: function (staffId, date) {
+        if (!this.enabled()) {
+            return null;
+        }
+        const entry = this.load()[this.key(staffId, date)];
+        if (!entry || Date.now() - entry.fetchedAt > SLOT_CACHE_MAX_AGE) {
+            return null;
+        }
+        return entry;
+    },
+
+    set: function (staffId, date, data) {
+        if (!this.enabled() || !data.version || date === moment.tz(timezone).format('YYYY-MM-DD')) {
+            return;
+        }
+        const now = Date.now();
+        const entries = this.load();
+        for (const key in entries) {
+            if (now - entries[key].fetchedAt > SLOT_CACHE_MAX_AGE) {
+                delete entries[key];
+            }
+        }
+        entries[this.key(staffId, date)] = {version: data.version, data: data, fetchedAt: now, checkedAt: now};
+        this.save();
+    },
+
+    // Keep the entries whose token is still current, drop the others.
+    update: function (staffId, versions) {
+        const entries = this.load();
+        const now = Date.now();
+        for (const date in versions) {
+            const key = this.key(staffId, date);
+            if (!entries[key]) {
+                continue;
+            }
+            if (entries[key].version === versions[date]) {
+                entries[key].checkedAt = now;
+            } else {
+                delete entries[key];
+            }
+        }
+        this.save();
+    },
+};
+
+function revalidateSlotCache(staffId, dates, callback) {
+    $.ajax({
+        url: availabilityVersionsURL,
+        data: {'staff_member': staffId, 'dates': dates.join(',')},
+        dataType: 'json',
+        success: function (data) {
+            if (!data.error) {
+                slotCache.update(staffId, data.versions);
+            }
+            callback();
         },
-        error: function() {
-            isRequestInProgress = false; // Ensure the flag is reset even if the request fails
+        error: function () {
+            callback();
         }
     });
 }
 
+function revalidateVisibleSlots(start, end) {
+    // Check every cached date of the displayed month in one request, so that picking them is instant.
+    if (!slotCache.enabled() || !staffId || staffId === 'none') {
+        return;
+    }
+    const dates = [];
+    for (let day = moment(start); day.isBefore(end); day.add(1, 'days')) {
+        const date = day.format('YYYY-MM-DD');
+        if (slotCache.get(staffId, date)) {
+            dates.push(date);
+        }
+    }
+    if (dates.length > 0) {
+        revalidateSlotCache(staffId, dates, function () {});
+    }
+}
+
 function requestNextAvailableSlot(serviceId) {
     const requestNextAvailableSlotURL = requestNextAvailableSlotURLTemplate.replace('0', serviceId);
     if (staffId === null) {
@@ -5,16 +5,28 @@
 Author: Adams Pierre David
 Since: 3.1.0
 """
+import time
 from datetime import timedelta
 
+from django.conf import settings
 from django.core.mail import EmailMessage
+from django.db.models import Q
 from django.utils import timezone
 from django.utils.translation import gettext as _
 
-from appointment.email_sender import notify_admin, send_email
+from appointment.email_sender import deliver_emails
 from appointment.logger_config import get_logger
-from appointment.models import Appointment, AppointmentRequest
-from appointment.settings import APPOINTMENT_CLEANUP_DAYS
+from appointment.models import (
+    Appointment, AppointmentRequest, AppointmentRescheduleHistory, EmailVerificationCode, PasswordResetToken
+)
+from appointment.settings import (
+    APPOINTMENT_CLEANUP_BATCH_SIZE, APPOINTMENT_CLEANUP_BATCH_SLEEP, APPOINTMENT_CLEANUP_DAYS
+)
+from appointment.utils.availability_cache import warm_slots_cache
+from appointment.utils.availability_table import rebuild_availability_table
+from appointment.utils.digest import send_admin_digest, send_staff_agenda_digests
+from appointment.utils.email_ops import EmailBatch
+from appointment.utils.metrics import CLEANUP_DELETIONS, EMAILS, REMINDER_LAG_SECONDS, SMTP_SECONDS
 from appointment.utils.template_helpers import get_email_template
 
 logger = get_logger(__name__)
@@ -22,31 +34,31 @@ logger = get_logger(__name__)
 
 def send_email_reminder(to_email, first_name, reschedule_link, appointment_id):
     """
-    Send a reminder email to the client about the upcoming appointment.
+    Send a reminder email to the client about the upcoming appointment, and its admin copy, as one batch.
     """
 
     # Fetch the appointment using appointment_id
     logger.info(f"Sending reminder to {to_email} for appointment {appointment_id}")
-    appointment = Appointment.objects.get(id=appointment_id)
-    recipient_type = 'client'
-    email_context = {
-        'first_name': first_name,
-        'appointment': appointment,
-        'reschedule_link': reschedule_link,
-        'recipient_type': recipient_type,
-    }
+    appointment = Appointment.objects.select_related(
+            'client', 'appointment_request__service', 'appointment_request__staff_member__user'
+    ).get(id=appointment_id)
+    due = appointment.get_start_time() - timedelta(days=1)
+    if timezone.is_naive(due):
+        due = timezone.make_aware(due)
+    REMINDER_LAG_SECONDS.observe(max((timezone.now() - due).total_seconds(), 0))
     template_url = get_email_template('reminder_email.html', 'email_sender/reminder_email.html')
-    send_email(
-            recipient_list=[to_email], subject=_("Reminder: Upcoming Appointment"),
-            template_url=template_url, context=email_context
-    )
-    # Notify the admin
-    logger.info(f"Sending admin reminder also")
-    email_context['recipient_type'] = 'admin'
-    notify_admin(
-            subject=_("Admin Reminder: Upcoming Appointment"),
-            template_url=template_url, context=email_context
-    )
+    batch = EmailBatch()
+    for recipient_type, recipient_list, subject in (
+            ('client', [to_email], _("Reminder: Upcoming Appointment")),
+            ('admin', [email for name, email in settings.ADMINS], _("Admin Reminder: Upcoming Appointment"))):
+        email_context = {
+            'first_name': first_name,
+            'appointment': appointment,
+            'reschedule_link': reschedule_link,
+            'recipient_type': recipient_type,
+        }
+        batch.add(recipient_list, subject, template_url=template_url, context=email_context)
+    batch.send()
 
 
 def send_email_task(recipient_list, subject, message, html_message, from_email, attachments=None):
@@ -65,11 +77,19 @@ def send_email_task(recipient_list, subject, message, html_message, from_email,
             for attachment in attachments:
                 email.attach(*attachment)
 
-        email.send(fail_silently=False)
+        with SMTP_SECONDS.time(function='send_email_task'):
+            email.send(fail_silently=False)
+        EMAILS.inc(function='send_email_task', result='sent')
     except Exception as e:
+        EMAILS.inc(function='send_email_task', result='failed')
         logger.error(f"Error sending email from task: {e}")
 
 
+def send_emails_task(emails, from_email):
+    """Task function sending a batch of e-mails queued by `send_emails`, over a single connection."""
+    deliver_emails(emails, from_email, 'send_emails_task')
+
+
 def notify_admin_task(subject, message, html_message):
     """
     Task function to send an admin email asynchronously.
@@ -82,45 +102,120 @@ def notify_admin_task(subject, message, html_message):
         logger.error(f"Error sending admin email from task: {e}")
 
 
-def cleanup_old_appointment_requests():
+def send_staff_agenda_digests_task():
+    """Task function e-mailing every staff member their appointments of the next day."""
+    return send_staff_agenda_digests()
+
+
+def send_admin_digest_task():
+    """Task function e-mailing the admins the appointments booked and rescheduled since the previous digest."""
+    return send_admin_digest()
+
+
+def warm_availability_cache_task(days=None):
+    """Task function computing the available slots of every staff member over the next days ahead of the requests."""
+    stats = warm_slots_cache(days)
+    logger.info(f"Warmed {stats['entries']} availability cache entries in {stats['seconds']}s")
+    return stats
+
+
+def rebuild_availability_table_task(days=None):
+    """Task function building the availability table over the next days, with the days passed pruned."""
+    stats = rebuild_availability_table(days, prune=True)
+    logger.info(f"Rebuilt {stats['rows']} availability rows in {stats['seconds']}s")
+    return stats
+
+
+def delete_in_batches(queryset, batch_size=None, sleep=None, dry_run=False):
+    """Delete the rows of a queryset by batches of primary keys, in ascending order.
+
+    Each batch selects the next `batch_size` primary keys above the last one deleted, then deletes them with the
+    queryset's conditions applied again, so a row that stopped matching in between is kept. Every batch commits on
+    its own, which keeps locks and transaction log growth bounded on large tables.
+
+    :param queryset: The rows to delete.
+    :param batch_size: Rows per batch (defaults to APPOINTMENT_CLEANUP_BATCH_SIZE).
+    :param sleep: Seconds to pause between batches (defaults to APPOINTMENT_CLEANUP_BATCH_SLEEP).
+    :param dry_run: Only count the matching rows.
+    :return: A dictionary with the number of rows deleted, the number of batches, the elapsed seconds and the
+        throughput in rows per second.
+    """
+    batch_size = batch_size or APPOINTMENT_CLEANUP_BATCH_SIZE
+    sleep = APPOINTMENT_CLEANUP_BATCH_SLEEP if sleep is None else sleep
+    started = time.perf_counter()
+    if dry_run:
+        return {'deleted': queryset.count(), 'batches': 0, 'seconds': 0.0, 'rows_per_second': 0.0}
+
+    deleted = batches = 0
+    last_pk = None
+    label = queryset.model._meta.label
+    while True:
+        page = queryset.order_by('pk') if last_pk is None else queryset.filter(pk__gt=last_pk).order_by('pk')
+        ids = list(page.values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            break
+        last_pk = ids[-1]
+        _total, per_model = queryset.filter(pk__in=ids).delete()
+        deleted += per_model.get(label, 0)
+        batches += 1
+        if len(ids) < batch_size:
+            break
+        if sleep:
+            time.sleep(sleep)
+    seconds = time.perf_counter() - started
+    return {'deleted': deleted, 'batches': batches, 'seconds': round(seconds, 3),
+            'rows_per_second': round(deleted / seconds, 1) if seconds else 0.0}
+
+
+def get_expired_querysets(cutoff_date):
+    """Return the querysets of expired rows, by table name.
+
+    - appointment requests created before the cutoff date and never booked;
+    - e-mail verification codes created before the cutoff date;
+    - password reset tokens that expired, were used or were invalidated;
+    - reschedule requests created before the cutoff date and never confirmed.
+    """
+    return {
+        'appointment_request': AppointmentRequest.objects.filter(created_at__lt=cutoff_date,
+                                                                 appointment__isnull=True),
+        'email_verification_code': EmailVerificationCode.objects.filter(created_at__lt=cutoff_date),
+        'password_reset_token': PasswordResetToken.objects.filter(
+                Q(expires_at__lt=timezone.now()) | ~Q(status=PasswordResetToken.TokenStatus.ACTIVE)),
+        'reschedule_history': AppointmentRescheduleHistory.objects.filter(created_at__lt=cutoff_date,
+                                                                          reschedule_status='pending'),
+    }
+
+
+def cleanup_old_appointment_requests(batch_size=None, sleep=None, dry_run=False):
     """
     Clean up AppointmentRequest objects that are not associated with any appointments
-    and are older than the specified period (APPOINTMENT_CLEANUP_DAYS).
-    
+    and are older than the specified period (APPOINTMENT_CLEANUP_DAYS), together with the other expiring rows
+    (see `get_expired_querysets`).
+
+    Rows are deleted in batches (see `delete_in_batches`).
     This task should be scheduled to run periodically using Django-Q.
     """
     try:
         # Calculate cutoff date
         cutoff_date = timezone.now() - timedelta(days=APPOINTMENT_CLEANUP_DAYS)
-        
-        # Find AppointmentRequests that:
-        # 1. Don't have an associated Appointment (using the reverse OneToOne relationship)
-        # 2. Were created before the cutoff date
-        old_unassociated_requests = AppointmentRequest.objects.filter(
-            created_at__lt=cutoff_date,
-            appointment__isnull=True  # Only those without an associated Appointment
-        )
-        
-        # Count before deletion for logging
-        count = old_unassociated_requests.count()
-        
-        if count > 0:
-            # Delete the old unassociated appointment requests
-            deleted_count, _ = old_unassociated_requests.delete()
+
+        tables = {}
+        for table, queryset in get_expired_querysets(cutoff_date).items():
+            stats = tables[table] = delete_in_batches(queryset, batch_size=batch_size, sleep=sleep, dry_run=dry_run)
+            if dry_run:
+                logger.info(f"Cleanup of {table} would delete {stats['deleted']} row(s)")
+                continue
+            CLEANUP_DELETIONS.inc(stats['deleted'], table=table)
             logger.info(
-                f"Cleaned up {deleted_count} old unassociated AppointmentRequest(s) "
-                f"older than {APPOINTMENT_CLEANUP_DAYS} days"
-            )
-        else:
-            logger.debug(
-                f"No old unassociated AppointmentRequest(s) found to clean up "
-                f"(older than {APPOINTMENT_CLEANUP_DAYS} days)"
+                f"Cleanup of {table}: {stats['deleted']} row(s) in {stats['batches']} batch(es), "
+                f"{stats['rows_per_second']} rows/s"
             )
-        
+
         return {
-            'deleted_count': count,
+            'deleted_count': tables['appointment_request']['deleted'],
             'cutoff_date': cutoff_date.isoformat(),
-            'cleanup_days': APPOINTMENT_CLEANUP_DAYS
+            'cleanup_days': APPOINTMENT_CLEANUP_DAYS,
+            'tables': tables,
         }
     except Exception as e:
         logger.error(f"Error during cleanup of old appointment requests: {e}", exc_info=True)
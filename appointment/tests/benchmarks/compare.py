@@ -0,0 +1,75 @@
+# compare.py
+# Path: appointment/tests/benchmarks/compare.py
+
+"""
+Author: Adams Pierre David
+Since: 3.11.0
+
+Compare two benchmark reports and flag regressions.
+
+Usage:
+    python -m appointment.tests.benchmarks.compare base.json head.json [--threshold 0.25] [--metric p50_ms]
+
+Exits with status 1 when a target got slower than the threshold allows or issues more queries than before.
+"""
+
+import argparse
+import json
+import sys
+
+
+def compare_reports(base: dict, head: dict, threshold: float = 0.25, metric: str = 'p50_ms'):
+    """Return one row per (scale, target) present in both reports.
+
+    :param base: The reference report.
+    :param head: The report to check.
+    :param threshold: Relative slowdown tolerated before a target is flagged (0.25 means 25%).
+    :param metric: The latency metric compared.
+    :return: A list of dictionaries with the base and head values, the relative change and a regression flag.
+    """
+    rows = []
+    for scale, base_targets in base.get('scales', {}).items():
+        head_targets = head.get('scales', {}).get(scale, {})
+        for target, base_result in base_targets.items():
+            head_result = head_targets.get(target)
+            if target == 'dataset' or not head_result:
+                continue
+            before, after = base_result[metric], head_result[metric]
+            change = (after - before) / before if before else 0.0
+            rows.append({
+                'scale': scale,
+                'target': target,
+                'base': before,
+                'head': after,
+                'change': change,
+                'base_queries': base_result['queries'],
+                'head_queries': head_result['queries'],
+                'regression': change > threshold or head_result['queries'] > base_result['queries'],
+            })
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('base')
+    parser.add_argument('head')
+    parser.add_argument('--threshold', type=float, default=0.25)
+    parser.add_argument('--metric', default='p50_ms')
+    args = parser.parse_args(argv)
+
+    with open(args.base, encoding='utf-8') as base_file, open(args.head, encoding='utf-8') as head_file:
+        base, head = json.load(base_file), json.load(head_file)
+    if base.get('environment', {}).get('database') != head.get('environment', {}).get('database'):
+        print("Warning: the reports were produced on different databases.")
+
+    rows = compare_reports(base, head, threshold=args.threshold, metric=args.metric)
+    print(f"{'scale':<8} {'target':<30} {'base':>10} {'head':>10} {'change':>8} {'queries':>10}")
+    for row in rows:
+        flag = '  <-- regression' if row['regression'] else ''
+        print(f"{row['scale']:<8} {row['target']:<30} {row['base']:>10.3f} {row['head']:>10.3f} "
+              f"{row['change']:>+8.1%} {row['base_queries']:>4}->{row['head_queries']:<4}{flag}")
+    return 1 if any(row['regression'] for row in rows) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
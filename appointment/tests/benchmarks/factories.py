@@ -0,0 +1,48 @@
+# factories.py
+# Path: appointment/tests/benchmarks/factories.py
+
+"""
+Author: Adams Pierre David
+Since: 3.11.0
+
+Synthetic data for the benchmarks, generated by `appointment.utils.seed` (the generator behind the
+`seed_appointments` management command).
+"""
+
+import datetime
+
+from appointment.utils.seed import seed_appointments
+
+# N staff members, M services, K appointments per staff member and working day, over D days
+SCALES = {
+    'small': {'staff': 5, 'services': 3, 'appointments_per_day': 4, 'days': 14},
+    'medium': {'staff': 25, 'services': 8, 'appointments_per_day': 8, 'days': 28},
+    'large': {'staff': 100, 'services': 20, 'appointments_per_day': 12, 'days': 56},
+}
+
+
+def build_benchmark_dataset(staff=5, services=3, appointments_per_day=4, days=14, start_date=None, clients=50,
+                            seed=42):
+    """Create a deterministic dataset for the benchmarks.
+
+    :param staff: Number of staff members.
+    :param services: Number of services; each staff member offers up to three of them.
+    :param appointments_per_day: Maximum number of appointments per staff member and working day.
+    :param days: Number of days covered, starting at `start_date`.
+    :param start_date: First day of the dataset. Defaults to the next Monday.
+    :param clients: Size of the client pool.
+    :param seed: Seed of the random generator.
+    :return: A dictionary with the created staff members, services, the covered range and the number of appointments.
+    """
+    today = datetime.date.today()
+    start_date = start_date or today + datetime.timedelta(days=7 - today.weekday())
+    dataset = seed_appointments(staff=staff, services=services, clients=clients,
+                                appointments_per_day=appointments_per_day, days=days, start_date=start_date,
+                                saturday_ratio=0, prefix='bench', seed=seed)
+    return {
+        'staff_members': dataset['staff_members'],
+        'services': dataset['services'],
+        'start_date': dataset['start_date'],
+        'end_date': dataset['end_date'],
+        'appointments': dataset['counts']['appointments'],
+    }
@@ -0,0 +1,87 @@
+# harness.py
+# Path: appointment/tests/benchmarks/harness.py
+
+"""
+Author: Adams Pierre David
+Since: 3.11.0
+"""
+
+import datetime
+import platform
+import statistics
+import subprocess
+import time
+import tracemalloc
+
+import django
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+
+def percentile(values, pct):
+    """Return the `pct` percentile of `values` with linear interpolation."""
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    rank = (len(ordered) - 1) * pct / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def measure(func, repeat=20, warmup=2):
+    """Time a callable and record the queries and the memory of one call.
+
+    The first `warmup` calls fill the caches a real process would have warm. Latencies come from `repeat` further
+    calls; queries and tracemalloc peak memory from one extra call, so that neither instrumentation skews the
+    timings.
+
+    :param func: A callable taking no argument.
+    :param repeat: Number of timed calls.
+    :param warmup: Number of untimed calls made first.
+    :return: A dictionary of latency percentiles (ms), query count and peak memory (KiB).
+    """
+    for _ in range(warmup):
+        func()
+
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - started) * 1000)
+
+    with CaptureQueriesContext(connection) as queries:
+        tracemalloc.start()
+        try:
+            func()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+    return {
+        'calls': repeat,
+        'p50_ms': round(percentile(timings, 50), 3),
+        'p90_ms': round(percentile(timings, 90), 3),
+        'p99_ms': round(percentile(timings, 99), 3),
+        'mean_ms': round(statistics.fmean(timings), 3),
+        'max_ms': round(max(timings), 3),
+        'queries': len(queries),
+        'peak_memory_kib': round(peak / 1024, 1),
+    }
+
+
+def environment():
+    """Describe the environment a report was produced in, so that reports are only compared like for like."""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        'commit': commit,
+        'created_at': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'database': connection.vendor,
+        'machine': platform.machine(),
+    }
@@ -0,0 +1,214 @@
+# test_benchmarks.py
+# Path: appointment/tests/benchmarks/test_benchmarks.py
+
+"""
+Benchmarks of the slot engine and of the booking and calendar views.
+
+They are skipped unless APPOINTMENT_BENCHMARKS is set, because they take minutes rather than seconds:
+
+    APPOINTMENT_BENCHMARKS=1 python manage.py test appointment.tests.benchmarks
+
+Environment variables:
+    APPOINTMENT_BENCHMARK_SCALES    Comma-separated scales from `factories.SCALES` (default: small,medium).
+    APPOINTMENT_BENCHMARK_REPEAT    Timed calls per target (default: 20).
+    APPOINTMENT_BENCHMARK_REPORT    Path of the JSON report (default: benchmark_report.json).
+
+Compare two reports with `python -m appointment.tests.benchmarks.compare base.json head.json`.
+
+`CacheStampedeBenchmark` only prints its results:
+    APPOINTMENT_BENCHMARK_CONCURRENCY   Comma-separated numbers of concurrent requests (default: 10,50,200).
+
+`AvailabilityReportMemoryBenchmark` checks the peak memory of a 500-staff, 12-week NumPy report built in memory.
+"""
+
+import datetime
+import json
+import os
+import threading
+import time
+import tracemalloc
+from unittest import skipUnless
+
+from django.core.cache import cache
+from django.db import transaction
+from django.test import Client, SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from appointment.models import Appointment, StaffMember
+from appointment.services import get_available_slots_for_staff
+from appointment.tests.benchmarks.factories import SCALES, build_benchmark_dataset
+from appointment.tests.benchmarks.harness import environment, measure, percentile
+from appointment.utils.availability import (
+    NUMPY_AVAILABLE, NUMPY_CHUNK_CELLS, AvailabilitySnapshot, compute_availability_rows
+)
+from appointment.utils.db_helpers import calculate_slots, exclude_booked_slots, get_weekday_num_from_date
+from appointment.utils.single_flight import get_or_compute
+
+BENCHMARKS_ENABLED = bool(os.environ.get('APPOINTMENT_BENCHMARKS'))
+
+
+@skipUnless(BENCHMARKS_ENABLED, "Set APPOINTMENT_BENCHMARKS=1 to run the benchmarks")
+@override_settings(DEBUG=False, APPOINTMENT_AVAILABILITY_CACHE_TIMEOUT=0)
+class SlotEngineBenchmark(TestCase):
+    """Time the hot paths at every requested scale and write one JSON report."""
+
+    def setUp(self):
+        cache.clear()
+        self.repeat = int(os.environ.get('APPOINTMENT_BENCHMARK_REPEAT', 20))
+        self.scales = [scale.strip() for scale in
+                       os.environ.get('APPOINTMENT_BENCHMARK_SCALES', 'small,medium').split(',') if scale.strip()]
+        self.report_path = os.environ.get('APPOINTMENT_BENCHMARK_REPORT', 'benchmark_report.json')
+
+    def test_benchmarks(self):
+        report = {'environment': environment(), 'repeat': self.repeat, 'scales': {}}
+        for scale in self.scales:
+            with transaction.atomic():
+                report['scales'][scale] = self.run_scale(scale)
+                transaction.set_rollback(True)
+            cache.clear()
+
+        with open(self.report_path, 'w', encoding='utf-8') as output:
+            json.dump(report, output, indent=2)
+        print(f"\nBenchmark report written to {self.report_path}")
+
+    def run_scale(self, scale):
+        dataset = build_benchmark_dataset(**SCALES[scale])
+        staff_member = dataset['staff_members'][1]
+        service = staff_member.services_offered.first()
+        # A busy working day of the dataset
+        date = dataset['start_date'] + datetime.timedelta(days=1)
+        weekday = get_weekday_num_from_date(date)
+        appointments = list(Appointment.objects.select_related('appointment_request').filter(
+                appointment_request__staff_member=staff_member, appointment_request__date=date))
+        day_start = datetime.datetime.combine(date, datetime.time(9, 0))
+        slots = calculate_slots(day_start, day_start + datetime.timedelta(hours=8), day_start,
+                                datetime.timedelta(minutes=30))
+
+        client = Client()
+        staff_client = Client()
+        staff_client.force_login(staff_member.user)
+        ajax = {'HTTP_X_REQUESTED_WITH': 'XMLHttpRequest'}
+        slots_url = reverse('appointment:available_slots_ajax')
+        next_url = reverse('appointment:request_next_available_slot', args=[service.id])
+        appointments_url = reverse('appointment:get_user_event_type', args=['json'])
+
+        targets = {
+            'calculate_slots': lambda: calculate_slots(day_start, day_start + datetime.timedelta(hours=8), day_start,
+                                                       datetime.timedelta(minutes=30)),
+            'exclude_booked_slots': lambda: exclude_booked_slots(appointments, slots, datetime.timedelta(minutes=30),
+                                                                 service_duration=service.duration, gap_time=10),
+            'get_available_slots_for_staff': lambda: get_available_slots_for_staff(date, staff_member, weekday,
+                                                                                   service=service),
+            'get_available_slots_ajax': lambda: self.assert_ok(client.get(
+                    slots_url, {'selected_date': date.isoformat(), 'staff_member': staff_member.id,
+                                'service_id': service.id}, **ajax)),
+            'get_next_available_date_ajax': lambda: self.assert_ok(client.get(
+                    next_url, {'staff_member': staff_member.id}, **ajax)),
+            'get_user_appointments': lambda: self.assert_ok(staff_client.get(appointments_url)),
+        }
+        results = {'dataset': {**SCALES[scale], 'appointments_created': dataset['appointments']}}
+        for name, target in targets.items():
+            results[name] = measure(target, repeat=self.repeat)
+        return results
+
+    def assert_ok(self, response):
+        self.assertEqual(response.status_code, 200, response.content[:200])
+        return response
+
+
+@skipUnless(BENCHMARKS_ENABLED, "Set APPOINTMENT_BENCHMARKS=1 to run the benchmarks")
+class CacheStampedeBenchmark(SimpleTestCase):
+    """Count the recomputations of one invalidated entry read by many concurrent requests.
+
+    The computation is simulated (50 ms) so that only the caching strategy is measured.
+    """
+    compute_seconds = 0.05
+
+    def setUp(self):
+        cache.clear()
+        self.concurrency = [int(value) for value in
+                            os.environ.get('APPOINTMENT_BENCHMARK_CONCURRENCY', '10,50,200').split(',') if value]
+
+    def run_requests(self, lookup, requests):
+        computations = []
+        latencies = []
+        lock = threading.Lock()
+        barrier = threading.Barrier(requests)
+
+        def compute():
+            with lock:
+                computations.append(1)
+            time.sleep(self.compute_seconds)
+            return ['09:00 AM']
+
+        def request():
+            barrier.wait()
+            started = time.perf_counter()
+            lookup(compute)
+            with lock:
+                latencies.append((time.perf_counter() - started) * 1000)
+
+        threads = [threading.Thread(target=request) for _ in range(requests)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return {'computations': len(computations), 'p50_ms': round(percentile(latencies, 50), 1),
+                'max_ms': round(max(latencies), 1)}
+
+    @staticmethod
+    def plain_lookup(key):
+        def lookup(compute):
+            value = cache.get(key)
+            if value is None:
+                value = compute()
+                cache.set(key, value, 60)
+            return value
+        return lookup
+
+    def test_stampede(self):
+        print()
+        for requests in self.concurrency:
+            plain = self.run_requests(self.plain_lookup(f'plain:{requests}'), requests)
+            single_flight = self.run_requests(
+                    lambda compute: get_or_compute(f'single_flight:{requests}', compute, 60, 'slots'), requests)
+            print(f"{requests} concurrent requests: plain {plain}, single-flight {single_flight}")
+            self.assertEqual(single_flight['computations'], 1)
+
+
+@skipUnless(BENCHMARKS_ENABLED and NUMPY_AVAILABLE, "Set APPOINTMENT_BENCHMARKS=1 and install NumPy to run it")
+class AvailabilityReportMemoryBenchmark(SimpleTestCase):
+    """Build the NumPy report of 500 staff members over 12 weeks and bound its peak memory.
+
+    Unchunked, each (staff × day × minute) array of this report would take about 480 MB.
+    """
+    staff = 500
+    days = 84
+    # A dozen arrays of one chunk, plus the report itself
+    max_peak_bytes = 16 * NUMPY_CHUNK_CELLS * 8
+
+    def build_snapshot(self):
+        start_date = datetime.date(2030, 1, 7)
+        staff_members = [StaffMember(id=index + 1, slot_duration=30) for index in range(self.staff)]
+        snapshot = AvailabilitySnapshot(staff_members, start_date, start_date + datetime.timedelta(days=self.days - 1))
+        for staff_member in staff_members:
+            for day_of_week in range(1, 6):
+                snapshot.working_hours[staff_member.id][day_of_week] = (datetime.time(9), datetime.time(17))
+            for date in snapshot.dates():
+                snapshot.appointments[(staff_member.id, date)] = [(datetime.time(10), datetime.time(11)),
+                                                                  (datetime.time(14), datetime.time(15, 30))]
+        return snapshot
+
+    def test_peak_memory(self):
+        snapshot = self.build_snapshot()
+        tracemalloc.start()
+        try:
+            started = time.perf_counter()
+            rows = compute_availability_rows(snapshot, engine='numpy')
+            seconds = time.perf_counter() - started
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        print(f"\n{len(rows)} report rows in {seconds:.2f}s, peak {peak / 2 ** 20:.0f} MB")
+        self.assertEqual(len(rows), self.staff * self.days)
+        self.assertLess(peak, self.max_peak_bytes)
@@ -1,7 +1,7 @@
 from datetime import date, time, timedelta
 
 from appointment.models import (
-    Appointment, AppointmentRequest, AppointmentRescheduleHistory, Config, Service, StaffMember
+    Appointment, AppointmentRequest, AppointmentRescheduleHistory, Config, DayOff, Service, StaffMember, WorkingHours
 )
 from appointment.utils.db_helpers import get_user_model
 
@@ -118,3 +118,54 @@ class ConfigMixin:
                 slot_duration=slot_duration,
                 appointment_buffer_time=appointment_buffer_time
         )
+
+
+class AvailabilityFixtureMixin:
+    """A two-week schedule for two staff members, shared by the availability engine tests.
+
+    Staff member 1 works Monday to Friday from 9:00 to 17:00 with the configured slot duration, takes the first
+    Wednesday off and has a pending reschedule on the first Thursday. Staff member 2 works Monday, Wednesday and
+    Saturday from 10:00 to 16:00 with 45-minute slots, a 15-minute buffer and a 10-minute gap.
+    """
+
+    def __init__(self):
+        pass
+
+    @classmethod
+    def create_availability_fixture_(cls, staff_member1, staff_member2, service1, service2, client, monday):
+        for day_of_week in range(1, 6):
+            WorkingHours.objects.create(staff_member=staff_member1, day_of_week=day_of_week,
+                                        start_time=time(9, 0), end_time=time(17, 0))
+        for day_of_week in (1, 3, 6):
+            WorkingHours.objects.create(staff_member=staff_member2, day_of_week=day_of_week,
+                                        start_time=time(10, 0), end_time=time(16, 0))
+        StaffMember.objects.filter(pk=staff_member2.pk).update(slot_duration=45, appointment_buffer_time=15,
+                                                               slot_gap_time=10)
+        staff_member2.refresh_from_db()
+        DayOff.objects.create(staff_member=staff_member1, start_date=monday + timedelta(days=2),
+                              end_date=monday + timedelta(days=2))
+
+        bookings = [
+            (staff_member1, service1, 0, time(10, 0), time(11, 0)),
+            (staff_member1, service1, 0, time(13, 15), time(14, 0)),
+            (staff_member1, service1, 1, time(9, 0), time(9, 30)),
+            (staff_member1, service1, 8, time(16, 0), time(17, 0)),
+            (staff_member2, service2, 0, time(11, 0), time(12, 30)),
+            (staff_member2, service2, 5, time(15, 0), time(16, 0)),
+            (staff_member2, service2, 9, time(10, 0), time(12, 0)),
+        ]
+        appointments = []
+        for staff_member, service, offset, start_time, end_time in bookings:
+            appointment_request = AppointmentRequest.objects.create(
+                    date=monday + timedelta(days=offset), start_time=start_time, end_time=end_time,
+                    service=service, staff_member=staff_member)
+            appointments.append(Appointment.objects.create(
+                    client=client, appointment_request=appointment_request, phone="+12392340543",
+                    address="Stargate Command, Cheyenne Mountain Complex, Colorado Springs, CO"))
+
+        # A client is moving the first appointment to Thursday 14:00; the slot is held while they confirm.
+        AppointmentRescheduleHistory.objects.create(
+                appointment_request=appointments[0].appointment_request, date=monday + timedelta(days=3),
+                start_time=time(14, 0), end_time=time(15, 0), staff_member=staff_member1,
+                reason_for_rescheduling="Zat'nik'tel Discharge")
+        return appointments
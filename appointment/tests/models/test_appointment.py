@@ -134,6 +134,46 @@ class AppointmentValidDateTestCase(BaseTest):
         self.assertFalse(is_valid)
         self.assertIn("has a day off on this date", message)
 
+    def book(self, start, end):
+        ar = self.create_appt_request_for_sm1(date_=self.appt_date, start_time=start, end_time=end)
+        return self.create_appointment_(user=self.users['client1'], appointment_request=ar)
+
+    def test_long_appointment_overlapping_another_is_refused(self):
+        self.book(time(10, 30), time(11, 0))
+        is_valid, message = Appointment.is_valid_date(self.appt_date, self.start_time, self.staff_member1,
+                                                      self.current_appointment_id, self.weekday,
+                                                      duration=timedelta(hours=1))
+        self.assertFalse(is_valid)
+        self.assertIn("already has an appointment", message)
+
+    def test_back_to_back_appointments_are_allowed(self):
+        self.book(time(9, 0), time(10, 0))
+        self.book(time(11, 0), time(12, 0))
+        is_valid, message = Appointment.is_valid_date(self.appt_date, self.start_time, self.staff_member1,
+                                                      self.current_appointment_id, self.weekday,
+                                                      duration=timedelta(hours=1))
+        self.assertTrue(is_valid)
+
+    def test_gap_time_is_respected(self):
+        self.book(time(11, 10), time(12, 0))
+        self.staff_member1.slot_gap_time = 15
+        is_valid, message = Appointment.is_valid_date(self.appt_date, self.start_time, self.staff_member1,
+                                                      self.current_appointment_id, self.weekday,
+                                                      duration=timedelta(hours=1))
+        self.assertFalse(is_valid)
+
+    def test_moved_appointment_does_not_conflict_with_itself(self):
+        appointment = self.book(time(10, 0), time(11, 0))
+        is_valid, message = Appointment.is_valid_date(self.appt_date, self.start_time, self.staff_member1,
+                                                      appointment.id, self.weekday, duration=timedelta(hours=1))
+        self.assertTrue(is_valid)
+
+    def test_single_query(self):
+        self.staff_member1.slot_gap_time = 0
+        with self.assertNumQueries(1):
+            Appointment.is_valid_date(self.appt_date, self.start_time, self.staff_member1,
+                                      self.current_appointment_id, self.weekday, duration=timedelta(hours=1))
+
 
 class AppointmentValidationTestCase(BaseTest):
     @classmethod
@@ -1,10 +1,18 @@
 from copy import deepcopy
 from datetime import date, datetime, time, timedelta
+from io import StringIO
+from unittest.mock import MagicMock, patch
 
 from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import IntegrityError, transaction
 from django.utils import timezone
 
+from appointment.models import Appointment, AppointmentRequest, WorkingHours
 from appointment.tests.base.base_test import BaseTest
+from appointment.utils.db_helpers import (
+    get_appointments_for_date_and_time, get_weekday_num_from_date, rename_appointment_reminder
+)
 
 
 class AppointmentRequestCreationAndBasicAttributesTests(BaseTest):
@@ -190,3 +198,91 @@ class AppointmentRequestRescheduleHistory(BaseTest):
         service = deepcopy(self.service1)
         ar = self.create_appointment_request_(service, self.staff_member1)
         self.assertFalse(ar.get_reschedule_history().exists())
+
+
+class AppointmentRequestStartAndEndAtTests(BaseTest):
+    def setUp(self):
+        super().setUp()
+        self.date_ = date.today() + timedelta(days=3)
+        self.ar = self.create_appt_request_for_sm1(date_=self.date_, start_time=time(9, 0), end_time=time(10, 0))
+
+    def test_set_on_save(self):
+        self.ar.refresh_from_db()
+        self.assertEqual(self.ar.start_at, timezone.make_aware(datetime.combine(self.date_, time(9, 0))))
+        self.assertEqual(self.ar.end_at, timezone.make_aware(datetime.combine(self.date_, time(10, 0))))
+
+    def test_kept_in_sync_when_saving_some_fields(self):
+        self.ar.start_time, self.ar.end_time = time(14, 0), time(14, 30)
+        self.ar.save(update_fields=['start_time', 'end_time'])
+        self.ar.refresh_from_db()
+        self.assertEqual(self.ar.start_at, timezone.make_aware(datetime.combine(self.date_, time(14, 0))))
+        self.assertEqual(self.ar.end_at, timezone.make_aware(datetime.combine(self.date_, time(14, 30))))
+
+    def test_backfill_command(self):
+        AppointmentRequest.objects.update(start_at=None, end_at=None)
+        call_command('backfill_appointment_datetimes', batch_size=1, stdout=StringIO())
+        self.ar.refresh_from_db()
+        self.assertEqual(self.ar.start_at, timezone.make_aware(datetime.combine(self.date_, time(9, 0))))
+        self.assertEqual(self.ar.end_at, timezone.make_aware(datetime.combine(self.date_, time(10, 0))))
+
+    def test_rows_not_backfilled_still_conflict(self):
+        appointment = self.create_appt_for_sm1(appointment_request=self.ar)
+        AppointmentRequest.objects.update(start_at=None, end_at=None)
+        overlapping = get_appointments_for_date_and_time(self.date_, time(9, 30), time(9, 45), self.staff_member1)
+        self.assertEqual(list(overlapping), [appointment])
+        self.assertFalse(get_appointments_for_date_and_time(self.date_, time(10, 30), time(11, 0),
+                                                            self.staff_member1).exists())
+
+        WorkingHours.objects.create(staff_member=self.staff_member1, day_of_week=get_weekday_num_from_date(self.date_),
+                                    start_time=time(8, 0), end_time=time(17, 0))
+        is_valid, _ = Appointment.is_valid_date(self.date_, datetime.combine(self.date_, time(9, 30)),
+                                                self.staff_member1, None, self.date_.strftime('%A'),
+                                                duration=timedelta(minutes=30))
+        self.assertFalse(is_valid)
+        is_valid, _ = Appointment.is_valid_date(self.date_, datetime.combine(self.date_, time(10, 0)),
+                                                self.staff_member1, None, self.date_.strftime('%A'),
+                                                duration=timedelta(minutes=30))
+        self.assertTrue(is_valid)
+
+
+class AppointmentRequestIdRequestTests(BaseTest):
+    def create_ar(self, hour, **kwargs):
+        return AppointmentRequest.objects.create(date=date.today(), start_time=time(hour, 0),
+                                                 end_time=time(hour + 1, 0), service=self.service1,
+                                                 staff_member=self.staff_member1, **kwargs)
+
+    def test_id_request_is_a_random_token(self):
+        ar = self.create_ar(9)
+        self.assertRegex(ar.id_request, r'^[0-9a-f]{32}$')
+        self.assertNotEqual(self.create_ar(13).id_request, ar.id_request)
+
+    def test_id_request_is_unique(self):
+        ar = self.create_ar(9)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            self.create_ar(13, id_request=ar.id_request)
+
+    def test_empty_id_request_is_generated(self):
+        self.assertTrue(self.create_ar(9, id_request='').id_request)
+
+    def test_command_fills_missing_id_requests(self):
+        ars = [self.create_ar(hour) for hour in (9, 11, 13)]
+        AppointmentRequest.objects.filter(pk__in=[ars[0].pk, ars[1].pk]).update(id_request=None)
+        out = StringIO()
+        call_command('deduplicate_id_requests', stdout=out)
+        self.assertIn("Re-keyed 2 appointment requests", out.getvalue())
+        id_requests = list(AppointmentRequest.objects.values_list('id_request', flat=True))
+        self.assertEqual(len(set(id_requests)), 3)
+        self.assertIn(ars[2].id_request, id_requests)
+        self.assertNotIn(None, id_requests)
+
+    def test_reminder_follows_the_new_id_request(self):
+        appointment = self.create_appt_for_sm1()
+        Appointment.objects.filter(pk=appointment.pk).update(id_request=None)
+        reminders = [MagicMock(kwargs=str({'appointment_id': appointment.pk + 1})),
+                     MagicMock(kwargs=str({'appointment_id': appointment.pk}))]
+        with patch('appointment.utils.db_helpers.Schedule') as mock_schedule:
+            mock_schedule.objects.filter.return_value = reminders
+            rename_appointment_reminder(appointment.pk, 'old', 'new')
+        mock_schedule.objects.filter.assert_called_once_with(name='reminder_old')
+        reminders[0].save.assert_not_called()
+        self.assertEqual(reminders[1].name, 'reminder_new')
@@ -1,9 +1,11 @@
+import tempfile
 from copy import deepcopy
 from datetime import timedelta
 
 from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import override_settings
 
 from appointment.models import Service
 from appointment.tests.base.base_test import BaseTest
@@ -164,7 +166,10 @@ class ServiceRepresentationAndMiscTests(BaseTest):
         image_path = settings.BASE_DIR / 'appointment/static/img/texture.webp'  # Adjust the path as necessary
         image = SimpleUploadedFile(name='test_image.png', content=open(image_path, 'rb').read(),
                                    content_type='image/png')
-        service = Service.objects.create(name="Service with Image", duration=timedelta(hours=1), price=50, image=image)
+        # Keep the uploaded file out of the working tree
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+            service = Service.objects.create(name="Service with Image", duration=timedelta(hours=1), price=50,
+                                             image=image)
 
         # Assuming you have MEDIA_URL set in your settings for development like '/media/'
         expected_url = f"{settings.MEDIA_URL}{service.image}"
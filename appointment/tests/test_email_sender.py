@@ -0,0 +1,140 @@
+# test_email_sender.py
+# Path: appointment/tests/test_email_sender.py
+
+import socketserver
+import threading
+import time
+from email import message_from_bytes
+from unittest.mock import patch
+
+from django.core.mail import EmailMessage
+from django.test import TestCase, override_settings
+
+from appointment.email_sender import deliver_emails, send_email, send_emails
+from appointment.email_sender.background import EmailDispatcher, get_email_dispatcher, shutdown_email_dispatcher
+
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+    """Just enough SMTP to accept messages, recording them on the server."""
+
+    def reply(self, line):
+        self.wfile.write(f"{line}\r\n".encode())
+
+    def handle(self):
+        self.server.connections += 1
+        self.reply("220 localhost")
+        recipients = []
+        while line := self.rfile.readline():
+            command = line.decode().strip().upper()
+            if command.startswith(('EHLO', 'HELO')):
+                self.reply("250 localhost")
+            elif command.startswith('RCPT'):
+                if 'REJECT' in command:
+                    self.reply("550 No such user")
+                    continue
+                recipients.append(line.decode().split(':', 1)[1].strip().strip('<>'))
+                self.reply("250 OK")
+            elif command == 'DATA':
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                data = b''
+                while (chunk := self.rfile.readline()) != b'.\r\n':
+                    data += chunk
+                if self.server.delay:
+                    time.sleep(self.server.delay)
+                self.server.messages.append((recipients, message_from_bytes(data)))
+                recipients = []
+                self.reply("250 OK")
+            elif command == 'QUIT':
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("250 OK")
+
+
+class LocalSMTPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, delay=0):
+        super().__init__(('127.0.0.1', 0), SMTPHandler)
+        self.delay = delay
+        self.messages = []
+        self.connections = 0
+
+    def __enter__(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+        self.server_close()
+
+
+@patch('appointment.email_sender.email_sender.has_required_email_settings', return_value=True)
+class BackgroundEmailDispatchTests(TestCase):
+    sender = 'noreply@example.com'
+
+    def smtp_settings(self, server, **kwargs):
+        return override_settings(EMAIL_BACKEND='django.core.mail.backends.smtp.EmailBackend', EMAIL_HOST='127.0.0.1',
+                                 EMAIL_PORT=server.server_address[1], EMAIL_USE_TLS=False, EMAIL_USE_SSL=False,
+                                 EMAIL_HOST_USER='', EMAIL_HOST_PASSWORD='', USE_DJANGO_Q_FOR_EMAILS=False,
+                                 APPOINTMENT_EMAIL_DISPATCH='thread', **kwargs)
+
+    def tearDown(self):
+        shutdown_email_dispatcher()
+        super().tearDown()
+
+    def test_send_email_returns_before_the_server_answers(self, _):
+        with LocalSMTPServer(delay=0.5) as server, self.smtp_settings(server):
+            started = time.perf_counter()
+            send_email(['client@example.com'], "Booked", message="See you soon", from_email=self.sender)
+            self.assertLess(time.perf_counter() - started, 0.4)
+            shutdown_email_dispatcher()
+        self.assertEqual(len(server.messages), 1)
+        recipients, message = server.messages[0]
+        self.assertEqual(recipients, ['client@example.com'])
+        self.assertEqual(message['Subject'], "Booked")
+
+    def test_worker_threads_reuse_their_connection(self, _):
+        emails = [{'recipient_list': [f'client{i}@example.com'], 'subject': "Reminder", 'message': "Hello"}
+                  for i in range(3)]
+        with LocalSMTPServer() as server, self.smtp_settings(server, APPOINTMENT_EMAIL_THREADS=1):
+            for _i in range(3):
+                send_emails(emails, from_email=self.sender)
+            shutdown_email_dispatcher()
+        self.assertEqual(len(server.messages), 9)
+        self.assertEqual(server.connections, 1)
+
+    def test_failures_are_captured_per_message(self, _):
+        with LocalSMTPServer() as server, self.smtp_settings(server):
+            send_emails([{'recipient_list': [address], 'subject': "Reminder", 'message': "Hello"}
+                         for address in ('one@example.com', 'reject@example.com', 'two@example.com')],
+                        from_email=self.sender)
+            dispatcher = get_email_dispatcher()
+            shutdown_email_dispatcher()
+        self.assertEqual([recipients for recipients, _message in server.messages],
+                         [['one@example.com'], ['two@example.com']])
+        self.assertEqual([(error[0], error[1]) for error in dispatcher.errors],
+                         [('send_emails', ['reject@example.com'])])
+
+    def test_synchronous_delivery_fails_per_message(self, _):
+        with LocalSMTPServer() as server, self.smtp_settings(server):
+            sent = deliver_emails([{'recipient_list': [address], 'subject': "Reminder", 'message': "Hello",
+                                    'html_message': None}
+                                   for address in ('one@example.com', 'reject@example.com', 'two@example.com')],
+                                  self.sender, 'send_emails')
+        self.assertEqual(sent, 2)
+        self.assertEqual([recipients for recipients, _message in server.messages],
+                         [['one@example.com'], ['two@example.com']])
+
+    def test_full_queue_sends_in_the_caller(self, _):
+        with LocalSMTPServer(delay=0.3) as server, self.smtp_settings(server):
+            dispatcher = EmailDispatcher(max_workers=1, queue_size=1, queue_timeout=0)
+            first = dispatcher.submit([EmailMessage("First", "Hello", self.sender, ['one@example.com'])], 'send_emails')
+            second = dispatcher.submit([EmailMessage("Second", "Hello", self.sender, ['two@example.com'])], 'send_emails')
+            self.assertIsNotNone(first)
+            self.assertIsNone(second)
+            # The caller waited for its own message to be sent.
+            self.assertIn("Second", [message['Subject'] for _recipients, message in server.messages])
+            dispatcher.shutdown()
+        self.assertEqual(len(server.messages), 2)
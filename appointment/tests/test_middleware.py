@@ -0,0 +1,108 @@
+# test_middleware.py
+# Path: appointment/tests/test_middleware.py
+
+from unittest.mock import patch
+
+from django.conf import settings
+from django.template import engines
+from django.db import connection
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import ResolverMatch, reverse
+
+from appointment.middleware import AppointmentProfilerMiddleware
+
+from appointment.tests.base.base_test import BaseTest
+from appointment.utils.profiler import clear_profiles, get_profiles, profile_section, start_profile, stop_profile
+
+PROFILER_MIDDLEWARE = settings.MIDDLEWARE + ['appointment.middleware.AppointmentProfilerMiddleware']
+
+
+@override_settings(APPOINTMENT_PROFILER_ENABLED=True, MIDDLEWARE=PROFILER_MIDDLEWARE)
+class AppointmentProfilerMiddlewareTests(BaseTest):
+    def setUp(self):
+        super().setUp()
+        clear_profiles()
+        self.need_staff_login()
+
+    def test_profiled_view_gets_server_timing_header(self):
+        response = self.client.get(reverse('appointment:get_service_list'))
+        self.assertEqual(response.status_code, 200)
+        metrics = [metric.split(';')[0] for metric in response.headers['Server-Timing'].split(', ')]
+        self.assertEqual(metrics[0], 'sql')
+        self.assertIn('view', metrics)
+        self.assertIn('template', metrics)
+        self.assertEqual(metrics[-1], 'total')
+
+    def test_profile_is_recorded(self):
+        self.client.get(reverse('appointment:get_service_list'))
+        profile = get_profiles()[0]
+        self.assertEqual(profile['view'], 'appointment:get_service_list')
+        self.assertEqual(profile['status'], 200)
+        self.assertGreater(profile['query_count'], 0)
+        self.assertLessEqual(sum(profile['sections'].values()), profile['total_ms'] + 0.01)
+        origins = [frame for query in profile['slowest_queries'] for frame in query['origin']]
+        self.assertTrue(any(frame.startswith('appointment/') for frame in origins))
+        self.assertFalse(any(frame.startswith(('appointment/utils/profiler.py', 'appointment/middleware.py',
+                                               'appointment/tests/')) for frame in origins))
+
+    def test_other_urls_are_not_profiled(self):
+        response = self.client.get('/en/admin/login/')
+        self.assertNotIn('Server-Timing', response.headers)
+        self.assertEqual(get_profiles(), [])
+
+    def test_urls_included_under_another_instance_namespace_are_profiled(self):
+        request = RequestFactory().get('/booking/services/')
+        request.resolver_match = ResolverMatch(lambda r: HttpResponse(), (), {}, url_name='get_service_list',
+                                               app_names=['appointment'], namespaces=['booking'])
+        middleware = AppointmentProfilerMiddleware(lambda r: HttpResponse())
+        middleware.process_view(request, request.resolver_match.func, (), {})
+        self.assertTrue(hasattr(request, '_appointment_profile'))
+        response = middleware(request)
+        self.assertIn('Server-Timing', response.headers)
+        self.assertEqual(get_profiles()[0]['view'], 'booking:get_service_list')
+        self.assertNotIn(request._appointment_profile[0].execute_wrapper, connection.execute_wrappers)
+
+    @override_settings(APPOINTMENT_PROFILER_BUFFER_SIZE=2)
+    def test_ring_buffer_is_bounded(self):
+        for _ in range(3):
+            self.client.get(reverse('appointment:get_service_list'))
+        self.assertEqual(len(get_profiles()), 2)
+
+    @override_settings(APPOINTMENT_PROFILER_ENABLED=False)
+    def test_disabled(self):
+        response = self.client.get(reverse('appointment:get_service_list'))
+        self.assertNotIn('Server-Timing', response.headers)
+        self.assertEqual(get_profiles(), [])
+
+
+class ProfileSectionTests(TestCase):
+    def setUp(self):
+        clear_profiles()
+
+    def test_sections_are_exclusive(self):
+        with patch('appointment.utils.profiler.time.perf_counter', side_effect=[0.0, 1.0, 2.0, 5.0, 6.0, 10.0, 10.0]):
+            _, token = start_profile('GET', '/', 'test')
+            with profile_section('email'):
+                with profile_section('template'):
+                    pass
+            profile = stop_profile(token, 200)
+        self.assertEqual(profile['sections'], {'view': 5000.0, 'email': 2000.0, 'template': 3000.0})
+
+    def test_section_without_profile_is_a_no_op(self):
+        with profile_section('email'):
+            engines['django'].from_string('x').render({})
+        self.assertEqual(get_profiles(), [])
+
+
+class ProfilerReportViewTests(BaseTest):
+    def test_superuser_sees_report(self):
+        self.need_superuser_login()
+        response = self.client.get(reverse('appointment:profiler_report'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, 'administration/profiler.html')
+
+    def test_staff_member_is_refused(self):
+        self.need_staff_login()
+        response = self.client.get(reverse('appointment:profiler_report_type', args=['json']))
+        self.assertEqual(response.status_code, 403)
@@ -0,0 +1,327 @@
+# test_query_budgets.py
+# Path: appointment/tests/test_query_budgets.py
+
+"""
+Query-count budgets for every URL of `appointment/urls.py`.
+
+Each view is requested once against a small fixture and once after the fixture has grown (more staff members,
+services, appointments, days off and reschedules, including for the staff member the views are called for). The
+number of queries must stay within the view's budget at both sizes; a view whose query count grows with the data
+(an N+1 pattern) exceeds its large-fixture budget. New URLs must be given a budget before they are exercised.
+"""
+
+import datetime
+import json
+from unittest import mock
+
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, URLResolver, reverse
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+
+from appointment import urls as appointment_urls
+from appointment.models import (
+    Appointment, AppointmentRequest, AppointmentRescheduleHistory, Config, DayOff, PasswordResetToken, Service,
+    StaffMember, WorkingHours
+)
+from appointment.tests.base.base_test import BaseTest
+from appointment.tests.benchmarks.factories import build_benchmark_dataset
+
+AJAX = {'HTTP_X_REQUESTED_WITH': 'XMLHttpRequest'}
+
+# label -> (max queries with the small fixture, max queries with the large fixture), measured with Django-Q enabled
+# (USE_DJANGO_Q=true, as in CI): the reminder lookups add queries that a run without it does not make.
+QUERY_BUDGETS = {
+    'get_user_event_type': (4, 4),
+    'get_user_event_type (superuser)': (3, 3),
+    'get_user_appointments': (4, 4),
+    'add_staff_member_info': (4, 4),
+    'add_staff_member_personal_info': (2, 2),
+    'update_staff_other_info': (6, 6),
+    'add_staff_other_info': (2, 2),
+    'make_superuser_staff_member': (6, 6),
+    'remove_superuser_staff_member': (3, 3),
+    'remove_staff_member': (16, 16),
+    'add_service': (2, 2),
+    'update_service': (3, 3),
+    'delete_service': (13, 13),
+    'get_service_list': (3, 3),
+    'get_service_list_type': (3, 3),
+    'view_service': (3, 3),
+    'display_appointment': (8, 8),
+    'user_profile': (11, 11),
+    'user_profile (staff list)': (4, 4),
+    'update_user_info': (3, 3),
+    'update_user_info (own)': (2, 2),
+    'add_day_off': (3, 3),
+    'update_day_off_id': (6, 6),
+    'delete_day_off_id': (6, 6),
+    'update_day_off': (6, 6),
+    'delete_day_off': (3, 3),
+    'update_working_hours_id': (6, 6),
+    'add_working_hours_id': (3, 3),
+    'delete_working_hours_id': (7, 7),
+    'update_working_hours': (6, 6),
+    'add_working_hours': (3, 3),
+    'delete_working_hours': (4, 4),
+    'delete_appointment': (8, 8),
+    'availability_report': (8, 8),
+    'metrics': (2, 2),
+    'profiler_report': (2, 2),
+    'profiler_report_type': (2, 2),
+    'available_slots_ajax': (17, 17),
+    'availability_versions_ajax': (0, 0),
+    'request_next_available_slot': (6, 6),
+    'get_non_working_days_ajax': (2, 2),
+    'fetch_service_list_for_staff': (5, 5),
+    'fetch_staff_list': (3, 3),
+    'update_appt_min_info': (14, 14),
+    'update_appt_date_time': (8, 8),
+    'move_appointment': (12, 12),
+    'bulk_appointment_operations': (10, 10),
+    'validate_appointment_date': (5, 5),
+    'delete_appointment_ajax': (8, 8),
+    'is_user_staff_admin': (3, 3),
+    'availability_heatmap': (9, 9),
+    'appointment_history': (5, 5),
+    'appointment_request': (9, 9),
+    'appointment_request_submit': (0, 0),
+    'prepare_reschedule_appointment': (21, 21),
+    'reschedule_appointment_submit': (10, 10),
+    'confirm_reschedule': (16, 16),
+    'appointment_client_information': (2, 2),
+    'enter_verification_code': (0, 0),
+    'email_change_verification_code': (2, 2),
+    'default_thank_you': (12, 12),
+    'set_passwd': (2, 2),
+}
+
+
+def iter_url_patterns(patterns=None):
+    """Yield (name, sorted keyword arguments) for every named URL pattern of the app."""
+    for pattern in appointment_urls.urlpatterns if patterns is None else patterns:
+        if isinstance(pattern, URLResolver):
+            yield from iter_url_patterns(pattern.url_patterns)
+        elif isinstance(pattern, URLPattern) and pattern.name:
+            yield pattern.name, tuple(sorted(pattern.pattern.converters))
+
+
+class ViewQueryBudgetTest(BaseTest):
+    """Request every view at two fixture sizes and compare the query counts against `QUERY_BUDGETS`."""
+
+    def setUp(self):
+        self.users['staff1'].is_staff = True
+        self.users['staff1'].save()
+        self.users['superuser'].is_superuser = True
+        self.users['superuser'].save()
+        Config.objects.create(slot_duration=30, lead_time=datetime.time(9, 0), finish_time=datetime.time(17, 0),
+                              appointment_buffer_time=0)
+        today = datetime.date.today()
+        self.monday = today + datetime.timedelta(days=7 - today.weekday())
+
+        self.staff_user = self.users['staff1']
+        StaffMember.objects.filter(pk=self.staff_member1.pk).update(work_on_saturday=True, work_on_sunday=True)
+        self.working_hours = [
+            WorkingHours.objects.create(staff_member=self.staff_member1, day_of_week=day,
+                                        start_time=datetime.time(9, 0), end_time=datetime.time(17, 0))
+            for day in range(7)
+        ]
+        self.day_off = DayOff.objects.create(staff_member=self.staff_member1,
+                                             start_date=self.monday + datetime.timedelta(days=20),
+                                             end_date=self.monday + datetime.timedelta(days=21))
+        self.appointment = self.book(self.monday, datetime.time(9, 0))
+        self.ar = self.appointment.appointment_request
+        self.reschedule = AppointmentRescheduleHistory.objects.create(
+                appointment_request=self.ar, date=self.monday + datetime.timedelta(days=1),
+                start_time=datetime.time(14, 0), end_time=datetime.time(15, 0), staff_member=self.staff_member1,
+                reason_for_rescheduling="Budget")
+
+    def book(self, date, start_time, staff_member=None, client='client1'):
+        end_time = (datetime.datetime.combine(date, start_time) + self.service1.duration).time()
+        ar = AppointmentRequest.objects.create(date=date, start_time=start_time, end_time=end_time,
+                                               service=self.service1,
+                                               staff_member=staff_member or self.staff_member1)
+        return Appointment.objects.create(client=self.users[client], appointment_request=ar, phone="+12392340543",
+                                          address="Cheyenne Mountain")
+
+    def grow(self):
+        """Multiply the data the views could iterate over, for other staff members and for staff member 1."""
+        build_benchmark_dataset(staff=8, services=5, appointments_per_day=4, days=7, start_date=self.monday)
+        for offset in range(1, 15):
+            day = self.monday + datetime.timedelta(days=offset)
+            for hour in (9, 11, 13, 15):
+                appointment = self.book(day, datetime.time(hour, 0), client='client2')
+                AppointmentRescheduleHistory.objects.create(
+                        appointment_request=appointment.appointment_request, date=day,
+                        start_time=datetime.time(hour, 0), end_time=datetime.time(hour + 1, 0),
+                        staff_member=self.staff_member1, reason_for_rescheduling="Budget")
+        for hour in (10, 11):
+            self.book(self.monday, datetime.time(hour, 0), client='client2')
+        for week in range(2, 8):
+            DayOff.objects.create(staff_member=self.staff_member1,
+                                  start_date=self.monday + datetime.timedelta(weeks=week),
+                                  end_date=self.monday + datetime.timedelta(weeks=week, days=1))
+        extra_services = [Service.objects.create(name=f"Budget service {i}", duration=datetime.timedelta(hours=1),
+                                                 price=100, description="Budget") for i in range(5)]
+        self.staff_member1.services_offered.add(*extra_services)
+
+    def specs(self):
+        """Return the request made for every label of `QUERY_BUDGETS`.
+
+        Each spec is (label, URL name, URL kwargs, user key or None, method, data, extra request arguments).
+        """
+        sm1, staff_user_id, monday = self.staff_member1, self.staff_user.id, self.monday
+        appointment_id, ar, wh_id, day_off_id = self.appointment.id, self.ar, self.working_hours[1].id, self.day_off.id
+        token = PasswordResetToken.create_token(user=self.users['client1'])
+        uidb64 = urlsafe_base64_encode(force_bytes(self.users['client1'].pk))
+        json_post = {'content_type': 'application/json', **AJAX}
+        same_slot = {'appointment_id': appointment_id, 'date': monday.isoformat(), 'start_time': '09:00:00.000000Z'}
+        appointment_updated_at = Appointment.objects.get(pk=appointment_id).updated_at.isoformat()
+        return [
+            ('get_user_event_type', 'get_user_event_type', {'response_type': 'json'}, 'staff1', 'get', None, {}),
+            ('get_user_event_type (superuser)', 'get_user_event_type', {'response_type': 'json'}, 'superuser',
+             'get', None, {}),
+            ('get_user_appointments', 'get_user_appointments', {}, 'staff1', 'get', None, {}),
+            ('add_staff_member_info', 'add_staff_member_info', {}, 'superuser', 'get', None, {}),
+            ('add_staff_member_personal_info', 'add_staff_member_personal_info', {}, 'superuser', 'get', None, {}),
+            ('update_staff_other_info', 'update_staff_other_info', {'user_id': staff_user_id}, 'superuser', 'get',
+             None, {}),
+            ('add_staff_other_info', 'add_staff_other_info', {}, 'staff1', 'get', None, {}),
+            ('make_superuser_staff_member', 'make_superuser_staff_member', {}, 'superuser', 'get', None, {}),
+            ('remove_superuser_staff_member', 'remove_superuser_staff_member', {}, 'superuser', 'get', None, {}),
+            ('remove_staff_member', 'remove_staff_member', {'staff_user_id': staff_user_id}, 'superuser', 'get',
+             None, {}),
+            ('add_service', 'add_service', {}, 'superuser', 'get', None, {}),
+            ('update_service', 'update_service', {'service_id': self.service1.id}, 'superuser', 'get', None, {}),
+            ('delete_service', 'delete_service', {'service_id': self.service1.id}, 'superuser', 'get', None, {}),
+            ('get_service_list', 'get_service_list', {}, 'staff1', 'get', None, {}),
+            ('get_service_list_type', 'get_service_list_type', {'response_type': 'json'}, 'staff1', 'get', None,
+             {}),
+            ('view_service', 'view_service', {'service_id': self.service1.id, 'view': 1}, 'superuser', 'get',
+             None, {}),
+            ('display_appointment', 'display_appointment', {'appointment_id': appointment_id}, 'staff1', 'get',
+             None, {}),
+            ('user_profile', 'user_profile', {'staff_user_id': staff_user_id}, 'superuser', 'get', None, {}),
+            ('user_profile (staff list)', 'user_profile', {}, 'superuser', 'get', None, {}),
+            ('update_user_info', 'update_user_info', {'staff_user_id': staff_user_id}, 'staff1', 'get', None, {}),
+            ('update_user_info (own)', 'update_user_info', {}, 'superuser', 'get', None, {}),
+            ('add_day_off', 'add_day_off', {'staff_user_id': staff_user_id}, 'staff1', 'get', None, {}),
+            ('update_day_off_id', 'update_day_off_id', {'day_off_id': day_off_id, 'staff_user_id': staff_user_id},
+             'staff1', 'get', None, {}),
+            ('delete_day_off_id', 'delete_day_off_id', {'day_off_id': day_off_id, 'staff_user_id': staff_user_id},
+             'staff1', 'get', None, {}),
+            ('update_day_off', 'update_day_off', {'day_off_id': day_off_id}, 'staff1', 'get', None, {}),
+            ('delete_day_off', 'delete_day_off', {'day_off_id': day_off_id}, 'staff1', 'get', None, {}),
+            ('update_working_hours_id', 'update_working_hours_id',
+             {'working_hours_id': wh_id, 'staff_user_id': staff_user_id}, 'staff1', 'get', None, {}),
+            ('add_working_hours_id', 'add_working_hours_id', {'staff_user_id': staff_user_id}, 'staff1', 'get',
+             None, {}),
+            ('delete_working_hours_id', 'delete_working_hours_id',
+             {'working_hours_id': wh_id, 'staff_user_id': staff_user_id}, 'staff1', 'get', None, {}),
+            ('update_working_hours', 'update_working_hours', {'working_hours_id': wh_id}, 'staff1', 'get', None,
+             {}),
+            ('add_working_hours', 'add_working_hours', {}, 'staff1', 'get', None, {}),
+            ('delete_working_hours', 'delete_working_hours', {'working_hours_id': wh_id}, 'staff1', 'get', None,
+             {}),
+            ('delete_appointment', 'delete_appointment', {'appointment_id': appointment_id}, 'staff1', 'get', None,
+             {}),
+            ('availability_report', 'availability_report', {}, 'superuser', 'get',
+             {'start_date': monday.isoformat(), 'days': 14}, {}),
+            ('metrics', 'metrics', {}, 'superuser', 'get', None, {}),
+            ('profiler_report', 'profiler_report', {}, 'superuser', 'get', None, {}),
+            ('profiler_report_type', 'profiler_report_type', {'response_type': 'json'}, 'superuser', 'get', None,
+             {}),
+            ('available_slots_ajax', 'available_slots_ajax', {}, None, 'get',
+             {'selected_date': monday.isoformat(), 'staff_member': sm1.id, 'service_id': self.service1.id}, AJAX),
+            ('availability_versions_ajax', 'availability_versions_ajax', {}, None, 'get',
+             {'staff_member': sm1.id, 'dates': monday.isoformat()}, AJAX),
+            ('request_next_available_slot', 'request_next_available_slot', {'service_id': self.service1.id}, None,
+             'get', {'staff_member': sm1.id}, AJAX),
+            ('get_non_working_days_ajax', 'get_non_working_days_ajax', {}, None, 'get', {'staff_member': sm1.id},
+             AJAX),
+            ('fetch_service_list_for_staff', 'fetch_service_list_for_staff', {}, 'staff1', 'get',
+             {'appointmentId': appointment_id}, AJAX),
+            ('fetch_staff_list', 'fetch_staff_list', {}, 'superuser', 'get', None, AJAX),
+            ('update_appt_min_info', 'update_appt_min_info', {}, 'staff1', 'post', {
+                'isCreating': False, 'appointment_id': appointment_id, 'client_name': "Georges Hammond",
+                'client_email': self.users['client1'].email, 'start_time': '09:00', 'client_phone': '+12392340543',
+                'client_address': "Cheyenne Mountain", 'service_id': self.service1.id, 'staff_member': sm1.id,
+                'want_reminder': 'false', 'additional_info': ""}, json_post),
+            ('update_appt_date_time', 'update_appt_date_time', {}, 'staff1', 'post', same_slot, json_post),
+            ('move_appointment', 'move_appointment', {}, 'staff1', 'post',
+             {**same_slot, 'start_time': f"{monday.isoformat()}T09:00:00", 'updated_at': appointment_updated_at},
+             json_post),
+            ('bulk_appointment_operations', 'bulk_appointment_operations', {}, 'staff1', 'post', {'operations': [
+                {**same_slot, 'action': 'move', 'start_time': '09:00'}]}, json_post),
+            ('validate_appointment_date', 'validate_appointment_date', {}, 'staff1', 'post',
+             {**same_slot, 'start_time': f"{monday.isoformat()}T09:00:00"}, json_post),
+            ('delete_appointment_ajax', 'delete_appointment_ajax', {}, 'staff1', 'post',
+             {'appointment_id': appointment_id}, json_post),
+            ('is_user_staff_admin', 'is_user_staff_admin', {}, 'staff1', 'get', None, AJAX),
+            ('availability_heatmap', 'availability_heatmap', {}, 'staff1', 'get',
+             {'start': monday.isoformat(), 'end': (monday + datetime.timedelta(days=42)).isoformat()}, AJAX),
+            ('appointment_history', 'appointment_history', {}, 'staff1', 'get', {'include_archived': 'true'}, {}),
+            ('appointment_request', 'appointment_request', {'service_id': self.service1.id}, None, 'get', None, {}),
+            ('appointment_request_submit', 'appointment_request_submit', {}, None, 'get', None, {}),
+            ('prepare_reschedule_appointment', 'prepare_reschedule_appointment', {'id_request': ar.id_request},
+             None, 'get', None, {}),
+            ('reschedule_appointment_submit', 'reschedule_appointment_submit', {}, None, 'post', {
+                'appointment_request_id': ar.id_request, 'date': (monday + datetime.timedelta(days=2)).isoformat(),
+                'start_time': '13:00', 'end_time': '14:00', 'staff_member': sm1.id, 'service': self.service1.id,
+                'reason_for_rescheduling': "Budget"}, {}),
+            ('confirm_reschedule', 'confirm_reschedule', {'id_request': self.reschedule.id_request}, None, 'get',
+             None, {}),
+            ('appointment_client_information', 'appointment_client_information',
+             {'appointment_request_id': ar.id, 'id_request': ar.id_request}, None, 'get', None, {}),
+            ('enter_verification_code', 'enter_verification_code',
+             {'appointment_request_id': ar.id, 'id_request': ar.id_request}, None, 'get', None, {}),
+            ('email_change_verification_code', 'email_change_verification_code', {}, 'staff1', 'get', None, {}),
+            ('default_thank_you', 'default_thank_you', {'appointment_id': appointment_id}, None, 'get', None, {}),
+            ('set_passwd', 'set_passwd', {'uidb64': uidb64, 'token': str(token.token)}, None, 'get', None, {}),
+        ]
+
+    def count_queries(self, url_name, url_kwargs, user_key, method, data, extra):
+        """Count the queries of one request, rolling back whatever the view wrote."""
+        client = Client()
+        with transaction.atomic():
+            if user_key:
+                client.force_login(self.users[user_key])
+            url = reverse(f'appointment:{url_name}', kwargs=url_kwargs)
+            cache.clear()
+            with CaptureQueriesContext(connection) as queries:
+                if method == 'post' and extra.get('content_type') == 'application/json':
+                    response = client.post(url, json.dumps(data), **extra)
+                else:
+                    response = getattr(client, method)(url, data, **extra)
+            transaction.set_rollback(True)
+        self.assertLess(response.status_code, 500, url)
+        return len(queries)
+
+    def measure(self):
+        # `date.today()` in the public views is the fixture's Monday, so that the next available date does not
+        # depend on the day and time the tests are run.
+        fixed_date = type('FixedDate', (datetime.date,), {'today': classmethod(lambda cls: self.monday)})
+        with mock.patch('appointment.views.date', fixed_date):
+            return {spec[0]: self.count_queries(*spec[1:]) for spec in self.specs()}
+
+    def test_every_url_has_a_budget(self):
+        exercised = {(spec[1], tuple(sorted(spec[2]))) for spec in self.specs()}
+        self.assertEqual(sorted(set(iter_url_patterns()) - exercised), [])
+        self.assertEqual(sorted(spec[0] for spec in self.specs()), sorted(QUERY_BUDGETS))
+
+    def test_query_budgets(self):
+        small = self.measure()
+        self.grow()
+        large = self.measure()
+
+        over_budget = [
+            f"{label}: {small[label]} queries (budget {small_budget}) with the small fixture, "
+            f"{large[label]} (budget {large_budget}) with the large one"
+            for label, (small_budget, large_budget) in QUERY_BUDGETS.items()
+            if small[label] > small_budget or large[label] > large_budget
+        ]
+        if over_budget:
+            self.fail("Views over their query budget:\n" + "\n".join(over_budget))
@@ -1,11 +1,20 @@
 # test_tasks.py
 # Path: appointment/tests/test_tasks.py
 
+from datetime import timedelta
+from io import StringIO
 from unittest.mock import patch
 
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import override_settings
+from django.utils import timezone
 from django.utils.translation import gettext as _
 
-from appointment.tasks import send_email_reminder
+from appointment.models import (
+    AppointmentRequest, AppointmentRescheduleHistory, EmailVerificationCode, PasswordResetToken
+)
+from appointment.tasks import cleanup_old_appointment_requests, send_email_reminder
 from appointment.tests.base.base_test import BaseTest
 
 
@@ -19,9 +28,9 @@ class SendEmailReminderTest(BaseTest):
     def tearDownClass(cls):
         super().tearDownClass()
 
-    @patch('appointment.tasks.send_email')
-    @patch('appointment.tasks.notify_admin')
-    def test_send_email_reminder(self, mock_notify_admin, mock_send_email):
+    @override_settings(ADMINS=[('Hammond', 'georges.hammond@django-appointment.com')])
+    @patch('appointment.utils.email_ops.send_emails')
+    def test_send_email_reminder(self, mock_send_emails):
         # Use BaseTest setup to create an appointment
         appointment_request = self.create_appt_request_for_sm1()
         appointment = self.create_appt_for_sm1(appointment_request=appointment_request)
@@ -34,19 +43,92 @@ class SendEmailReminderTest(BaseTest):
         # Call the function under test
         send_email_reminder(to_email, first_name, "", appointment_id)
 
-        # Verify send_email was called with correct parameters
-        mock_send_email.assert_called_once_with(
-            recipient_list=[to_email],
-            subject=_("Reminder: Upcoming Appointment"),
-            template_url='email_sender/reminder_email.html',
-            context={'first_name': first_name, 'appointment': appointment, 'reschedule_link': "",
-                     'recipient_type': 'admin'}
-        )
-
-        # Verify notify_admin was called with correct parameters
-        mock_notify_admin.assert_called_once_with(
-            subject=_("Admin Reminder: Upcoming Appointment"),
-            template_url='email_sender/reminder_email.html',
-            context={'first_name': first_name, 'appointment': appointment, 'reschedule_link': "",
-                     'recipient_type': 'admin'}
-        )
+        # The client e-mail and the admin copy are sent as one batch
+        mock_send_emails.assert_called_once()
+        client_email, admin_email = mock_send_emails.call_args.args[0]
+        self.assertEqual(client_email['recipient_list'], [to_email])
+        self.assertEqual(client_email['subject'], _("Reminder: Upcoming Appointment"))
+        self.assertEqual(admin_email['recipient_list'], ['georges.hammond@django-appointment.com'])
+        self.assertEqual(admin_email['subject'], _("Admin Reminder: Upcoming Appointment"))
+        self.assertIn(first_name, client_email['html_message'])
+        self.assertNotEqual(client_email['html_message'], admin_email['html_message'])
+
+    @override_settings(ADMINS=[])
+    @patch('appointment.utils.email_ops.send_emails')
+    def test_send_email_reminder_without_admins(self, mock_send_emails):
+        appointment = self.create_appt_for_sm1()
+        send_email_reminder(appointment.client.email, appointment.client.first_name, "", appointment.id)
+        self.assertEqual([email['recipient_list'] for email in mock_send_emails.call_args.args[0]],
+                         [[appointment.client.email]])
+
+
+class CleanupOldAppointmentRequestsTest(BaseTest):
+    def setUp(self):
+        super().setUp()
+        self.old = timezone.now() - timedelta(days=30)
+
+    def make_old(self, queryset):
+        queryset.update(created_at=self.old)
+
+    def test_deletes_expired_rows_in_batches(self):
+        stale = [self.create_appt_request_for_sm1() for _ in range(5)]
+        booked = self.create_appt_for_sm1()
+        recent = self.create_appt_request_for_sm1()
+        self.make_old(AppointmentRequest.objects.filter(
+                pk__in=[ar.pk for ar in stale] + [booked.appointment_request.pk]))
+
+        result = cleanup_old_appointment_requests(batch_size=2, sleep=0)
+
+        self.assertEqual(result['deleted_count'], 5)
+        self.assertEqual(result['tables']['appointment_request']['batches'], 3)
+        self.assertEqual(set(AppointmentRequest.objects.values_list('pk', flat=True)),
+                         {booked.appointment_request.pk, recent.pk})
+
+    def test_expires_codes_tokens_and_pending_reschedules(self):
+        client = self.users['client1']
+        EmailVerificationCode.generate_code(client)
+        self.make_old(EmailVerificationCode.objects.all())
+        EmailVerificationCode.generate_code(client)
+        expired = PasswordResetToken.create_token(client)
+        PasswordResetToken.objects.filter(pk=expired.pk).update(expires_at=timezone.now() - timedelta(minutes=1))
+        used = PasswordResetToken.create_token(client)
+        used.mark_as_verified()
+        active = PasswordResetToken.create_token(self.users['client2'])
+        ar = self.create_appt_request_for_sm1()
+        pending = self.create_reschedule_history_(ar, date_=ar.date, start_time=ar.start_time,
+                                                  end_time=ar.end_time, staff_member=self.staff_member1)
+        confirmed = self.create_reschedule_history_(ar, date_=ar.date, start_time=ar.start_time,
+                                                    end_time=ar.end_time, staff_member=self.staff_member1)
+        AppointmentRescheduleHistory.objects.filter(pk=confirmed.pk).update(reschedule_status='confirmed')
+        AppointmentRescheduleHistory.objects.update(created_at=self.old)
+
+        result = cleanup_old_appointment_requests(batch_size=10, sleep=0)
+
+        tables = result['tables']
+        self.assertEqual(tables['email_verification_code']['deleted'], 1)
+        self.assertEqual(tables['password_reset_token']['deleted'], 2)
+        self.assertEqual(tables['reschedule_history']['deleted'], 1)
+        self.assertEqual(EmailVerificationCode.objects.count(), 1)
+        self.assertEqual(list(PasswordResetToken.objects.all()), [active])
+        self.assertEqual(list(AppointmentRescheduleHistory.objects.values_list('pk', flat=True)), [confirmed.pk])
+        self.assertFalse(AppointmentRescheduleHistory.objects.filter(pk=pending.pk).exists())
+
+    def test_dry_run_only_counts(self):
+        self.make_old(AppointmentRequest.objects.filter(pk=self.create_appt_request_for_sm1().pk))
+        result = cleanup_old_appointment_requests(dry_run=True)
+        self.assertEqual(result['deleted_count'], 1)
+        self.assertEqual(AppointmentRequest.objects.count(), 1)
+
+
+class CleanupAppointmentRequestsCommandTest(BaseTest):
+    def test_reports_per_table_throughput(self):
+        ar = self.create_appt_request_for_sm1()
+        AppointmentRequest.objects.filter(pk=ar.pk).update(created_at=timezone.now() - timedelta(days=30))
+        out = StringIO()
+        call_command('cleanup_appointment_requests', '--batch-size', '10', stdout=out)
+        self.assertIn('appointment_request: 1 deleted in 1 batch(es)', out.getvalue())
+        self.assertFalse(AppointmentRequest.objects.exists())
+
+    def test_invalid_batch_size(self):
+        with self.assertRaises(CommandError):
+            call_command('cleanup_appointment_requests', '--batch-size', '0', stdout=StringIO())
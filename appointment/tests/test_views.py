@@ -7,13 +7,16 @@ import uuid
 from datetime import date, time, timedelta
 from unittest.mock import MagicMock, patch
 
+from asgiref.sync import async_to_sync
 from django.contrib import messages
 from django.contrib.messages import get_messages
 from django.contrib.messages.middleware import MessageMiddleware
 from django.contrib.sessions.middleware import SessionMiddleware
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
 from django.http import HttpResponseRedirect
-from django.test import Client
-from django.test.client import RequestFactory
+from django.test import Client, override_settings
+from django.test.client import AsyncRequestFactory, RequestFactory
 from django.urls import reverse
 from django.utils import timezone
 from django.utils.encoding import force_bytes
@@ -27,10 +30,15 @@ from appointment.models import (
     PasswordResetToken, StaffMember
 )
 from appointment.tests.base.base_test import BaseTest
+from appointment.utils.date_time import decode_slot_runs
 from appointment.utils.db_helpers import Service, WorkingHours, create_user_with_username
 from appointment.utils.error_codes import ErrorCode
+from appointment.services import get_available_slots_for_staff
 from appointment.views import (
-    create_appointment, redirect_to_payment_or_thank_you_page, verify_user_and_login
+    aget_availability_versions_ajax, aget_available_slots_ajax, aget_next_available_date_ajax,
+    aget_non_working_days_ajax, create_appointment, get_availability_versions_ajax, get_available_slots_ajax,
+    get_next_available_date_ajax, get_non_working_days_ajax, redirect_to_payment_or_thank_you_page,
+    verify_user_and_login
 )
 
 
@@ -1297,3 +1305,400 @@ class CreateAppointmentTests(BaseTest):
     #
     #     # Verify that the redirect_to_payment_or_thank_you_page was called with the created appointment
     #     mock_redirect.assert_called_once_with(mock_appointment)
+
+
+class AvailabilityReportViewTestCase(BaseTest):
+    def setUp(self):
+        super().setUp()
+        self.url = reverse('appointment:availability_report')
+        WorkingHours.objects.create(staff_member=self.staff_member1, day_of_week=1, start_time=time(9, 0),
+                                    end_time=time(17, 0))
+
+    def test_requires_superuser(self):
+        self.need_staff_login()
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 403)
+
+    def test_report_for_one_staff_member(self):
+        self.need_superuser_login()
+        response = self.client.get(self.url, {'days': 7, 'staff_member': self.staff_member1.id, 'engine': 'python'})
+        self.assertEqual(response.status_code, 200)
+        report = response.json()['report']
+        self.assertEqual(len(report['days']), 7)
+        self.assertEqual([row['staff_member_id'] for row in report['staff']], [self.staff_member1.id])
+        self.assertEqual(sum(row['is_working'] for row in report['days']), 1)
+
+    def test_invalid_parameters(self):
+        self.need_superuser_login()
+        for params in ({'days': 0}, {'days': 'many'}, {'start_date': '31-12-2025'}, {'engine': 'fortran'}):
+            with self.subTest(params=params):
+                response = self.client.get(self.url, params)
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json()['errorCode'], ErrorCode.INVALID_DATA.value)
+
+    def test_unknown_service(self):
+        self.need_superuser_login()
+        response = self.client.get(self.url, {'service_id': 9999})
+        self.assertEqual(response.status_code, 404)
+
+
+class AvailabilityHeatmapViewTestCase(BaseTest):
+    def setUp(self):
+        super().setUp()
+        self.url = reverse('appointment:availability_heatmap')
+        self.monday = date.today() + timedelta(days=7 - date.today().weekday())
+        WorkingHours.objects.create(staff_member=self.staff_member1, day_of_week=1, start_time=time(9, 0),
+                                    end_time=time(17, 0))
+        WorkingHours.objects.create(staff_member=self.staff_member2, day_of_week=2, start_time=time(9, 0),
+                                    end_time=time(12, 0))
+        self.params = {'start': self.monday.isoformat(), 'end': (self.monday + timedelta(days=7)).isoformat()}
+
+    def test_staff_member_gets_own_counts(self):
+        self.need_staff_login()
+        response = self.client.get(self.url, self.params)
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['staff_member_ids'], [self.staff_member1.id])
+        self.assertEqual(len(data['days']), 7)
+        self.assertEqual([day['working_staff'] for day in data['days']], [1, 0, 0, 0, 0, 0, 0])
+
+    def test_staff_member_cannot_read_other_staff_counts(self):
+        self.need_staff_login()
+        response = self.client.get(self.url, {**self.params, 'staff_member': self.staff_member2.id})
+        self.assertEqual(response.status_code, 403)
+
+    def test_superuser_gets_all_staff_members(self):
+        self.need_superuser_login()
+        response = self.client.get(self.url, self.params)
+        data = response.json()
+        self.assertEqual(sorted(data['staff_member_ids']), sorted([self.staff_member1.id, self.staff_member2.id]))
+        self.assertEqual(data['days'][1]['working_minutes'], 180)
+
+    def test_invalid_range(self):
+        self.need_superuser_login()
+        response = self.client.get(self.url, {'start': self.params['end'], 'end': self.params['start']})
+        self.assertEqual(response.status_code, 400)
+
+
+@patch('appointment.services.update_appointment_reminder')
+class MoveAppointmentTestCase(BaseTest):
+    def setUp(self):
+        super().setUp()
+        self.url = reverse('appointment:move_appointment')
+        self.monday = date.today() + timedelta(days=7 - date.today().weekday())
+        WorkingHours.objects.create(staff_member=self.staff_member1, day_of_week=1, start_time=time(9, 0),
+                                    end_time=time(17, 0))
+        self.appointment = self.create_appt_for_sm1(self.create_appt_request_for_sm1(date_=self.monday))
+        self.need_staff_login()
+
+    def move(self, start_time, version=None):
+        data = {'appointment_id': self.appointment.id, 'date': self.monday.isoformat(),
+                'start_time': f"{self.monday.isoformat()}T{start_time}:00.000Z",
+                'updated_at': version or self.appointment.updated_at.isoformat()}
+        return self.client.post(self.url, data=json.dumps(data), content_type='application/json',
+                                HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+
+    def test_move_returns_the_event_with_its_new_version(self, mock_reminder):
+        response = self.move('13:00')
+        self.assertEqual(response.status_code, 200)
+        event = response.json()['appt']
+        self.appointment.refresh_from_db()
+        self.assertEqual(self.appointment.appointment_request.start_time, time(13, 0))
+        self.assertEqual(self.appointment.appointment_request.end_time, time(14, 0))
+        self.assertEqual(event['updated_at'], self.appointment.updated_at.isoformat())
+        self.assertTrue(event['start_time'].endswith('T13:00:00'))
+
+    def test_stale_version_is_refused(self, mock_reminder):
+        version = self.appointment.updated_at.isoformat()
+        self.assertEqual(self.move('13:00', version).status_code, 200)
+        response = self.move('15:00', version)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['errorCode'], ErrorCode.STALE_APPOINTMENT.value)
+        self.appointment.refresh_from_db()
+        self.assertEqual(self.appointment.appointment_request.start_time, time(13, 0))
+
+    def test_malformed_body_is_refused(self, mock_reminder):
+        for body in ('not json', '[]', json.dumps({'appointment_id': self.appointment.id})):
+            response = self.client.post(self.url, data=body, content_type='application/json',
+                                        HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+            self.assertEqual(response.status_code, 400, body)
+            self.assertEqual(response.json()['errorCode'], ErrorCode.INVALID_DATA.value)
+
+    def test_conflict_is_refused_and_rolled_back(self, mock_reminder):
+        other = self.create_appt_request_for_sm1(date_=self.monday, start_time=time(13, 30), end_time=time(14, 0))
+        self.create_appointment_(user=self.users['client2'], appointment_request=other)
+        version = self.appointment.updated_at
+        response = self.move('13:00')
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(response.json()['errorCode'], ErrorCode.INVALID_DATE.value)
+        self.appointment.refresh_from_db()
+        self.assertEqual(self.appointment.updated_at, version)
+        self.assertEqual(self.appointment.appointment_request.start_time, time(9, 0))
+
+    def test_missing_version(self, mock_reminder):
+        response = self.client.post(self.url, data=json.dumps({'appointment_id': self.appointment.id}),
+                                    content_type='application/json', HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertEqual(response.status_code, 400)
+
+    def test_other_staff_member_cannot_move(self, mock_reminder):
+        self.client.force_login(self.users['staff2'])
+        self.assertEqual(self.move('13:00').status_code, 403)
+
+
+@patch('appointment.services.schedule_email_reminder')
+class BulkAppointmentOperationsTestCase(BaseTest):
+    def setUp(self):
+        super().setUp()
+        self.url = reverse('appointment:bulk_appointment_operations')
+        self.monday = date.today() + timedelta(days=7 - date.today().weekday())
+        for staff_member in (self.staff_member1, self.staff_member2):
+            WorkingHours.objects.create(staff_member=staff_member, day_of_week=1, start_time=time(9, 0),
+                                        end_time=time(17, 0))
+        self.first = self.create_appt_for_sm1(self.create_appt_request_for_sm1(date_=self.monday))
+        self.second = self.create_appointment_(user=self.users['client2'], appointment_request=(
+                self.create_appt_request_for_sm1(date_=self.monday, start_time=time(11, 0), end_time=time(12, 0))))
+        self.need_staff_login()
+
+    def post(self, operations, **data):
+        return self.client.post(self.url, data=json.dumps({'operations': operations, **data}),
+                                content_type='application/json', HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+
+    def move(self, appointment, start_time, **extra):
+        return {'action': 'move', 'appointment_id': appointment.id, 'date': self.monday.isoformat(),
+                'start_time': start_time, **extra}
+
+    def start_times(self):
+        return [AppointmentRequest.objects.get(appointment=appointment).start_time
+                for appointment in (self.first, self.second)]
+
+    def test_mixed_batch(self, mock_reminder):
+        response = self.post([self.move(self.first, '13:00'),
+                              {'action': 'mark_paid', 'appointment_id': self.second.id}])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.json()['moved'], response.json()['marked_paid']), (1, 1))
+        self.first.refresh_from_db()
+        self.assertEqual((self.first.appointment_request.start_time, self.first.appointment_request.end_time),
+                         (time(13, 0), time(14, 0)))
+        self.assertIsNotNone(self.first.appointment_request.start_at)
+        self.assertTrue(Appointment.objects.get(pk=self.second.pk).paid)
+
+    def test_delete(self, mock_reminder):
+        response = self.post([{'action': 'delete', 'appointment_id': self.first.id}])
+        self.assertEqual(response.json()['deleted'], 1)
+        self.assertFalse(Appointment.objects.filter(pk=self.first.pk).exists())
+
+    def test_swap_within_the_batch(self, mock_reminder):
+        response = self.post([self.move(self.first, '11:00'), self.move(self.second, '09:00')])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.start_times(), [time(11, 0), time(9, 0)])
+
+    def test_overlap_within_the_batch_rolls_everything_back(self, mock_reminder):
+        response = self.post([self.move(self.first, '14:00'), self.move(self.second, '14:30')])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['errorCode'], ErrorCode.APPOINTMENT_CONFLICT.value)
+        self.assertEqual(self.start_times(), [time(9, 0), time(11, 0)])
+
+    def test_reassign(self, mock_reminder):
+        self.need_superuser_login()
+        response = self.post([{'action': 'reassign', 'appointment_id': self.first.id,
+                               'staff_member': self.staff_member2.id}])
+        self.assertEqual(response.status_code, 400)
+        self.staff_member2.services_offered.add(self.service1)
+        response = self.post([{'action': 'reassign', 'appointment_id': self.first.id,
+                               'staff_member': self.staff_member2.id}])
+        self.assertEqual(response.json()['reassigned'], 1)
+        self.assertEqual(AppointmentRequest.objects.get(appointment=self.first).staff_member, self.staff_member2)
+        mock_reminder.assert_not_called()
+
+    def test_clients_are_notified_in_one_batch(self, mock_reminder):
+        with patch('appointment.services.send_emails') as mock_send_emails:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.post([self.move(self.first, '13:00'), {'action': 'delete', 'appointment_id': self.second.id}])
+        mock_send_emails.assert_called_once()
+        emails = mock_send_emails.call_args.args[0]
+        self.assertEqual(sorted(email['recipient_list'][0] for email in emails),
+                         sorted([self.users['client1'].email, self.users['client2'].email]))
+
+    def test_staff_member_cannot_reassign_to_another_staff_member(self, mock_reminder):
+        self.staff_member2.services_offered.add(self.service1)
+        reassign = {'action': 'reassign', 'appointment_id': self.first.id, 'staff_member': self.staff_member2.id}
+        for operation in (reassign, self.move(self.first, '13:00', staff_member=self.staff_member2.id)):
+            with self.subTest(action=operation['action']):
+                response = self.post([operation])
+                self.assertEqual(response.status_code, 403)
+                self.assertEqual(response.json()['errorCode'], ErrorCode.NOT_AUTHORIZED.value)
+        self.assertEqual(AppointmentRequest.objects.get(appointment=self.first).staff_member, self.staff_member1)
+
+    def test_unknown_error_code_is_a_bad_request(self, mock_reminder):
+        with patch('appointment.views_admin.apply_bulk_operations',
+                   side_effect=ValidationError(["Invalid batch.", "Try again."])):
+            response = self.post([{'action': 'delete', 'appointment_id': self.first.id}])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['message'], "Invalid batch. Try again.")
+
+    def test_unknown_appointment(self, mock_reminder):
+        response = self.post([{'action': 'delete', 'appointment_id': self.first.id + self.second.id}])
+        self.assertEqual(response.status_code, 404)
+
+    def test_other_staff_member_is_refused(self, mock_reminder):
+        self.client.force_login(self.users['staff2'])
+        response = self.post([{'action': 'mark_paid', 'appointment_id': self.first.id}])
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(Appointment.objects.get(pk=self.first.pk).paid)
+
+
+class AsyncAvailabilityViewsTestCase(BaseTest):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.factory = RequestFactory()
+        self.async_factory = AsyncRequestFactory()
+        self.ajax_headers = {'X-Requested-With': 'XMLHttpRequest'}
+        for day in range(1, 6):
+            WorkingHours.objects.create(staff_member=self.staff_member1, day_of_week=day,
+                                        start_time=time(9, 0), end_time=time(17, 0))
+        self.monday = date.today() + timedelta(days=7 - date.today().weekday() + 7)
+        DayOff.objects.create(staff_member=self.staff_member1, start_date=self.monday + timedelta(days=2),
+                              end_date=self.monday + timedelta(days=2))
+
+    def responses(self, sync_view, async_view, data, *args):
+        sync_response = sync_view(self.factory.get('/', data, headers=self.ajax_headers), *args)
+        async_response = async_to_sync(async_view)(
+                self.async_factory.get('/', data, headers=self.ajax_headers), *args)
+        return json.loads(sync_response.content), json.loads(async_response.content)
+
+    def test_available_slots_match_the_sync_view(self):
+        sm = self.staff_member1.id
+        for data in [{'selected_date': self.monday.isoformat(), 'staff_member': sm},
+                     {'selected_date': self.monday.isoformat(), 'staff_member': sm, 'service_id': self.service1.id},
+                     {'selected_date': self.monday.isoformat(), 'staff_member': sm, 'slot_format': 'runs'},
+                     {'selected_date': (self.monday + timedelta(days=2)).isoformat(), 'staff_member': sm},
+                     {'selected_date': (self.monday + timedelta(days=6)).isoformat(), 'staff_member': sm},
+                     {'selected_date': (date.today() - timedelta(days=1)).isoformat(), 'staff_member': sm},
+                     {'selected_date': 'not a date', 'staff_member': sm},
+                     {'selected_date': self.monday.isoformat()},
+                     {'selected_date': self.monday.isoformat(), 'staff_member': 'abc'},
+                     {'selected_date': self.monday.isoformat(), 'staff_member': 999},
+                     {'selected_date': self.monday.isoformat(), 'staff_member': sm, 'service_id': 999}]:
+            with self.subTest(data=data):
+                sync_data, async_data = self.responses(get_available_slots_ajax, aget_available_slots_ajax, data)
+                self.assertEqual(async_data, sync_data)
+
+    @override_settings(APPOINTMENT_AVAILABILITY_CACHE_TIMEOUT=300)
+    def test_slots_are_cached_until_a_booking(self):
+        data = {'selected_date': self.monday.isoformat(), 'staff_member': self.staff_member1.id}
+        with patch('appointment.views.get_available_slots_for_staff', wraps=get_available_slots_for_staff) as mock:
+            _sync_data, first = self.responses(get_available_slots_ajax, aget_available_slots_ajax, data)
+            _sync_data, second = self.responses(get_available_slots_ajax, aget_available_slots_ajax, data)
+            self.assertEqual(second, first)
+            self.assertEqual(mock.call_count, 1)  # both views share the cached slots
+
+            self.create_appt_for_sm1(self.create_appt_request_for_sm1(date_=self.monday, start_time=time(9, 0),
+                                                                      end_time=time(10, 0)))
+            sync_data, third = self.responses(get_available_slots_ajax, aget_available_slots_ajax, data)
+        self.assertEqual(mock.call_count, 2)
+        self.assertEqual(third, sync_data)
+        self.assertLess(len(third['available_slots']), len(first['available_slots']))
+
+    def test_next_available_date_matches_the_sync_view(self):
+        for data in [{'staff_member': self.staff_member1.id}, {'staff_member': 'none'}]:
+            with self.subTest(data=data):
+                sync_data, async_data = self.responses(get_next_available_date_ajax, aget_next_available_date_ajax,
+                                                       data, self.service1.id)
+                self.assertEqual(async_data, sync_data)
+
+    def test_next_available_date_without_working_hours(self):
+        request = self.async_factory.get('/', {'staff_member': self.staff_member2.id},
+                                         headers=self.ajax_headers)
+        response = async_to_sync(aget_next_available_date_ajax)(request, self.service2.id)
+        self.assertEqual(json.loads(response.content)['errorCode'], ErrorCode.INVALID_DATE.value)
+
+    def test_non_working_days_match_the_sync_view(self):
+        for data in [{'staff_member': self.staff_member1.id}, {'staff_member': 999}, {'staff_member': 'none'}]:
+            with self.subTest(data=data):
+                sync_data, async_data = self.responses(get_non_working_days_ajax, aget_non_working_days_ajax, data)
+                self.assertEqual(async_data, sync_data)
+
+    def test_ajax_is_required(self):
+        response = async_to_sync(aget_available_slots_ajax)(self.async_factory.get('/'))
+        self.assertEqual(response.status_code, 400)
+
+    def test_versions_match_the_sync_view(self):
+        dates = f"{self.monday.isoformat()},{(self.monday + timedelta(days=1)).isoformat()}"
+        for data in [{'staff_member': self.staff_member1.id, 'dates': dates}, {'staff_member': 'none', 'dates': dates},
+                     {'staff_member': self.staff_member1.id, 'dates': 'tomorrow'}]:
+            with self.subTest(data=data):
+                sync_data, async_data = self.responses(get_availability_versions_ajax,
+                                                       aget_availability_versions_ajax, data)
+                self.assertEqual(async_data, sync_data)
+
+
+@override_settings(APPOINTMENT_AVAILABILITY_CACHE_TIMEOUT=300)
+class AvailabilityVersionsTestCase(BaseTest):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.client.defaults['HTTP_X_REQUESTED_WITH'] = 'XMLHttpRequest'
+        for day in range(1, 6):
+            WorkingHours.objects.create(staff_member=self.staff_member1, day_of_week=day,
+                                        start_time=time(9, 0), end_time=time(17, 0))
+        self.monday = date.today() + timedelta(days=7 - date.today().weekday() + 7)
+        self.tuesday = self.monday + timedelta(days=1)
+
+    def slots(self, day):
+        return self.client.get(reverse('appointment:available_slots_ajax'),
+                               {'selected_date': day.isoformat(), 'staff_member': self.staff_member1.id}).json()
+
+    def versions(self, *days, staff_member=None):
+        return self.client.get(reverse('appointment:availability_versions_ajax'), {
+            'staff_member': staff_member or self.staff_member1.id,
+            'dates': ','.join(day.isoformat() for day in days)}).json()
+
+    def test_slots_come_with_the_version_of_their_day(self):
+        monday, tuesday = self.slots(self.monday), self.slots(self.tuesday)
+        self.assertEqual(self.versions(self.monday, self.tuesday)['versions'],
+                         {self.monday.isoformat(): monday['version'], self.tuesday.isoformat(): tuesday['version']})
+        # Unavailable days have a version too.
+        self.assertIn('version', self.slots(self.monday + timedelta(days=6)))
+
+    def test_booking_changes_the_version_of_its_day_only(self):
+        before = self.versions(self.monday, self.tuesday)['versions']
+        self.create_appt_for_sm1(self.create_appt_request_for_sm1(date_=self.monday))
+        after = self.versions(self.monday, self.tuesday)['versions']
+        self.assertNotEqual(after[self.monday.isoformat()], before[self.monday.isoformat()])
+        self.assertEqual(after[self.tuesday.isoformat()], before[self.tuesday.isoformat()])
+
+    def test_working_hours_change_every_version_of_the_staff_member(self):
+        before = self.versions(self.monday, self.tuesday)['versions']
+        WorkingHours.objects.filter(staff_member=self.staff_member1, day_of_week=1).update(end_time=time(12, 0))
+        WorkingHours.objects.get(staff_member=self.staff_member1, day_of_week=2).save()
+        after = self.versions(self.monday, self.tuesday)['versions']
+        self.assertNotEqual(after[self.monday.isoformat()], before[self.monday.isoformat()])
+        self.assertNotEqual(after[self.tuesday.isoformat()], before[self.tuesday.isoformat()])
+
+    def test_slot_runs_expand_to_the_slot_list(self):
+        data = {'selected_date': self.monday.isoformat(), 'staff_member': self.staff_member1.id}
+        slots = self.client.get(reverse('appointment:available_slots_ajax'), data).json()
+        runs = self.client.get(reverse('appointment:available_slots_ajax'), {**data, 'slot_format': 'runs'}).json()
+        self.assertNotIn('available_slots', runs)
+        self.assertEqual(runs['slot_runs'], [[540, 30, 16]])
+        self.assertEqual([time(minute // 60, minute % 60).strftime('%I:%M %p')
+                          for minute in decode_slot_runs(runs['slot_runs'])], slots['available_slots'])
+
+    @override_settings(APPOINTMENT_AVAILABILITY_CACHE_TIMEOUT=0)
+    def test_no_versions_without_the_shared_cache(self):
+        self.assertIsNone(self.slots(self.monday)['version'])
+        self.assertEqual(self.versions(self.monday, self.tuesday)['versions'], {})
+        page = self.client.get(reverse('appointment:appointment_request', args=[self.service1.id]))
+        self.assertNotContains(page, 'availabilityVersionsURL =')
+
+    def test_booking_page_defines_the_versions_url(self):
+        page = self.client.get(reverse('appointment:appointment_request', args=[self.service1.id]))
+        self.assertContains(page, 'availabilityVersionsURL =')
+
+    def test_invalid_parameters(self):
+        self.assertEqual(self.versions(self.monday, staff_member='none')['errorCode'],
+                         ErrorCode.STAFF_ID_REQUIRED.value)
+        self.assertEqual(self.versions()['errorCode'], ErrorCode.INVALID_DATE.value)
+        too_many = [self.monday + timedelta(days=offset) for offset in range(43)]
+        self.assertEqual(self.versions(*too_many)['errorCode'], ErrorCode.INVALID_DATE.value)
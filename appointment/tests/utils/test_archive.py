@@ -0,0 +1,142 @@
+# test_archive.py
+# Path: appointment/tests/utils/test_archive.py
+
+import datetime
+from io import StringIO
+
+from django.core.management import CommandError, call_command
+from django.urls import reverse
+
+from appointment.models import (
+    Appointment, AppointmentRequest, AppointmentRescheduleHistory, ArchivedAppointment, ArchivedAppointmentRequest,
+    ArchivedAppointmentRescheduleHistory
+)
+from appointment.tests.base.base_test import BaseTest
+from appointment.utils.archive import archive_appointments, get_appointment_history, subtract_months
+
+
+class ArchiveTestMixin:
+    def create_past_appt(self, days_ago, staff_member=None, rescheduled=False):
+        """Create an appointment, then move its request in the past (saving past dates is refused)."""
+        appointment = self.create_appt_for_sm1(self.create_appt_request_for_sm1(staff_member=staff_member))
+        if rescheduled:
+            self.create_appt_reschedule_for_sm1(appointment.appointment_request)
+        AppointmentRequest.objects.filter(pk=appointment.appointment_request_id).update(
+                date=datetime.date.today() - datetime.timedelta(days=days_ago))
+        return Appointment.objects.get(pk=appointment.pk)
+
+
+class SubtractMonthsTests(BaseTest):
+    def test_subtract_months(self):
+        self.assertEqual(subtract_months(datetime.date(2024, 5, 15), 3), datetime.date(2024, 2, 15))
+        self.assertEqual(subtract_months(datetime.date(2024, 1, 10), 12), datetime.date(2023, 1, 10))
+
+    def test_end_of_month_is_clamped(self):
+        self.assertEqual(subtract_months(datetime.date(2024, 3, 31), 1), datetime.date(2024, 2, 29))
+        self.assertEqual(subtract_months(datetime.date(2024, 5, 31), 15), datetime.date(2023, 2, 28))
+
+
+class ArchiveAppointmentsTests(ArchiveTestMixin, BaseTest):
+    def setUp(self):
+        super().setUp()
+        self.old = self.create_past_appt(400, rescheduled=True)
+        self.history = AppointmentRescheduleHistory.objects.get(appointment_request=self.old.appointment_request)
+        self.recent = self.create_past_appt(10)
+        self.before = datetime.date.today() - datetime.timedelta(days=365)
+
+    def test_old_rows_are_moved_with_their_primary_keys(self):
+        result = archive_appointments(self.before)
+        self.assertEqual((result['appointment_requests'], result['appointments'], result['reschedule_histories']),
+                         (1, 1, 1))
+        self.assertFalse(Appointment.objects.filter(pk=self.old.pk).exists())
+        self.assertFalse(AppointmentRescheduleHistory.objects.filter(pk=self.history.pk).exists())
+        self.assertTrue(Appointment.objects.filter(pk=self.recent.pk).exists())
+
+        archived = ArchivedAppointment.objects.get(pk=self.old.pk)
+        self.assertEqual(archived.appointment_request_id, self.old.appointment_request_id)
+        self.assertEqual(archived.id_request, self.old.id_request)
+        self.assertEqual(archived.client, self.users['client1'])
+        self.assertEqual(archived.appointment_request.staff_member, self.staff_member1)
+        self.assertTrue(ArchivedAppointmentRescheduleHistory.objects.filter(
+                pk=self.history.pk, appointment_request_id=self.old.appointment_request_id).exists())
+
+    def test_batches(self):
+        self.create_past_appt(500)
+        self.create_past_appt(600)
+        batches = []
+        result = archive_appointments(self.before, batch_size=2, progress=lambda counts: batches.append(dict(counts)))
+        self.assertEqual(result['batches'], 2)
+        self.assertEqual([counts['appointment_requests'] for counts in batches], [2, 3])
+        self.assertEqual(ArchivedAppointmentRequest.objects.count(), 3)
+        self.assertEqual(AppointmentRequest.objects.count(), 1)
+
+    def test_dry_run_only_counts(self):
+        result = archive_appointments(self.before, dry_run=True)
+        self.assertEqual((result['appointment_requests'], result['appointments'], result['reschedule_histories']),
+                         (1, 1, 1))
+        self.assertEqual(ArchivedAppointmentRequest.objects.count(), 0)
+        self.assertEqual(AppointmentRequest.objects.count(), 2)
+
+    def test_history_includes_archived_rows_on_request(self):
+        archive_appointments(self.before)
+        hot = get_appointment_history(client=self.users['client1'])
+        self.assertEqual([row['id'] for row in hot], [self.recent.pk])
+        rows = get_appointment_history(client=self.users['client1'], include_archived=True)
+        self.assertEqual([(row['id'], row['archived']) for row in rows], [(self.recent.pk, False), (self.old.pk, True)])
+        self.assertEqual(rows[1]['staff_member'], self.staff_member1.get_staff_member_name())
+
+    def test_command(self):
+        out = StringIO()
+        call_command('archive_appointments', '--before', self.before.isoformat(), stdout=out)
+        self.assertIn("appointment requests: 1", out.getvalue())
+        self.assertTrue(ArchivedAppointment.objects.filter(pk=self.old.pk).exists())
+
+    def test_command_refuses_future_date(self):
+        with self.assertRaises(CommandError):
+            call_command('archive_appointments', '--before',
+                         (datetime.date.today() + datetime.timedelta(days=1)).isoformat(), stdout=StringIO())
+
+
+class AppointmentHistoryViewTests(ArchiveTestMixin, BaseTest):
+    def setUp(self):
+        super().setUp()
+        self.url = reverse('appointment:appointment_history')
+        self.own = self.create_past_appt(400)
+        self.other = self.create_past_appt(400, staff_member=self.staff_member2)
+        archive_appointments(datetime.date.today())
+
+    def test_staff_member_gets_own_archived_appointments(self):
+        self.need_staff_login()
+        response = self.client.get(self.url, {'include_archived': 'true'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['id'] for row in response.json()['appointments']], [self.own.pk])
+
+    def test_archive_is_not_read_by_default(self):
+        self.need_staff_login()
+        response = self.client.get(self.url)
+        self.assertEqual(response.json()['appointments'], [])
+
+    def test_staff_member_cannot_read_another_staff_member(self):
+        self.need_staff_login()
+        response = self.client.get(self.url, {'staff_member': self.staff_member2.id})
+        self.assertEqual(response.status_code, 403)
+
+    def test_superuser_must_filter(self):
+        self.need_superuser_login()
+        response = self.client.get(self.url, {'include_archived': 'true'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_superuser_reads_any_staff_member(self):
+        self.need_superuser_login()
+        response = self.client.get(self.url, {'staff_member': self.staff_member2.id, 'include_archived': 'true'})
+        self.assertEqual([row['id'] for row in response.json()['appointments']], [self.other.pk])
+        self.assertFalse(response.json()['truncated'])
+
+    def test_history_is_limited(self):
+        newer = self.create_past_appt(10)
+        self.need_staff_login()
+        response = self.client.get(self.url, {'include_archived': 'true', 'limit': 1})
+        self.assertEqual([row['id'] for row in response.json()['appointments']], [newer.pk])
+        self.assertTrue(response.json()['truncated'])
+        response = self.client.get(self.url, {'limit': 0})
+        self.assertEqual(response.status_code, 400)
@@ -0,0 +1,187 @@
+# test_availability.py
+# Path: appointment/tests/utils/test_availability.py
+
+import datetime
+import json
+from io import StringIO
+from unittest import skipUnless
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.utils import timezone
+
+from appointment.models import Config, StaffMember
+from appointment.services import get_available_slots_for_staff
+from appointment.tests.base.base_test import BaseTest
+from appointment.tests.mixins.base_mixin import AvailabilityFixtureMixin
+from appointment.utils.availability import (
+    NUMPY_AVAILABLE, build_availability_report, compute_staff_day_slots, load_availability_snapshot, resolve_engine
+)
+from appointment.utils.db_helpers import get_config, get_weekday_num_from_date
+
+
+def next_monday(weeks_ahead=1):
+    today = timezone.now().date()
+    return today + datetime.timedelta(days=(7 - today.weekday()) % 7 or 7, weeks=weeks_ahead - 1)
+
+
+class AvailabilityEngineTestBase(BaseTest, AvailabilityFixtureMixin):
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        Config.objects.create(slot_duration=30, lead_time=datetime.time(9, 0), finish_time=datetime.time(17, 0),
+                              appointment_buffer_time=0)
+        self.monday = next_monday()
+        self.create_availability_fixture_(self.staff_member1, self.staff_member2, self.service1, self.service2,
+                                          self.users['client1'], self.monday)
+        self.staff_members = list(StaffMember.objects.filter(
+                pk__in=[self.staff_member1.pk, self.staff_member2.pk]).select_related('user').order_by('pk'))
+        self.start_date = self.monday - datetime.timedelta(days=1)
+        self.end_date = self.monday + datetime.timedelta(days=13)
+
+    def tearDown(self):
+        super().tearDown()
+        cache.clear()
+
+    def scalar_slots(self, staff_member, date, service=None):
+        return get_available_slots_for_staff(date, staff_member, get_weekday_num_from_date(date), service=service)
+
+
+class LoadAvailabilitySnapshotTests(AvailabilityEngineTestBase):
+
+    def test_snapshot_is_loaded_with_a_constant_number_of_queries(self):
+        get_config()  # the configuration is cached
+        with self.assertNumQueries(4):
+            snapshot = load_availability_snapshot(self.staff_members, self.start_date, self.end_date)
+        self.assertEqual(len(snapshot.dates()), 15)
+        self.assertEqual(sum(len(booked) for booked in snapshot.appointments.values()), 7)
+        self.assertTrue(snapshot.is_day_off(self.staff_member1.id, self.monday + datetime.timedelta(days=2)))
+        self.assertEqual(len(snapshot.pending_reschedules), 1)
+
+    def test_empty_staff_set(self):
+        get_config()
+        with self.assertNumQueries(0):
+            snapshot = load_availability_snapshot([], self.start_date, self.end_date)
+        self.assertEqual(snapshot.staff_members, [])
+
+
+class ComputeStaffDaySlotsTests(AvailabilityEngineTestBase):
+    """The batch engine must give the same answers as `get_available_slots_for_staff`."""
+
+    def assert_matches_scalar(self, service=None):
+        snapshot = load_availability_snapshot(self.staff_members, self.start_date, self.end_date)
+        for staff_member in self.staff_members:
+            for date in snapshot.dates():
+                with self.subTest(staff_member=staff_member.id, date=date, service=service):
+                    self.assertEqual(compute_staff_day_slots(snapshot, staff_member, date, service=service),
+                                     self.scalar_slots(staff_member, date, service=service))
+
+    def test_matches_scalar_engine(self):
+        self.assert_matches_scalar()
+
+    def test_matches_scalar_engine_with_service_duration(self):
+        self.assert_matches_scalar(service=self.service2)
+
+    def test_matches_scalar_engine_with_config_gap_time(self):
+        Config.objects.filter(pk=1).update(slot_gap_time=20, default_to_service_duration=False)
+        cache.clear()
+        self.assert_matches_scalar(service=self.service1)
+
+
+class BuildAvailabilityReportTests(AvailabilityEngineTestBase):
+
+    def report(self, engine, service=None):
+        return build_availability_report(self.start_date, self.end_date, staff_members=self.staff_members,
+                                         service=service, engine=engine)
+
+    def test_python_report_counts_match_scalar_engine(self):
+        report = self.report('python')
+        self.assertEqual(report['engine'], 'python')
+        self.assertEqual(len(report['days']), 2 * 15)
+        for row in report['days']:
+            staff_member = next(sm for sm in self.staff_members if sm.id == row['staff_member_id'])
+            slots = self.scalar_slots(staff_member, datetime.date.fromisoformat(row['date']))
+            self.assertEqual(row['free_slots'], len(slots))
+            self.assertEqual(row['first_free'], slots[0].strftime('%H:%M') if slots else None)
+
+    def test_python_report_values(self):
+        rows = {(row['staff_member_id'], row['date']): row for row in self.report('python')['days']}
+        monday_sm1 = rows[(self.staff_member1.id, self.monday.isoformat())]
+        self.assertEqual(monday_sm1['working_minutes'], 480)
+        self.assertEqual(monday_sm1['booked_minutes'], 105)
+        self.assertEqual(monday_sm1['total_slots'], 16)
+        self.assertEqual(monday_sm1['utilization'], round(105 / 480, 4))
+        sunday_sm1 = rows[(self.staff_member1.id, self.start_date.isoformat())]
+        self.assertFalse(sunday_sm1['is_working'])
+        self.assertEqual(sunday_sm1['free_slots'], 0)
+        day_off = rows[(self.staff_member1.id, (self.monday + datetime.timedelta(days=2)).isoformat())]
+        self.assertFalse(day_off['is_working'])
+
+    def test_staff_summary(self):
+        report = self.report('python')
+        summary = {row['staff_member_id']: row for row in report['staff']}
+        days = [row for row in report['days'] if row['staff_member_id'] == self.staff_member2.id]
+        self.assertEqual(summary[self.staff_member2.id]['free_slots'], sum(row['free_slots'] for row in days))
+        self.assertEqual(summary[self.staff_member2.id]['staff_member'], self.staff_member2.get_staff_member_name())
+
+    @skipUnless(NUMPY_AVAILABLE, "NumPy is not installed")
+    def test_numpy_report_matches_python_report(self):
+        for service in (None, self.service1, self.service2):
+            with self.subTest(service=service):
+                numpy_report, python_report = self.report('numpy', service), self.report('python', service)
+                self.assertEqual(numpy_report['engine'], 'numpy')
+                self.assertEqual(numpy_report['days'], python_report['days'])
+                self.assertEqual(numpy_report['staff'], python_report['staff'])
+
+    @skipUnless(NUMPY_AVAILABLE, "NumPy is not installed")
+    def test_numpy_report_with_gap_time_matches_python_report(self):
+        Config.objects.filter(pk=1).update(slot_gap_time=25, appointment_buffer_time=20)
+        cache.clear()
+        self.assertEqual(self.report('numpy')['days'], self.report('python')['days'])
+
+    @skipUnless(NUMPY_AVAILABLE, "NumPy is not installed")
+    def test_numpy_report_by_chunks_matches_python_report(self):
+        # One staff member per chunk
+        with patch('appointment.utils.availability.NUMPY_CHUNK_CELLS', 1):
+            self.assertEqual(self.report('numpy', self.service1)['days'], self.report('python', self.service1)['days'])
+
+
+class ResolveEngineTests(BaseTest):
+
+    def test_unknown_engine(self):
+        with self.assertRaises(ValueError):
+            resolve_engine('fortran')
+
+    def test_python_engine(self):
+        self.assertEqual(resolve_engine('python'), 'python')
+
+    @patch('appointment.utils.availability.NUMPY_AVAILABLE', False)
+    def test_auto_falls_back_to_python_without_numpy(self):
+        self.assertEqual(resolve_engine('auto'), 'python')
+
+    @patch('appointment.utils.availability.NUMPY_AVAILABLE', False)
+    def test_numpy_engine_requires_numpy(self):
+        with self.assertRaises(ImproperlyConfigured):
+            resolve_engine('numpy')
+
+
+class AvailabilityReportCommandTests(AvailabilityEngineTestBase):
+
+    def test_command_prints_json_report(self):
+        out = StringIO()
+        call_command('availability_report', '--start', self.monday.isoformat(), '--days', '7',
+                     '--engine', 'python', stdout=out)
+        report = json.loads(out.getvalue())
+        self.assertEqual(report['start_date'], self.monday.isoformat())
+        self.assertEqual(len(report['staff']), StaffMember.objects.count())
+        self.assertIn('elapsed_ms', report)
+
+    def test_command_summary_only(self):
+        out = StringIO()
+        call_command('availability_report', '--staff', str(self.staff_member1.id), '--summary', stdout=out)
+        report = json.loads(out.getvalue())
+        self.assertNotIn('days', report)
+        self.assertEqual([row['staff_member_id'] for row in report['staff']], [self.staff_member1.id])
@@ -0,0 +1,215 @@
+# test_availability_cache.py
+# Path: appointment/tests/utils/test_availability_cache.py
+
+import datetime
+import multiprocessing
+from io import StringIO
+from unittest import skipUnless
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connections
+from django.test import override_settings
+
+from appointment.models import Appointment, AppointmentRequest, Config, StaffMember, WorkingHours
+from appointment.tests.utils.test_availability import AvailabilityEngineTestBase
+from appointment.utils.availability import build_availability_report
+from appointment.utils.availability_cache import (
+    aggregate_heatmap, get_availability_heatmap, get_cached_slots, get_staff_day_tokens, get_staff_week_tokens,
+    get_week_start, invalidate_staff_availability, invalidate_staff_day_availability, warm_slots_cache
+)
+from appointment.utils.single_flight import STALE_GRACE
+
+
+@override_settings(APPOINTMENT_AVAILABILITY_CACHE_TIMEOUT=300)
+class AvailabilityHeatmapTests(AvailabilityEngineTestBase):
+
+    def heatmap(self, start_date=None, end_date=None):
+        return get_availability_heatmap(self.staff_members, start_date or self.monday,
+                                        end_date or self.monday + datetime.timedelta(days=13))
+
+    def test_heatmap_matches_report(self):
+        heatmap = self.heatmap()
+        report = build_availability_report(self.monday, self.monday + datetime.timedelta(days=13),
+                                           staff_members=self.staff_members, engine='python')
+        for row in report['days']:
+            counts = heatmap[row['staff_member_id']][row['date']]
+            self.assertEqual(counts['free_slots'], row['free_slots'])
+            self.assertEqual(counts['booked_minutes'], row['booked_minutes'])
+
+    def test_range_bounds(self):
+        heatmap = self.heatmap(self.monday + datetime.timedelta(days=2), self.monday + datetime.timedelta(days=8))
+        dates = list(heatmap[self.staff_member1.id])
+        self.assertEqual(dates[0], (self.monday + datetime.timedelta(days=2)).isoformat())
+        self.assertEqual(dates[-1], (self.monday + datetime.timedelta(days=8)).isoformat())
+        self.assertEqual(len(dates), 7)
+
+    def test_second_call_is_served_from_cache(self):
+        first = self.heatmap()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.heatmap(), first)
+
+    def test_booking_invalidates_only_its_week(self):
+        self.heatmap()
+        tuesday = self.monday + datetime.timedelta(days=1)
+        before = self.heatmap()[self.staff_member1.id][tuesday.isoformat()]['free_slots']
+        ar = AppointmentRequest.objects.create(date=tuesday, start_time=datetime.time(15, 0),
+                                               end_time=datetime.time(16, 0), service=self.service1,
+                                               staff_member=self.staff_member1)
+        Appointment.objects.create(client=self.users['client2'], appointment_request=ar, phone="+12392340543")
+
+        with self.assertNumQueries(0):
+            self.heatmap(self.monday + datetime.timedelta(days=7))
+        after = self.heatmap()[self.staff_member1.id][tuesday.isoformat()]['free_slots']
+        self.assertEqual(after, before - 2)
+
+    def test_moving_a_request_frees_its_previous_day(self):
+        appointment = Appointment.objects.select_related('appointment_request').filter(
+                appointment_request__staff_member=self.staff_member1,
+                appointment_request__date=self.monday + datetime.timedelta(days=8)).get()
+        day = (self.monday + datetime.timedelta(days=8)).isoformat()
+        before = self.heatmap()[self.staff_member1.id][day]['booked_minutes']
+
+        ar = AppointmentRequest.objects.get(pk=appointment.appointment_request_id)
+        ar.date = self.monday + datetime.timedelta(days=4)
+        ar.save()
+
+        self.assertEqual(before, 60)
+        self.assertEqual(self.heatmap()[self.staff_member1.id][day]['booked_minutes'], 0)
+
+    def test_working_hours_change_invalidates_staff_member(self):
+        self.heatmap()
+        WorkingHours.objects.filter(staff_member=self.staff_member2, day_of_week=6).delete()
+        saturday = (self.monday + datetime.timedelta(days=5)).isoformat()
+        # QuerySet.delete() sends post_delete for every row
+        self.assertFalse(self.heatmap()[self.staff_member2.id][saturday]['is_working'])
+
+    def test_config_change_invalidates_everything(self):
+        self.heatmap()
+        config = Config.objects.get()
+        config.slot_duration = 60
+        config.save()
+        self.assertIsNone(cache.get('config'))
+        wednesday = (self.monday + datetime.timedelta(days=9)).isoformat()
+        self.assertEqual(self.heatmap()[self.staff_member1.id][wednesday]['total_slots'], 8)
+
+    @override_settings(APPOINTMENT_AVAILABILITY_CACHE_TIMEOUT=0)
+    def test_cache_can_be_disabled(self):
+        self.heatmap()
+        with self.assertNumQueries(4):
+            self.heatmap()
+
+    def test_aggregate_heatmap(self):
+        days = aggregate_heatmap(self.heatmap())
+        monday = days[0]
+        self.assertEqual(monday['date'], self.monday.isoformat())
+        self.assertEqual(monday['working_staff'], 2)
+        self.assertEqual(monday['booked_minutes'], 105 + 90)
+        self.assertEqual(monday['working_minutes'], 480 + 360)
+        self.assertEqual(monday['utilization'], round(195 / 840, 4))
+
+
+class VersionTokenTests(AvailabilityEngineTestBase):
+
+    def test_day_invalidation_changes_week_token(self):
+        week = get_week_start(self.monday)
+        before = get_staff_week_tokens([self.staff_member1.id], [week])
+        invalidate_staff_day_availability(self.staff_member1.id, self.monday + datetime.timedelta(days=3))
+        after = get_staff_week_tokens([self.staff_member1.id], [week])
+        self.assertNotEqual(before, after)
+
+    def test_staff_invalidation_changes_every_week_token(self):
+        weeks = [get_week_start(self.monday), get_week_start(self.monday) + datetime.timedelta(days=7)]
+        before = get_staff_week_tokens([self.staff_member1.id, self.staff_member2.id], weeks)
+        invalidate_staff_availability(self.staff_member1.id)
+        after = get_staff_week_tokens([self.staff_member1.id, self.staff_member2.id], weeks)
+        for week in weeks:
+            self.assertNotEqual(before[(self.staff_member1.id, week)], after[(self.staff_member1.id, week)])
+            self.assertEqual(before[(self.staff_member2.id, week)], after[(self.staff_member2.id, week)])
+
+    def test_tokens_survive_eviction(self):
+        week = get_week_start(self.monday)
+        before = get_staff_week_tokens([self.staff_member1.id], [week])
+        cache.clear()
+        self.assertNotEqual(before, get_staff_week_tokens([self.staff_member1.id], [week]))
+
+
+@override_settings(APPOINTMENT_AVAILABILITY_CACHE_TIMEOUT=300)
+class CacheWarmupTests(AvailabilityEngineTestBase):
+
+    def cached_slots(self, staff_member, date, service=None):
+        def compute():
+            raise AssertionError(f"The slots of {date} were not warmed")
+
+        token = get_staff_day_tokens(staff_member.id, [date])[date]
+        return get_cached_slots(staff_member.id, date, service.id if service else None, token, compute)
+
+    def test_warmed_slots_match_the_scalar_pipeline(self):
+        stats = warm_slots_cache(14, start_date=self.monday)
+        self.assertEqual(stats['staff_members'], 2)
+        self.assertGreater(stats['entries'], 0)
+        for staff_member, service, offsets in ((self.staff_member1, self.service1, (0, 3)),
+                                               (self.staff_member2, self.service2, (0, 2))):
+            for date in (self.monday + datetime.timedelta(days=offset) for offset in offsets):
+                self.assertEqual(self.cached_slots(staff_member, date, service),
+                                 self.scalar_slots(staff_member, date, service=service))
+                self.assertEqual(self.cached_slots(staff_member, date), self.scalar_slots(staff_member, date))
+
+    @override_settings(APPOINTMENT_AVAILABILITY_CACHE_TIMEOUT=3600)
+    def test_only_days_with_a_pending_reschedule_expire_early(self):
+        with patch.object(cache, 'set_many', wraps=cache.set_many) as mock_set_many:
+            warm_slots_cache(7, start_date=self.monday)
+        timeouts = {call.args[1]: len(call.args[0]) for call in mock_set_many.call_args_list}
+        # Staff member 1 has a pending reschedule on Thursday; each of their days is cached with and without service.
+        self.assertEqual(timeouts[300 + STALE_GRACE], 2)
+        self.assertIn(3600 + STALE_GRACE, timeouts)
+
+    def test_days_off_and_non_working_days_are_skipped(self):
+        warm_slots_cache(7, start_date=self.monday)
+        with self.assertRaises(AssertionError):
+            self.cached_slots(self.staff_member1, self.monday + datetime.timedelta(days=2))
+        with self.assertRaises(AssertionError):
+            self.cached_slots(self.staff_member2, self.monday + datetime.timedelta(days=1))
+
+    def test_a_booking_after_the_warmup_is_not_served_stale(self):
+        warm_slots_cache(7, start_date=self.monday)
+        ar = AppointmentRequest.objects.create(date=self.monday, start_time=datetime.time(15, 0),
+                                               end_time=datetime.time(16, 0), service=self.service1,
+                                               staff_member=self.staff_member1)
+        Appointment.objects.create(client=self.users['client2'], appointment_request=ar, phone="+12392340543")
+        with self.assertRaises(AssertionError):
+            self.cached_slots(self.staff_member1, self.monday, self.service1)
+
+    def test_only_the_given_staff_members_are_warmed(self):
+        stats = warm_slots_cache(7, start_date=self.monday, staff_member_ids=[self.staff_member2.id])
+        self.assertEqual(stats['staff_members'], 1)
+        self.cached_slots(self.staff_member2, self.monday)
+        with self.assertRaises(AssertionError):
+            self.cached_slots(self.staff_member1, self.monday)
+
+    def test_chunks_report_their_progress(self):
+        calls = []
+        warm_slots_cache(7, start_date=self.monday, chunk_size=1, progress=lambda *args: calls.append(args))
+        self.assertEqual([call[:2] for call in calls], [(1, 2), (2, 2)])
+
+    # The test database lives in memory: only forked workers see its rows.
+    @skipUnless(multiprocessing.get_start_method() == 'fork', "requires forked worker processes")
+    def test_worker_processes_leave_the_connections_usable(self):
+        with patch.object(connections, 'close_all', wraps=connections.close_all) as mock_close_all:
+            stats = warm_slots_cache(7, start_date=self.monday, chunk_size=1, processes=2)
+        mock_close_all.assert_called_once_with()
+        self.assertEqual(stats['staff_members'], 2)
+        self.assertEqual(StaffMember.objects.filter(pk__in=[self.staff_member1.pk, self.staff_member2.pk]).count(), 2)
+        self.assertEqual(self.cached_slots(self.staff_member1, self.monday, self.service1),
+                         self.scalar_slots(self.staff_member1, self.monday, service=self.service1))
+
+    @override_settings(APPOINTMENT_AVAILABILITY_CACHE_TIMEOUT=0)
+    def test_nothing_is_warmed_when_the_cache_is_disabled(self):
+        self.assertEqual(warm_slots_cache(7, start_date=self.monday)['entries'], 0)
+
+    def test_command(self):
+        out = StringIO()
+        call_command('warm_availability_cache', '--days', '7', '--start-date', self.monday.isoformat(), stdout=out)
+        self.assertIn("for 2 staff member(s) over 7 day(s)", out.getvalue())
+        self.cached_slots(self.staff_member1, self.monday, self.service1)
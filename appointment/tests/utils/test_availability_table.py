@@ -0,0 +1,183 @@
+# test_availability_table.py
+# Path: appointment/tests/utils/test_availability_table.py
+
+import datetime
+from io import StringIO
+from unittest.mock import patch
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from appointment.models import (
+    Appointment, AppointmentRequest, AppointmentRescheduleHistory, StaffDayAvailability, StaffMember, WorkingHours
+)
+from appointment.tests.utils.test_availability import AvailabilityEngineTestBase
+from appointment.utils.availability_table import (
+    find_available_staff, get_staff_day_slots, rebuild_availability_table, subtract_intervals
+)
+from appointment.utils.db_helpers import get_config
+
+
+@override_settings(APPOINTMENT_AVAILABILITY_TABLE=True)
+class AvailabilityTableTests(AvailabilityEngineTestBase):
+
+    def setUp(self):
+        super().setUp()
+        self.days = [self.monday + datetime.timedelta(days=offset) for offset in range(14)]
+
+    def row(self, staff_member, offset):
+        return StaffDayAvailability.objects.get(staff_member=staff_member,
+                                                date=self.monday + datetime.timedelta(days=offset))
+
+    def book(self, staff_member, service, date, start_time, end_time):
+        ar = AppointmentRequest.objects.create(date=date, start_time=start_time, end_time=end_time, service=service,
+                                               staff_member=staff_member)
+        return Appointment.objects.create(client=self.users['client2'], appointment_request=ar, phone="+12392340543")
+
+    def test_subtract_intervals(self):
+        self.assertEqual(subtract_intervals(540, 1020, [[600, 660], [630, 700], [1000, 1100]]),
+                         [[540, 600], [700, 1000]])
+        self.assertEqual(subtract_intervals(540, 1020, []), [[540, 1020]])
+        self.assertEqual(subtract_intervals(540, 1020, [[500, 1100]]), [])
+
+    def test_rebuild_builds_every_staff_day(self):
+        stats = rebuild_availability_table(14, start_date=self.monday)
+        self.assertEqual(stats['rows'], 28)
+        monday = self.row(self.staff_member1, 0)
+        self.assertEqual(monday.free_intervals, [[540, 600], [660, 795], [840, 1020]])
+        self.assertEqual((monday.free_minutes, monday.longest_free_minutes), (375, 180))
+        day_off = self.row(self.staff_member1, 2)
+        self.assertTrue(day_off.is_day_off)
+        self.assertIsNone(day_off.start_time)
+        self.assertEqual(self.row(self.staff_member1, 3).held_intervals, [[840, 900]])
+        self.assertIsNotNone(self.row(self.staff_member1, 3).refresh_after)
+
+    def test_slots_match_the_scalar_pipeline(self):
+        rebuild_availability_table(14, start_date=self.monday)
+        for staff_member, service in ((self.staff_member1, self.service1), (self.staff_member2, self.service2)):
+            for date in self.days:
+                for day_service in (None, service):
+                    self.assertEqual(get_staff_day_slots(staff_member, date, service=day_service),
+                                     self.scalar_slots(staff_member, date, service=day_service), (date, day_service))
+
+    def test_slots_are_read_with_one_query(self):
+        rebuild_availability_table(14, start_date=self.monday)
+        get_config()
+        with self.assertNumQueries(1):
+            get_staff_day_slots(self.staff_member1, self.monday, service=self.service1)
+
+    def test_missing_row_is_built_on_read(self):
+        slots = get_staff_day_slots(self.staff_member1, self.monday)
+        self.assertEqual(slots, self.scalar_slots(self.staff_member1, self.monday))
+        self.assertEqual(self.row(self.staff_member1, 0).free_minutes, 375)
+
+    def test_booking_refreshes_its_day(self):
+        rebuild_availability_table(14, start_date=self.monday)
+        tuesday = self.monday + datetime.timedelta(days=1)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.book(self.staff_member1, self.service1, tuesday, datetime.time(15, 0), datetime.time(16, 0))
+        self.assertEqual(self.row(self.staff_member1, 1).free_intervals, [[570, 900], [960, 1020]])
+        self.assertEqual(get_staff_day_slots(self.staff_member1, tuesday, service=self.service1),
+                         self.scalar_slots(self.staff_member1, tuesday, service=self.service1))
+
+    def test_moving_a_request_frees_its_previous_day(self):
+        rebuild_availability_table(14, start_date=self.monday)
+        ar = AppointmentRequest.objects.get(staff_member=self.staff_member1, date=self.monday + datetime.timedelta(1))
+        with self.captureOnCommitCallbacks(execute=True):
+            ar.date = self.monday + datetime.timedelta(days=4)
+            ar.save()
+        self.assertEqual(self.row(self.staff_member1, 1).booked_intervals, [])
+        self.assertEqual(self.row(self.staff_member1, 4).booked_intervals, [[540, 570]])
+
+    def test_working_hours_change_refreshes_upcoming_rows(self):
+        rebuild_availability_table(14, start_date=self.monday)
+        with self.captureOnCommitCallbacks(execute=True):
+            WorkingHours.objects.filter(staff_member=self.staff_member1, day_of_week=1).update(
+                    start_time=datetime.time(8, 0))
+            WorkingHours.objects.get(staff_member=self.staff_member1, day_of_week=1).save()
+        self.assertEqual(self.row(self.staff_member1, 0).start_time, datetime.time(8, 0))
+        self.assertEqual(self.row(self.staff_member1, 7).free_minutes, 540)
+
+    def test_queryset_deletion_refreshes_the_days(self):
+        rebuild_availability_table(14, start_date=self.monday)
+        with self.captureOnCommitCallbacks(execute=True):
+            Appointment.objects.filter(appointment_request__staff_member=self.staff_member1).delete()
+        self.assertFalse(StaffDayAvailability.objects.filter(staff_member=self.staff_member1).exclude(
+                booked_intervals=[]).exists())
+        self.assertEqual(self.row(self.staff_member2, 0).booked_intervals, [[660, 750]])
+
+    def test_stale_row_is_rebuilt_on_read(self):
+        rebuild_availability_table(14, start_date=self.monday)
+        AppointmentRescheduleHistory.objects.update(created_at=timezone.now() - datetime.timedelta(minutes=10))
+        StaffDayAvailability.objects.filter(held_intervals=[[840, 900]]).update(
+                refresh_after=timezone.now() - datetime.timedelta(minutes=5))
+        thursday = self.monday + datetime.timedelta(days=3)
+        self.assertEqual(get_staff_day_slots(self.staff_member1, thursday),
+                         self.scalar_slots(self.staff_member1, thursday))
+        self.assertEqual(self.row(self.staff_member1, 3).held_intervals, [])
+        self.assertIsNone(self.row(self.staff_member1, 3).refresh_after)
+
+    def test_find_available_staff(self):
+        rebuild_availability_table(14, start_date=self.monday)
+        self.assertEqual(find_available_staff(self.monday, 180, start_time=datetime.time(14, 0)),
+                         [self.staff_member1.id])
+        self.assertEqual(find_available_staff(self.monday, 200), [self.staff_member2.id])
+        self.assertEqual(find_available_staff(self.monday, 60, end_time=datetime.time(12, 0)),
+                         [self.staff_member1.id, self.staff_member2.id])
+        self.assertEqual(find_available_staff(self.monday + datetime.timedelta(days=2), 30),
+                         [self.staff_member2.id])
+
+    def test_find_available_staff_builds_missing_rows(self):
+        monday = self.monday + datetime.timedelta(days=7)
+        rebuild_availability_table(1, start_date=monday, staff_member_ids=[self.staff_member1.id])
+        self.assertEqual(find_available_staff(monday, 60), [self.staff_member1.id, self.staff_member2.id])
+        self.assertEqual(StaffDayAvailability.objects.filter(date=monday).count(), 2)
+        self.assertEqual(find_available_staff(monday + datetime.timedelta(days=1), 60), [self.staff_member1.id])
+
+    def test_rows_are_replaced_without_upserts(self):
+        rebuild_availability_table(14, start_date=self.monday)
+        expected = list(StaffDayAvailability.objects.order_by('staff_member', 'date').values_list(
+                'staff_member', 'date', 'free_intervals'))
+        with patch.object(connection.features, 'supports_update_conflicts_with_target', False), \
+                patch.object(connection.features, 'supports_update_conflicts', False):
+            rebuild_availability_table(14, start_date=self.monday)
+        self.assertEqual(list(StaffDayAvailability.objects.order_by('staff_member', 'date').values_list(
+                'staff_member', 'date', 'free_intervals')), expected)
+
+    def test_deleting_a_staff_member_deletes_their_rows(self):
+        rebuild_availability_table(14, start_date=self.monday)
+        with self.captureOnCommitCallbacks(execute=True):
+            StaffMember.objects.get(pk=self.staff_member1.pk).delete()
+        self.assertFalse(StaffDayAvailability.objects.filter(staff_member_id=self.staff_member1.pk).exists())
+
+    def test_available_slots_view_reads_the_table(self):
+        rebuild_availability_table(14, start_date=self.monday)
+        url = reverse('appointment:available_slots_ajax')
+        query = {'selected_date': self.monday.isoformat(), 'staff_member': self.staff_member2.id,
+                 'service_id': self.service2.id}
+        response = self.client.get(url, query, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        with override_settings(APPOINTMENT_AVAILABILITY_TABLE=False, APPOINTMENT_AVAILABILITY_CACHE_TIMEOUT=0):
+            expected = self.client.get(url, query, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertEqual(response.json()['available_slots'], expected.json()['available_slots'])
+        self.assertTrue(response.json()['available_slots'])
+
+    def test_command(self):
+        out = StringIO()
+        call_command('rebuild_availability_table', '--days', '7', '--start-date', self.monday.isoformat(), '--prune',
+                     stdout=out)
+        self.assertIn("Built 14 rows for 2 staff member(s) over 7 day(s)", out.getvalue())
+        self.assertEqual(StaffDayAvailability.objects.count(), 14)
+
+
+class AvailabilityTableDisabledTests(AvailabilityEngineTestBase):
+
+    def test_rows_are_not_maintained(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            ar = AppointmentRequest.objects.create(date=self.monday, start_time=datetime.time(15, 0),
+                                                   end_time=datetime.time(16, 0), service=self.service1,
+                                                   staff_member=self.staff_member1)
+            Appointment.objects.create(client=self.users['client2'], appointment_request=ar, phone="+12392340543")
+        self.assertFalse(StaffDayAvailability.objects.exists())
@@ -9,7 +9,7 @@ from django.test import TestCase
 from appointment.utils.date_time import (
     combine_date_and_time, convert_12_hour_time_to_24_hour_time, convert_24_hour_time_to_12_hour_time,
     convert_minutes_in_human_readable_format, convert_str_to_date,
-    convert_str_to_time, get_ar_end_time, get_current_year, get_timestamp, get_weekday_num,
+    convert_str_to_time, decode_slot_runs, encode_slot_runs, get_ar_end_time, get_current_year, get_timestamp, get_weekday_num,
     time_difference
 )
 
@@ -387,3 +387,16 @@ class GeneralDateTimeTests(TestCase):
     def test_invalid_get_weekday_num(self):
         """Test get_weekday_num function with invalid input which should return -1"""
         self.assertEqual(get_weekday_num("InvalidDay"), -1)
+
+
+class SlotRunsTests(TestCase):
+    def test_encode_slot_runs(self):
+        slots = [datetime.time(9, 0), datetime.time(9, 30), datetime.time(10, 0), datetime.time(14, 0),
+                 datetime.time(15, 0), datetime.time(15, 5), datetime.time(15, 10)]
+        runs = encode_slot_runs(slots)
+        self.assertEqual(runs, [[540, 30, 3], [840, 60, 2], [905, 5, 2]])
+        self.assertEqual(decode_slot_runs(runs), [slot.hour * 60 + slot.minute for slot in slots])
+
+    def test_encode_slot_runs_empty_and_single(self):
+        self.assertEqual(encode_slot_runs([]), [])
+        self.assertEqual(encode_slot_runs([datetime.datetime(2030, 1, 1, 23, 45)]), [[1425, 0, 1]])
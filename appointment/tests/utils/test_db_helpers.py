@@ -21,6 +21,7 @@ from appointment.settings import check_q_cluster
 from appointment.tests.base.base_test import BaseTest
 from appointment.tests.mixins.base_mixin import ConfigMixin
 from appointment.utils.db_helpers import (
+    allocate_usernames,
     Appointment, AppointmentRequest, AppointmentRescheduleHistory, Config, WorkingHours, calculate_slots,
     calculate_staff_slots, can_appointment_be_rescheduled, cancel_existing_reminder, check_day_off_for_staff,
     create_and_save_appointment, create_new_user, create_payment_info_and_get_url, day_off_exists_for_date_range,
@@ -29,9 +30,10 @@ from appointment.utils.db_helpers import (
     get_appointment_finish_time, get_appointment_lead_time, get_appointment_slot_duration,
     get_appointments_for_date_and_time, get_config, get_day_off_by_id, get_non_working_days_for_staff,
     get_staff_member_appointment_list, get_staff_member_by_user_id, get_staff_member_from_user_id_or_logged_in,
-    get_times_from_config, get_user_by_email, get_user_model, get_website_name, get_weekday_num_from_date,
-    get_working_hours_by_id, get_working_hours_for_staff_and_day, is_working_day, parse_name, schedule_email_reminder,
-    staff_change_allowed_on_reschedule, update_appointment_reminder, username_in_user_model, working_hours_exist
+    get_times_from_config, get_user_by_email, get_user_model, get_usernames_starting_with, get_website_name,
+    get_weekday_num_from_date, get_working_hours_by_id, get_working_hours_for_staff_and_day, is_working_day,
+    parse_name, schedule_email_reminder, staff_change_allowed_on_reschedule, update_appointment_reminder,
+    username_in_user_model, working_hours_exist
 )
 
 logger = get_logger(__name__)
@@ -1203,6 +1205,36 @@ class CreateNewUserTest(TestCase):
         # Check that no password has been set
         self.assertFalse(user.has_usable_password())
 
+    def test_generate_unique_username_uses_one_query(self):
+        """The first free suffix is found with a single query, however many are taken."""
+        CLIENT_MODEL = get_user_model()
+        for username in ['info', 'info01', 'info02', 'info04', 'information']:
+            CLIENT_MODEL.objects.create_user(username=username, email=f'{username}@example.com')
+        with self.assertNumQueries(1):
+            self.assertEqual(generate_unique_username_from_email('info@django-appointment.com'), 'info03')
+
+    def test_only_numeric_suffixes_are_loaded(self):
+        """Usernames merely sharing the base are not read."""
+        for username in ['info', 'info01', 'information', 'info.desk', 'info01a']:
+            get_user_model().objects.create_user(username=username, email=f'{username}@example.com')
+        self.assertEqual(get_usernames_starting_with(['info', 'in.fo']), {'info', 'info01'})
+
+    def test_allocate_usernames(self):
+        """Usernames allocated in bulk are distinct from the existing ones and from each other."""
+        get_user_model().objects.create_user(username='info', email='info@example.com')
+        emails = ['info@a.com', 'contact@b.com', 'info@c.com', 'contact@d.com']
+        with self.assertNumQueries(1):
+            usernames = allocate_usernames(emails)
+        self.assertEqual(usernames, ['info01', 'contact', 'info02', 'contact01'])
+
+    def test_create_new_user_retries_when_username_is_taken_concurrently(self):
+        """A username taken between the lookup and the insert is replaced by the next free one."""
+        get_user_model().objects.create_user(username='bra.tac', email='bra.tac@example.com')
+        client_data = {'name': "Bra'tac", 'email': 'bra.tac@django-appointment.com'}
+        with patch('appointment.utils.db_helpers.get_usernames_starting_with', side_effect=[set(), {'bra.tac'}]):
+            user = create_new_user(client_data)
+        self.assertEqual(user.username, 'bra.tac01')
+
 
 class UsernameInUserModelTests(TestCase):
 
@@ -0,0 +1,104 @@
+# test_digest.py
+# Path: appointment/tests/utils/test_digest.py
+
+import datetime
+from io import StringIO
+from unittest.mock import patch
+
+from django.core import mail
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from appointment.tests.base.base_test import BaseTest
+from appointment.utils.digest import (
+    ADMIN_DIGEST_LAST_RUN_KEY, get_staff_agendas, send_admin_digest, send_staff_agenda_digests
+)
+from appointment.utils.email_ops import notify_admin_about_appointment
+
+
+@override_settings(USE_DJANGO_Q_FOR_EMAILS=False)
+class StaffAgendaDigestTests(BaseTest):
+    def setUp(self):
+        super().setUp()
+        self.tomorrow = timezone.localdate() + datetime.timedelta(days=1)
+        for hour in (14, 9):
+            self.create_appt_for_sm1(self.create_appt_request_for_sm1(
+                    date_=self.tomorrow, start_time=datetime.time(hour, 0), end_time=datetime.time(hour, 30)))
+        self.create_appt_for_sm2(self.create_appt_request_for_sm2(date_=self.tomorrow))
+        # Another day
+        self.create_appt_for_sm2(self.create_appt_request_for_sm2(date_=self.tomorrow + datetime.timedelta(days=1)))
+
+    def test_agendas_are_grouped_from_one_query(self):
+        with CaptureQueriesContext(connection) as queries:
+            agendas = get_staff_agendas(self.tomorrow)
+            names = [(staff_member.user.email, [(a.appointment_request.start_time, a.get_service_name(),
+                                                 a.client.email) for a in appointments])
+                     for staff_member, appointments in agendas]
+        self.assertEqual(len(queries), 1)
+        self.assertEqual([staff_member for staff_member, _appointments in agendas],
+                         [self.staff_member1, self.staff_member2])
+        self.assertEqual([start_time for start_time, _service, _client in names[0][1]],
+                         [datetime.time(9, 0), datetime.time(14, 0)])
+
+    def test_one_email_per_staff_member_in_one_batch(self):
+        with patch('appointment.utils.email_ops.send_emails') as mock_send_emails:
+            result = send_staff_agenda_digests()
+        self.assertEqual((result['staff_members'], result['appointments']), (2, 3))
+        mock_send_emails.assert_called_once()
+        emails = mock_send_emails.call_args.args[0]
+        self.assertEqual([email['recipient_list'] for email in emails],
+                         [[self.users['staff1'].email], [self.users['staff2'].email]])
+
+    def test_email_lists_the_appointments(self):
+        send_staff_agenda_digests()
+        self.assertEqual(len(mail.outbox), 2)
+        body = mail.outbox[0].body
+        self.assertIn(self.service1.name, body)
+        self.assertIn("09:00", body)
+
+    def test_dry_run_and_empty_day(self):
+        self.assertEqual(send_staff_agenda_digests(dry_run=True)['staff_members'], 2)
+        self.assertEqual(send_staff_agenda_digests(self.tomorrow + datetime.timedelta(days=5))['staff_members'], 0)
+        self.assertEqual(mail.outbox, [])
+
+    def test_command(self):
+        out = StringIO()
+        call_command('send_staff_agenda_digests', '--date', self.tomorrow.isoformat(), '--dry-run', stdout=out)
+        self.assertIn("Would e-mail 2 staff member(s) about 3 appointment(s)", out.getvalue())
+
+
+@override_settings(ADMINS=[('Hammond', 'georges.hammond@django-appointment.com')], USE_DJANGO_Q_FOR_EMAILS=False)
+class AdminDigestTests(BaseTest):
+    def setUp(self):
+        super().setUp()
+        cache.delete(ADMIN_DIGEST_LAST_RUN_KEY)
+        self.appointment = self.create_appt_for_sm1()
+
+    @override_settings(APPOINTMENT_ADMIN_DIGEST_MINUTES=30)
+    @patch('appointment.utils.email_ops.send_emails')
+    def test_admins_are_not_notified_per_event(self, mock_send_emails):
+        notify_admin_about_appointment(self.appointment, "Jack")
+        emails = mock_send_emails.call_args.args[0]
+        self.assertEqual([email['recipient_list'] for email in emails], [[self.users['staff1'].email]])
+
+    @override_settings(APPOINTMENT_ADMIN_DIGEST_MINUTES=30)
+    def test_digest_covers_the_window_once(self):
+        reschedule = self.create_appt_reschedule_for_sm1(self.create_appt_request_for_sm1(
+                date_=timezone.localdate() + datetime.timedelta(days=3)))
+        self.create_appt_for_sm1(reschedule.appointment_request)
+        reschedule.reschedule_status = 'confirmed'
+        reschedule.save()
+
+        result = send_admin_digest()
+        self.assertEqual((result['new_appointments'], result['reschedules']), (2, 1))
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['georges.hammond@django-appointment.com'])
+
+        # The next run starts where this one ended.
+        result = send_admin_digest()
+        self.assertEqual((result['new_appointments'], result['reschedules']), (0, 0))
+        self.assertEqual(len(mail.outbox), 1)
@@ -3,13 +3,15 @@ from datetime import datetime
 from unittest import mock
 from unittest.mock import MagicMock, patch
 
+from django.test import override_settings
 from django.test.client import RequestFactory
 from django.utils import timezone
 from django.utils.translation import gettext as _
 
 from appointment.messages_ import thank_you_no_payment, thank_you_payment, thank_you_payment_plus_down
-from appointment.models import AppointmentRescheduleHistory
+from appointment.models import AppointmentRescheduleHistory, Config
 from appointment.tests.base.base_test import BaseTest
+from appointment.utils.db_helpers import get_website_name
 from appointment.utils.email_ops import (
     get_thank_you_message, notify_admin_about_appointment, notify_admin_about_reschedule,
     send_reschedule_confirmation_email,
@@ -91,6 +93,22 @@ class GetThankYouMessageTests(BaseTest):
             self.assertIn(str(thank_you_payment), message)
 
 
+class SendThankYouEmailTests(BaseTest):
+    @patch('appointment.utils.email_ops.generate_ics_file', return_value=b'ICS')
+    @patch('appointment.utils.email_ops.send_emails')
+    def test_thank_you_is_sent_as_a_batch(self, mock_send_emails, mock_ics):
+        appointment = self.create_appt_for_sm1()
+        send_thank_you_email(appointment.appointment_request, appointment.client, RequestFactory().get('/'),
+                             appointment.client.email)
+
+        mock_send_emails.assert_called_once()
+        [email] = mock_send_emails.call_args.args[0]
+        self.assertEqual(email['recipient_list'], [appointment.client.email])
+        self.assertEqual(email['attachments'], [('appointment.ics', b'ICS', 'text/calendar')])
+        self.assertTrue(email['html_message'])
+        mock_ics.assert_called_once()
+
+
 class SendVerificationEmailTests(BaseTest):
     def setUp(self):
         super().setUp()
@@ -145,3 +163,54 @@ class SendRescheduleConfirmationEmailTests(BaseTest):
         self.assertIn('reschedule_date', call_kwargs['context'])
         self.assertIn('confirmation_link', call_kwargs['context'])
         self.assertEqual(call_kwargs['context']['confirmation_link'], "http://gateroomserver/confirmation_link")
+
+
+@override_settings(ADMINS=[('Hammond', 'georges.hammond@django-appointment.com')])
+class NotifyAdminTests(BaseTest):
+    def setUp(self):
+        super().setUp()
+        self.appointment = self.create_appt_for_sm1()
+        self.appointment_request = self.appointment.appointment_request
+        self.reschedule_history = AppointmentRescheduleHistory.objects.create(
+                appointment_request=self.appointment_request,
+                date=self.appointment_request.date + timezone.timedelta(days=1),
+                start_time=self.appointment_request.start_time,
+                end_time=self.appointment_request.end_time,
+                staff_member=self.staff_member1,
+                reason_for_rescheduling="Off-world mission"
+        )
+
+    @patch('appointment.utils.email_ops.generate_ics_file', return_value=b'ICS')
+    @patch('appointment.utils.email_ops.render_email_template', return_value="<p>Rescheduled</p>")
+    @patch('appointment.utils.email_ops.send_emails')
+    def test_reschedule_is_rendered_once_for_admins_and_staff(self, mock_send_emails, mock_render, mock_ics):
+        notify_admin_about_reschedule(self.reschedule_history, self.appointment_request, "Jack O'Neill")
+
+        mock_send_emails.assert_called_once()
+        emails = mock_send_emails.call_args.args[0]
+        self.assertEqual([email['recipient_list'] for email in emails],
+                         [['georges.hammond@django-appointment.com'], [self.users['staff1'].email]])
+        self.assertEqual({email['html_message'] for email in emails}, {"<p>Rescheduled</p>"})
+        self.assertEqual(emails[0]['attachments'], [('appointment.ics', b'ICS', 'text/calendar')])
+        mock_render.assert_called_once()
+        mock_ics.assert_called_once()
+
+    @patch('appointment.utils.email_ops.generate_ics_file', return_value=b'ICS')
+    @patch('appointment.utils.email_ops.send_emails')
+    def test_new_appointment_is_sent_as_one_batch(self, mock_send_emails, mock_ics):
+        notify_admin_about_appointment(self.appointment, "Jack")
+
+        mock_send_emails.assert_called_once()
+        emails = mock_send_emails.call_args.args[0]
+        self.assertEqual([email['recipient_list'] for email in emails],
+                         [['georges.hammond@django-appointment.com'], [self.users['staff1'].email]])
+        # Only the staff member gets the calendar file.
+        self.assertEqual([email['attachments'] for email in emails],
+                         [None, [('appointment.ics', b'ICS', 'text/calendar')]])
+        mock_ics.assert_called_once()
+
+    def test_website_name_is_read_once(self):
+        Config.objects.create(website_name="Stargate Command")
+        self.assertEqual(get_website_name(), "Stargate Command")
+        with self.assertNumQueries(0):
+            self.assertEqual(get_website_name(), "Stargate Command")
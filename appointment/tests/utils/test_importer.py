@@ -0,0 +1,165 @@
+# test_importer.py
+# Path: appointment/tests/utils/test_importer.py
+
+import csv
+import datetime
+import os
+import tempfile
+from io import StringIO
+from unittest.mock import patch
+
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from icalendar import Calendar, Event, vCalAddress
+
+from appointment.models import Appointment, AppointmentRequest
+from appointment.tests.base.base_test import BaseTest
+from appointment.utils.db_helpers import get_user_model
+from appointment.utils.importer import FIELDS, import_appointments, read_csv_rows, read_ics_rows
+
+
+class ImporterTestMixin:
+    def setUp(self):
+        super().setUp()
+        self.date = datetime.date.today() + datetime.timedelta(days=10)
+        self.staff_email = self.users['staff1'].email
+
+    def row(self, start_time, end_time='', **fields):
+        return {'date': self.date.isoformat(), 'start_time': start_time, 'end_time': end_time,
+                'service': self.service1.name, 'staff_member': self.staff_email,
+                'client_email': 'new.client@example.com', 'client_name': "Vala Mal Doran", **fields}
+
+    def csv_text(self, rows):
+        out = StringIO()
+        writer = csv.DictWriter(out, fieldnames=FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+        return out.getvalue()
+
+    def run_import(self, rows, **kwargs):
+        rejects = []
+        result = import_appointments(read_csv_rows(StringIO(self.csv_text(rows))),
+                                     on_reject=lambda source, row, reason: rejects.append((source, reason)), **kwargs)
+        return result, rejects
+
+
+class ImportAppointmentsTests(ImporterTestMixin, BaseTest):
+    def test_rows_are_imported(self):
+        result, rejects = self.run_import([self.row('09:00', paid='yes', phone='+12392340543'),
+                                           self.row('13:00', '13:30', client_email=self.users['client1'].email)])
+        self.assertEqual((result['imported'], result['rejected'], result['clients_created']), (2, 0, 1))
+        self.assertEqual(rejects, [])
+        appointment = Appointment.objects.get(client__email='new.client@example.com')
+        request = appointment.appointment_request
+        self.assertEqual((request.start_time, request.end_time), (datetime.time(9, 0), datetime.time(10, 0)))
+        self.assertIsNotNone(request.start_at)
+        self.assertTrue(appointment.paid)
+        self.assertEqual(appointment.amount_to_pay, self.service1.price)
+        self.assertEqual(appointment.client.first_name, "Vala")
+        self.assertTrue(Appointment.objects.filter(client=self.users['client1']).exists())
+
+    def test_overlaps_with_existing_and_incoming_rows_are_rejected(self):
+        self.create_appt_for_sm1(self.create_appt_request_for_sm1(date_=self.date, start_time=datetime.time(9, 0),
+                                                                  end_time=datetime.time(10, 0)))
+        result, rejects = self.run_import([
+            self.row('14:00'),
+            self.row('09:30'),  # existing appointment
+            self.row('08:30'),  # ends in the existing appointment
+            self.row('14:30'),  # earlier row of the file
+            self.row('10:00'),  # right after the existing appointment
+        ])
+        self.assertEqual(result['imported'], 2)
+        self.assertEqual(sorted(source for source, _reason in rejects), [3, 4, 5])
+        self.assertEqual(sorted(AppointmentRequest.objects.filter(date=self.date).values_list('start_time', flat=True)),
+                         [datetime.time(9, 0), datetime.time(10, 0), datetime.time(14, 0)])
+
+    def test_gap_time_is_respected(self):
+        self.staff_member1.slot_gap_time = 15
+        self.staff_member1.save()
+        result, rejects = self.run_import([self.row('09:00'), self.row('10:00'), self.row('10:15', '10:45')])
+        self.assertEqual(result['imported'], 2)
+        self.assertEqual([source for source, _reason in rejects], [3])
+
+    def test_unresolved_rows_are_rejected(self):
+        result, rejects = self.run_import([
+            self.row('09:00', service="Unknown"),
+            self.row('09:00', staff_member='nobody@example.com'),
+            self.row('09:00', service=self.service2.name),
+            self.row('09:00', date='tomorrow'),
+            self.row('09:00', client_email=''),
+        ])
+        self.assertEqual((result['imported'], result['rejected']), (0, 5))
+        self.assertIn("does not offer", rejects[2][1])
+
+    def test_queries_do_not_grow_with_the_rows(self):
+        def count(rows):
+            with CaptureQueriesContext(connection) as queries:
+                self.run_import(rows)
+            return len(queries)
+
+        few = count([self.row('09:00', client_email='info@example.com')])
+        many = count([self.row(f'{hour}:00', client_email=f'info@{hour}.example.com', date='2030-01-02')
+                      for hour in range(9, 17)])
+        self.assertEqual(few, many)
+
+    def test_dry_run(self):
+        result, _rejects = self.run_import([self.row('09:00')], dry_run=True)
+        self.assertEqual((result['imported'], result['clients_created']), (1, 1))
+        self.assertFalse(AppointmentRequest.objects.exists())
+        self.assertFalse(get_user_model().objects.filter(email='new.client@example.com').exists())
+
+    @patch('appointment.utils.importer.send_emails')
+    def test_notifications_are_sent_per_batch(self, mock_send_emails):
+        result, _rejects = self.run_import([self.row('09:00'), self.row('11:00'), self.row('13:00')], notify=True,
+                                           batch_size=2)
+        self.assertEqual(result['notified'], 3)
+        self.assertEqual([len(call.args[0]) for call in mock_send_emails.call_args_list], [2, 1])
+
+
+class ReadIcsRowsTests(ImporterTestMixin, BaseTest):
+    def ics_text(self, start, end=None):
+        calendar = Calendar()
+        event = Event()
+        event.add('uid', 'legacy-1')
+        event.add('summary', self.service1.name)
+        event.add('dtstart', start)
+        if end:
+            event.add('dtend', end)
+        event.add('organizer', f"MAILTO:{self.staff_email}")
+        attendee = vCalAddress("MAILTO:new.client@example.com")
+        attendee.params['cn'] = "Vala Mal Doran"
+        event.add('attendee', attendee)
+        calendar.add_component(event)
+        return calendar.to_ical().decode()
+
+    def test_event_is_read(self):
+        start = datetime.datetime.combine(self.date, datetime.time(9, 0))
+        rows = list(read_ics_rows(StringIO(self.ics_text(start, start + datetime.timedelta(minutes=30)))))
+        self.assertEqual(rows, [('legacy-1', {
+            'date': self.date.isoformat(), 'start_time': '09:00', 'end_time': '09:30', 'service': self.service1.name,
+            'staff_member': self.staff_email, 'client_email': 'new.client@example.com',
+            'client_name': "Vala Mal Doran", 'address': '', 'additional_info': ''})])
+        result = import_appointments(rows)
+        self.assertEqual(result['imported'], 1)
+
+    def test_all_day_event_is_rejected(self):
+        rejects = []
+        result = import_appointments(read_ics_rows(StringIO(self.ics_text(self.date))),
+                                     on_reject=lambda source, row, reason: rejects.append(reason))
+        self.assertEqual(result['rejected'], 1)
+        self.assertIn("All-day", rejects[0])
+
+
+class ImportAppointmentsCommandTests(ImporterTestMixin, BaseTest):
+    def test_rejects_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            source, rejects = os.path.join(directory, 'in.csv'), os.path.join(directory, 'rejects.csv')
+            with open(source, 'w', newline='') as f:
+                f.write(self.csv_text([self.row('09:00'), self.row('09:30')]))
+            out = StringIO()
+            call_command('import_appointments', source, '--rejects', rejects, stdout=out)
+            with open(rejects, newline='') as f:
+                lines = list(csv.DictReader(f))
+        self.assertIn("1 of 2 rows", out.getvalue())
+        self.assertEqual([(line['source'], line['start_time']) for line in lines], [('3', '09:30')])
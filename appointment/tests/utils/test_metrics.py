@@ -0,0 +1,135 @@
+# test_metrics.py
+# Path: appointment/tests/utils/test_metrics.py
+
+import datetime
+from unittest.mock import patch
+
+from django.core import mail
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from appointment.email_sender.email_sender import send_email, send_emails
+from appointment.models import WorkingHours
+from appointment.services import get_available_slots_for_staff
+from appointment.tests.base.base_test import BaseTest
+from appointment.utils.metrics import Counter, Histogram, REGISTRY, render_metrics
+
+
+def sample(name, labels=''):
+    """Return the value of a series in the rendered metrics."""
+    series = f"{name}{{{labels}}}" if labels else name
+    for line in render_metrics().splitlines():
+        if line.startswith(f"{series} "):
+            return float(line.split(' ')[1])
+    raise AssertionError(f"{series} not found")
+
+
+@override_settings(APPOINTMENT_METRICS_ENABLED=True)
+class MetricsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.counter = Counter('test_events_total', "Events.", {'result': ('ok', 'error')})
+        self.histogram = Histogram('test_duration_seconds', "Durations.", (0.1, 1))
+
+    def tearDown(self):
+        REGISTRY.remove(self.counter)
+        REGISTRY.remove(self.histogram)
+
+    def test_counter(self):
+        self.counter.inc(result='ok')
+        self.counter.inc(2, result='ok')
+        self.assertEqual(sample('test_events_total', 'result="ok"'), 3)
+        self.assertEqual(sample('test_events_total', 'result="error"'), 0)
+
+    def test_histogram_buckets_are_cumulative(self):
+        for value in (0.05, 0.5, 0.7, 3):
+            self.histogram.observe(value)
+        self.assertEqual(sample('test_duration_seconds_bucket', 'le="0.1"'), 1)
+        self.assertEqual(sample('test_duration_seconds_bucket', 'le="1"'), 3)
+        self.assertEqual(sample('test_duration_seconds_bucket', 'le="+Inf"'), 4)
+        self.assertEqual(sample('test_duration_seconds_count'), 4)
+        self.assertAlmostEqual(sample('test_duration_seconds_sum'), 4.25)
+
+    def test_undeclared_label_value_is_refused(self):
+        with self.assertRaises(ValueError):
+            self.counter.inc(result='unknown')
+        with self.assertRaises(ValueError):
+            self.counter.inc()
+
+    def test_help_and_type_lines(self):
+        text = render_metrics()
+        self.assertIn("# HELP test_events_total Events.\n# TYPE test_events_total counter\n", text)
+        self.assertIn("# TYPE test_duration_seconds histogram\n", text)
+
+    @override_settings(APPOINTMENT_METRICS_ENABLED=False)
+    def test_disabled_metrics_are_not_recorded(self):
+        self.counter.inc(result='ok')
+        self.histogram.observe(0.5)
+        self.assertEqual(cache.get_many(self.counter.keys() + self.histogram.keys()), {})
+
+
+@override_settings(APPOINTMENT_METRICS_ENABLED=True)
+class InstrumentationTests(BaseTest):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    def test_slot_computation_is_measured(self):
+        date = datetime.date.today() + datetime.timedelta(days=7)
+        WorkingHours.objects.create(staff_member=self.staff_member1, day_of_week=(date.weekday() + 1) % 7,
+                                    start_time=datetime.time(9, 0), end_time=datetime.time(12, 0))
+        slots = get_available_slots_for_staff(date, self.staff_member1, (date.weekday() + 1) % 7)
+        self.assertEqual(sample('appointment_slot_computation_seconds_count'), 1)
+        self.assertEqual(sample('appointment_slots_returned_sum'), len(slots))
+
+    @override_settings(USE_DJANGO_Q_FOR_EMAILS=False)
+    @patch('appointment.email_sender.email_sender.has_required_email_settings', return_value=True)
+    def test_emails_sent_and_failed(self, _):
+        with patch('appointment.email_sender.email_sender.send_mail'):
+            send_email(['client@example.com'], "Subject", message="Hello")
+        with patch('appointment.email_sender.email_sender.send_mail', side_effect=OSError("refused")):
+            send_email(['client@example.com'], "Subject", message="Hello")
+        self.assertEqual(sample('appointment_emails_total', 'function="send_email",result="sent"'), 1)
+        self.assertEqual(sample('appointment_emails_total', 'function="send_email",result="failed"'), 1)
+        self.assertEqual(sample('appointment_smtp_seconds_count', 'function="send_email"'), 2)
+
+    @override_settings(USE_DJANGO_Q_FOR_EMAILS=False)
+    @patch('appointment.email_sender.email_sender.has_required_email_settings', return_value=True)
+    def test_batch_uses_one_connection(self, _):
+        emails = [{'recipient_list': [f'client{i}@example.com'], 'subject': "Subject", 'message': "Hello"}
+                  for i in range(3)]
+        send_emails(emails)
+        self.assertEqual([message.to for message in mail.outbox], [[email['recipient_list'][0]] for email in emails])
+        self.assertEqual(sample('appointment_emails_total', 'function="send_emails",result="sent"'), 3)
+        self.assertEqual(sample('appointment_smtp_seconds_count', 'function="send_emails"'), 1)
+
+
+@override_settings(APPOINTMENT_METRICS_ENABLED=True, APPOINTMENT_METRICS_TOKEN='s3cret')
+class MetricsViewTests(BaseTest):
+    def setUp(self):
+        super().setUp()
+        self.url = reverse('appointment:metrics')
+
+    def test_scraper_with_token(self):
+        response = self.client.get(self.url, HTTP_AUTHORIZATION='Bearer s3cret')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        self.assertIn(b"# TYPE appointment_bookings_total counter", response.content)
+
+    def test_wrong_token_is_refused(self):
+        response = self.client.get(self.url, HTTP_AUTHORIZATION='Bearer nope')
+        self.assertEqual(response.status_code, 403)
+
+    def test_superuser_session(self):
+        self.need_superuser_login()
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+
+    def test_staff_member_is_refused(self):
+        self.need_staff_login()
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+    @override_settings(APPOINTMENT_METRICS_ENABLED=False)
+    def test_disabled(self):
+        response = self.client.get(self.url, HTTP_AUTHORIZATION='Bearer s3cret')
+        self.assertEqual(response.status_code, 404)
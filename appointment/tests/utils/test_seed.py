@@ -0,0 +1,97 @@
+# test_seed.py
+# Path: appointment/tests/utils/test_seed.py
+
+import datetime
+from io import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+
+from appointment.models import (
+    Appointment, AppointmentRequest, AppointmentRescheduleHistory, DayOff, StaffMember, WorkingHours
+)
+from appointment.utils.db_helpers import get_weekday_num_from_date
+from appointment.utils.seed import seed_appointments
+
+
+class SeedAppointmentsTests(TestCase):
+
+    def setUp(self):
+        self.start_date = datetime.date.today() + datetime.timedelta(days=1)
+        self.result = seed_appointments(staff=6, services=4, clients=20, appointments_per_day=6, days=21,
+                                        start_date=self.start_date, days_off_ratio=0.5, reschedule_ratio=0.2)
+
+    def test_counts_match_database(self):
+        counts = self.result['counts']
+        self.assertEqual(StaffMember.objects.count(), 6)
+        self.assertEqual(WorkingHours.objects.count(), counts['working_hours'])
+        self.assertEqual(DayOff.objects.count(), counts['days_off'])
+        self.assertEqual(AppointmentRequest.objects.count(), counts['appointment_requests'])
+        self.assertEqual(Appointment.objects.count(), counts['appointments'])
+        self.assertEqual(AppointmentRescheduleHistory.objects.count(), counts['reschedule_histories'])
+        self.assertEqual(AppointmentRequest.objects.filter(reschedule_attempts=1).count(),
+                         counts['reschedule_histories'])
+        self.assertGreater(counts['appointments'], 0)
+        self.assertEqual(self.result['end_date'], self.start_date + datetime.timedelta(days=20))
+
+    def test_appointments_are_consistent(self):
+        working_hours = {(wh.staff_member_id, wh.day_of_week): wh for wh in WorkingHours.objects.all()}
+        days_off = list(DayOff.objects.all())
+        previous = {}
+        for ar in AppointmentRequest.objects.select_related('service', 'staff_member').order_by(
+                'staff_member_id', 'date', 'start_time'):
+            wh = working_hours.get((ar.staff_member_id, get_weekday_num_from_date(ar.date)))
+            self.assertIsNotNone(wh)
+            self.assertTrue(wh.start_time <= ar.start_time and ar.end_time <= wh.end_time)
+            self.assertFalse(any(d.staff_member_id == ar.staff_member_id and d.start_date <= ar.date <= d.end_date
+                                 for d in days_off))
+            start = datetime.datetime.combine(ar.date, ar.start_time)
+            self.assertEqual(datetime.datetime.combine(ar.date, ar.end_time) - start, ar.service.duration)
+            self.assertTrue(ar.staff_member.get_service_is_offered(ar.service_id))
+            last_end = previous.get((ar.staff_member_id, ar.date))
+            if last_end is not None:
+                gap = datetime.timedelta(minutes=ar.staff_member.slot_gap_time or 0)
+                self.assertGreaterEqual(start, last_end + gap)
+            previous[(ar.staff_member_id, ar.date)] = datetime.datetime.combine(ar.date, ar.end_time)
+
+    def test_amount_to_pay_follows_payment_type(self):
+        for appointment in Appointment.objects.select_related('appointment_request__service'):
+            service = appointment.appointment_request.service
+            expected = service.down_payment if appointment.appointment_request.payment_type == 'down' \
+                else service.price
+            self.assertEqual(appointment.amount_to_pay, expected)
+
+    def test_same_seed_gives_same_schedule(self):
+        def schedule(prefix):
+            return list(AppointmentRequest.objects.filter(staff_member__user__email__startswith=prefix).order_by(
+                    'staff_member__user__last_name', 'date', 'start_time').values_list(
+                    'staff_member__user__last_name', 'date', 'start_time', 'end_time'))
+
+        seed_appointments(staff=6, services=4, clients=20, appointments_per_day=6, days=21,
+                          start_date=self.start_date, days_off_ratio=0.5, reschedule_ratio=0.2, prefix='again')
+        self.assertEqual(schedule('seed.'), schedule('again.'))
+
+    def test_appointments_target_is_met_exactly(self):
+        result = seed_appointments(staff=3, services=2, clients=5, appointments_per_day=4, appointments=100,
+                                   start_date=self.start_date, prefix='target')
+        self.assertEqual(result['counts']['appointments'], 100)
+        self.assertEqual(result['end_date'], AppointmentRequest.objects.filter(
+                staff_member__user__email__startswith='target.').latest('date').date)
+        per_staff = Appointment.objects.filter(client__email__startswith='target.').values_list(
+                'appointment_request__staff_member', flat=True)
+        self.assertEqual(sorted(list(per_staff).count(staff_id) for staff_id in set(per_staff)), [33, 33, 34])
+
+
+class SeedAppointmentsCommandTests(TestCase):
+
+    def test_command_reports_counts(self):
+        out = StringIO()
+        call_command('seed_appointments', '--staff', '3', '--days', '7', '--clients', '10', stdout=out)
+        self.assertIn("appointments: ", out.getvalue())
+        self.assertEqual(StaffMember.objects.count(), 3)
+
+    def test_existing_prefix_is_refused(self):
+        call_command('seed_appointments', '--staff', '1', '--days', '1', '--clients', '1', stdout=StringIO())
+        with self.assertRaises(CommandError):
+            call_command('seed_appointments', '--staff', '1', '--days', '1', '--clients', '1', stdout=StringIO())
@@ -0,0 +1,84 @@
+# test_single_flight.py
+# Path: appointment/tests/utils/test_single_flight.py
+
+import threading
+import time
+from unittest.mock import patch
+
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.test import SimpleTestCase
+
+from appointment.utils.single_flight import CachedValue, aget_or_compute, get_or_compute
+
+
+class SingleFlightTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.calls = 0
+        self.calls_lock = threading.Lock()
+
+    def compute(self, value='fresh', delay=0.0):
+        def compute():
+            with self.calls_lock:
+                self.calls += 1
+            time.sleep(delay)
+            return value
+        return compute
+
+    def test_value_is_cached(self):
+        self.assertEqual(get_or_compute('key', self.compute(), 60, 'slots'), 'fresh')
+        self.assertEqual(get_or_compute('key', self.compute('other'), 60, 'slots'), 'fresh')
+        self.assertEqual(self.calls, 1)
+
+    def test_concurrent_misses_compute_once(self):
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(
+                get_or_compute('key', self.compute(delay=0.2), 60, 'slots'))) for _ in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, ['fresh'] * 20)
+        self.assertEqual(self.calls, 1)
+
+    def test_stale_value_is_served_while_another_worker_recomputes(self):
+        cache.set('key', CachedValue('stale', time.time() - 1, 0.1), 60)
+        cache.add('key:lock', 1, 10)
+        self.assertEqual(get_or_compute('key', self.compute(), 60, 'slots'), 'stale')
+        self.assertEqual(self.calls, 0)
+
+    def test_expired_value_is_recomputed(self):
+        cache.set('key', CachedValue('stale', time.time() - 1, 0.1), 60)
+        self.assertEqual(get_or_compute('key', self.compute(), 60, 'slots'), 'fresh')
+        self.assertIsNone(cache.get('key:lock'))
+
+    def test_value_is_refreshed_early_near_expiry(self):
+        cache.set('key', CachedValue('old', time.time() + 0.5, 1.0), 60)
+        # -log(1 - 0.99) is about 4.6 compute times: past the expiry
+        with patch('appointment.utils.single_flight.random.random', return_value=0.99):
+            self.assertEqual(get_or_compute('key', self.compute(), 60, 'slots'), 'fresh')
+        with patch('appointment.utils.single_flight.random.random', return_value=0.0):
+            self.assertEqual(get_or_compute('key', self.compute('newer'), 60, 'slots'), 'fresh')
+
+    @patch('appointment.utils.single_flight.WAIT_TIMEOUT', 0.1)
+    def test_waiting_ends_with_a_computation(self):
+        cache.add('key:lock', 1, 10)
+        self.assertEqual(get_or_compute('key', self.compute(), 60, 'slots'), 'fresh')
+        self.assertEqual(self.calls, 1)
+
+    def test_plain_values_and_disabled_cache(self):
+        cache.set('key', 'plain')
+        self.assertEqual(get_or_compute('key', self.compute(), 60, 'config'), 'plain')
+        self.assertEqual(get_or_compute('other', self.compute(), 0, 'slots'), 'fresh')
+        self.assertIsNone(cache.get('other'))
+
+    def test_async_version(self):
+        async def compute():
+            self.calls += 1
+            return 'fresh'
+
+        self.assertEqual(async_to_sync(aget_or_compute)('key', compute, 60, 'slots'), 'fresh')
+        self.assertEqual(async_to_sync(aget_or_compute)('key', compute, 60, 'slots'), 'fresh')
+        self.assertEqual(self.calls, 1)
+        self.assertIsNone(cache.get('key:lock'))
@@ -8,22 +8,39 @@ Since: 1.0.0
 
 from django.urls import include, path
 
+from appointment.settings import APPOINTMENT_ASYNC_AVAILABILITY_VIEWS
 from appointment.views import (
-    appointment_client_information, appointment_request, appointment_request_submit, confirm_reschedule,
-    default_thank_you, enter_verification_code, get_available_slots_ajax, get_next_available_date_ajax,
-    get_non_working_days_ajax, prepare_reschedule_appointment, reschedule_appointment_submit, set_passwd
+    aget_availability_versions_ajax, aget_available_slots_ajax, aget_next_available_date_ajax,
+    aget_non_working_days_ajax, appointment_client_information, appointment_request, appointment_request_submit,
+    confirm_reschedule, default_thank_you, enter_verification_code, get_availability_versions_ajax,
+    get_available_slots_ajax, get_next_available_date_ajax, get_non_working_days_ajax, prepare_reschedule_appointment,
+    reschedule_appointment_submit, set_passwd
 )
 from appointment.views_admin import (
     add_day_off, add_or_update_service, add_or_update_staff_info, add_staff_member_info, add_working_hours,
-    create_new_staff_member, delete_appointment, delete_appointment_ajax, delete_day_off, delete_service,
-    delete_working_hours, display_appointment, email_change_verification_code, fetch_service_list_for_staff,
-    fetch_staff_list, get_service_list, get_user_appointments, is_user_staff_admin, make_superuser_staff_member,
-    remove_staff_member, remove_superuser_staff_member, update_appt_date_time, update_appt_min_info, update_day_off,
+    bulk_appointment_operations, create_new_staff_member, delete_appointment, delete_appointment_ajax,
+    delete_day_off, delete_service, delete_working_hours, display_appointment, email_change_verification_code,
+    fetch_appointment_history, fetch_availability_heatmap, fetch_service_list_for_staff, fetch_staff_list,
+    get_availability_report, get_metrics, get_profiler_report, get_service_list, get_user_appointments,
+    is_user_staff_admin, make_superuser_staff_member, move_appointment, remove_staff_member,
+    remove_superuser_staff_member, update_appt_date_time, update_appt_min_info, update_day_off,
     update_personal_info, update_working_hours, user_profile, validate_appointment_date
 )
 
 app_name = 'appointment'
 
+# Under ASGI, the async variants do not hold a thread while waiting on the database or the cache.
+if APPOINTMENT_ASYNC_AVAILABILITY_VIEWS:
+    available_slots_view = aget_available_slots_ajax
+    availability_versions_view = aget_availability_versions_ajax
+    next_available_date_view = aget_next_available_date_ajax
+    non_working_days_view = aget_non_working_days_ajax
+else:
+    available_slots_view = get_available_slots_ajax
+    availability_versions_view = get_availability_versions_ajax
+    next_available_date_view = get_next_available_date_ajax
+    non_working_days_view = get_non_working_days_ajax
+
 admin_urlpatterns = [
     # display the calendar with the events
     path('appointments/<str:response_type>/', get_user_appointments, name='get_user_event_type'),
@@ -80,21 +97,36 @@ admin_urlpatterns = [
 
     # delete appointment
     path('delete-appointment/<int:appointment_id>/', delete_appointment, name='delete_appointment'),
+
+    # free capacity per staff member and per day
+    path('availability-report/', get_availability_report, name='availability_report'),
+
+    # Prometheus metrics
+    path('metrics/', get_metrics, name='metrics'),
+
+    # requests recorded by the profiler middleware
+    path('profiler/', get_profiler_report, name='profiler_report'),
+    path('profiler/<str:response_type>/', get_profiler_report, name='profiler_report_type'),
 ]
 
 ajax_urlpatterns = [
-    path('available_slots/', get_available_slots_ajax, name='available_slots_ajax'),
-    path('request_next_available_slot/<int:service_id>/', get_next_available_date_ajax,
+    path('available_slots/', available_slots_view, name='available_slots_ajax'),
+    path('availability_versions/', availability_versions_view, name='availability_versions_ajax'),
+    path('request_next_available_slot/<int:service_id>/', next_available_date_view,
          name='request_next_available_slot'),
-    path('request_staff_info/', get_non_working_days_ajax, name='get_non_working_days_ajax'),
+    path('request_staff_info/', non_working_days_view, name='get_non_working_days_ajax'),
     path('fetch_service_list_for_staff/', fetch_service_list_for_staff, name='fetch_service_list_for_staff'),
     path('fetch_staff_list/', fetch_staff_list, name='fetch_staff_list'),
     path('update_appt_min_info/', update_appt_min_info, name="update_appt_min_info"),
     path('update_appt_date_time/', update_appt_date_time, name="update_appt_date_time"),
+    path('move_appointment/', move_appointment, name="move_appointment"),
+    path('bulk_appointment_operations/', bulk_appointment_operations, name="bulk_appointment_operations"),
     path('validate_appointment_date/', validate_appointment_date, name="validate_appointment_date"),
     # delete appointment ajax
     path('delete_appointment/', delete_appointment_ajax, name="delete_appointment_ajax"),
     path('is_user_staff_admin/', is_user_staff_admin, name="is_user_staff_admin"),
+    path('availability_heatmap/', fetch_availability_heatmap, name="availability_heatmap"),
+    path('appointment_history/', fetch_appointment_history, name="appointment_history"),
 ]
 
 urlpatterns = [
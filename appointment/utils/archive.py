@@ -0,0 +1,136 @@
+# archive.py
+# Path: appointment/utils/archive.py
+
+"""
+Author: Adams Pierre David
+Since: 3.11.0
+
+Hot/cold archival of past appointments.
+
+`archive_appointments` moves appointment requests dated before a cutoff, with their appointment and reschedule
+histories, to the `Archived*` tables, which have the same columns and keep the primary keys. It walks the requests
+by batches of primary keys; each batch is copied and deleted inside one transaction, so an interrupted run leaves
+every row either archived or untouched and can simply be restarted. Payment infos of archived appointments are
+deleted with them.
+
+Archived rows are not read by the booking paths; `get_appointment_history` reads them on request.
+"""
+
+import calendar
+import datetime
+import time
+
+from django.db import transaction
+
+from appointment.models import (
+    Appointment, AppointmentRequest, AppointmentRescheduleHistory, ArchivedAppointment, ArchivedAppointmentRequest,
+    ArchivedAppointmentRescheduleHistory
+)
+from appointment.settings import APPOINTMENT_CLEANUP_BATCH_SIZE
+
+# Most appointments `get_appointment_history` returns at once
+HISTORY_LIMIT = 500
+
+
+def subtract_months(date: datetime.date, months: int) -> datetime.date:
+    """Return the same day `months` months earlier, clamped to the end of the month."""
+    year, month = divmod(date.year * 12 + date.month - 1 - months, 12)
+    return date.replace(year=year, month=month + 1, day=min(date.day, calendar.monthrange(year, month + 1)[1]))
+
+
+def _copy(obj, archive_model):
+    return archive_model(**{field.attname: getattr(obj, field.attname) for field in obj._meta.concrete_fields})
+
+
+def archive_appointments(before: datetime.date, batch_size: int = None, dry_run: bool = False, progress=None) -> dict:
+    """Move the appointment requests dated before the given date to the archive tables.
+
+    :param before: The first date kept in the hot tables.
+    :param batch_size: Appointment requests moved per transaction (defaults to APPOINTMENT_CLEANUP_BATCH_SIZE).
+    :param dry_run: Only count the appointment requests that would be moved.
+    :param progress: Optional callable receiving the running counts after each batch.
+    :return: The number of appointment requests, appointments and reschedule histories moved, the number of batches
+        and the elapsed seconds.
+    """
+    batch_size = batch_size or APPOINTMENT_CLEANUP_BATCH_SIZE
+    queryset = AppointmentRequest.objects.filter(date__lt=before)
+    counts = {'appointment_requests': 0, 'appointments': 0, 'reschedule_histories': 0, 'batches': 0}
+    started = time.perf_counter()
+    if dry_run:
+        counts['appointment_requests'] = queryset.count()
+        counts['appointments'] = Appointment.objects.filter(appointment_request__date__lt=before).count()
+        counts['reschedule_histories'] = AppointmentRescheduleHistory.objects.filter(
+                appointment_request__date__lt=before).count()
+        return {**counts, 'seconds': 0.0}
+
+    last_pk = None
+    while True:
+        page = queryset.order_by('pk') if last_pk is None else queryset.filter(pk__gt=last_pk).order_by('pk')
+        page_ids = list(page.values_list('pk', flat=True)[:batch_size])
+        if not page_ids:
+            break
+        last_pk = page_ids[-1]
+        with transaction.atomic():
+            requests = list(queryset.filter(pk__in=page_ids))
+            ids = [request.pk for request in requests]
+            appointments = list(Appointment.objects.filter(appointment_request_id__in=ids))
+            histories = list(AppointmentRescheduleHistory.objects.filter(appointment_request_id__in=ids))
+            ArchivedAppointmentRequest.objects.bulk_create([_copy(obj, ArchivedAppointmentRequest)
+                                                            for obj in requests])
+            ArchivedAppointment.objects.bulk_create([_copy(obj, ArchivedAppointment) for obj in appointments])
+            ArchivedAppointmentRescheduleHistory.objects.bulk_create(
+                    [_copy(obj, ArchivedAppointmentRescheduleHistory) for obj in histories])
+            # Cascades to the appointments, reschedule histories and payment infos.
+            AppointmentRequest.objects.filter(pk__in=ids).delete()
+        counts['appointment_requests'] += len(requests)
+        counts['appointments'] += len(appointments)
+        counts['reschedule_histories'] += len(histories)
+        counts['batches'] += 1
+        if progress:
+            progress(counts)
+        if len(page_ids) < batch_size:
+            break
+    return {**counts, 'seconds': round(time.perf_counter() - started, 3)}
+
+
+def _history_row(appointment, archived):
+    request = appointment.appointment_request
+    return {
+        'id': appointment.id,
+        'id_request': appointment.id_request,
+        'date': request.date,
+        'start_time': request.start_time,
+        'end_time': request.end_time,
+        'service': request.service.name if request.service else None,
+        'staff_member': request.staff_member.get_staff_member_name() if request.staff_member else None,
+        'client': appointment.client.email if appointment.client else None,
+        'paid': appointment.paid,
+        'amount_to_pay': appointment.amount_to_pay,
+        'archived': archived,
+    }
+
+
+def get_appointment_history(client=None, staff_member=None, include_archived: bool = False,
+                            limit: int = HISTORY_LIMIT) -> list:
+    """Return the most recent appointments of a client and/or a staff member, most recent first.
+
+    :param client: Optional user whose appointments are returned.
+    :param staff_member: Optional staff member whose appointments are returned.
+    :param include_archived: Also read the archive tables.
+    :param limit: The maximum number of appointments returned.
+    :return: A list of dictionaries, with `archived` telling which table each appointment comes from.
+    """
+    related = ('client', 'appointment_request__service', 'appointment_request__staff_member__user')
+    sources = [(Appointment.objects.select_related(*related), False)]
+    if include_archived:
+        sources.append((ArchivedAppointment.objects.select_related(*related), True))
+
+    rows = []
+    for queryset, archived in sources:
+        if client is not None:
+            queryset = queryset.filter(client=client)
+        if staff_member is not None:
+            queryset = queryset.filter(appointment_request__staff_member=staff_member)
+        queryset = queryset.order_by('-appointment_request__date', '-appointment_request__start_time', '-id')
+        rows += [_history_row(appointment, archived) for appointment in queryset[:limit]]
+    return sorted(rows, key=lambda row: (row['date'], row['start_time']), reverse=True)[:limit]
@@ -0,0 +1,464 @@
+# availability.py
+# Path: appointment/utils/availability.py
+
+"""
+Author: Adams Pierre David
+Since: 3.11.0
+
+Batch availability engine.
+
+`get_available_slots_for_staff` answers one (staff member, day) question at a time and issues several queries to do
+so. The helpers below load the schedules, days off, appointments and pending reschedules of a whole staff set over a
+date range with a handful of queries, then answer the same question for every (staff member, day) pair from memory.
+
+Two engines share the loaded data:
+
+- a pure Python engine, which replays the scalar slot pipeline step by step and is always available;
+- a NumPy engine, used when NumPy is installed, which builds a (staff × day × minute) occupancy array and derives
+  free-slot counts, utilization and first-free times with vectorized operations. It works at minute resolution,
+  which is the resolution of the working hours and appointment times entered through the app.
+"""
+
+import datetime
+from collections import defaultdict
+
+from django.apps import apps
+from django.core.exceptions import ImproperlyConfigured
+from django.utils import timezone
+
+from appointment.logger_config import get_logger
+from appointment.settings import APPOINTMENT_BUFFER_TIME, APPOINTMENT_SLOT_DURATION
+from appointment.utils.date_time import get_weekday_num
+from appointment.utils.db_helpers import calculate_slots, get_config
+
+logger = get_logger(__name__)
+
+try:
+    import numpy as np
+
+    NUMPY_AVAILABLE = True
+except ImportError:
+    np = None
+    NUMPY_AVAILABLE = False
+
+Appointment = apps.get_model('appointment', 'Appointment')
+AppointmentRescheduleHistory = apps.get_model('appointment', 'AppointmentRescheduleHistory')
+DayOff = apps.get_model('appointment', 'DayOff')
+StaffMember = apps.get_model('appointment', 'StaffMember')
+WorkingHours = apps.get_model('appointment', 'WorkingHours')
+
+MINUTES_PER_DAY = 24 * 60
+# Same window as `exclude_pending_reschedules`.
+PENDING_RESCHEDULE_WINDOW = datetime.timedelta(minutes=5)
+ENGINES = ('auto', 'numpy', 'python')
+# Cells of the (staff × day × minute) arrays built at once by the NumPy engine: about 32 MB per float64 array.
+NUMPY_CHUNK_CELLS = 4 * 1024 * 1024
+
+
+class AvailabilitySnapshot:
+    """Everything the slot pipeline needs for a set of staff members over a date range, loaded in bulk."""
+
+    def __init__(self, staff_members, start_date, end_date, config=None):
+        self.staff_members = list(staff_members)
+        self.start_date = start_date
+        self.end_date = end_date
+        self.config = config
+        # {staff_member_id: {day_of_week: (start_time, end_time)}}
+        self.working_hours = defaultdict(dict)
+        # {staff_member_id: [(start_date, end_date), ...]}
+        self.days_off = defaultdict(list)
+        # {(staff_member_id, date): [(start_time, end_time), ...]}
+        self.appointments = defaultdict(list)
+        # {(staff_member_id, date): [(start_time, end_time), ...]}
+        self.pending_reschedules = defaultdict(list)
+        # {(staff_member_id, date): when the first of its pending reschedules stops holding its slot}
+        self.pending_reschedules_expiry = {}
+
+    def dates(self):
+        """Return every date of the snapshot's range, bounds included."""
+        days = (self.end_date - self.start_date).days + 1
+        return [self.start_date + datetime.timedelta(days=offset) for offset in range(max(days, 0))]
+
+    def is_day_off(self, staff_member_id, date) -> bool:
+        return any(start <= date <= end for start, end in self.days_off.get(staff_member_id, ()))
+
+
+def load_availability_snapshot(staff_members, start_date, end_date):
+    """Load schedules, days off, appointments and pending reschedules for the given staff set and date range.
+
+    Four queries are issued whatever the size of the staff set or of the range (plus one for the configuration
+    when it is not cached yet).
+
+    :param staff_members: An iterable of StaffMember instances.
+    :param start_date: The first date of the range.
+    :param end_date: The last date of the range (inclusive).
+    :return: An AvailabilitySnapshot.
+    """
+    snapshot = AvailabilitySnapshot(staff_members, start_date, end_date, config=get_config())
+    staff_ids = [staff_member.id for staff_member in snapshot.staff_members]
+    if not staff_ids:
+        return snapshot
+
+    working_hours = WorkingHours.objects.filter(staff_member_id__in=staff_ids).values_list(
+            'staff_member_id', 'day_of_week', 'start_time', 'end_time')
+    for staff_id, day_of_week, start_time, end_time in working_hours:
+        snapshot.working_hours[staff_id][day_of_week] = (start_time, end_time)
+
+    days_off = DayOff.objects.filter(
+            staff_member_id__in=staff_ids, start_date__lte=end_date, end_date__gte=start_date
+    ).values_list('staff_member_id', 'start_date', 'end_date')
+    for staff_id, off_start, off_end in days_off:
+        snapshot.days_off[staff_id].append((off_start, off_end))
+
+    appointments = Appointment.objects.filter(
+            appointment_request__staff_member_id__in=staff_ids,
+            appointment_request__date__range=(start_date, end_date)
+    ).values_list('appointment_request__staff_member_id', 'appointment_request__date',
+                  'appointment_request__start_time', 'appointment_request__end_time')
+    for staff_id, date, start_time, end_time in appointments:
+        snapshot.appointments[(staff_id, date)].append((start_time, end_time))
+
+    reschedules = AppointmentRescheduleHistory.objects.filter(
+            appointment_request__staff_member_id__in=staff_ids,
+            date__range=(start_date, end_date),
+            reschedule_status='pending',
+            created_at__gte=timezone.now() - PENDING_RESCHEDULE_WINDOW
+    ).values_list('appointment_request__staff_member_id', 'date', 'start_time', 'end_time', 'created_at')
+    for staff_id, date, start_time, end_time, created_at in reschedules:
+        snapshot.pending_reschedules[(staff_id, date)].append((start_time, end_time))
+        expiry = created_at + PENDING_RESCHEDULE_WINDOW
+        snapshot.pending_reschedules_expiry[(staff_id, date)] = min(
+                expiry, snapshot.pending_reschedules_expiry.get((staff_id, date), expiry))
+
+    return snapshot
+
+
+def get_staff_day_parameters(snapshot, staff_member, date, service=None):
+    """Resolve the slot parameters of a staff member on a given date, the same way the scalar pipeline does.
+
+    :param snapshot: The AvailabilitySnapshot holding the staff member's data.
+    :param staff_member: The staff member.
+    :param date: The date.
+    :param service: Optional Service whose duration widens the overlap-check window.
+    :return: A dictionary of parameters, or None if the staff member does not work that day.
+    """
+    if snapshot.is_day_off(staff_member.id, date):
+        return None
+    day_of_week = get_weekday_num(date.strftime("%A"))
+    hours = snapshot.working_hours.get(staff_member.id, {}).get(day_of_week)
+    if not hours:
+        return None
+
+    config = snapshot.config
+    # Slot generation step and buffer (see `get_times_from_config` and `calculate_staff_slots`)
+    config_slot = config.slot_duration if config else APPOINTMENT_SLOT_DURATION
+    config_buffer = config.appointment_buffer_time if config else APPOINTMENT_BUFFER_TIME
+    step = staff_member.slot_duration or config_slot
+    buffer = staff_member.appointment_buffer_time or config_buffer
+
+    # Overlap-check window (see `StaffMember.get_slot_duration` and `get_available_slots_for_staff`)
+    check_duration = datetime.timedelta(minutes=staff_member.slot_duration or (config.slot_duration if config else 0))
+    if service is not None:
+        use_service_dur = (config.default_to_service_duration if config is not None else True) \
+                          or service.use_service_duration_as_slot
+        if use_service_dur:
+            check_duration = max(check_duration, service.duration)
+
+    if staff_member.slot_gap_time is not None:
+        gap = float(staff_member.slot_gap_time)
+    elif config and config.slot_gap_time is not None:
+        gap = float(config.slot_gap_time)
+    else:
+        gap = 0.0
+
+    return {
+        'start_time': hours[0],
+        'end_time': hours[1],
+        'step': step,
+        'buffer': buffer or 0,
+        'check_duration': check_duration,
+        'gap': gap,
+    }
+
+
+def _appointments_in_working_hours(snapshot, staff_member_id, date, params):
+    """Mirror of `get_appointments_for_date_and_time`."""
+    return [(start, end) for start, end in snapshot.appointments.get((staff_member_id, date), ())
+            if start <= params['end_time'] and end >= params['start_time']]
+
+
+def compute_staff_day_slots(snapshot, staff_member, date, service=None, params=None):
+    """Return the available slots of a staff member on a date, computed from the snapshot only.
+
+    The result is the same list of datetimes `get_available_slots_for_staff` returns.
+
+    :param snapshot: The AvailabilitySnapshot holding the staff member's data.
+    :param staff_member: The staff member.
+    :param date: The date.
+    :param service: Optional Service whose duration widens the overlap-check window.
+    :param params: Parameters already resolved by `get_staff_day_parameters`, if any.
+    :return: A list of datetime objects.
+    """
+    params = params or get_staff_day_parameters(snapshot, staff_member, date, service=service)
+    if not params or params['step'] <= 0:
+        return []
+
+    start = datetime.datetime.combine(date, params['start_time'])
+    end = datetime.datetime.combine(date, params['end_time'])
+    buffer_time = start + datetime.timedelta(minutes=params['buffer'])
+    slots = calculate_slots(start, end, buffer_time, datetime.timedelta(minutes=params['step']))
+
+    for rs_start, rs_end in snapshot.pending_reschedules.get((staff_member.id, date), ()):
+        rs_start = datetime.datetime.combine(date, rs_start)
+        rs_end = datetime.datetime.combine(date, rs_end)
+        slots = [slot for slot in slots if not (rs_start <= slot < rs_end)]
+
+    gap_delta = datetime.timedelta(minutes=params['gap'])
+    check_duration = params['check_duration']
+    booked = [(datetime.datetime.combine(date, a_start), datetime.datetime.combine(date, a_end))
+              for a_start, a_end in _appointments_in_working_hours(snapshot, staff_member.id, date, params)]
+    return [slot for slot in slots
+            if not any(a_start < slot + check_duration + gap_delta and slot < a_end + gap_delta
+                       for a_start, a_end in booked)]
+
+
+def _minutes(value) -> float:
+    """Return the number of minutes elapsed since midnight for a time object."""
+    return value.hour * 60 + value.minute + value.second / 60
+
+
+def _format_minutes(minutes):
+    if minutes is None:
+        return None
+    return f"{int(minutes) // 60:02d}:{int(minutes) % 60:02d}"
+
+
+def _summary_row(staff_member, date, free_slots, total_slots, booked_minutes, working_minutes, first_free):
+    return {
+        'staff_member_id': staff_member.id,
+        'date': date.isoformat(),
+        'is_working': working_minutes > 0,
+        'free_slots': int(free_slots),
+        'total_slots': int(total_slots),
+        'booked_minutes': int(round(booked_minutes)),
+        'working_minutes': int(round(working_minutes)),
+        'utilization': round(booked_minutes / working_minutes, 4) if working_minutes else 0.0,
+        'first_free': _format_minutes(first_free),
+    }
+
+
+def _python_report(snapshot, service=None):
+    rows = []
+    for staff_member in snapshot.staff_members:
+        for date in snapshot.dates():
+            params = get_staff_day_parameters(snapshot, staff_member, date, service=service)
+            if not params:
+                rows.append(_summary_row(staff_member, date, 0, 0, 0, 0, None))
+                continue
+            ws, we = _minutes(params['start_time']), _minutes(params['end_time'])
+            slots = compute_staff_day_slots(snapshot, staff_member, date, service=service, params=params)
+            total = 0
+            if params['step'] > 0:
+                start = datetime.datetime.combine(date, params['start_time'])
+                total = len(calculate_slots(start, datetime.datetime.combine(date, params['end_time']),
+                                            start + datetime.timedelta(minutes=params['buffer']),
+                                            datetime.timedelta(minutes=params['step'])))
+            # Length of the union of the booked intervals clipped to the working window
+            booked, cursor = 0.0, ws
+            for a_start, a_end in sorted((max(_minutes(s), ws), min(_minutes(e), we)) for s, e in
+                                         _appointments_in_working_hours(snapshot, staff_member.id, date, params)):
+                a_start = max(a_start, cursor)
+                if a_end > a_start:
+                    booked += a_end - a_start
+                    cursor = a_end
+            first_free = _minutes(slots[0].time()) if slots else None
+            rows.append(_summary_row(staff_member, date, len(slots), total, booked, max(we - ws, 0), first_free))
+    return rows
+
+
+def _numpy_report(snapshot, service=None):
+    # The arrays hold one cell per (staff member, day, minute): staff members are processed by chunks so that their
+    # size stays around NUMPY_CHUNK_CELLS cells whatever the size of the report.
+    dates = snapshot.dates()
+    chunk_size = max(1, NUMPY_CHUNK_CELLS // (max(len(dates), 1) * MINUTES_PER_DAY))
+    rows = []
+    for index in range(0, len(snapshot.staff_members), chunk_size):
+        rows.extend(_numpy_report_chunk(snapshot, snapshot.staff_members[index:index + chunk_size], dates, service))
+    return rows
+
+
+def _numpy_report_chunk(snapshot, staff_members, dates, service=None):
+    n_staff, n_days = len(staff_members), len(dates)
+    if not n_staff or not n_days:
+        return []
+    shape = (n_staff, n_days)
+    ws = np.zeros(shape, dtype=np.float64)
+    we = np.zeros(shape, dtype=np.float64)
+    step = np.ones(shape, dtype=np.int32)
+    buffer = np.zeros(shape, dtype=np.float64)
+    check = np.zeros(shape, dtype=np.float64)
+    gap = np.zeros(shape, dtype=np.float64)
+    working = np.zeros(shape, dtype=bool)
+
+    # Interval lists: flattened (staff, day) row, start minute, end minute
+    appt_rows, appt_starts, appt_ends = [], [], []
+    hold_rows, hold_starts, hold_ends = [], [], []
+    for s, staff_member in enumerate(staff_members):
+        for d, date in enumerate(dates):
+            params = get_staff_day_parameters(snapshot, staff_member, date, service=service)
+            if not params or params['step'] <= 0:
+                continue
+            working[s, d] = True
+            ws[s, d], we[s, d] = _minutes(params['start_time']), _minutes(params['end_time'])
+            step[s, d] = params['step']
+            buffer[s, d] = params['buffer']
+            check[s, d] = params['check_duration'].total_seconds() / 60
+            gap[s, d] = params['gap']
+            row = s * n_days + d
+            for a_start, a_end in snapshot.appointments.get((staff_member.id, date), ()):
+                appt_rows.append(row)
+                appt_starts.append(_minutes(a_start))
+                appt_ends.append(_minutes(a_end))
+            for rs_start, rs_end in snapshot.pending_reschedules.get((staff_member.id, date), ()):
+                hold_rows.append(row)
+                hold_starts.append(_minutes(rs_start))
+                hold_ends.append(_minutes(rs_end))
+
+    minutes = np.arange(MINUTES_PER_DAY, dtype=np.int32)
+    n_rows = n_staff * n_days
+
+    def interval_mask(rows, lows, highs):
+        """Mark the [low, high) minute ranges of each row with a difference array and a cumulative sum."""
+        diff = np.zeros((n_rows, MINUTES_PER_DAY + 1), dtype=np.int32)
+        lows = np.clip(lows, 0, MINUTES_PER_DAY).astype(np.int64)
+        highs = np.clip(highs, 0, MINUTES_PER_DAY).astype(np.int64)
+        keep = lows < highs
+        np.add.at(diff, (rows[keep], lows[keep]), 1)
+        np.add.at(diff, (rows[keep], highs[keep]), -1)
+        return (np.cumsum(diff[:, :MINUTES_PER_DAY], axis=1) > 0).reshape(n_staff, n_days, MINUTES_PER_DAY)
+
+    appt_rows = np.asarray(appt_rows, dtype=np.int64)
+    appt_starts = np.asarray(appt_starts, dtype=np.float64)
+    appt_ends = np.asarray(appt_ends, dtype=np.float64)
+    # Only appointments overlapping the working window count (see `get_appointments_for_date_and_time`)
+    flat_ws, flat_we = ws.reshape(-1), we.reshape(-1)
+    relevant = (appt_starts <= flat_we[appt_rows]) & (appt_ends >= flat_ws[appt_rows])
+    appt_rows, appt_starts, appt_ends = appt_rows[relevant], appt_starts[relevant], appt_ends[relevant]
+
+    # A slot starting at t is blocked when a_start < t + check + gap and t < a_end + gap,
+    # i.e. for integer minutes t in [floor(a_start - check - gap) + 1, ceil(a_end + gap)).
+    flat_check, flat_gap = check.reshape(-1)[appt_rows], gap.reshape(-1)[appt_rows]
+    blocked = interval_mask(appt_rows,
+                            np.floor(appt_starts - flat_check - flat_gap) + 1,
+                            np.ceil(appt_ends + flat_gap))
+    # Pending reschedules hold the slots starting in [start, end)
+    blocked |= interval_mask(np.asarray(hold_rows, dtype=np.int64),
+                             np.ceil(np.asarray(hold_starts, dtype=np.float64)),
+                             np.ceil(np.asarray(hold_ends, dtype=np.float64)))
+    occupancy = interval_mask(appt_rows, np.floor(appt_starts), np.ceil(appt_ends))
+
+    m = minutes[None, None, :]
+    offset = m - ws[..., None]
+    in_window = working[..., None] & (offset >= 0) & (m < we[..., None])
+    candidates = (in_window
+                  & (np.mod(offset, step[..., None]) == 0)
+                  & (m + step[..., None] <= we[..., None])
+                  & (m >= ws[..., None] + buffer[..., None]))
+    free = candidates & ~blocked
+
+    free_slots = free.sum(axis=2)
+    total_slots = candidates.sum(axis=2)
+    booked_minutes = (occupancy & in_window).sum(axis=2)
+    working_minutes = np.where(working, np.maximum(we - ws, 0), 0)
+    first_free = np.where(free.any(axis=2), free.argmax(axis=2), -1)
+
+    rows = []
+    for s, staff_member in enumerate(staff_members):
+        for d, date in enumerate(dates):
+            rows.append(_summary_row(staff_member, date, free_slots[s, d], total_slots[s, d],
+                                     float(booked_minutes[s, d]), float(working_minutes[s, d]),
+                                     int(first_free[s, d]) if first_free[s, d] >= 0 else None))
+    return rows
+
+
+def resolve_engine(engine: str = 'auto') -> str:
+    """Return the engine to use for a requested engine name.
+
+    :param engine: 'auto', 'numpy' or 'python'.
+    :return: 'numpy' or 'python'.
+    """
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown availability engine '{engine}'. Choose from {', '.join(ENGINES)}.")
+    if engine == 'numpy' and not NUMPY_AVAILABLE:
+        raise ImproperlyConfigured("The 'numpy' availability engine requires NumPy. "
+                                   "Install it with `pip install django-appointment[numpy]`.")
+    if engine == 'auto':
+        return 'numpy' if NUMPY_AVAILABLE else 'python'
+    return engine
+
+
+def compute_availability_rows(snapshot, service=None, engine: str = 'auto'):
+    """Compute one summary row per (staff member, day) pair of a snapshot.
+
+    :param snapshot: An AvailabilitySnapshot.
+    :param service: Optional Service whose duration widens the overlap-check window.
+    :param engine: 'auto' (NumPy when installed), 'numpy' or 'python'.
+    :return: A list of dictionaries ordered by staff member, then by date.
+    """
+    if resolve_engine(engine) == 'numpy':
+        return _numpy_report(snapshot, service)
+    return _python_report(snapshot, service)
+
+
+def build_availability_report(start_date, end_date, staff_members=None, service=None, engine: str = 'auto'):
+    """Compute free capacity for every (staff member, day) pair of a date range.
+
+    :param start_date: The first date of the range.
+    :param end_date: The last date of the range (inclusive).
+    :param staff_members: The staff members to report on. Defaults to all staff members.
+    :param service: Optional Service whose duration widens the overlap-check window.
+    :param engine: 'auto' (NumPy when installed), 'numpy' or 'python'.
+    :return: A dictionary with the engine used, one row per (staff member, day) and per staff member totals.
+    """
+    engine = resolve_engine(engine)
+    if staff_members is None:
+        staff_members = StaffMember.objects.select_related('user').all()
+    snapshot = load_availability_snapshot(staff_members, start_date, end_date)
+    days = compute_availability_rows(snapshot, service=service, engine=engine)
+    return {
+        'engine': engine,
+        'start_date': start_date.isoformat(),
+        'end_date': end_date.isoformat(),
+        'service_id': service.id if service else None,
+        'days': days,
+        'staff': summarize_by_staff(snapshot.staff_members, days),
+    }
+
+
+def summarize_by_staff(staff_members, days):
+    """Aggregate report rows per staff member.
+
+    :param staff_members: The staff members the rows belong to.
+    :param days: Rows produced by one of the engines.
+    :return: A list of dictionaries, one per staff member.
+    """
+    totals = {staff_member.id: {'free_slots': 0, 'total_slots': 0, 'booked_minutes': 0, 'working_minutes': 0,
+                                'first_free': None} for staff_member in staff_members}
+    for row in days:
+        total = totals[row['staff_member_id']]
+        for key in ('free_slots', 'total_slots', 'booked_minutes', 'working_minutes'):
+            total[key] += row[key]
+        if total['first_free'] is None and row['first_free'] is not None:
+            total['first_free'] = f"{row['date']}T{row['first_free']}"
+
+    summary = []
+    for staff_member in staff_members:
+        total = totals[staff_member.id]
+        working = total['working_minutes']
+        summary.append({
+            'staff_member_id': staff_member.id,
+            'staff_member': staff_member.get_staff_member_name(),
+            **total,
+            'utilization': round(total['booked_minutes'] / working, 4) if working else 0.0,
+        })
+    return summary
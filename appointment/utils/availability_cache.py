@@ -0,0 +1,405 @@
+# availability_cache.py
+# Path: appointment/utils/availability_cache.py
+
+"""
+Author: Adams Pierre David
+Since: 3.11.0
+
+Cache of computed availability with write-driven invalidation.
+
+Cached entries are never deleted explicitly. Their keys embed version counters instead, and writes bump the counters
+(see `appointment.signals`):
+
+- a global generation, bumped when the configuration or a service changes;
+- a per staff member generation, bumped when their profile, working hours or days off change;
+- a per (staff member, week) version, bumped when an appointment or a pending reschedule of that week changes;
+- a per (staff member, day) version, bumped alongside the week version.
+
+A bump makes every key built from the previous value unreachable, so stale entries simply expire. Writes that bypass
+model signals (`QuerySet.update()`, `bulk_create()`) must call the `invalidate_*` helpers themselves.
+"""
+
+import datetime
+import multiprocessing
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+
+from appointment.logger_config import get_logger
+from appointment.utils.availability import (
+    PENDING_RESCHEDULE_WINDOW, StaffMember, compute_availability_rows, compute_staff_day_slots,
+    get_staff_day_parameters, load_availability_snapshot
+)
+from appointment.utils.metrics import AVAILABILITY_CACHE_REQUESTS
+from appointment.utils.single_flight import STALE_GRACE, CachedValue, aget_or_compute, get_or_compute
+
+logger = get_logger(__name__)
+
+CACHE_PREFIX = 'appointment:availability'
+HEATMAP_FIELDS = ('is_working', 'free_slots', 'total_slots', 'booked_minutes', 'working_minutes', 'utilization')
+
+
+def get_availability_cache_timeout() -> int:
+    """Get the value of the APPOINTMENT_AVAILABILITY_CACHE_TIMEOUT setting (seconds, 0 disables caching).
+
+    Caching is disabled by default: the version counters must be shared by every worker, so it should only be enabled
+    with a shared cache backend (Redis, Memcached, database), never with the per-process `LocMemCache`.
+    """
+    return getattr(settings, 'APPOINTMENT_AVAILABILITY_CACHE_TIMEOUT', 0)
+
+
+def get_cache_warmup_days() -> int:
+    """Get the value of the APPOINTMENT_CACHE_WARMUP_DAYS setting (days warmed by `warm_slots_cache`)."""
+    return getattr(settings, 'APPOINTMENT_CACHE_WARMUP_DAYS', 14)
+
+
+def get_cache_warmup_minutes() -> int:
+    """Get the value of the APPOINTMENT_CACHE_WARMUP_MINUTES setting (minutes between warmups, 0 disables them)."""
+    return getattr(settings, 'APPOINTMENT_CACHE_WARMUP_MINUTES', 0)
+
+
+def get_week_start(date: datetime.date) -> datetime.date:
+    """Return the Monday of the week the given date belongs to."""
+    return date - datetime.timedelta(days=date.weekday())
+
+
+def _global_version_key():
+    return f"{CACHE_PREFIX}:gen"
+
+
+def _staff_version_key(staff_member_id):
+    return f"{CACHE_PREFIX}:staff:{staff_member_id}:gen"
+
+
+def _week_version_key(staff_member_id, week_start):
+    return f"{CACHE_PREFIX}:week:{staff_member_id}:{week_start.isoformat()}:v"
+
+
+def _day_version_key(staff_member_id, date):
+    return f"{CACHE_PREFIX}:day:{staff_member_id}:{date.isoformat()}:v"
+
+
+def _new_version() -> int:
+    # Seeding counters with the clock keeps an evicted counter from coming back with a value used before.
+    return time.time_ns() // 1000
+
+
+def get_versions(keys) -> dict:
+    """Return the current value of the given version counters, creating the missing ones.
+
+    :param keys: The cache keys of the counters.
+    :return: A dictionary mapping each key to its value.
+    """
+    keys = list(keys)
+    versions = cache.get_many(keys)
+    missing = [key for key in keys if key not in versions]
+    if missing:
+        for key in missing:
+            cache.add(key, _new_version(), None)
+        versions.update(cache.get_many(missing))
+    return versions
+
+
+async def aget_versions(keys) -> dict:
+    """Async version of `get_versions`, using the async cache API."""
+    keys = list(keys)
+    versions = await cache.aget_many(keys)
+    missing = [key for key in keys if key not in versions]
+    if missing:
+        for key in missing:
+            await cache.aadd(key, _new_version(), None)
+        versions.update(await cache.aget_many(missing))
+    return versions
+
+
+def _bump(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, _new_version(), None)
+
+
+def invalidate_all_availability():
+    """Invalidate every cached availability entry, e.g. after a configuration change."""
+    _bump(_global_version_key())
+
+
+def invalidate_staff_availability(staff_member_id):
+    """Invalidate every cached availability entry of a staff member, e.g. after a working hours change."""
+    _bump(_staff_version_key(staff_member_id))
+
+
+def invalidate_staff_day_availability(staff_member_id, date):
+    """Invalidate the cached availability of a staff member on one day, e.g. after a booking."""
+    if staff_member_id is None or date is None:
+        return
+    _bump(_day_version_key(staff_member_id, date))
+    _bump(_week_version_key(staff_member_id, get_week_start(date)))
+
+
+def get_staff_week_tokens(staff_member_ids, week_starts) -> dict:
+    """Return the version token of every (staff member, week) pair.
+
+    :param staff_member_ids: The staff member IDs.
+    :param week_starts: The Mondays of the weeks.
+    :return: A dictionary mapping (staff_member_id, week_start) to a string token.
+    """
+    keys = [_global_version_key()] + [_staff_version_key(staff_id) for staff_id in staff_member_ids] + \
+           [_week_version_key(staff_id, week) for staff_id in staff_member_ids for week in week_starts]
+    versions = get_versions(keys)
+    global_version = versions[_global_version_key()]
+    return {
+        (staff_id, week): f"{global_version}.{versions[_staff_version_key(staff_id)]}."
+                          f"{versions[_week_version_key(staff_id, week)]}"
+        for staff_id in staff_member_ids for week in week_starts
+    }
+
+
+def _day_token_keys(staff_member_id, date):
+    return [_global_version_key(), _staff_version_key(staff_member_id), _day_version_key(staff_member_id, date)]
+
+
+def _day_tokens(staff_member_id, dates, versions) -> dict:
+    return {date: '.'.join(str(versions[key]) for key in _day_token_keys(staff_member_id, date)) for date in dates}
+
+
+def get_staff_day_tokens(staff_member_id, dates) -> dict:
+    """Return the version token of a staff member's availability on each of the given days.
+
+    A token changes whenever anything the availability of that day depends on changes, so clients can keep the slots
+    they fetched for as long as the token they came with is current.
+
+    :param staff_member_id: The staff member ID.
+    :param dates: The dates.
+    :return: A dictionary mapping each date to a string token.
+    """
+    dates = list(dates)
+    keys = {key for date in dates for key in _day_token_keys(staff_member_id, date)}
+    return _day_tokens(staff_member_id, dates, get_versions(keys))
+
+
+async def aget_staff_day_tokens(staff_member_id, dates) -> dict:
+    """Async version of `get_staff_day_tokens`, using the async cache API."""
+    dates = list(dates)
+    keys = {key for date in dates for key in _day_token_keys(staff_member_id, date)}
+    return _day_tokens(staff_member_id, dates, await aget_versions(keys))
+
+
+def _slots_key(staff_member_id, date, service_id, token):
+    return f"{CACHE_PREFIX}:slots:{staff_member_id}:{date.isoformat()}:{service_id}:{token}"
+
+
+def _slots_timeout() -> int:
+    # Slots held by a pending reschedule are freed after a few minutes without any write to signal it.
+    return min(get_availability_cache_timeout(), int(PENDING_RESCHEDULE_WINDOW.total_seconds()))
+
+
+def get_cached_slots(staff_member_id, date, service_id, token, compute):
+    """Return the available slots of a staff member on one day from the cache, computing them on a miss.
+
+    Concurrent misses of the same day compute it once (see `appointment.utils.single_flight`).
+
+    :param staff_member_id: The staff member ID.
+    :param date: The date.
+    :param service_id: The ID of the service the slots are computed for, if any.
+    :param token: The current token of the day, from `get_staff_day_tokens`.
+    :param compute: A callable taking no argument and returning the slots.
+    :return: The list of slots.
+    """
+    return get_or_compute(_slots_key(staff_member_id, date, service_id, token), compute, _slots_timeout(), 'slots')
+
+
+async def aget_cached_slots(staff_member_id, date, service_id, token, compute):
+    """Async version of `get_cached_slots`, using the async cache API; `compute` is a coroutine function."""
+    return await aget_or_compute(_slots_key(staff_member_id, date, service_id, token), compute, _slots_timeout(),
+                                 'slots')
+
+
+def _heatmap_key(staff_member_id, week_start, token):
+    return f"{CACHE_PREFIX}:heatmap:{staff_member_id}:{week_start.isoformat()}:{token}"
+
+
+def get_availability_heatmap(staff_members, start_date, end_date) -> dict:
+    """Return free-slot and booked-minute counts per staff member and per day.
+
+    Counts are cached per (staff member, week). Weeks missing from the cache are computed together from a single
+    bulk load covering all of them.
+
+    :param staff_members: The staff members.
+    :param start_date: The first date of the range.
+    :param end_date: The last date of the range (inclusive).
+    :return: A dictionary mapping each staff member ID to a dictionary mapping ISO dates to their counts.
+    """
+    staff_members = list(staff_members)
+    staff_ids = [staff_member.id for staff_member in staff_members]
+    weeks = []
+    week = get_week_start(start_date)
+    while week <= end_date:
+        weeks.append(week)
+        week += datetime.timedelta(days=7)
+
+    tokens = get_staff_week_tokens(staff_ids, weeks)
+    keys = {pair: _heatmap_key(pair[0], pair[1], token) for pair, token in tokens.items()}
+    cached = cache.get_many(list(keys.values()))
+    weeks_by_pair = {pair: cached[key] for pair, key in keys.items() if key in cached}
+
+    missing = [pair for pair in keys if pair not in weeks_by_pair]
+    AVAILABILITY_CACHE_REQUESTS.inc(len(weeks_by_pair), cache='heatmap', result='hit')
+    AVAILABILITY_CACHE_REQUESTS.inc(len(missing), cache='heatmap', result='miss')
+    if missing:
+        weeks_by_pair.update(_compute_heatmap_weeks(staff_members, missing, keys))
+
+    heatmap = {}
+    for staff_id in staff_ids:
+        days = {}
+        for week in weeks:
+            days.update(weeks_by_pair[(staff_id, week)])
+        heatmap[staff_id] = {date: counts for date, counts in sorted(days.items())
+                             if start_date.isoformat() <= date <= end_date.isoformat()}
+    return heatmap
+
+
+def _compute_heatmap_weeks(staff_members, pairs, keys) -> dict:
+    missing_staff_ids = {staff_id for staff_id, _ in pairs}
+    first_week = min(week for _, week in pairs)
+    last_week = max(week for _, week in pairs)
+    snapshot = load_availability_snapshot([staff_member for staff_member in staff_members
+                                           if staff_member.id in missing_staff_ids],
+                                          first_week, last_week + datetime.timedelta(days=6))
+
+    computed = defaultdict(dict)
+    for row in compute_availability_rows(snapshot):
+        week = get_week_start(datetime.date.fromisoformat(row['date']))
+        computed[(row['staff_member_id'], week)][row['date']] = {field: row[field] for field in HEATMAP_FIELDS}
+
+    timeout = get_availability_cache_timeout()
+    held_weeks = {(staff_id, get_week_start(date)) for staff_id, date in snapshot.pending_reschedules}
+    to_cache, held = {}, {}
+    for pair in pairs:
+        target = held if pair in held_weeks else to_cache
+        target[keys[pair]] = computed[pair]
+    if timeout:
+        cache.set_many(to_cache, timeout)
+        # Pending reschedules stop holding their slot after a few minutes without any write to signal it.
+        cache.set_many(held, min(timeout, int(PENDING_RESCHEDULE_WINDOW.total_seconds())))
+    return {pair: computed[pair] for pair in pairs}
+
+
+def aggregate_heatmap(heatmap: dict) -> list:
+    """Sum the per staff member counts of a heatmap day by day.
+
+    :param heatmap: A heatmap as returned by `get_availability_heatmap`.
+    :return: A list of dictionaries, one per day, ordered by date.
+    """
+    totals = {}
+    for days in heatmap.values():
+        for date, counts in days.items():
+            total = totals.setdefault(date, {'date': date, 'working_staff': 0, 'free_slots': 0, 'total_slots': 0,
+                                             'booked_minutes': 0, 'working_minutes': 0})
+            total['working_staff'] += int(counts['is_working'])
+            for field in ('free_slots', 'total_slots', 'booked_minutes', 'working_minutes'):
+                total[field] += counts[field]
+    for total in totals.values():
+        total['utilization'] = round(total['booked_minutes'] / total['working_minutes'], 4) \
+            if total['working_minutes'] else 0.0
+    return [totals[date] for date in sorted(totals)]
+
+
+def _compute_slot_entries(staff_member_ids, start_date, end_date, tokens) -> dict:
+    """Compute the slots cache entries of some staff members over a date range, from one bulk load.
+
+    Entries are stored for the configured timeout, since a write changes the token of their day anyway, except the
+    days with a pending reschedule, which frees its slot after a few minutes without any write to signal it.
+
+    :param tokens: The token of every (staff member ID, date) pair, from `get_staff_day_tokens`.
+    :return: A dictionary mapping timeouts to dictionaries mapping cache keys to `CachedValue` entries.
+    """
+    staff_members = list(StaffMember.objects.filter(id__in=staff_member_ids).prefetch_related('services_offered'))
+    snapshot = load_availability_snapshot(staff_members, start_date, end_date)
+    entries = defaultdict(dict)
+    for staff_member in staff_members:
+        # The booking page asks for the slots of a service; other callers may leave it out.
+        services = [None] + list(staff_member.services_offered.all())
+        for date in snapshot.dates():
+            if get_staff_day_parameters(snapshot, staff_member, date) is None:
+                # The views answer for days off and non-working days without looking the slots up.
+                continue
+            held = (staff_member.id, date) in snapshot.pending_reschedules
+            timeout = _slots_timeout() if held else get_availability_cache_timeout()
+            for service in services:
+                started = time.time()
+                slots = compute_staff_day_slots(snapshot, staff_member, date, service=service)
+                now = time.time()
+                key = _slots_key(staff_member.id, date, service.id if service else None,
+                                 tokens[(staff_member.id, date)])
+                entries[timeout][key] = CachedValue(slots, now + timeout, now - started)
+    return dict(entries)
+
+
+def warm_slots_cache(days: int = None, start_date=None, staff_member_ids=None, chunk_size: int = 50,
+                     processes: int = 1, progress=None) -> dict:
+    """Compute and cache the available slots of every staff member, for each service they offer, over the next days.
+
+    Staff members are handled by chunks: every chunk is loaded with a few queries (see `load_availability_snapshot`)
+    and its entries are written with one `set_many()` per timeout. With `processes` above 1, chunks are computed by a
+    pool of worker processes; they return their entries and this process writes them, so any cache backend works.
+
+    :param days: Number of days to warm, starting at `start_date` (defaults to APPOINTMENT_CACHE_WARMUP_DAYS).
+    :param start_date: The first day, today by default.
+    :param staff_member_ids: The staff members to warm, all of them by default.
+    :param chunk_size: Staff members per chunk.
+    :param processes: Number of worker processes (1 computes in this process).
+    :param progress: Optional callable receiving (staff members done, staff members total, entries written).
+    :return: A dictionary with the counts and the elapsed seconds.
+    """
+    started = time.perf_counter()
+    days = days or get_cache_warmup_days()
+    start_date = start_date or datetime.date.today()
+    end_date = start_date + datetime.timedelta(days=days - 1)
+    queryset = StaffMember.objects.order_by('id')
+    if staff_member_ids is not None:
+        queryset = queryset.filter(id__in=staff_member_ids)
+    ids = list(queryset.values_list('id', flat=True))
+    chunks = [ids[index:index + chunk_size] for index in range(0, len(ids), chunk_size)]
+    dates = [start_date + datetime.timedelta(days=offset) for offset in range(days)]
+
+    def chunk_tokens(chunk):
+        return {(staff_id, date): token for staff_id in chunk
+                for date, token in get_staff_day_tokens(staff_id, dates).items()}
+
+    written = done = 0
+
+    def store(chunk, entries):
+        nonlocal written, done
+        for timeout, batch in entries.items():
+            cache.set_many(batch, timeout + STALE_GRACE)
+            written += len(batch)
+        done += len(chunk)
+        if progress:
+            progress(done, len(ids), written)
+
+    if not _slots_timeout():
+        # Nothing is cached, so there is nothing to warm.
+        chunks = []
+    if processes > 1 and len(chunks) > 1:
+        # Forked workers would share the sockets of this process's connections, so they are closed before the pool
+        # starts and every worker opens its own. Workers started by spawn or forkserver must set Django up first.
+        connections.close_all()
+        initializer = None if multiprocessing.get_start_method() == 'fork' else django.setup
+        with ProcessPoolExecutor(max_workers=processes, initializer=initializer) as executor:
+            futures = [(chunk, executor.submit(_compute_slot_entries, chunk, start_date, end_date,
+                                               chunk_tokens(chunk))) for chunk in chunks]
+            for chunk, future in futures:
+                store(chunk, future.result())
+    else:
+        for chunk in chunks:
+            store(chunk, _compute_slot_entries(chunk, start_date, end_date, chunk_tokens(chunk)))
+
+    seconds = time.perf_counter() - started
+    return {'staff_members': len(ids), 'days': days, 'entries': written, 'seconds': round(seconds, 3),
+            'entries_per_second': round(written / seconds, 1) if seconds else 0.0}
@@ -0,0 +1,275 @@
+# availability_table.py
+# Path: appointment/utils/availability_table.py
+
+"""
+Author: Adams Pierre David
+Since: 3.11.0
+
+Materialized availability: one `StaffDayAvailability` row per staff member and day, holding the day's working hours
+and its booked, held and free intervals, so that availability can be queried in SQL (e.g. staff members with a free
+hour on a given morning) and the slots of a day read with one indexed query.
+
+Enabled with APPOINTMENT_AVAILABILITY_TABLE. The rows are then:
+
+- built in bulk by `rebuild_availability_table` (the `rebuild_availability_table` command, or its task, daily);
+- refreshed after each committed change for the affected staff days only: the day of a booked, moved or cancelled
+  appointment or of a reschedule, and the staff member's upcoming rows when their working hours or days off change;
+- rebuilt on read when they are missing, or stale because a pending reschedule stopped holding its slot.
+"""
+
+import datetime
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from appointment.logger_config import get_logger
+from appointment.models import AppointmentRequest, StaffDayAvailability, StaffMember
+from appointment.utils.availability import (
+    AvailabilitySnapshot, compute_staff_day_slots, load_availability_snapshot
+)
+from appointment.utils.db_helpers import get_config, get_weekday_num_from_date
+
+logger = get_logger(__name__)
+
+ROW_FIELDS = ('is_day_off', 'start_time', 'end_time', 'booked_intervals', 'held_intervals', 'free_intervals',
+              'free_minutes', 'longest_free_minutes', 'refresh_after', 'updated_at')
+
+
+def get_availability_table_enabled() -> bool:
+    """Get the value of the APPOINTMENT_AVAILABILITY_TABLE setting (maintain and read `StaffDayAvailability`)."""
+    return getattr(settings, 'APPOINTMENT_AVAILABILITY_TABLE', False)
+
+
+def get_availability_table_days() -> int:
+    """Get the value of the APPOINTMENT_AVAILABILITY_TABLE_DAYS setting (days built ahead by a rebuild)."""
+    return getattr(settings, 'APPOINTMENT_AVAILABILITY_TABLE_DAYS', 60)
+
+
+def _to_minutes(value: datetime.time) -> int:
+    return value.hour * 60 + value.minute
+
+
+def _to_time(minutes: int) -> datetime.time:
+    return datetime.time(minutes // 60, minutes % 60)
+
+
+def subtract_intervals(start: int, end: int, busy) -> list:
+    """Return the parts of [start, end] that no busy interval covers, as a sorted list of [start, end]."""
+    free = []
+    cursor = start
+    for busy_start, busy_end in sorted(busy):
+        if busy_start > cursor:
+            free.append([cursor, min(busy_start, end)])
+        cursor = max(cursor, busy_end)
+        if cursor >= end:
+            break
+    if cursor < end:
+        free.append([cursor, end])
+    return [interval for interval in free if interval[0] < interval[1]]
+
+
+def build_staff_day(snapshot, staff_member, date) -> StaffDayAvailability:
+    """Build the (unsaved) row of a staff member on a date from a snapshot loaded over that date."""
+    key = (staff_member.id, date)
+    row = StaffDayAvailability(staff_member=staff_member, date=date, updated_at=timezone.now(),
+                               is_day_off=snapshot.is_day_off(staff_member.id, date))
+    # Every appointment of the day is kept: the slot pipeline itself ignores those outside the working hours.
+    row.booked_intervals = sorted([_to_minutes(start), _to_minutes(end)]
+                                  for start, end in snapshot.appointments.get(key, ()))
+    row.held_intervals = sorted([_to_minutes(start), _to_minutes(end)]
+                                for start, end in snapshot.pending_reschedules.get(key, ()))
+    row.refresh_after = snapshot.pending_reschedules_expiry.get(key)
+
+    hours = None if row.is_day_off else snapshot.working_hours.get(staff_member.id, {}).get(
+            get_weekday_num_from_date(date))
+    if hours:
+        row.start_time, row.end_time = hours
+        row.free_intervals = subtract_intervals(_to_minutes(hours[0]), _to_minutes(hours[1]),
+                                                row.booked_intervals + row.held_intervals)
+    row.free_minutes = sum(end - start for start, end in row.free_intervals)
+    row.longest_free_minutes = max((end - start for start, end in row.free_intervals), default=0)
+    return row
+
+
+def save_staff_days(rows):
+    """Insert or update rows with one query per batch.
+
+    Backends that cannot name the conflict target (MySQL, MariaDB) upsert on any unique key; those without upserts
+    (Oracle) replace the rows in a transaction instead.
+    """
+    features = connection.features
+    if features.supports_update_conflicts_with_target:
+        StaffDayAvailability.objects.bulk_create(rows, batch_size=500, update_conflicts=True,
+                                                 unique_fields=['staff_member', 'date'], update_fields=ROW_FIELDS)
+    elif features.supports_update_conflicts:
+        StaffDayAvailability.objects.bulk_create(rows, batch_size=500, update_conflicts=True, update_fields=ROW_FIELDS)
+    else:
+        dates_by_staff = defaultdict(set)
+        for row in rows:
+            dates_by_staff[row.staff_member_id].add(row.date)
+        with transaction.atomic():
+            for staff_member_id, dates in dates_by_staff.items():
+                StaffDayAvailability.objects.filter(staff_member_id=staff_member_id, date__in=dates).delete()
+            StaffDayAvailability.objects.bulk_create(rows, batch_size=500)
+
+
+def refresh_staff_days(pairs) -> list:
+    """Rebuild the rows of some (staff member ID, date) pairs; pairs of deleted staff members are skipped.
+
+    :return: The saved rows.
+    """
+    dates_by_staff = defaultdict(set)
+    for staff_member_id, date in pairs:
+        if staff_member_id is not None and date is not None:
+            dates_by_staff[staff_member_id].add(date)
+    if not dates_by_staff:
+        return []
+    staff_members = list(StaffMember.objects.filter(id__in=dates_by_staff))
+    all_dates = set().union(*dates_by_staff.values())
+    snapshot = load_availability_snapshot(staff_members, min(all_dates), max(all_dates))
+    rows = [build_staff_day(snapshot, staff_member, date)
+            for staff_member in staff_members for date in sorted(dates_by_staff[staff_member.id])]
+    save_staff_days(rows)
+    return rows
+
+
+def refresh_staff_member(staff_member_id):
+    """Rebuild the existing rows of a staff member from today on, e.g. after a change of their schedule.
+
+    Only existing rows are updated, so that this is harmless while the staff member is being deleted.
+    """
+    rows = list(StaffDayAvailability.objects.filter(staff_member_id=staff_member_id, date__gte=datetime.date.today())
+                .select_related('staff_member'))
+    if not rows:
+        return
+    snapshot = load_availability_snapshot([rows[0].staff_member], rows[0].date, rows[-1].date)
+    for row in rows:
+        rebuilt = build_staff_day(snapshot, row.staff_member, row.date)
+        for field in ROW_FIELDS:
+            setattr(row, field, getattr(rebuilt, field))
+    StaffDayAvailability.objects.bulk_update(rows, ROW_FIELDS, batch_size=500)
+
+
+def refresh_staff_days_on_commit(*pairs):
+    """Rebuild the rows of some (staff member ID, date) pairs once the current transaction commits."""
+    transaction.on_commit(lambda: refresh_staff_days(pairs))
+
+
+def refresh_staff_member_on_commit(staff_member_id):
+    """Rebuild the upcoming rows of a staff member once the current transaction commits."""
+    transaction.on_commit(lambda: refresh_staff_member(staff_member_id))
+
+
+def refresh_request_days_on_commit(origin, appointment_request_id, date=None):
+    """Rebuild the day of an appointment request (or `date`) once the deletion started by `origin` commits.
+
+    Used for the rows of cascade and queryset deletions, whose request is not loaded: the requests are looked up with
+    one query for the whole deletion instead of one per row.
+    """
+    pending = getattr(origin, '_availability_table_requests', None)
+    if pending is None:
+        pending = origin._availability_table_requests = set()
+        transaction.on_commit(lambda: refresh_request_days(pending))
+    pending.add((appointment_request_id, date))
+
+
+def refresh_request_days(pending):
+    """Rebuild the days of (appointment request ID, date or None) pairs; the requests deleted since are skipped."""
+    requests = {pk: (staff_member_id, date) for pk, staff_member_id, date in AppointmentRequest.objects.filter(
+            pk__in={request_id for request_id, _ in pending}).values_list('pk', 'staff_member_id', 'date')}
+    refresh_staff_days([(requests[request_id][0], date or requests[request_id][1])
+                        for request_id, date in pending if request_id in requests])
+
+
+def rebuild_availability_table(days: int = None, start_date=None, staff_member_ids=None, chunk_size: int = 50,
+                               prune: bool = False, progress=None) -> dict:
+    """Build the rows of every staff member over the next days, by chunks of staff members loaded in bulk.
+
+    :param days: Number of days to build, starting at `start_date` (defaults to APPOINTMENT_AVAILABILITY_TABLE_DAYS).
+    :param start_date: The first day, today by default.
+    :param staff_member_ids: The staff members to build, all of them by default.
+    :param chunk_size: Staff members per chunk.
+    :param prune: Also delete the rows dated before `start_date`.
+    :param progress: Optional callable receiving (staff members done, staff members total, rows written).
+    :return: A dictionary with the counts and the elapsed seconds.
+    """
+    started = time.perf_counter()
+    days = days or get_availability_table_days()
+    start_date = start_date or datetime.date.today()
+    end_date = start_date + datetime.timedelta(days=days - 1)
+    queryset = StaffMember.objects.order_by('id')
+    if staff_member_ids is not None:
+        queryset = queryset.filter(id__in=staff_member_ids)
+    staff_members = list(queryset)
+
+    written = pruned = 0
+    for index in range(0, len(staff_members), chunk_size):
+        chunk = staff_members[index:index + chunk_size]
+        snapshot = load_availability_snapshot(chunk, start_date, end_date)
+        rows = [build_staff_day(snapshot, staff_member, date)
+                for staff_member in chunk for date in snapshot.dates()]
+        save_staff_days(rows)
+        written += len(rows)
+        if progress:
+            progress(index + len(chunk), len(staff_members), written)
+    if prune:
+        pruned, _ = StaffDayAvailability.objects.filter(date__lt=start_date).delete()
+
+    seconds = time.perf_counter() - started
+    return {'staff_members': len(staff_members), 'days': days, 'rows': written, 'pruned': pruned,
+            'seconds': round(seconds, 3), 'rows_per_second': round(written / seconds, 1) if seconds else 0.0}
+
+
+def _row_snapshot(row, staff_member):
+    """Rebuild the snapshot a row was built from, so that slots are derived by the same pipeline."""
+    snapshot = AvailabilitySnapshot([staff_member], row.date, row.date, config=get_config())
+    key = (staff_member.id, row.date)
+    if row.start_time is not None:
+        snapshot.working_hours[staff_member.id][get_weekday_num_from_date(row.date)] = (row.start_time, row.end_time)
+    snapshot.appointments[key] = [(_to_time(start), _to_time(end)) for start, end in row.booked_intervals]
+    snapshot.pending_reschedules[key] = [(_to_time(start), _to_time(end)) for start, end in row.held_intervals]
+    return snapshot
+
+
+def get_staff_day_slots(staff_member, date, service=None) -> list:
+    """Return the available slots of a staff member on a date from their row, read with one indexed query.
+
+    The row is rebuilt first when it is missing or stale. The result is the list `get_available_slots_for_staff`
+    returns.
+    """
+    row = StaffDayAvailability.objects.filter(staff_member=staff_member, date=date).first()
+    if row is None or row.is_stale():
+        row = refresh_staff_days([(staff_member.id, date)])[0]
+    return compute_staff_day_slots(_row_snapshot(row, staff_member), staff_member, date, service=service)
+
+
+def find_available_staff(date, minutes: int, start_time=None, end_time=None):
+    """Return the IDs of the staff members with `minutes` of free time in a row on `date`, within the given hours.
+
+    Rows without a long enough free interval are filtered out in SQL (`date`, `longest_free_minutes` index); the
+    remaining intervals are clipped to the hours. Stale rows, and the rows of staff members who have none on `date`
+    yet, are built first.
+    """
+    low = _to_minutes(start_time) if start_time else 0
+    high = _to_minutes(end_time) if end_time else 24 * 60
+    now = timezone.now()
+    rows = StaffDayAvailability.objects.filter(
+            Q(longest_free_minutes__gte=minutes) | Q(refresh_after__lte=now), date=date
+    ).values_list('staff_member_id', 'free_intervals', 'refresh_after')
+    stale = []
+    found = []
+    for staff_member_id, free_intervals, refresh_after in rows:
+        if refresh_after is not None and refresh_after <= now:
+            stale.append((staff_member_id, date))
+        elif any(min(end, high) - max(start, low) >= minutes for start, end in free_intervals):
+            found.append(staff_member_id)
+    stale += [(staff_member_id, date) for staff_member_id in StaffMember.objects.exclude(
+            day_availabilities__date=date).values_list('id', flat=True)]
+    for row in refresh_staff_days(stale):
+        if any(min(end, high) - max(start, low) >= minutes for start, end in row.free_intervals):
+            found.append(row.staff_member_id)
+    return sorted(found)
@@ -8,6 +8,7 @@ Since: 2.0.0
 
 import datetime
 
+from django.conf import settings
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _, ngettext
 
@@ -22,6 +23,20 @@ def combine_date_and_time(date, time) -> datetime.datetime:
     return datetime.datetime.combine(date, time)
 
 
+def make_appointment_datetime(date, time) -> datetime.datetime:
+    """Combine a date and a wall-clock time into the datetime stored in `AppointmentRequest.start_at` and
+    `end_at`: aware, in the default time zone, when USE_TZ is on, naive otherwise.
+
+    :param date: The date.
+    :param time: The time.
+    :return: A datetime object.
+    """
+    value = datetime.datetime.combine(date, time)
+    if settings.USE_TZ:
+        value = timezone.make_aware(value, timezone.get_default_timezone())
+    return value
+
+
 def convert_12_hour_time_to_24_hour_time(time_to_convert) -> str:
     """Convert a 12-hour time to a 24-hour time.
 
@@ -235,6 +250,35 @@ def time_difference(time1, time2):
     return delta
 
 
+def encode_slot_runs(slots) -> list:
+    """Encode ordered slot start times as runs of evenly spaced slots.
+
+    Each run is [minute of the day of its first slot, minutes between its slots, number of slots], so the slots
+    9:00, 9:30, 10:00 and 14:00 are encoded as [[540, 30, 3], [840, 0, 1]].
+
+    :param slots: The slots, as datetime.datetime or datetime.time objects in ascending order.
+    :return: The list of runs.
+    """
+    runs = []
+    for slot in slots:
+        minute = slot.hour * 60 + slot.minute
+        if runs:
+            run = runs[-1]
+            if run[2] == 1 and minute > run[0]:
+                run[1], run[2] = minute - run[0], 2
+                continue
+            if minute == run[0] + run[1] * run[2]:
+                run[2] += 1
+                continue
+        runs.append([minute, 0, 1])
+    return runs
+
+
+def decode_slot_runs(runs) -> list:
+    """Expand the runs of `encode_slot_runs` into the minutes of the day of every slot."""
+    return [start + step * index for start, step, count in runs for index in range(count)]
+
+
 DATE_FORMATS = {
     'ar': "D، j F Y",                        # "خ، 14 أغسطس 2025" (Arabic: RTL with Arabic comma)
     'bg': "D, j F Y",                        # "чт, 14 август 2025" (Bulgarian: comma after weekday)
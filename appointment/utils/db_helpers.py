@@ -6,7 +6,9 @@ Author: Adams Pierre David
 Since: 2.0.0
 """
 
+import ast
 import datetime
+import re
 from typing import Optional
 from urllib.parse import urlparse
 
@@ -14,7 +16,9 @@ from django.apps import apps
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.cache import cache
-from django.core.exceptions import FieldDoesNotExist
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db import IntegrityError, transaction
+from django.db.models import Q
 from django.urls import reverse
 from django.utils import timezone
 
@@ -23,10 +27,16 @@ from appointment.settings import (
     APPOINTMENT_BUFFER_TIME, APPOINTMENT_FINISH_TIME, APPOINTMENT_LEAD_TIME, APPOINTMENT_PAYMENT_URL,
     APPOINTMENT_SLOT_DURATION, APPOINTMENT_WEBSITE_NAME
 )
-from appointment.utils.date_time import combine_date_and_time, get_weekday_num
+from appointment.utils.date_time import combine_date_and_time, get_weekday_num, make_appointment_datetime
+from appointment.utils.metrics import BOOKINGS
+from appointment.utils.single_flight import get_or_compute
 
 logger = get_logger(__name__)
 
+USERNAME_BASES_PER_QUERY = 100
+USERNAME_ATTEMPTS = 3
+WEBSITE_NAME_CACHE_KEY = 'appointment:website_name'
+
 # Check if django-q is installed in settings
 DJANGO_Q_AVAILABLE = 'django_q' in settings.INSTALLED_APPS
 
@@ -108,6 +118,11 @@ def check_day_off_for_staff(staff_member, date) -> bool:
     return DayOff.objects.filter(staff_member=staff_member, start_date__lte=date, end_date__gte=date).exists()
 
 
+async def acheck_day_off_for_staff(staff_member, date) -> bool:
+    """Async version of `check_day_off_for_staff`."""
+    return await DayOff.objects.filter(staff_member=staff_member, start_date__lte=date, end_date__gte=date).aexists()
+
+
 def create_and_save_appointment(ar, client_data: dict, appointment_data: dict, request):
     """Create and save a new appointment based on the provided appointment request and client data.
 
@@ -118,10 +133,15 @@ def create_and_save_appointment(ar, client_data: dict, appointment_data: dict, r
     :return: The newly created appointment.
     """
     user = request.user if request.user.is_authenticated else get_user_by_email(client_data['email'])
-    appointment = Appointment.objects.create(
-            client=user, appointment_request=ar,
-            **appointment_data
-    )
+    try:
+        appointment = Appointment.objects.create(
+                client=user, appointment_request=ar,
+                **appointment_data
+        )
+    except (IntegrityError, ValidationError):
+        BOOKINGS.inc(result='conflict')
+        raise
+    BOOKINGS.inc(result='created')
     appointment.save()
     logger.info(f"New appointment created: {appointment.to_dict()}")
     if appointment.want_reminder:
@@ -220,6 +240,32 @@ def cancel_existing_reminder(appointment_id_request):
     Schedule.objects.filter(name=task_name).delete()
 
 
+def cancel_existing_reminders(appointment_id_requests):
+    """Cancels the existing reminders of several appointments with a single query."""
+    if not DJANGO_Q_AVAILABLE:
+        logger.warning("Django-Q is not available. Appointment reminders cannot be updated.")
+        return
+    Schedule.objects.filter(name__in=[f"reminder_{id_request}" for id_request in appointment_id_requests]).delete()
+
+
+def rename_appointment_reminder(appointment_id, old_id_request, new_id_request):
+    """Rename the reminder of an appointment whose request ID changed, so that it can still be cancelled.
+
+    Reminders are named after the request ID; when several appointments shared it, the one of `appointment_id` is
+    told apart by the keyword arguments of the scheduled task.
+    """
+    if not DJANGO_Q_AVAILABLE:
+        return
+    for reminder in Schedule.objects.filter(name=f"reminder_{old_id_request}"):
+        try:
+            kwargs = ast.literal_eval(reminder.kwargs or '{}')
+        except (ValueError, SyntaxError):
+            continue
+        if kwargs.get('appointment_id') == appointment_id:
+            reminder.name = f"reminder_{new_id_request}"
+            reminder.save(update_fields=['name'])
+
+
 def can_appointment_be_rescheduled(appointment_request):
     # Datetime 5 minutes ago from now
     five_minutes_ago = timezone.now() - timezone.timedelta(minutes=5)
@@ -246,17 +292,53 @@ def staff_change_allowed_on_reschedule():
     return Config.objects.first().allow_staff_change_on_reschedule
 
 
-def generate_unique_username_from_email(email: str) -> str:
-    username_base = email.split('@')[0]
-    username = username_base
+def _next_free_username(username_base: str, taken) -> str:
+    """Return the first of `username_base`, `username_base01`, `username_base02`... that is not in `taken`."""
+    if username_base not in taken:
+        return username_base
     suffix = 1
+    while f"{username_base}{suffix:02}" in taken:
+        suffix += 1
+    return f"{username_base}{suffix:02}"
+
+
+def get_usernames_starting_with(username_bases) -> set:
+    """Return the existing usernames made of one of the given bases and an optional numeric suffix, one query per
+    USERNAME_BASES_PER_QUERY.
+
+    Only those can collide with a generated username, so other usernames sharing a short base (e.g. `info`) are not
+    loaded; the prefix condition lets the database narrow the rows down with an index before matching the regex.
+    """
     CLIENT_MODEL = get_user_model()
+    username_bases = sorted(set(username_bases))
+    taken = set()
+    for start in range(0, len(username_bases), USERNAME_BASES_PER_QUERY):
+        query = Q()
+        for username_base in username_bases[start:start + USERNAME_BASES_PER_QUERY]:
+            query |= Q(username__startswith=username_base, username__regex=rf'^{re.escape(username_base)}\d*$')
+        taken.update(CLIENT_MODEL.objects.filter(query).values_list('username', flat=True))
+    return taken
+
+
+def generate_unique_username_from_email(email: str) -> str:
+    username_base = email.split('@')[0]
+    return _next_free_username(username_base, get_usernames_starting_with([username_base]))
 
-    while CLIENT_MODEL.objects.filter(username=username).exists():
-        suffix_str = f"{suffix:02}"
-        username = f"{username_base}{suffix_str}"
-        suffix += 1
-    return username
+
+def allocate_usernames(emails) -> list:
+    """Return a unique username for each e-mail, as `generate_unique_username_from_email` would, for bulk creations.
+
+    The usernames are distinct from the existing ones and from each other; the existing ones are read with one query
+    per USERNAME_BASES_PER_QUERY distinct bases.
+    """
+    username_bases = [email.split('@')[0] for email in emails]
+    taken = get_usernames_starting_with(username_bases)
+    usernames = []
+    for username_base in username_bases:
+        username = _next_free_username(username_base, taken)
+        taken.add(username)
+        usernames.append(username)
+    return usernames
 
 
 def parse_name(name: str):
@@ -280,18 +362,23 @@ def create_user_with_email(client_data: dict):
 
 def create_user_with_username(client_data: dict):
     CLIENT_MODEL = get_user_model()
-    if 'username' not in client_data:
-        username = generate_unique_username_from_email(client_data['email'])
-    else:
-        username = client_data['username']
     user_data = {
-        'username': username,
         'email': client_data['email'],
         'first_name': client_data.get('first_name', ''),
         'last_name': client_data.get('last_name', '')
     }
-    user = CLIENT_MODEL.objects.create_user(**user_data)
-    return user
+    if 'username' in client_data:
+        return CLIENT_MODEL.objects.create_user(username=client_data['username'], **user_data)
+    # Two concurrent signups can pick the same free username: the one losing the race takes the next one.
+    for attempt in range(USERNAME_ATTEMPTS):
+        username = generate_unique_username_from_email(client_data['email'])
+        try:
+            with transaction.atomic():
+                return CLIENT_MODEL.objects.create_user(username=username, **user_data)
+        except IntegrityError:
+            if attempt == USERNAME_ATTEMPTS - 1:
+                raise
+            logger.info(f"Username {username} was taken in the meantime, retrying")
 
 
 def create_new_user(client_data: dict):
@@ -508,6 +595,35 @@ def get_appointment_slot_duration():
     return APPOINTMENT_SLOT_DURATION
 
 
+def appointment_overlap_q(start: datetime.datetime, end: datetime.datetime, inclusive: bool = True) -> Q:
+    """Return a Q matching the appointments whose request overlaps the wall-clock range [start, end].
+
+    The range is one predicate on the (staff_member, start_at, end_at) index. Requests whose `start_at` or `end_at`
+    is not filled yet (see the `backfill_appointment_datetimes` command) are compared on their date, start time and
+    end time instead, so that they keep blocking their slot.
+
+    :param start: The start of the range, a naive datetime.
+    :param end: The end of the range, a naive datetime.
+    :param inclusive: Whether ranges that only touch overlap.
+    :return: A Q object on `Appointment`.
+    """
+    before, after = ('lte', 'gte') if inclusive else ('lt', 'gt')
+    indexed = Q(**{f'appointment_request__start_at__{before}': make_appointment_datetime(end.date(), end.time()),
+                   f'appointment_request__end_at__{after}': make_appointment_datetime(start.date(), start.time())})
+    legacy = Q()
+    date = start.date()
+    while date <= end.date():
+        day = Q(appointment_request__date=date)
+        if date == end.date():
+            day &= Q(**{f'appointment_request__start_time__{before}': end.time()})
+        if date == start.date():
+            day &= Q(**{f'appointment_request__end_time__{after}': start.time()})
+        legacy |= day
+        date += datetime.timedelta(days=1)
+    not_backfilled = Q(appointment_request__start_at__isnull=True) | Q(appointment_request__end_at__isnull=True)
+    return indexed | (not_backfilled & legacy)
+
+
 def get_appointments_for_date_and_time(date, start_time, end_time, staff_member):
     """Returns all appointments that overlap with the specified date and time range.
 
@@ -519,21 +635,17 @@ def get_appointments_for_date_and_time(date, start_time, end_time, staff_member)
     :return: QuerySet, all appointments that overlap with the specified date and time range
     """
     return Appointment.objects.filter(
-            appointment_request__date=date,
-            appointment_request__start_time__lte=end_time,
-            appointment_request__end_time__gte=start_time,
+            appointment_overlap_q(datetime.datetime.combine(date, start_time), datetime.datetime.combine(date, end_time)),
             appointment_request__staff_member=staff_member
-    )
+    ).select_related('appointment_request')
 
 
 def get_config():
-    """Returns the configuration object from the database or the cache."""
-    config = cache.get('config')
-    if not config:
-        config = Config.objects.first()
-        # Cache the configuration for 1 hour (3600 seconds)
-        cache.set('config', config, 3600)
-    return config
+    """Returns the configuration object from the database or the cache.
+
+    The configuration is cached for 1 hour, and reloaded by a single request when it expires or changes.
+    """
+    return get_or_compute('config', Config.objects.first, 3600, 'config')
 
 
 def get_day_off_by_id(day_off_id):
@@ -562,6 +674,13 @@ def get_non_working_days_for_staff(staff_member_id):
         return []
 
 
+async def aget_non_working_days_for_staff(staff_member_id):
+    """Async version of `get_non_working_days_for_staff`."""
+    if not await StaffMember.objects.filter(id=staff_member_id).aexists():
+        return []
+    return list(set(range(7)) - await aget_working_days(staff_member_id))
+
+
 def get_staff_member_appointment_list(staff_member: StaffMember) -> list:
     """Get a list of appointments for the given staff member."""
     return Appointment.objects.filter(appointment_request__staff_member=staff_member)
@@ -677,15 +796,16 @@ def get_user_by_email(email: str):
 def get_website_name() -> str:
     """Get the website name from the configuration file.
 
+    The configured name is cached (see `appointment.signals`), since every e-mail reads it.
+
     :return: The website name
     """
-    from appointment.models import Config
-
-    config = Config.objects.first()
-
-    if config and config.website_name != "":
-        return config.website_name
-    return APPOINTMENT_WEBSITE_NAME
+    website_name = cache.get(WEBSITE_NAME_CACHE_KEY)
+    if website_name is None:
+        config = Config.objects.first()
+        website_name = config.website_name if config else ""
+        cache.set(WEBSITE_NAME_CACHE_KEY, website_name, 3600)
+    return website_name or APPOINTMENT_WEBSITE_NAME
 
 
 def get_working_hours_by_id(working_hours_id):
@@ -748,6 +868,12 @@ def is_working_day(staff_member: StaffMember, day: int) -> bool:
     return day in working_days
 
 
+async def aget_working_days(staff_member_id) -> set:
+    """Return the days of the week (0=Sunday) the given staff member works, using the async ORM."""
+    return {day async for day in WorkingHours.objects.filter(staff_member_id=staff_member_id).values_list(
+            'day_of_week', flat=True)}
+
+
 def working_hours_exist(day_of_week, staff_member):
     """Check if working hours exist for the given day of the week and staff member."""
     return WorkingHours.objects.filter(day_of_week=day_of_week, staff_member=staff_member).exists()
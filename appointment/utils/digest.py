@@ -0,0 +1,129 @@
+# digest.py
+# Path: appointment/utils/digest.py
+
+"""
+Author: Adams Pierre David
+Since: 3.11.0
+
+Digest e-mails: the daily agenda of every staff member, and the coalesced notifications of the admins.
+
+`send_staff_agenda_digests` loads the appointments of a day for all staff members with one query, groups them per
+staff member and sends one e-mail each, as a single batch. It runs daily when `APPOINTMENT_STAFF_DIGEST_TIME` is set
+(see `AppointmentConfig.ready`).
+
+When `APPOINTMENT_ADMIN_DIGEST_MINUTES` is set, `notify_admin_about_appointment` and `notify_admin_about_reschedule`
+stop e-mailing the admins on every event; `send_admin_digest` sends them the new and rescheduled appointments of the
+elapsed window instead, every that many minutes. Staff members are still notified of each event.
+"""
+
+import datetime
+from itertools import groupby
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from django.utils.translation import gettext as _
+
+from appointment.logger_config import get_logger
+from appointment.models import Appointment, AppointmentRescheduleHistory
+from appointment.utils.db_helpers import get_website_name
+from appointment.utils.email_ops import EmailBatch
+from appointment.utils.template_helpers import get_email_template
+
+logger = get_logger(__name__)
+
+ADMIN_DIGEST_LAST_RUN_KEY = 'appointment:admin_digest:last_run'
+
+
+def get_staff_digest_time():
+    """Get the value of the APPOINTMENT_STAFF_DIGEST_TIME setting ('HH:MM', None disables the staff digest)."""
+    return getattr(settings, 'APPOINTMENT_STAFF_DIGEST_TIME', None)
+
+
+def get_admin_digest_minutes() -> int:
+    """Get the value of the APPOINTMENT_ADMIN_DIGEST_MINUTES setting (0 keeps one admin e-mail per event)."""
+    return getattr(settings, 'APPOINTMENT_ADMIN_DIGEST_MINUTES', 0)
+
+
+def _with_relations(queryset):
+    return queryset.select_related('client', 'appointment_request__service', 'appointment_request__staff_member__user')
+
+
+def get_staff_agendas(date) -> list:
+    """Return the appointments of a day grouped per staff member, from a single query.
+
+    :param date: The day.
+    :return: A list of (staff member, appointments ordered by start time) tuples.
+    """
+    appointments = _with_relations(Appointment.objects.filter(
+            appointment_request__date=date, appointment_request__staff_member__isnull=False
+    )).order_by('appointment_request__staff_member_id', 'appointment_request__start_time')
+    return [(agenda[0].appointment_request.staff_member, agenda) for agenda in (
+        list(group) for _staff_member_id, group in groupby(
+                appointments, key=lambda appointment: appointment.appointment_request.staff_member_id))]
+
+
+def send_staff_agenda_digests(date=None, dry_run=False) -> dict:
+    """E-mail every staff member their appointments of a day, in one batch.
+
+    :param date: The day, tomorrow by default.
+    :param dry_run: Only count the e-mails that would be sent.
+    :return: The date and the number of staff members and appointments covered.
+    """
+    date = date or timezone.localdate() + datetime.timedelta(days=1)
+    agendas = [(staff_member, appointments) for staff_member, appointments in get_staff_agendas(date)
+               if staff_member.user.email]
+    if agendas and not dry_run:
+        template_url = get_email_template('staff_agenda_digest.html', 'email_sender/staff_agenda_digest_email.html')
+        company = get_website_name()
+        formatted_date = date.strftime("%A, %d %B %Y")
+        batch = EmailBatch()
+        for staff_member, appointments in agendas:
+            batch.add([staff_member.user.email], _("Your appointments for {date}").format(date=formatted_date),
+                      template_url=template_url, context={
+                          'staff_member_name': staff_member.get_staff_member_name(),
+                          'date': formatted_date,
+                          'appointments': appointments,
+                          'company': company,
+                      })
+        batch.send()
+    result = {'date': date.isoformat(), 'staff_members': len(agendas),
+              'appointments': sum(len(appointments) for _staff_member, appointments in agendas)}
+    logger.info(f"Staff agenda digests for {result['date']}: {result['staff_members']} staff member(s), "
+                f"{result['appointments']} appointment(s)")
+    return result
+
+
+def send_admin_digest(until=None) -> dict:
+    """E-mail the admins the appointments booked and the reschedules confirmed since the previous digest.
+
+    The window starts where the previous run ended, or APPOINTMENT_ADMIN_DIGEST_MINUTES before `until` on the first
+    run.
+
+    :param until: The end of the window, now by default.
+    :return: The window and the number of events sent.
+    """
+    until = until or timezone.now()
+    since = cache.get(ADMIN_DIGEST_LAST_RUN_KEY) or until - datetime.timedelta(minutes=get_admin_digest_minutes())
+    new_appointments = list(_with_relations(Appointment.objects.filter(created_at__gte=since, created_at__lt=until))
+                            .order_by('created_at'))
+    reschedules = list(AppointmentRescheduleHistory.objects.filter(
+            reschedule_status='confirmed', updated_at__gte=since, updated_at__lt=until
+    ).select_related('appointment_request__service', 'appointment_request__staff_member__user',
+                     'appointment_request__appointment__client').order_by('updated_at'))
+
+    admin_emails = [email for name, email in settings.ADMINS]
+    if admin_emails and (new_appointments or reschedules):
+        template_url = get_email_template('admin_digest.html', 'email_sender/admin_digest_email.html')
+        batch = EmailBatch()
+        batch.add(admin_emails, _("Appointment activity summary"), template_url=template_url, context={
+            'new_appointments': new_appointments,
+            'reschedules': reschedules,
+            'since': timezone.localtime(since),
+            'until': timezone.localtime(until),
+            'company': get_website_name(),
+        })
+        batch.send()
+    cache.set(ADMIN_DIGEST_LAST_RUN_KEY, until, None)
+    return {'since': since.isoformat(), 'until': until.isoformat(), 'new_appointments': len(new_appointments),
+            'reschedules': len(reschedules)}
@@ -16,7 +16,8 @@ from django.utils.http import urlsafe_base64_encode
 from django.utils.translation import gettext as _
 
 from appointment import messages_ as email_messages
-from appointment.email_sender import notify_admin, send_email
+from appointment.email_sender import send_email, send_emails
+from appointment.email_sender.email_sender import render_email_template
 from appointment.logger_config import get_logger
 from appointment.models import Appointment, AppointmentRequest, EmailVerificationCode, PasswordResetToken
 from appointment.settings import APPOINTMENT_PAYMENT_URL
@@ -28,6 +29,40 @@ from appointment.utils.template_helpers import get_email_template
 logger = get_logger(__name__)
 
 
+class EmailBatch:
+    """The e-mails sent for one event, handed to `send_emails` together.
+
+    Templates are rendered once per (template, context) pair, so a context dictionary must not be changed after being
+    added. The ICS file of an appointment is generated once per batch.
+    """
+
+    def __init__(self):
+        self.emails = []
+        self._rendered = {}
+        self._ics_files = {}
+
+    def add(self, recipient_list, subject, template_url=None, context=None, message=None, attachments=None):
+        if not recipient_list:
+            return
+        email = {'recipient_list': list(recipient_list), 'subject': subject, 'message': message,
+                 'attachments': attachments}
+        if template_url:
+            key = (template_url, id(context))
+            if key not in self._rendered:
+                # Holding the context keeps its id from being reused by another dictionary.
+                self._rendered[key] = (context, render_email_template(template_url, context))
+            email['html_message'] = self._rendered[key][1]
+        self.emails.append(email)
+
+    def ics_attachment(self, appointment):
+        if appointment.pk not in self._ics_files:
+            self._ics_files[appointment.pk] = ('appointment.ics', generate_ics_file(appointment), 'text/calendar')
+        return self._ics_files[appointment.pk]
+
+    def send(self):
+        send_emails(self.emails)
+
+
 def get_thank_you_message(ar: AppointmentRequest) -> str:
     """
     Get the appropriate email message based on the appointment request.
@@ -79,8 +114,9 @@ def send_thank_you_email(ar: AppointmentRequest, user, request, email: str, appo
                 "you to manage your appointments, view service details, and make any necessary adjustments with ease.")
 
     # let's get the ics file
-    appt = Appointment.objects.get(appointment_request=ar)
-    ics_file = generate_ics_file(appt)
+    appt = Appointment.objects.select_related('client', 'appointment_request__service',
+                                              'appointment_request__staff_member__user').get(appointment_request=ar)
+    batch = EmailBatch()
 
     email_context = {
         'first_name': user.first_name,
@@ -100,13 +136,9 @@ def send_thank_you_email(ar: AppointmentRequest, user, request, email: str, appo
     # User must name their template 'thank_you.html' in their email directory
     template_path = get_email_template('thank_you.html', 'email_sender/thank_you_email.html')
 
-    send_email(
-            recipient_list=[email],
-            subject=_("Thank you for booking us."),
-            template_url=template_path,
-            context=email_context,
-            attachments=[('appointment.ics', ics_file, 'text/calendar')]
-    )
+    batch.add([email], _("Thank you for booking us."), template_url=template_path, context=email_context,
+              attachments=[batch.ics_attachment(appt)])
+    batch.send()
 
 
 def send_reset_link_to_staff_member(user, request, email: str, account_details=None):
@@ -189,16 +221,22 @@ def send_reset_link_to_staff_member(user, request, email: str, account_details=N
         )
 
 
+def get_notified_admins() -> list:
+    """Return the (name, e-mail) of the admins notified of every new or rescheduled appointment.
+
+    None are when the admins get periodic digests instead (see `appointment.utils.digest`).
+    """
+    from appointment.utils.digest import get_admin_digest_minutes
+    return [] if get_admin_digest_minutes() else list(settings.ADMINS)
+
+
 def notify_admin_about_appointment(appointment, client_name: str):
     """Notify admin with custom template support."""
 
     logger.info(f"Sending notifications for new appointment {appointment.id}")
 
     staff_member = appointment.get_staff_member()
-    ics_file = generate_ics_file(appointment)
-
-    # Create a set to keep track of notified email addresses
-    notified_emails = set()
+    batch = EmailBatch()
 
     # Prepare the staff member notification
     staff_email = staff_member.user.email
@@ -219,11 +257,13 @@ def notify_admin_about_appointment(appointment, client_name: str):
         'is_staff_member': True,
         'staff_member_name': staff_name
     }
+    subject = _("New Appointment Request for ") + client_name
 
-    # Notify admins
-    for admin_name, admin_email in settings.ADMINS:
+    # Notify admins, each address once
+    notified_emails = set()
+    for admin_name, admin_email in get_notified_admins():
         if admin_email in notified_emails:
-            continue  # Skip if this email has already been notified
+            continue
 
         is_staff_admin = admin_email == staff_email
         email_context = staff_context if is_staff_admin else {
@@ -233,31 +273,17 @@ def notify_admin_about_appointment(appointment, client_name: str):
             'is_staff_member': False,
             'staff_member_name': staff_name
         }
-
-        subject = _("New Appointment Request for ") + client_name
-        attachments = [('appointment.ics', ics_file, 'text/calendar')] if is_staff_admin else None
-
-        notify_admin(
-                subject=subject,
-                template_url=template_path,
-                context=email_context,
-                recipient_email=admin_email,
-                attachments=attachments
-        )
-
+        attachments = [batch.ics_attachment(appointment)] if is_staff_admin else None
+        batch.add([admin_email], subject, template_url=template_path, context=email_context, attachments=attachments)
         notified_emails.add(admin_email)
 
     # Notify staff member if they haven't been notified as an admin
     if staff_email not in notified_emails:
         logger.info(f"Notifying the staff member for new appointment {appointment.id}")
-        send_email(
-                recipient_list=[staff_email],
-                subject=_("New Appointment Request for ") + client_name,
-                template_url=template_path,
-                context=staff_context,
-                attachments=[('appointment.ics', ics_file, 'text/calendar')]
-        )
+        batch.add([staff_email], subject, template_url=template_path, context=staff_context,
+                  attachments=[batch.ics_attachment(appointment)])
 
+    batch.send()
     logger.info(f"Notifications sent for appointment {appointment.id}")
 
 
@@ -351,22 +377,23 @@ def notify_admin_about_reschedule(reschedule_history, appointment_request, clien
     }
 
     # let's get the new ics file
-    appt = Appointment.objects.get(appointment_request=appointment_request)
-    ics_file = generate_ics_file(appt)
+    appt = Appointment.objects.select_related(
+            'client', 'appointment_request__service', 'appointment_request__staff_member__user'
+    ).get(appointment_request=appointment_request)
+    batch = EmailBatch()
+    attachments = [batch.ics_attachment(appt)]
 
     subject = _("Reschedule Request for ") + client_name
-    staff_member = appointment_request.staff_member
+    staff_email = appt.appointment_request.staff_member.user.email
 
     # User must name their template 'notify_admin_about_reschedule_email.html' in their email directory
     template_path = get_email_template('notify_admin_about_reschedule_email.html', 'email_sender/reschedule_email.html')
 
-    # Notifying admin
-    notify_admin(subject=subject, template_url=template_path, context=email_context,
-                 attachments=[('appointment.ics', ics_file, 'text/calendar')])
-
-    if staff_member.user.email not in settings.ADMINS:
-        send_email(recipient_list=[staff_member.user.email], subject=subject, context=email_context,
-                   template_url=template_path,
-                   attachments=[('appointment.ics', ics_file, 'text/calendar')])
+    # The admins and the staff member get the same e-mail, rendered once
+    admin_emails = [email for name, email in get_notified_admins()]
+    batch.add(admin_emails, subject, template_url=template_path, context=email_context, attachments=attachments)
+    if staff_email not in admin_emails:
+        batch.add([staff_email], subject, template_url=template_path, context=email_context, attachments=attachments)
+    batch.send()
 
     logger.info(f"Reschedule notifications sent for appointment {appointment_request.id}")
@@ -24,3 +24,4 @@ class ErrorCode(Enum):
     WORKING_HOURS_CONFLICT = auto()
     SERVICE_NOT_FOUND = auto()
     STAFF_MEMBER_NOT_FOUND = auto()
+    STALE_APPOINTMENT = auto()
@@ -0,0 +1,376 @@
+# importer.py
+# Path: appointment/utils/importer.py
+
+"""
+Author: Adams Pierre David
+Since: 3.11.0
+
+Bulk import of appointments from another booking tool, as CSV or ICS.
+
+Both readers are generators: a CSV file is read row by row and an ICS file event by event, so that files with hundreds
+of thousands of appointments are imported with a bounded memory footprint. `import_appointments` consumes the rows by
+batches; for each batch:
+
+- services (by name), staff members (by e-mail) and clients (by e-mail) are resolved with one query each, services
+  and staff members being kept for the next batches;
+- the existing appointments of the staff members on the dates of the batch are read with one query, then every
+  staff-day is swept in start order: an incoming row overlapping an existing appointment or an earlier row of the
+  file, once the staff member's gap time is added, is rejected;
+- missing clients, appointment requests and appointments are inserted with `bulk_create`, in one transaction.
+
+`save()` is bypassed, as in `seed`, and with it `full_clean()` and the signals: the rows are made consistent here
+(request IDs, `start_at`/`end_at`, `amount_to_pay`) and the availability cache of every staff-day touched is
+invalidated. Working hours and days off are not checked, since imported calendars may predate them. Rejected rows are
+handed to `on_reject` with the reason.
+"""
+
+import bisect
+import csv
+import datetime
+import time
+from collections import defaultdict
+
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.utils import timezone
+from django.utils.translation import gettext as _
+from icalendar import Event
+from phonenumber_field.phonenumber import PhoneNumber
+
+from appointment.email_sender import send_emails
+from appointment.models import Appointment, AppointmentRequest, Service, StaffMember
+from appointment.settings import APPOINTMENT_CLEANUP_BATCH_SIZE
+from appointment.utils.availability_cache import invalidate_staff_day_availability
+from appointment.utils.date_time import convert_str_to_date, convert_str_to_time
+from appointment.utils.db_helpers import (
+    allocate_usernames, get_config, get_user_model, parse_name, username_in_user_model)
+from appointment.utils.seed import assign_primary_keys
+from appointment.utils.view_helpers import generate_id_request
+
+FIELDS = ('date', 'start_time', 'end_time', 'service', 'staff_member', 'client_email', 'client_name', 'phone',
+          'address', 'want_reminder', 'paid', 'additional_info')
+TRUE_VALUES = ('1', 'true', 'yes', 'y')
+
+
+class ImportRowError(ValueError):
+    """Raised when a row cannot be imported; the message is written to the rejects."""
+
+
+def read_csv_rows(stream):
+    """Yield `(line number, row)` for every row of a CSV file whose header names the columns of `FIELDS`.
+
+    Header names are matched case-insensitively; unknown columns are ignored.
+    """
+    reader = csv.reader(stream)
+    header = [name.strip().lower() for name in next(reader, [])]
+    for values in reader:
+        if any(value.strip() for value in values):
+            yield reader.line_num, {name: value.strip() for name, value in zip(header, values) if name in FIELDS}
+
+
+def _ics_value(event, name):
+    value = event.get(name)
+    return str(value).strip() if value is not None else ''
+
+
+def _ics_row(event):
+    start = event.decoded('dtstart')
+    if not isinstance(start, datetime.datetime):
+        raise ImportRowError("All-day events cannot be imported.")
+    if 'dtend' in event:
+        end = event.decoded('dtend')
+    elif 'duration' in event:
+        end = start + event.decoded('duration')
+    else:
+        end = None
+    if timezone.is_aware(start):
+        start = timezone.localtime(start)
+        end = timezone.localtime(end) if end else None
+    if end and end.date() != start.date():
+        raise ImportRowError("Appointments spanning several days cannot be imported.")
+    attendee = event.get('attendee')
+    if isinstance(attendee, list):
+        attendee = attendee[0]
+    return {
+        'date': start.date().isoformat(),
+        'start_time': start.strftime('%H:%M'),
+        'end_time': end.strftime('%H:%M') if end else '',
+        'service': _ics_value(event, 'summary'),
+        'staff_member': _ics_value(event, 'organizer').split(':', 1)[-1],
+        'client_email': str(attendee).split(':', 1)[-1].strip() if attendee is not None else '',
+        'client_name': str(attendee.params.get('CN', '')) if attendee is not None else '',
+        'address': _ics_value(event, 'location'),
+        'additional_info': _ics_value(event, 'description'),
+    }
+
+
+def read_ics_rows(stream):
+    """Yield `(UID, row)` for every event of an ICS file, reading one VEVENT at a time.
+
+    The event's summary is the service, its organizer the staff member and its first attendee the client, as in the
+    files made by `ics_utils.generate_ics_file`. Events that cannot be read are yielded with an `ImportRowError` as
+    row.
+    """
+    lines, count = None, 0
+    for line in stream:
+        stripped = line.rstrip('\r\n')
+        if stripped.upper() == 'BEGIN:VEVENT':
+            lines = [stripped]
+        elif lines is not None:
+            lines.append(stripped)
+            if stripped.upper() == 'END:VEVENT':
+                count += 1
+                try:
+                    event = Event.from_ical('\r\n'.join(lines))
+                    source = _ics_value(event, 'uid') or f"event {count}"
+                    yield source, _ics_row(event)
+                except (ImportRowError, ValueError, KeyError) as e:
+                    yield f"event {count}", ImportRowError(str(e))
+                lines = None
+
+
+def _parse_bool(value) -> bool:
+    return str(value or '').strip().lower() in TRUE_VALUES
+
+
+def _minutes(value: datetime.time) -> int:
+    return value.hour * 60 + value.minute
+
+
+class _Importer:
+    def __init__(self, dry_run, notify, on_reject):
+        self.dry_run = dry_run
+        self.notify = notify
+        self.on_reject = on_reject
+        self.services = {}
+        self.staff_members = {}
+        self.offered = set()
+        config = get_config()
+        self.default_gap = config.slot_gap_time if config and config.slot_gap_time is not None else 0
+        self.password = make_password(None)
+        self.with_username = username_in_user_model()
+        self.counts = {'read': 0, 'imported': 0, 'rejected': 0, 'clients_created': 0, 'notified': 0, 'batches': 0}
+
+    def reject(self, source, row, reason):
+        self.counts['rejected'] += 1
+        if self.on_reject:
+            self.on_reject(source, row if isinstance(row, dict) else {}, str(reason))
+
+    def resolve(self, rows):
+        """Load the services and staff members of the batch that are not known yet."""
+        names = {row.get('service', '') for _source, row in rows} - set(self.services)
+        if names:
+            for service in Service.objects.filter(name__in=names).order_by('-pk'):
+                # The oldest service wins when several have the same name
+                self.services[service.name] = service
+            # Unknown names are remembered too, so that they are looked up once
+            self.services.update({name: None for name in names if name not in self.services})
+        emails = {row.get('staff_member', '') for _source, row in rows
+                  if row.get('staff_member', '').lower() not in self.staff_members}
+        if emails:
+            emails |= {email.lower() for email in emails}
+            for staff_member in StaffMember.objects.select_related('user').prefetch_related(
+                    'services_offered').filter(user__email__in=emails):
+                self.staff_members[staff_member.user.email.lower()] = staff_member
+                self.offered.update((staff_member.id, service.id) for service in staff_member.services_offered.all())
+            self.staff_members.update({email.lower(): None for email in emails
+                                       if email.lower() not in self.staff_members})
+
+    def parse(self, row):
+        """Return the appointment request and the appointment fields of a row, or raise `ImportRowError`."""
+        service = self.services.get(row.get('service', ''))
+        if service is None:
+            raise ImportRowError(f"Unknown service: {row.get('service', '')!r}.")
+        staff_member = self.staff_members.get(row.get('staff_member', '').lower())
+        if staff_member is None:
+            raise ImportRowError(f"Unknown staff member: {row.get('staff_member', '')!r}.")
+        if (staff_member.id, service.id) not in self.offered:
+            raise ImportRowError(f"{staff_member.get_staff_member_name()} does not offer {service.name}.")
+        if not row.get('client_email'):
+            raise ImportRowError("The client e-mail is required.")
+        try:
+            date = convert_str_to_date(row.get('date', ''))
+            start_time = convert_str_to_time(row.get('start_time', ''))
+            if row.get('end_time'):
+                end_time = convert_str_to_time(row['end_time'])
+            else:
+                end = datetime.datetime.combine(date, start_time) + service.duration
+                if end.date() != date:
+                    raise ValueError("The appointment would end on the next day.")
+                end_time = end.time()
+        except ValueError as e:
+            raise ImportRowError(str(e))
+        if end_time <= start_time:
+            raise ImportRowError("The end time must be after the start time.")
+        phone = ''
+        if row.get('phone'):
+            try:
+                phone = PhoneNumber.from_string(row['phone'])
+            except Exception:
+                phone = None
+            if phone is None or not phone.is_valid():
+                raise ImportRowError(f"Invalid phone number: {row['phone']!r}.")
+        return {
+            'service': service, 'staff_member': staff_member, 'date': date, 'start_time': start_time,
+            'end_time': end_time, 'client_email': row['client_email'], 'client_name': row.get('client_name', ''),
+            'phone': phone, 'address': row.get('address', ''), 'additional_info': row.get('additional_info', ''),
+            'want_reminder': _parse_bool(row.get('want_reminder')), 'paid': _parse_bool(row.get('paid')),
+        }
+
+    def sweep(self, candidates):
+        """Split the candidates into accepted and conflicting ones, per staff-day, in start order.
+
+        :param candidates: A list of (source, row, fields).
+        :return: The accepted candidates and the rejected ones with their reason.
+        """
+        by_day = defaultdict(list)
+        for candidate in candidates:
+            fields = candidate[2]
+            by_day[(fields['staff_member'].id, fields['date'])].append(candidate)
+        existing = defaultdict(list)
+        for staff_member_id, date, start_time, end_time in AppointmentRequest.objects.filter(
+                staff_member_id__in={staff_member_id for staff_member_id, _date in by_day},
+                date__in={date for _staff_member_id, date in by_day}, appointment__isnull=False
+        ).values_list('staff_member_id', 'date', 'start_time', 'end_time'):
+            if (staff_member_id, date) in by_day:
+                existing[(staff_member_id, date)].append((_minutes(start_time), _minutes(end_time)))
+
+        accepted, rejected = [], []
+        for key, day_candidates in by_day.items():
+            staff_member = day_candidates[0][2]['staff_member']
+            gap = staff_member.slot_gap_time if staff_member.slot_gap_time is not None else self.default_gap
+            booked = sorted(existing.get(key, ()))
+            booked_starts = [start for start, _end in booked]
+            # End of the last slot taken before the current start, by an existing appointment or an accepted row
+            last_end, position = None, 0
+            day_candidates.sort(key=lambda candidate: (candidate[2]['start_time'], candidate[2]['end_time']))
+            for candidate in day_candidates:
+                start, end = _minutes(candidate[2]['start_time']), _minutes(candidate[2]['end_time'])
+                while position < len(booked) and booked[position][0] <= start:
+                    last_end = max(last_end or 0, booked[position][1])
+                    position += 1
+                next_start = booked_starts[position] if position < len(booked) else None
+                if (last_end is not None and start < last_end + gap) or (
+                        next_start is not None and next_start < end + gap):
+                    rejected.append((candidate, "Overlaps another appointment of the staff member."))
+                    continue
+                accepted.append(candidate)
+                # Later rows are checked against this one as if it already existed
+                insert_at = bisect.bisect_left(booked_starts, start, lo=position)
+                booked.insert(insert_at, (start, end))
+                booked_starts.insert(insert_at, start)
+        return accepted, rejected
+
+    def clients(self, accepted):
+        """Return the users of the accepted rows by e-mail, creating the missing ones."""
+        User = get_user_model()
+        emails = {fields['client_email'] for _source, _row, fields in accepted}
+        users = {user.email: user for user in User.objects.filter(email__in=emails)}
+        missing = {}
+        for _source, _row, fields in accepted:
+            email = fields['client_email']
+            if email not in users and email not in missing:
+                first_name, last_name = parse_name(fields['client_name'] or email.split('@')[0])
+                missing[email] = User(email=email, first_name=first_name, last_name=last_name,
+                                      password=self.password)
+        if missing and not self.dry_run:
+            if self.with_username:
+                for user, username in zip(missing.values(), allocate_usernames(list(missing))):
+                    user.username = username
+            users.update({user.email: user for user in assign_primary_keys(
+                    User.objects.bulk_create(list(missing.values())), 'email')})
+        self.counts['clients_created'] += len(missing)
+        return users
+
+    def insert(self, accepted):
+        users = self.clients(accepted)
+        if self.dry_run:
+            return []
+        requests = []
+        for _source, _row, fields in accepted:
+            request = AppointmentRequest(
+                    date=fields['date'], start_time=fields['start_time'], end_time=fields['end_time'],
+                    service=fields['service'], staff_member=fields['staff_member'], payment_type='full',
+                    id_request=generate_id_request())
+            # bulk_create() does not call save()
+            request.set_start_and_end_at()
+            requests.append(request)
+        requests = assign_primary_keys(AppointmentRequest.objects.bulk_create(requests), 'id_request')
+        appointments = Appointment.objects.bulk_create([
+            Appointment(client=users[fields['client_email']], appointment_request=request, phone=fields['phone'],
+                        address=fields['address'], additional_info=fields['additional_info'],
+                        want_reminder=fields['want_reminder'], paid=fields['paid'],
+                        amount_to_pay=fields['service'].price, id_request=generate_id_request())
+            for request, (_source, _row, fields) in zip(requests, accepted)
+        ])
+        return appointments
+
+    def notification(self, appointment):
+        client, request = appointment.client, appointment.appointment_request
+        return {'recipient_list': [client.email], 'subject': _("Your appointment"), 'message': _(
+                "Hello {first_name},\n\nYour {service} appointment on {date} at {time} with {staff_member} has been "
+                "booked.").format(first_name=client.first_name, service=request.service.name, date=request.date,
+                                  time=request.start_time.strftime('%H:%M'),
+                                  staff_member=request.staff_member.get_staff_member_name())}
+
+    def process(self, batch):
+        self.counts['read'] += len(batch)
+        self.counts['batches'] += 1
+        rows = [(source, row) for source, row in batch if isinstance(row, dict)]
+        for source, error in batch:
+            if not isinstance(error, dict):
+                self.reject(source, None, error)
+        self.resolve(rows)
+        candidates = []
+        for source, row in rows:
+            try:
+                candidates.append((source, row, self.parse(row)))
+            except ImportRowError as e:
+                self.reject(source, row, e)
+        accepted, conflicts = self.sweep(candidates)
+        for (source, row, _fields), reason in conflicts:
+            self.reject(source, row, reason)
+        if not accepted:
+            return
+        with transaction.atomic():
+            appointments = self.insert(accepted)
+        self.counts['imported'] += len(accepted)
+        if self.dry_run:
+            return
+        for staff_member_id, date in {(fields['staff_member'].id, fields['date']) for _s, _r, fields in accepted}:
+            invalidate_staff_day_availability(staff_member_id, date)
+        if self.notify:
+            emails = [self.notification(appointment) for appointment in appointments]
+            send_emails(emails)
+            self.counts['notified'] += len(emails)
+
+
+def import_appointments(rows, batch_size: int = None, dry_run: bool = False, notify: bool = False, on_reject=None,
+                        progress=None) -> dict:
+    """Import appointments from rows made by `read_csv_rows` or `read_ics_rows`.
+
+    :param rows: An iterable of (source, row) pairs; the source (a line number, a UID) identifies rejected rows.
+    :param batch_size: Rows resolved, checked and inserted at a time (defaults to APPOINTMENT_CLEANUP_BATCH_SIZE).
+    :param dry_run: Check the rows without writing anything.
+    :param notify: E-mail the clients of the imported appointments, one `send_emails` batch per batch of rows.
+    :param on_reject: Optional callable receiving the source, the row and the reason of every rejected row.
+    :param progress: Optional callable receiving the running counts after each batch.
+    :return: The number of rows read, imported and rejected, of clients created and notified, of batches, and the
+        elapsed seconds.
+    """
+    batch_size = batch_size or APPOINTMENT_CLEANUP_BATCH_SIZE
+    importer = _Importer(dry_run, notify, on_reject)
+    started = time.perf_counter()
+    batch = []
+    for item in rows:
+        batch.append(item)
+        if len(batch) == batch_size:
+            importer.process(batch)
+            batch = []
+            if progress:
+                progress(importer.counts)
+    if batch:
+        importer.process(batch)
+        if progress:
+            progress(importer.counts)
+    return {**importer.counts, 'seconds': round(time.perf_counter() - started, 3)}
@@ -36,6 +36,7 @@ def convert_appointment_to_json(request, appointments: list) -> list:
         "staff_id": appt.appointment_request.staff_member.id,
         "additional_info": appt.additional_info,
         "want_reminder": appt.want_reminder,
+        "updated_at": appt.updated_at.isoformat(),
     } for appt in appointments]
 
 
@@ -0,0 +1,226 @@
+# metrics.py
+# Path: appointment/utils/metrics.py
+
+"""
+Author: Adams Pierre David
+Since: 3.11.0
+
+Prometheus counters and histograms for the booking hot paths, served in the text exposition format by
+`views_admin.get_metrics`.
+
+Values live in a Django cache (`APPOINTMENT_METRICS_CACHE`, `'default'` by default) and are updated with
+`cache.incr()`, so every worker process of a deployment adds to the same series when that cache is shared (Redis,
+Memcached, database or file-based cache). Increments are atomic with Redis and Memcached; the database and
+file-based caches may lose a few under contention. Values are stored without expiry; when the cache is cleared or
+evicts them, Prometheus sees a counter reset.
+
+Labels only take the values declared with the metric, which keeps the series known in advance: rendering reads them
+all with a single `get_many()`.
+"""
+
+import itertools
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import caches
+
+from appointment.logger_config import get_logger
+
+logger = get_logger(__name__)
+
+CACHE_PREFIX = 'appointment:metrics'
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+# Histogram sums are stored as integers, in millionths of the observed unit
+SUM_SCALE = 1_000_000
+
+
+def get_metrics_enabled() -> bool:
+    """Get the value of the APPOINTMENT_METRICS_ENABLED setting."""
+    return getattr(settings, 'APPOINTMENT_METRICS_ENABLED', False)
+
+
+def get_metrics_token():
+    """Get the value of the APPOINTMENT_METRICS_TOKEN setting, the bearer token expected from scrapers."""
+    return getattr(settings, 'APPOINTMENT_METRICS_TOKEN', None)
+
+
+def get_metrics_cache():
+    """Return the cache named by the APPOINTMENT_METRICS_CACHE setting."""
+    return caches[getattr(settings, 'APPOINTMENT_METRICS_CACHE', 'default')]
+
+
+def _incr(key, amount):
+    store = get_metrics_cache()
+    try:
+        store.incr(key, amount)
+    except ValueError:
+        # First increment: `add()` only succeeds for one of the processes racing to create the key.
+        if not store.add(key, amount, timeout=None):
+            store.incr(key, amount)
+    except Exception as e:
+        logger.warning(f"Could not update metric {key}: {e}")
+
+
+def _format_value(value):
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name: str, documentation: str, labels: dict = None):
+        """
+        :param name: The metric name.
+        :param documentation: The help text.
+        :param labels: A dictionary mapping each label name to the tuple of values it can take.
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels or {}
+        REGISTRY.append(self)
+
+    def _label_key(self, labels: dict) -> str:
+        if set(labels) != set(self.labels):
+            raise ValueError(f"{self.name} expects the labels {sorted(self.labels)}, got {sorted(labels)}.")
+        for label, value in labels.items():
+            if value not in self.labels[label]:
+                raise ValueError(f"Unknown value {value!r} for the label {label} of {self.name}.")
+        return ','.join(f'{label}="{labels[label]}"' for label in sorted(self.labels))
+
+    def _label_sets(self):
+        names = sorted(self.labels)
+        return [','.join(f'{name}="{value}"' for name, value in zip(names, values))
+                for values in itertools.product(*(self.labels[name] for name in names))]
+
+    def _key(self, label_key, suffix):
+        return f"{CACHE_PREFIX}:{self.name}:{label_key}:{suffix}"
+
+    def keys(self):
+        raise NotImplementedError
+
+    def render(self, values: dict):
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount: int = 1, **labels):
+        if not get_metrics_enabled() or amount <= 0:
+            return
+        _incr(self._key(self._label_key(labels), 'total'), amount)
+
+    def keys(self):
+        return [self._key(label_key, 'total') for label_key in self._label_sets()]
+
+    def render(self, values):
+        lines = []
+        for label_key in self._label_sets():
+            series = f"{self.name}{{{label_key}}}" if label_key else self.name
+            lines.append(f"{series} {_format_value(values.get(self._key(label_key, 'total'), 0))}")
+        return lines
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name: str, documentation: str, buckets, labels: dict = None):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        if not get_metrics_enabled():
+            return
+        label_key = self._label_key(labels)
+        # Buckets are stored non-cumulatively, one increment per observation, and accumulated when rendered.
+        bucket = next((str(bound) for bound in self.buckets if value <= bound), '+Inf')
+        _incr(self._key(label_key, f'bucket:{bucket}'), 1)
+        _incr(self._key(label_key, 'count'), 1)
+        _incr(self._key(label_key, 'sum'), int(round(value * SUM_SCALE)))
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of the block, in seconds."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def keys(self):
+        keys = []
+        for label_key in self._label_sets():
+            keys += [self._key(label_key, f'bucket:{bound}') for bound in self.buckets + ('+Inf',)]
+            keys += [self._key(label_key, 'count'), self._key(label_key, 'sum')]
+        return keys
+
+    def render(self, values):
+        lines = []
+        for label_key in self._label_sets():
+            prefix = f"{label_key}," if label_key else ''
+            cumulative = 0
+            for bound in self.buckets + ('+Inf',):
+                cumulative += values.get(self._key(label_key, f'bucket:{bound}'), 0)
+                lines.append(f'{self.name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+            suffix = f"{{{label_key}}}" if label_key else ''
+            total = values.get(self._key(label_key, 'sum'), 0) / SUM_SCALE
+            lines.append(f"{self.name}_sum{suffix} {_format_value(total)}")
+            lines.append(f"{self.name}_count{suffix} {values.get(self._key(label_key, 'count'), 0)}")
+        return lines
+
+
+REGISTRY = []
+
+EMAIL_FUNCTIONS = ('send_email', 'notify_admin', 'send_email_task', 'send_emails', 'send_emails_task')
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+
+SLOT_COMPUTATION_SECONDS = Histogram(
+        'appointment_slot_computation_seconds',
+        "Time spent computing the available slots of a staff member for a day.", LATENCY_BUCKETS)
+SLOTS_RETURNED = Histogram(
+        'appointment_slots_returned', "Number of available slots returned for a staff member and a day.",
+        (0, 1, 2, 4, 8, 16, 32, 64))
+AVAILABILITY_CACHE_REQUESTS = Counter(
+        'appointment_availability_cache_requests_total',
+        "Lookups in the availability and configuration caches: hits, misses computed by the caller, stale values "
+        "served and waits while another worker computes the value.",
+        {'cache': ('heatmap', 'slots', 'config'), 'result': ('hit', 'miss', 'stale', 'wait')})
+BOOKINGS = Counter(
+        'appointment_bookings_total',
+        "Appointments created from an appointment request, and attempts refused because the request was already "
+        "booked or is invalid.",
+        {'result': ('created', 'conflict')})
+EMAILS = Counter(
+        'appointment_emails_total', "E-mails handled, by sending function and outcome.",
+        {'function': EMAIL_FUNCTIONS, 'result': ('sent', 'failed', 'queued', 'skipped')})
+SMTP_SECONDS = Histogram(
+        'appointment_smtp_seconds', "Time spent handing e-mails to the mail backend.",
+        (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10), {'function': EMAIL_FUNCTIONS})
+REMINDER_LAG_SECONDS = Histogram(
+        'appointment_reminder_lag_seconds', "Delay between the time a reminder was due and the time it was sent.",
+        (1, 5, 15, 30, 60, 300, 900, 3600, 14400))
+CLEANUP_DELETIONS = Counter(
+        'appointment_cleanup_deleted_total', "Expired rows deleted by the cleanup task, by table.",
+        {'table': ('appointment_request', 'email_verification_code', 'password_reset_token', 'reschedule_history')})
+
+
+def render_metrics() -> str:
+    """Return every metric in the Prometheus text exposition format (version 0.0.4)."""
+    keys = [key for metric in REGISTRY for key in metric.keys()]
+    try:
+        values = get_metrics_cache().get_many(keys)
+    except Exception as e:
+        logger.warning(f"Could not read metrics: {e}")
+        values = {}
+    lines = []
+    for metric in REGISTRY:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.type}")
+        lines += metric.render(values)
+    return '\n'.join(lines) + '\n'
+
+
+def reset_metrics():
+    """Delete every stored value."""
+    get_metrics_cache().delete_many([key for metric in REGISTRY for key in metric.keys()])
@@ -0,0 +1,203 @@
+# profiler.py
+# Path: appointment/utils/profiler.py
+
+"""
+Author: Adams Pierre David
+Since: 3.11.0
+
+Per-request SQL and timing profile of the appointment views, recorded by
+`appointment.middleware.AppointmentProfilerMiddleware`.
+
+A profile records every query run while it is active (duration, SQL and the innermost frames of the `appointment`
+package that issued it) and splits the wall time into exclusive sections: time spent inside `profile_section('email')`
+is not counted in the `view` section, a template rendered while sending an e-mail is counted in `template` only, and
+so on. Finished profiles are kept in a bounded in-memory ring buffer, per process.
+"""
+
+import contextvars
+import heapq
+import itertools
+import os
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.utils import timezone
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TESTS_DIR = os.path.join(PACKAGE_DIR, 'tests')
+# Frames of these files are never reported as the origin of a query
+_IGNORED_FILES = (os.path.abspath(__file__), os.path.join(PACKAGE_DIR, 'middleware.py'))
+ORIGIN_DEPTH = 3
+
+_current_profile = contextvars.ContextVar('appointment_profile', default=None)
+_profiles = deque(maxlen=200)
+_profiles_lock = threading.Lock()
+_template_render_patched = False
+
+
+def get_profiler_enabled() -> bool:
+    """Get the value of the APPOINTMENT_PROFILER_ENABLED setting."""
+    return getattr(settings, 'APPOINTMENT_PROFILER_ENABLED', False)
+
+
+def get_profiler_buffer_size() -> int:
+    """Get the value of the APPOINTMENT_PROFILER_BUFFER_SIZE setting (number of requests kept)."""
+    return getattr(settings, 'APPOINTMENT_PROFILER_BUFFER_SIZE', 200)
+
+
+def get_profiler_slow_queries() -> int:
+    """Get the value of the APPOINTMENT_PROFILER_SLOW_QUERIES setting (slowest queries kept per request)."""
+    return getattr(settings, 'APPOINTMENT_PROFILER_SLOW_QUERIES', 5)
+
+
+def _query_origin():
+    """Return the innermost frames of the appointment package on the current stack, innermost first."""
+    origin = []
+    frame = sys._getframe(2)
+    while frame is not None and len(origin) < ORIGIN_DEPTH:
+        filename = frame.f_code.co_filename
+        if filename.startswith(PACKAGE_DIR) and not filename.startswith(TESTS_DIR) \
+                and filename not in _IGNORED_FILES:
+            origin.append(f"{os.path.relpath(filename, os.path.dirname(PACKAGE_DIR))}:{frame.f_lineno} "
+                          f"in {frame.f_code.co_name}")
+        frame = frame.f_back
+    return origin
+
+
+class RequestProfile:
+    """Queries and section timings of one request."""
+
+    def __init__(self, method, path, view_name, slow_queries=5):
+        self.method = method
+        self.path = path
+        self.view_name = view_name
+        self.slow_queries = slow_queries
+        self.query_count = 0
+        self.sql_ms = 0.0
+        self.sections = {'view': 0.0}
+        self._slowest = []
+        self._counter = itertools.count()
+        self._stack = ['view']
+        self._started = self._mark = time.perf_counter()
+        self.total_ms = None
+
+    def execute_wrapper(self, execute, sql, params, many, context):
+        """Database execute wrapper (see `connection.execute_wrapper`) timing every query."""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = (time.perf_counter() - started) * 1000
+            self.query_count += 1
+            self.sql_ms += duration
+            if self.slow_queries:
+                entry = (duration, next(self._counter), {'sql': sql, 'duration_ms': round(duration, 3),
+                                                         'origin': _query_origin()})
+                if len(self._slowest) < self.slow_queries:
+                    heapq.heappush(self._slowest, entry)
+                elif duration > self._slowest[0][0]:
+                    heapq.heapreplace(self._slowest, entry)
+
+    def enter(self, name):
+        now = time.perf_counter()
+        self.sections[self._stack[-1]] += (now - self._mark) * 1000
+        self.sections.setdefault(name, 0.0)
+        self._stack.append(name)
+        self._mark = now
+
+    def exit(self):
+        now = time.perf_counter()
+        self.sections[self._stack.pop()] += (now - self._mark) * 1000
+        self._mark = now
+
+    def finish(self, status_code):
+        """Stop the clock and return the profile as a dictionary."""
+        while len(self._stack) > 1:
+            self.exit()
+        self.exit()
+        self.total_ms = (time.perf_counter() - self._started) * 1000
+        return {
+            'timestamp': timezone.now(),
+            'method': self.method,
+            'path': self.path,
+            'view': self.view_name,
+            'status': status_code,
+            'total_ms': round(self.total_ms, 3),
+            'sections': {name: round(duration, 3) for name, duration in self.sections.items()},
+            'query_count': self.query_count,
+            'sql_ms': round(self.sql_ms, 3),
+            'slowest_queries': [entry for _, _, entry in sorted(self._slowest, key=lambda e: (-e[0], e[1]))],
+        }
+
+
+def start_profile(method, path, view_name):
+    """Start profiling the current request and return the profile together with the token used to stop it."""
+    profile = RequestProfile(method, path, view_name, slow_queries=get_profiler_slow_queries())
+    return profile, _current_profile.set(profile)
+
+
+def stop_profile(token, status_code):
+    """Stop the current profile, store it in the ring buffer and return it as a dictionary."""
+    profile = _current_profile.get()
+    _current_profile.reset(token)
+    data = profile.finish(status_code)
+    global _profiles
+    with _profiles_lock:
+        if _profiles.maxlen != get_profiler_buffer_size():
+            _profiles = deque(_profiles, maxlen=get_profiler_buffer_size())
+        _profiles.append(data)
+    return data
+
+
+@contextmanager
+def profile_section(name):
+    """Count the time spent in the block in the given section of the current profile, if any."""
+    profile = _current_profile.get()
+    if profile is None:
+        yield
+        return
+    profile.enter(name)
+    try:
+        yield
+    finally:
+        profile.exit()
+
+
+def get_profiles():
+    """Return the profiles in the ring buffer, newest first."""
+    with _profiles_lock:
+        return list(reversed(_profiles))
+
+
+def clear_profiles():
+    with _profiles_lock:
+        _profiles.clear()
+
+
+def format_server_timing(data) -> str:
+    """Format a finished profile as the value of a `Server-Timing` header."""
+    metrics = [f'sql;dur={data["sql_ms"]:.2f};desc="{data["query_count"]} queries"']
+    metrics += [f"{name};dur={duration:.2f}" for name, duration in data['sections'].items()]
+    metrics.append(f"total;dur={data['total_ms']:.2f}")
+    return ", ".join(metrics)
+
+
+def patch_template_render():
+    """Time Django template rendering in the `template` section. Idempotent."""
+    global _template_render_patched
+    if _template_render_patched:
+        return
+    from django.template.backends.django import Template
+
+    render = Template.render
+
+    def profiled_render(self, *args, **kwargs):
+        with profile_section('template'):
+            return render(self, *args, **kwargs)
+
+    Template.render = profiled_render
+    _template_render_patched = True
@@ -0,0 +1,278 @@
+# seed.py
+# Path: appointment/utils/seed.py
+
+"""
+Author: Adams Pierre David
+Since: 3.11.0
+
+Generate realistic volumes of staff members, schedules, clients and appointments for load and capacity testing.
+
+Rows are inserted with `bulk_create`, in batches and per staff member chunk, so that millions of appointments are
+generated in minutes with a bounded memory footprint. `AppointmentRequest.save()` and `Appointment.save()` are
+bypassed (and with them the model signals); the data is consistent nonetheless:
+
+- appointments fall within the staff member's working hours, never on a day off, and never overlap once the staff
+  member's gap time is added between them;
+- the duration of an appointment request is its service's duration;
+- `amount_to_pay` follows the request's payment type, as `Appointment.save()` would set it;
+- reschedule histories are confirmed, point to an earlier slot of the same staff member and are counted in the
+  request's `reschedule_attempts`.
+
+The output is deterministic for a given `seed`, except for the creation timestamps and the request IDs, which are
+unique across seedings.
+"""
+
+import datetime
+import random
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from phonenumber_field.phonenumber import PhoneNumber
+
+from appointment.models import (
+    Appointment, AppointmentRequest, AppointmentRescheduleHistory, DayOff, Service, StaffMember, WorkingHours
+)
+from appointment.utils.availability_cache import invalidate_all_availability
+from appointment.utils.db_helpers import get_user_model, username_in_user_model
+from appointment.utils.view_helpers import generate_id_request
+
+SERVICE_DURATIONS = (30, 45, 60, 90, 120)
+# (start, end) of the weekly shifts staff members are given
+SHIFTS = ((datetime.time(8, 0), datetime.time(16, 0)), (datetime.time(9, 0), datetime.time(17, 0)),
+          (datetime.time(10, 0), datetime.time(18, 0)), (datetime.time(12, 0), datetime.time(20, 0)))
+# Parsed once: assigning a string to the phone field parses it again for every row
+CLIENT_PHONE = PhoneNumber.from_string("+12392340543")
+GAP_TIMES = (None, None, 5, 10, 15)
+
+
+def _add_minutes(value: datetime.time, minutes: int) -> datetime.time:
+    return (datetime.datetime.combine(datetime.date.min, value) + datetime.timedelta(minutes=minutes)).time()
+
+
+def _minutes(value: datetime.time) -> int:
+    return value.hour * 60 + value.minute
+
+
+def _days_for(appointments, staff, appointments_per_day):
+    """Estimate, generously, the number of days needed to book `appointments` appointments.
+
+    Staff members work five days a week and get half their maximum number of appointments per day on average.
+    """
+    per_day = max(staff * appointments_per_day / 2 * 5 / 7, 1)
+    return int(appointments / per_day) + 7
+
+
+def _create_users(prefix, kind, count, password, batch_size):
+    User = get_user_model()
+    with_username = username_in_user_model()
+    users = []
+    for start in range(0, count, batch_size):
+        batch = []
+        for i in range(start, min(start + batch_size, count)):
+            fields = {'email': f"{prefix}.{kind}.{i}@example.com", 'first_name': kind.capitalize(),
+                      'last_name': str(i), 'password': password, 'is_staff': kind == 'staff'}
+            if with_username:
+                fields['username'] = f"{prefix}.{kind}.{i}"
+            batch.append(User(**fields))
+        users.extend(assign_primary_keys(User.objects.bulk_create(batch), 'email'))
+    return users
+
+
+def assign_primary_keys(objs, field):
+    """Fill the primary keys of bulk-created rows on backends that do not return them (e.g. MySQL).
+
+    :param objs: The rows returned by `bulk_create`.
+    :param field: A field whose values identify the rows.
+    :return: `objs`, with their primary keys set.
+    """
+    if not objs or objs[0].pk is not None:
+        return objs
+    model = type(objs[0])
+    values = [getattr(obj, field) for obj in objs]
+    ids = dict(model.objects.filter(**{f'{field}__in': values}).values_list(field, 'pk'))
+    for obj in objs:
+        obj.pk = ids[getattr(obj, field)]
+    return objs
+
+
+def seed_appointments(staff=10, services=5, clients=200, appointments_per_day=6, days=28, appointments=None,
+                      start_date=None, days_off_ratio=0.1, reschedule_ratio=0.05, reminder_ratio=0.3,
+                      saturday_ratio=0.2, prefix='seed', seed=42, batch_size=5000, progress=None):
+    """Generate a consistent dataset and return what was created.
+
+    :param staff: Number of staff members.
+    :param services: Number of services; each staff member offers up to three of them.
+    :param clients: Size of the client pool the appointments are spread over.
+    :param appointments_per_day: Maximum number of appointments per staff member and working day.
+    :param days: Number of days covered, starting at `start_date`.
+    :param appointments: Exact number of appointments to generate, spread evenly over the staff members. When given,
+        `days` is ignored and each staff member's calendar is filled day after day until their share is booked.
+    :param start_date: First day covered. Defaults to today.
+    :param days_off_ratio: Share of staff members taking a day off in every four weeks.
+    :param reschedule_ratio: Share of appointment requests that were rescheduled once.
+    :param reminder_ratio: Share of appointments for which the client wants a reminder.
+    :param saturday_ratio: Share of staff members also working on Saturdays.
+    :param prefix: Prefix of the generated usernames, e-mails and service names, so that a database can be seeded
+        several times.
+    :param seed: Seed of the random generator.
+    :param batch_size: Number of rows per INSERT.
+    :param progress: Optional callable receiving a dictionary of counts after each chunk of staff members.
+    :return: A dictionary with the staff members, the services, the covered range and the number of rows created.
+    """
+    rng = random.Random(seed)
+    quotas = [None] * staff
+    if appointments is not None:
+        days = _days_for(appointments, staff, appointments_per_day)
+        quotas = [appointments // staff + (i < appointments % staff) for i in range(staff)]
+    start_date = start_date or datetime.date.today()
+    end_date = start_date + datetime.timedelta(days=days - 1)
+    password = make_password(None)
+    counts = {'staff_members': staff, 'services': services, 'clients': clients, 'working_hours': 0, 'days_off': 0,
+              'appointment_requests': 0, 'appointments': 0, 'reschedule_histories': 0}
+
+    with transaction.atomic():
+        service_objs = assign_primary_keys(Service.objects.bulk_create([
+            Service(name=f"{prefix.capitalize()} service {i}",
+                    duration=datetime.timedelta(minutes=SERVICE_DURATIONS[i % len(SERVICE_DURATIONS)]),
+                    price=Decimal(40 + 10 * (i % 12)), down_payment=Decimal(10 * (i % 3)),
+                    description=f"{prefix.capitalize()} service {i}")
+            for i in range(services)
+        ]), 'name')
+        client_users = _create_users(prefix, 'client', clients, password, batch_size)
+        staff_users = _create_users(prefix, 'staff', staff, password, batch_size)
+
+        shifts, saturdays = [], []
+        for _ in staff_users:
+            shifts.append(rng.choice(SHIFTS))
+            saturdays.append(rng.random() < saturday_ratio)
+        staff_objs = assign_primary_keys(StaffMember.objects.bulk_create([
+            StaffMember(user=user, slot_gap_time=rng.choice(GAP_TIMES), work_on_saturday=saturday,
+                        work_on_sunday=False)
+            for user, saturday in zip(staff_users, saturdays)
+        ], batch_size=batch_size), 'user_id')
+
+        through = StaffMember.services_offered.through
+        offered, links = {}, []
+        for staff_member in staff_objs:
+            offered[staff_member.id] = rng.sample(service_objs, k=min(3, len(service_objs)))
+            links.extend(through(staffmember_id=staff_member.id, service_id=service.id)
+                         for service in offered[staff_member.id])
+        through.objects.bulk_create(links, batch_size=batch_size)
+
+        # DAYS_OF_WEEK: 0 is Sunday, 6 is Saturday
+        working_hours = [
+            WorkingHours(staff_member=staff_member, day_of_week=day_of_week, start_time=shift[0], end_time=shift[1])
+            for staff_member, shift, saturday in zip(staff_objs, shifts, saturdays)
+            for day_of_week in (range(1, 7) if saturday else range(1, 6))
+        ]
+        WorkingHours.objects.bulk_create(working_hours, batch_size=batch_size)
+        counts['working_hours'] = len(working_hours)
+
+        days_off = {}
+        for staff_member in staff_objs:
+            for period_start in range(0, days, 28):
+                if rng.random() < days_off_ratio:
+                    off_start = start_date + datetime.timedelta(days=period_start + rng.randrange(min(28, days)))
+                    days_off.setdefault(staff_member.id, []).append(
+                            (off_start, off_start + datetime.timedelta(days=rng.choice((0, 1, 4)))))
+        day_off_objs = [DayOff(staff_member_id=staff_id, start_date=off_start, end_date=off_end, description="Seed")
+                        for staff_id, periods in days_off.items() for off_start, off_end in periods]
+        DayOff.objects.bulk_create(day_off_objs, batch_size=batch_size)
+        counts['days_off'] = len(day_off_objs)
+
+    # Appointments are generated for a chunk of staff members at a time, so that memory stays bounded.
+    chunk = max(1, batch_size // max(appointments_per_day * days * 5 // 7, 1))
+    last_date = None
+    for chunk_start in range(0, len(staff_objs), chunk):
+        members = slice(chunk_start, chunk_start + chunk)
+        with transaction.atomic():
+            chunk_counts, chunk_last_date = _seed_staff_appointments(
+                    rng, staff_objs[members], shifts[members], quotas[members], offered, days_off, client_users,
+                    start_date, days, appointments_per_day, reschedule_ratio, reminder_ratio, batch_size)
+        for key, value in chunk_counts.items():
+            counts[key] += value
+        if chunk_last_date and (last_date is None or chunk_last_date > last_date):
+            last_date = chunk_last_date
+        if progress:
+            progress(dict(counts, staff_done=min(chunk_start + chunk, len(staff_objs))))
+
+    # `bulk_create` sends no signal: drop whatever availability was cached before the seeding.
+    invalidate_all_availability()
+    return {
+        'staff_members': staff_objs,
+        'services': service_objs,
+        'start_date': start_date,
+        'end_date': last_date if appointments is not None and last_date else end_date,
+        'counts': counts,
+    }
+
+
+def _seed_staff_appointments(rng, staff_members, shifts, quotas, offered, days_off, client_users, start_date, days,
+                             appointments_per_day, reschedule_ratio, reminder_ratio, batch_size):
+    requests, bookings = [], []
+    last_date = None
+    for staff_member, (shift_start, shift_end), quota in zip(staff_members, shifts, quotas):
+        gap = staff_member.slot_gap_time or 0
+        periods = days_off.get(staff_member.id, ())
+        booked = 0
+        # With a quota, `days` is only an estimate: keep going (within reason) until the quota is met
+        for offset in range(days if quota is None else days * 4):
+            if booked == quota:
+                break
+            date = start_date + datetime.timedelta(days=offset)
+            weekday = date.weekday()
+            if weekday == 6 or (weekday == 5 and not staff_member.work_on_saturday):
+                continue
+            if any(off_start <= date <= off_end for off_start, off_end in periods):
+                continue
+            cursor = shift_start
+            for _ in range(rng.randint(appointments_per_day // 2, appointments_per_day)):
+                cursor = _add_minutes(cursor, rng.choice((0, 0, 15, 30, 60)))
+                service = rng.choice(offered[staff_member.id])
+                duration = int(service.duration.total_seconds() // 60)
+                if _minutes(cursor) + duration > _minutes(shift_end):
+                    break
+                end = _add_minutes(cursor, duration)
+                payment_type = 'down' if service.down_payment and rng.random() < 0.3 else 'full'
+                rescheduled = rng.random() < reschedule_ratio
+                request = AppointmentRequest(
+                        date=date, start_time=cursor, end_time=end, service=service, staff_member=staff_member,
+                        payment_type=payment_type, reschedule_attempts=int(rescheduled),
+                        id_request=generate_id_request())
+                # bulk_create() does not call save()
+                request.set_start_and_end_at()
+                requests.append(request)
+                bookings.append((rng.choice(client_users), service, payment_type))
+                cursor = _add_minutes(end, gap)
+                last_date = date
+                booked += 1
+                if booked == quota:
+                    break
+
+    requests = assign_primary_keys(AppointmentRequest.objects.bulk_create(requests, batch_size=batch_size),
+                                    'id_request')
+
+    appointment_objs, histories = [], []
+    for request, (client, service, payment_type) in zip(requests, bookings):
+        appointment_objs.append(Appointment(
+                client=client, appointment_request=request, phone=CLIENT_PHONE,
+                address=f"{rng.randint(1, 999)} Main Street", want_reminder=rng.random() < reminder_ratio,
+                paid=rng.random() < 0.5,
+                amount_to_pay=service.down_payment if payment_type == 'down' else service.price,
+                id_request=generate_id_request()))
+        if request.reschedule_attempts:
+            # The request was moved from an earlier slot of the same day
+            previous_start = _add_minutes(datetime.time(0, 0),
+                                          max(_minutes(request.start_time) - 60 * rng.randint(1, 3), 0))
+            histories.append(AppointmentRescheduleHistory(
+                    appointment_request=request, date=request.date, start_time=previous_start,
+                    end_time=_add_minutes(previous_start, int(service.duration.total_seconds() // 60)),
+                    staff_member_id=request.staff_member_id, reason_for_rescheduling="Seed",
+                    reschedule_status='confirmed', id_request=generate_id_request()))
+
+    Appointment.objects.bulk_create(appointment_objs, batch_size=batch_size)
+    AppointmentRescheduleHistory.objects.bulk_create(histories, batch_size=batch_size)
+    counts = {'appointment_requests': len(requests), 'appointments': len(appointment_objs),
+              'reschedule_histories': len(histories)}
+    return counts, last_date
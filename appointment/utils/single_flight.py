@@ -0,0 +1,145 @@
+# single_flight.py
+# Path: appointment/utils/single_flight.py
+
+"""
+Author: Adams Pierre David
+Since: 3.11.0
+
+Cache lookups that recompute a missing or expiring value once, however many requests ask for it at the same time.
+
+When a popular entry expires or is invalidated, every request reading it would otherwise recompute it at once. With
+`get_or_compute`:
+
+- the request that adds the lock key (`cache.add()` succeeds for one caller only) recomputes the value and stores it;
+- the others keep serving the previous value, which is stored for `STALE_GRACE` seconds past its expiry, or, when
+  there is none (e.g. after an invalidation), wait up to `WAIT_TIMEOUT` seconds for the new one before computing it
+  themselves;
+- entries are refreshed a little before they expire, with a probability rising as expiry gets closer and with the
+  time the value took to compute (probabilistic early expiration), so that the recomputation usually happens before
+  any request finds the entry missing.
+
+The lock expires after `LOCK_TIMEOUT` seconds, so a worker dying while it computes only delays the others.
+"""
+
+import asyncio
+import math
+import random
+import time
+from collections import namedtuple
+
+from django.core.cache import cache
+
+from appointment.logger_config import get_logger
+from appointment.utils.metrics import AVAILABILITY_CACHE_REQUESTS
+
+logger = get_logger(__name__)
+
+STALE_GRACE = 60
+LOCK_TIMEOUT = 10
+WAIT_TIMEOUT = 2.0
+POLL_INTERVAL = 0.02
+
+# What `get_or_compute` stores: the value, when it stops being fresh (epoch seconds), and how long it took to compute.
+CachedValue = namedtuple('CachedValue', ['value', 'expires_at', 'compute_seconds'])
+
+
+def _lock_key(key):
+    return f"{key}:lock"
+
+
+def _is_fresh(entry, beta, now) -> bool:
+    # XFetch: recompute early with a probability growing as expiry nears, scaled by the recomputation cost.
+    return now - entry.compute_seconds * beta * math.log(1.0 - random.random()) < entry.expires_at
+
+
+def _store(key, value, started, timeout):
+    now = time.time()
+    cache.set(key, CachedValue(value, now + timeout, now - started), timeout + STALE_GRACE)
+
+
+async def _astore(key, value, started, timeout):
+    now = time.time()
+    await cache.aset(key, CachedValue(value, now + timeout, now - started), timeout + STALE_GRACE)
+
+
+def get_or_compute(key, compute, timeout: int, name: str, beta: float = 1.0):
+    """Return the value cached under `key`, computing it with `compute` at most once at a time across workers.
+
+    :param key: The cache key.
+    :param compute: A callable taking no argument and returning the value.
+    :param timeout: Seconds the value stays fresh; 0 disables caching.
+    :param name: The `cache` label of the lookups in the metrics.
+    :param beta: How eagerly values are refreshed before they expire (0 never refreshes them early).
+    :return: The value.
+    """
+    if not timeout:
+        return compute()
+    entry = cache.get(key)
+    if entry is not None and not isinstance(entry, CachedValue):
+        # A value stored with a plain `cache.set()`, e.g. by an earlier version.
+        return entry
+    if entry is not None and _is_fresh(entry, beta, time.time()):
+        AVAILABILITY_CACHE_REQUESTS.inc(cache=name, result='hit')
+        return entry.value
+
+    lock_key = _lock_key(key)
+    deadline = time.monotonic() + WAIT_TIMEOUT
+    while not cache.add(lock_key, 1, LOCK_TIMEOUT):
+        if entry is not None:
+            AVAILABILITY_CACHE_REQUESTS.inc(cache=name, result='stale')
+            return entry.value
+        if time.monotonic() >= deadline:
+            logger.warning(f"Gave up waiting for {key} to be computed by another worker")
+            AVAILABILITY_CACHE_REQUESTS.inc(cache=name, result='miss')
+            return compute()
+        time.sleep(POLL_INTERVAL)
+        current = cache.get(key)
+        if isinstance(current, CachedValue):
+            AVAILABILITY_CACHE_REQUESTS.inc(cache=name, result='wait')
+            return current.value
+
+    AVAILABILITY_CACHE_REQUESTS.inc(cache=name, result='miss')
+    try:
+        started = time.time()
+        value = compute()
+        _store(key, value, started, timeout)
+        return value
+    finally:
+        cache.delete(lock_key)
+
+
+async def aget_or_compute(key, compute, timeout: int, name: str, beta: float = 1.0):
+    """Async version of `get_or_compute`, using the async cache API; `compute` is a coroutine function."""
+    if not timeout:
+        return await compute()
+    entry = await cache.aget(key)
+    if entry is not None and not isinstance(entry, CachedValue):
+        return entry
+    if entry is not None and _is_fresh(entry, beta, time.time()):
+        AVAILABILITY_CACHE_REQUESTS.inc(cache=name, result='hit')
+        return entry.value
+
+    lock_key = _lock_key(key)
+    deadline = time.monotonic() + WAIT_TIMEOUT
+    while not await cache.aadd(lock_key, 1, LOCK_TIMEOUT):
+        if entry is not None:
+            AVAILABILITY_CACHE_REQUESTS.inc(cache=name, result='stale')
+            return entry.value
+        if time.monotonic() >= deadline:
+            logger.warning(f"Gave up waiting for {key} to be computed by another worker")
+            AVAILABILITY_CACHE_REQUESTS.inc(cache=name, result='miss')
+            return await compute()
+        await asyncio.sleep(POLL_INTERVAL)
+        current = await cache.aget(key)
+        if isinstance(current, CachedValue):
+            AVAILABILITY_CACHE_REQUESTS.inc(cache=name, result='wait')
+            return current.value
+
+    AVAILABILITY_CACHE_REQUESTS.inc(cache=name, result='miss')
+    try:
+        started = time.time()
+        value = await compute()
+        await _astore(key, value, started, timeout)
+        return value
+    finally:
+        await cache.adelete(lock_key)
@@ -6,6 +6,7 @@ Author: Adams Pierre David
 Since: 2.0.0
 """
 
+import secrets
 import uuid
 
 from django.utils.translation import get_language, to_locale
@@ -38,3 +39,11 @@ def generate_random_id() -> str:
     :return: The randomly generated UUID as a hex string
     """
     return uuid.uuid4().hex
+
+
+def generate_id_request() -> str:
+    """Generate the token identifying an appointment request, a reschedule history or an appointment in public links.
+
+    :return: 128 random bits as a hex string
+    """
+    return secrets.token_hex(16)
@@ -8,11 +8,13 @@ Since: 1.0.0
 
 from datetime import date, timedelta
 
+from asgiref.sync import sync_to_async
 from django.contrib import messages
 from django.contrib.auth import login
 from django.contrib.auth.forms import SetPasswordForm
+from django.core.exceptions import ValidationError
 from django.db.models import Q
-from django.http import HttpResponseRedirect
+from django.http import Http404, HttpResponseRedirect
 from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse
 from django.utils import timezone, translation
@@ -30,11 +32,15 @@ from appointment.models import (
     StaffMember
 )
 from appointment.settings import check_q_cluster
+from appointment.utils.availability_cache import (
+    aget_cached_slots, aget_staff_day_tokens, get_availability_cache_timeout, get_cached_slots, get_staff_day_tokens
+)
+from appointment.utils.availability_table import get_availability_table_enabled, get_staff_day_slots
 from appointment.utils.db_helpers import (
-    can_appointment_be_rescheduled, check_day_off_for_staff, create_and_save_appointment,
-    create_payment_info_and_get_url, get_non_working_days_for_staff, get_user_by_email, get_user_model,
-    get_website_name, get_weekday_num_from_date, is_working_day, staff_change_allowed_on_reschedule,
-    username_in_user_model
+    acheck_day_off_for_staff, aget_non_working_days_for_staff, aget_working_days, can_appointment_be_rescheduled,
+    check_day_off_for_staff, create_and_save_appointment, create_payment_info_and_get_url,
+    get_non_working_days_for_staff, get_user_by_email, get_user_model, get_website_name, get_weekday_num_from_date,
+    is_working_day, staff_change_allowed_on_reschedule, username_in_user_model
 )
 from appointment.utils.email_ops import notify_admin_about_appointment, notify_admin_about_reschedule, \
     send_reschedule_confirmation_email, \
@@ -46,50 +52,149 @@ from .email_sender.email_sender import has_required_email_settings
 from .messages_ import passwd_error, passwd_set_successfully
 from .services import get_appointments_and_slots, get_available_slots_for_staff
 from .settings import (APPOINTMENT_PAYMENT_URL, APPOINTMENT_THANK_YOU_URL)
-from .utils.date_time import DATE_FORMATS, convert_str_to_date
+from .utils.date_time import DATE_FORMATS, convert_str_to_date, encode_slot_runs
 from .utils.error_codes import ErrorCode
 from .utils.json_context import get_generic_context_with_extra, json_response
 from .utils.template_helpers import get_custom_template
 
 logger = get_logger(__name__)
 
+# The most dates one availability versions lookup may ask for, about a month and a half.
+MAX_VERSION_DATES = 42
+
+
+def _slot_form_error_response(errors: dict):
+    """Return the response to a slot lookup with invalid parameters.
+
+    :param errors: A dictionary mapping the invalid fields of `SlotForm`, in the form order, to their first message.
+    """
+    custom_data = {'error': True, 'available_slots': [], 'date_chosen': '', 'date_iso': ''}
+    error_code = 0
+    if 'selected_date' in errors:
+        error_code = ErrorCode.PAST_DATE
+    elif 'staff_member' in errors:
+        error_code = ErrorCode.STAFF_ID_REQUIRED
+    message = next(iter(errors.values()))
+    return json_response(message=message, custom_data=custom_data, success=False, error_code=error_code)
+
+
+def _slot_lookup_context(selected_date) -> dict:
+    current_lang = translation.get_language()
+    format_string = DATE_FORMATS.get(current_lang, "D, F j, Y")
+    return {
+        'date_chosen': date_format(selected_date, format_string, use_l10n=True),
+        'date_iso': selected_date.isoformat()
+    }
+
+
+def _unavailable_day_response(message, custom_data: dict):
+    custom_data['available_slots'] = []
+    return json_response(message=message, custom_data=custom_data, success=False, error_code=ErrorCode.INVALID_DATE)
+
+
+def _wants_slot_runs(request) -> bool:
+    # With `slot_format=runs`, the slots are sent as `slot_runs` (see `encode_slot_runs`) and formatted by the client.
+    return request.GET.get('slot_format') == 'runs'
+
+
+def _available_slots_response(selected_date, available_slots, custom_data: dict, slot_runs: bool = False):
+    # Check if the selected_date is today and filter out past slots
+    if selected_date == date.today():
+        current_time = timezone.now().time()
+        available_slots = [slot for slot in available_slots if slot.time() > current_time]
+
+    if slot_runs:
+        custom_data['slot_runs'] = encode_slot_runs(available_slots)
+    else:
+        custom_data['available_slots'] = [slot.strftime('%I:%M %p') for slot in available_slots]
+    if len(available_slots) == 0:
+        custom_data['error'] = True
+        message = _('No availability')
+        return json_response(message=message, custom_data=custom_data, success=False, error_code=ErrorCode.INVALID_DATE)
+    custom_data['error'] = False
+    return json_response(message='Successfully retrieved available slots', custom_data=custom_data, success=True)
+
+
+def _clean_versions_query(data):
+    """Validate the parameters of an availability versions lookup.
+
+    :param data: The query parameters: `staff_member`, and `dates`, a comma-separated list of ISO dates.
+    :return: A tuple (staff_member_id, dates, error_response), error_response being None when the parameters are valid.
+    """
+    try:
+        staff_member_id = int(data.get('staff_member', ''))
+    except ValueError:
+        return None, None, json_response(message=_('No staff member selected'), custom_data={'error': True},
+                                         success=False, error_code=ErrorCode.STAFF_ID_REQUIRED)
+    try:
+        dates = sorted({date.fromisoformat(value) for value in data.get('dates', '').split(',') if value})
+    except ValueError:
+        dates = None
+    if not dates or len(dates) > MAX_VERSION_DATES:
+        message = _('Between 1 and {count} valid dates are required.').format(count=MAX_VERSION_DATES)
+        return None, None, json_response(message=message, custom_data={'error': True}, success=False,
+                                         error_code=ErrorCode.INVALID_DATE)
+    return staff_member_id, dates, None
+
+
+def _versions_response(tokens: dict):
+    custom_data = {'error': False, 'versions': {day.isoformat(): token for day, token in tokens.items()}}
+    return json_response(message='Successfully retrieved availability versions', custom_data=custom_data,
+                         success=True)
+
+
+@require_ajax
+def get_availability_versions_ajax(request):
+    """This view function handles AJAX requests for the availability version tokens of a staff member on some dates.
+
+    Clients compare them with the `version` returned with the slots they keep, and fetch again only the dates whose
+    token changed. The lookup reads a few cache entries and no table. The tokens are only shared by every worker
+    when the availability cache is enabled (it then requires a shared backend); otherwise no token is returned and
+    clients do not keep slots.
+
+    :param request: The request instance.
+    :return: A JSON response mapping each requested ISO date to its token.
+    """
+    staff_member_id, dates, error_response = _clean_versions_query(request.GET)
+    if error_response:
+        return error_response
+    if not get_availability_cache_timeout():
+        return _versions_response({})
+    return _versions_response(get_staff_day_tokens(staff_member_id, dates))
+
+
+def _compute_available_slots(selected_date, staff_member, weekday_num, service):
+    """Compute the slots of a day, from the availability table when it is enabled (see `get_staff_day_slots`)."""
+    if get_availability_table_enabled():
+        return get_staff_day_slots(staff_member, selected_date, service=service)
+    return get_available_slots_for_staff(selected_date, staff_member, weekday_num, service=service)
+
 
 @require_ajax
 def get_available_slots_ajax(request):
     """This view function handles AJAX requests to get available slots for a selected date.
 
+    The slots are cached per staff member and per day until a write changes them (see `get_cached_slots`).
+
     :param request: The request instance.
     :return: A JSON response containing available slots, selected date, an error flag, and an optional error message.
     """
 
     slot_form = SlotForm(request.GET)
-    error_code = 0
     if not slot_form.is_valid():
-        custom_data = {'error': True, 'available_slots': [], 'date_chosen': '', 'date_iso': ''}
-        if 'selected_date' in slot_form.errors:
-            error_code = ErrorCode.PAST_DATE
-        elif 'staff_member' in slot_form.errors:
-            error_code = ErrorCode.STAFF_ID_REQUIRED
-        message = list(slot_form.errors.as_data().items())[0][1][0].messages[0]  # dirty way to keep existing behavior
-        return json_response(message=message, custom_data=custom_data, success=False,
-                             error_code=error_code)
+        return _slot_form_error_response({field: errors[0].messages[0]
+                                          for field, errors in slot_form.errors.as_data().items()})
 
     selected_date = slot_form.cleaned_data['selected_date']
     sm = slot_form.cleaned_data['staff_member']
-    current_lang = translation.get_language()
-    format_string = DATE_FORMATS.get(current_lang, "D, F j, Y")
-    date_chosen = date_format(selected_date, format_string, use_l10n=True)
-    custom_data = {
-        'date_chosen': date_chosen,
-        'date_iso': selected_date.isoformat()
-    }
+    custom_data = _slot_lookup_context(selected_date)
+    # Read before the computation, so that a write racing with it leaves the client with an outdated token.
+    custom_data['version'] = (get_staff_day_tokens(sm.id, [selected_date])[selected_date]
+                              if get_availability_cache_timeout() else None)
 
     days_off_exist = check_day_off_for_staff(staff_member=sm, date=selected_date)
     if days_off_exist:
-        message = _("Day off. Please select another date!")
-        custom_data['available_slots'] = []
-        custom_data['date_iso'] = selected_date.isoformat()
-        return json_response(message=message, custom_data=custom_data, success=False, error_code=ErrorCode.INVALID_DATE)
+        return _unavailable_day_response(_("Day off. Please select another date!"), custom_data)
     # if selected_date is not a working day for the staff, return an empty list of slots and 'message' is Day Off
     weekday_num = get_weekday_num_from_date(selected_date)
     is_working_day_ = is_working_day(staff_member=sm, day=weekday_num)
@@ -98,26 +203,12 @@ def get_available_slots_ajax(request):
     if not is_working_day_:
         message = _("Not a working day for {staff_member}. Please select another date!").format(
                 staff_member=sm.get_staff_member_first_name())
-        custom_data['available_slots'] = []
-        custom_data['date_iso'] = selected_date.isoformat()
-        return json_response(message=message, custom_data=custom_data, success=False, error_code=ErrorCode.INVALID_DATE)
+        return _unavailable_day_response(message, custom_data)
     service = slot_form.cleaned_data.get('service_id')
-    available_slots = get_available_slots_for_staff(selected_date, sm, weekday_num, service=service)
-
-    # Check if the selected_date is today and filter out past slots
-    if selected_date == date.today():
-        current_time = timezone.now().time()
-        available_slots = [slot for slot in available_slots if slot.time() > current_time]
-
-    custom_data['available_slots'] = [slot.strftime('%I:%M %p') for slot in available_slots]
-    if len(available_slots) == 0:
-        custom_data['error'] = True
-        custom_data['date_iso'] = selected_date.isoformat()
-        message = _('No availability')
-        return json_response(message=message, custom_data=custom_data, success=False, error_code=ErrorCode.INVALID_DATE)
-    custom_data['error'] = False
-    custom_data['date_iso'] = selected_date.isoformat()
-    return json_response(message='Successfully retrieved available slots', custom_data=custom_data, success=True)
+    available_slots = get_cached_slots(
+            sm.id, selected_date, service.id if service else None, custom_data['version'],
+            lambda: _compute_available_slots(selected_date, sm, weekday_num, service))
+    return _available_slots_response(selected_date, available_slots, custom_data, slot_runs=_wants_slot_runs(request))
 
 
 # TODO: service id and staff id are not checked
@@ -188,6 +279,136 @@ def get_non_working_days_ajax(request):
     return json_response(message=message, custom_data=custom_data, success=not error, error_code=error_code)
 
 
+async def _aclean_slot_form(data):
+    """Validate the parameters of a slot lookup like `SlotForm`, fetching the staff member and the service with the
+    async ORM.
+
+    :param data: The query parameters.
+    :return: A tuple (cleaned_data, errors), errors mapping the invalid fields, in the form order, to their message.
+    """
+    fields = SlotForm.base_fields
+    cleaned_data, errors = {}, {}
+    try:
+        cleaned_data['selected_date'] = fields['selected_date'].clean(data.get('selected_date'))
+    except ValidationError as e:
+        errors['selected_date'] = e.messages[0]
+    for name, queryset in (('staff_member', StaffMember.objects.select_related('user')),
+                           ('service_id', Service.objects.all())):
+        field, value = fields[name], data.get(name)
+        if value in field.empty_values:
+            if field.required:
+                errors[name] = str(field.error_messages['required'])
+            else:
+                cleaned_data[name] = None
+            continue
+        try:
+            cleaned_data[name] = await queryset.aget(pk=value)
+        except (ValueError, TypeError, ValidationError, queryset.model.DoesNotExist):
+            errors[name] = str(field.error_messages['invalid_choice'])
+    return cleaned_data, errors
+
+
+async def _aget_object_or_404(queryset, **kwargs):
+    obj = await queryset.filter(**kwargs).afirst()
+    if obj is None:
+        raise Http404(f"No {queryset.model._meta.object_name} matches the given query.")
+    return obj
+
+
+@require_ajax
+async def aget_available_slots_ajax(request):
+    """Async version of `get_available_slots_ajax`, served when APPOINTMENT_ASYNC_AVAILABILITY_VIEWS is enabled.
+
+    The lookups use the async ORM and the slots are cached per staff member and per day through the async cache API;
+    only the slot computation of a cache miss runs in a thread.
+    """
+    cleaned_data, errors = await _aclean_slot_form(request.GET)
+    if errors:
+        return _slot_form_error_response(errors)
+
+    selected_date = cleaned_data['selected_date']
+    sm = cleaned_data['staff_member']
+    custom_data = _slot_lookup_context(selected_date)
+    custom_data['version'] = ((await aget_staff_day_tokens(sm.id, [selected_date]))[selected_date]
+                              if get_availability_cache_timeout() else None)
+
+    if await acheck_day_off_for_staff(staff_member=sm, date=selected_date):
+        return _unavailable_day_response(_("Day off. Please select another date!"), custom_data)
+    weekday_num = get_weekday_num_from_date(selected_date)
+
+    custom_data['staff_member'] = sm.get_staff_member_name()
+    if weekday_num not in await aget_working_days(sm.id):
+        message = _("Not a working day for {staff_member}. Please select another date!").format(
+                staff_member=sm.get_staff_member_first_name())
+        return _unavailable_day_response(message, custom_data)
+    service = cleaned_data.get('service_id')
+    available_slots = await aget_cached_slots(
+            sm.id, selected_date, service.id if service else None, custom_data['version'],
+            lambda: sync_to_async(_compute_available_slots)(selected_date, sm, weekday_num, service))
+    return _available_slots_response(selected_date, available_slots, custom_data, slot_runs=_wants_slot_runs(request))
+
+
+@require_ajax
+async def aget_availability_versions_ajax(request):
+    """Async version of `get_availability_versions_ajax`, served when APPOINTMENT_ASYNC_AVAILABILITY_VIEWS is enabled."""
+    staff_member_id, dates, error_response = _clean_versions_query(request.GET)
+    if error_response:
+        return error_response
+    if not get_availability_cache_timeout():
+        return _versions_response({})
+    return _versions_response(await aget_staff_day_tokens(staff_member_id, dates))
+
+
+@require_ajax
+async def aget_next_available_date_ajax(request, service_id):
+    """Async version of `get_next_available_date_ajax`, served when APPOINTMENT_ASYNC_AVAILABILITY_VIEWS is enabled.
+
+    Unlike the sync view, a staff member without working hours gets a 'No availability' error instead of a search
+    that never ends.
+    """
+    staff_id = request.GET.get('staff_member')
+    if not staff_id or staff_id == 'none':
+        data = {'error': True}
+        message = _('No staff member selected')
+        return json_response(message=message, custom_data=data, success=False, error_code=ErrorCode.STAFF_ID_REQUIRED)
+
+    staff_member = await _aget_object_or_404(StaffMember.objects.all(), pk=staff_id)
+    service = await _aget_object_or_404(Service.objects.all(), pk=service_id)
+    current_date = date.today()
+    days_off = [day_off async for day_off in DayOff.objects.filter(staff_member=staff_member).filter(
+            Q(start_date__lte=current_date, end_date__gte=current_date) | Q(start_date__gte=current_date))]
+    working_days = await aget_working_days(staff_member.id)
+    if not working_days:
+        return json_response(message=_('No availability'), custom_data={'error': True}, success=False,
+                             error_code=ErrorCode.INVALID_DATE)
+
+    next_available_date = None
+    day_offset = 0
+    while next_available_date is None:
+        potential_date = current_date + timedelta(days=day_offset)
+        is_day_off = any(day_off.start_date <= potential_date <= day_off.end_date for day_off in days_off)
+        if not is_day_off and get_weekday_num_from_date(potential_date) in working_days:
+            _appointments, available_slots = await sync_to_async(get_appointments_and_slots)(potential_date, service)
+            if available_slots:
+                next_available_date = potential_date
+        day_offset += 1
+    message = _('Successfully retrieved next available date')
+    data = {'next_available_date': next_available_date.isoformat()}
+    return json_response(message=message, custom_data=data, success=True)
+
+
+async def aget_non_working_days_ajax(request):
+    """Async version of `get_non_working_days_ajax`, served when APPOINTMENT_ASYNC_AVAILABILITY_VIEWS is enabled."""
+    staff_id = request.GET.get('staff_member')
+    if not staff_id or staff_id == 'none':
+        message = _('No staff member selected')
+        return json_response(message=message, custom_data={'error': True}, success=False,
+                             error_code=ErrorCode.STAFF_ID_REQUIRED)
+    non_working_days = await aget_non_working_days_for_staff(staff_id)
+    return json_response(message=_('Successfully retrieved non-working days'),
+                         custom_data={"non_working_days": non_working_days}, success=True)
+
+
 def appointment_request(request, service_id=None, staff_member_id=None):
     """This view function handles requests to book an appointment for a service.
 
@@ -206,7 +427,7 @@ def appointment_request(request, service_id=None, staff_member_id=None):
 
     if service_id:
         service = get_object_or_404(Service, pk=service_id)
-        all_staff_members = StaffMember.objects.filter(services_offered=service)
+        all_staff_members = StaffMember.objects.filter(services_offered=service).select_related('user')
 
         # If only one staff member for a service, choose them by default and fetch their slots.
         if all_staff_members.count() == 1:
@@ -241,7 +462,8 @@ def appointment_request(request, service_id=None, staff_member_id=None):
         'date_chosen': date_chosen,
         'locale': get_locale(),
         'timezoneTxt': get_current_timezone_name(),
-        'label': label
+        'label': label,
+        'availability_versions_enabled': bool(get_availability_cache_timeout()),
     }
     context = get_generic_context_with_extra(request, extra_context, admin=False)
     appointment_template = get_custom_template('appointments.html', 'appointment/appointments.html')
@@ -524,12 +746,12 @@ def prepare_reschedule_appointment(request, id_request):
     # if staff change allowed, filter all staff offering the service otherwise, filter only the selected staff member
     staff_filter_criteria = {'id': ar.staff_member.id} if not staff_change_allowed_on_reschedule() else {
         'services_offered': ar.service}
-    all_staff_members = StaffMember.objects.filter(**staff_filter_criteria)
+    all_staff_members = StaffMember.objects.filter(**staff_filter_criteria).select_related('user')
     day_of_week = get_weekday_num_from_date(ar.date)
-    available_slots = get_available_slots_for_staff(ar.date, selected_sm, day_of_week, service=service)
     page_title = _("Rescheduling appointment for {s}").format(s=service.name)
     page_description = _("Reschedule your appointment for {s} at {wn}.").format(s=service.name, wn=get_website_name())
     date_chosen = ar.date.strftime("%a, %B %d, %Y")
+    available_slots = get_available_slots_for_staff(ar.date, selected_sm, day_of_week, service=service)
 
     extra_context = {
         'service': service,
@@ -545,6 +767,7 @@ def prepare_reschedule_appointment(request, id_request):
         'rescheduled_date': ar.date.strftime("%Y-%m-%d"),
         'page_header': page_title,
         'ar_id_request': ar.id_request,
+        'availability_versions_enabled': bool(get_availability_cache_timeout()),
     }
     context = get_generic_context_with_extra(request, extra_context, admin=False)
     return render(request, appointment_template, context=context)
@@ -579,10 +802,9 @@ def reschedule_appointment_submit(request):
             )
             messages.success(request, _("Appointment rescheduled successfully"))
             context = get_generic_context_with_extra(request, {}, admin=False)
-            client_first_name = Appointment.objects.get(appointment_request=ar).client.first_name
-            email = Appointment.objects.get(appointment_request=ar).client.email
-            send_reschedule_confirmation_email(request=request, reschedule_history=arh, first_name=client_first_name,
-                                               email=email, appointment_request=ar)
+            client = Appointment.objects.select_related('client').get(appointment_request=ar).client
+            send_reschedule_confirmation_email(request=request, reschedule_history=arh, first_name=client.first_name,
+                                               email=client.email, appointment_request=ar)
             return render(request, rescheduling_thank_you_template, context=context)
         else:
             messages.error(request, _("There was an error in your submission. Please check the form and try again."))
@@ -593,7 +815,8 @@ def reschedule_appointment_submit(request):
 
 
 def confirm_reschedule(request, id_request):
-    reschedule_history = get_object_or_404(AppointmentRescheduleHistory, id_request=id_request)
+    reschedule_history = get_object_or_404(AppointmentRescheduleHistory.objects.select_related('appointment_request'),
+                                           id_request=id_request)
 
     if reschedule_history.reschedule_status != 'pending' or not reschedule_history.still_valid():
         error_message = _("O-o-oh! This link is no longer valid.") if not reschedule_history.still_valid() else _(
@@ -624,10 +847,11 @@ def confirm_reschedule(request, id_request):
     reschedule_history.end_time = previous_details['end_time']
     reschedule_history.staff_member = previous_details['staff_member']
     reschedule_history.reschedule_status = 'confirmed'
-    reschedule_history.save(update_fields=['date', 'start_time', 'end_time', 'staff_member', 'reschedule_status'])
+    reschedule_history.save(update_fields=['date', 'start_time', 'end_time', 'staff_member', 'reschedule_status',
+                                           'updated_at'])
 
     messages.success(request, _("Appointment rescheduled successfully"))
     # notify admin and the concerned staff admin about client's rescheduling
-    client_name = Appointment.objects.get(appointment_request=ar).client.get_full_name()
-    notify_admin_about_reschedule(reschedule_history, ar, client_name)
-    return redirect('appointment:default_thank_you', appointment_id=ar.appointment.id)
+    appointment = Appointment.objects.select_related('client').get(appointment_request=ar)
+    notify_admin_about_reschedule(reschedule_history, ar, appointment.client.get_full_name())
+    return redirect('appointment:default_thank_you', appointment_id=appointment.id)
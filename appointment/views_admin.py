@@ -11,8 +11,12 @@ import datetime
 import json
 
 from django.contrib import messages
-from django.core.exceptions import ValidationError
+from django.core.exceptions import ImproperlyConfigured, ValidationError
+from django.db import transaction
+from django.http import HttpResponse
 from django.shortcuts import get_object_or_404, redirect, render
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare
 from django.utils.translation import gettext_lazy as _
 from django.views.decorators.http import require_POST
 
@@ -22,10 +26,14 @@ from appointment.forms import PersonalInformationForm, ServiceForm, StaffAppoint
 from appointment.messages_ import appt_updated_successfully
 from appointment.models import Appointment, DayOff, StaffMember, WorkingHours
 from appointment.services import (
-    create_new_appointment, create_staff_member_service, email_change_verification_service,
+    apply_bulk_operations, create_new_appointment, create_staff_member_service, email_change_verification_service,
     fetch_user_appointments, handle_entity_management_request, handle_service_management_request,
-    prepare_appointment_display_data, prepare_user_profile_data, save_appt_date_time, update_existing_appointment,
-    update_personal_info_service)
+    prepare_appointment_display_data, prepare_user_profile_data, save_appt_date_time, set_appt_date_time,
+    update_existing_appointment, update_personal_info_service)
+from appointment.utils.archive import HISTORY_LIMIT, get_appointment_history
+from appointment.utils.availability import ENGINES, build_availability_report
+from appointment.utils.availability_cache import aggregate_heatmap, get_availability_heatmap
+from appointment.utils.date_time import convert_str_to_date
 from appointment.utils.db_helpers import (
     Service, get_day_off_by_id, get_staff_member_by_user_id, get_user_model,
     get_working_hours_by_id)
@@ -33,10 +41,14 @@ from appointment.utils.error_codes import ErrorCode
 from appointment.utils.json_context import (
     convert_appointment_to_json, get_generic_context, get_generic_context_with_extra, handle_unauthorized_response,
     json_response)
-from appointment.utils.permissions import check_extensive_permissions, check_permissions, \
+from appointment.utils.metrics import CONTENT_TYPE, get_metrics_enabled, get_metrics_token, render_metrics
+from appointment.utils.permissions import check_entity_ownership, check_extensive_permissions, check_permissions, \
     has_permission_to_delete_appointment
+from appointment.utils.profiler import get_profiler_enabled, get_profiles
 from appointment.utils.template_helpers import get_custom_template
 
+AVAILABILITY_REPORT_MAX_DAYS = 92
+
 
 ###############################################################
 
@@ -277,7 +289,7 @@ def fetch_service_list_for_staff(request):
 @require_user_authenticated
 @require_superuser
 def fetch_staff_list(request):
-    staff_members = StaffMember.objects.all()
+    staff_members = StaffMember.objects.select_related('user')
     staff_data = []
     for staff in staff_members:
         staff_data.append({
@@ -317,13 +329,15 @@ def validate_appointment_date(request):
     start_time_obj = datetime.datetime.fromisoformat(start_time_str)
     appt_date = datetime.datetime.strptime(appt_date_str, "%Y-%m-%d").date()
 
-    # Get the staff member for the appointment
-    appt = Appointment.objects.get(id=appointment_id)
+    # Get the staff member and the service for the appointment
+    appt = Appointment.objects.select_related(
+            'appointment_request__service', 'appointment_request__staff_member__user').get(id=appointment_id)
     staff_member = appt.appointment_request.staff_member
 
-    # Check if the appointment's date and time are valid
+    # Check if the appointment's date and time are valid, for the whole length of its service
     weekday: str = appt_date.strftime("%A")
-    is_valid, message = Appointment.is_valid_date(appt_date, start_time_obj, staff_member, appointment_id, weekday)
+    is_valid, message = Appointment.is_valid_date(appt_date, start_time_obj, staff_member, appointment_id, weekday,
+                                                  duration=appt.appointment_request.service.duration)
     if not is_valid:
         return json_response(message, status=403, success=False, error_code=ErrorCode.INVALID_DATE)
     return json_response(_("Appointment date and time are valid."))
@@ -352,6 +366,90 @@ def update_appt_date_time(request):
     return json_response(appt_updated_successfully, custom_data={'appt': appt.id})
 
 
+@require_user_authenticated
+@require_staff_or_superuser
+@require_ajax
+@require_POST
+def move_appointment(request):
+    """Validate and apply a calendar drag and drop in one transaction.
+
+    The body holds `appointment_id`, `date`, `start_time` (ISO datetime) and `updated_at`, the version of the
+    appointment the calendar was rendered with. A move based on an outdated version is refused with a 409; a successful
+    one returns the re-serialized event, which carries the new version.
+    """
+    try:
+        data = json.loads(request.body)
+        appointment_id = data.get("appointment_id")
+        start_time_obj = datetime.datetime.fromisoformat(data["start_time"])
+        appt_date = datetime.datetime.strptime(data["date"], "%Y-%m-%d").date()
+        version = datetime.datetime.fromisoformat(data["updated_at"])
+    except (KeyError, TypeError, ValueError, AttributeError) as e:
+        return json_response(str(e), status=400, success=False, error_code=ErrorCode.INVALID_DATA)
+
+    appt = Appointment.objects.select_related(
+            'client', 'appointment_request__service', 'appointment_request__staff_member__user'
+    ).filter(pk=appointment_id).first()
+    if appt is None:
+        return json_response(_("Appointment does not exist."), status=404, success=False,
+                             error_code=ErrorCode.APPOINTMENT_NOT_FOUND)
+    if not check_entity_ownership(request.user, appt):
+        return json_response(_("You can only update your own appointments."), status=403, success=False,
+                             error_code=ErrorCode.NOT_AUTHORIZED)
+    staff_member = appt.appointment_request.staff_member
+
+    with transaction.atomic():
+        # Moves of a staff member's appointments are serialized, so that two of them cannot take the same slot
+        StaffMember.objects.select_for_update().get(pk=staff_member.pk)
+        # Compare-and-set on the version; also catches edits made through the other endpoints
+        if not Appointment.objects.filter(pk=appt.pk, updated_at=version).update(updated_at=timezone.now()):
+            return json_response(_("This appointment has been changed in the meantime. Please reload the calendar."),
+                                 status=409, success=False, error_code=ErrorCode.STALE_APPOINTMENT)
+        is_valid, message = Appointment.is_valid_date(appt_date, start_time_obj, staff_member, appt.pk,
+                                                      appt_date.strftime("%A"),
+                                                      duration=appt.appointment_request.service.duration)
+        if not is_valid:
+            transaction.set_rollback(True)
+            return json_response(message, status=403, success=False, error_code=ErrorCode.INVALID_DATE)
+        try:
+            appt = set_appt_date_time(appt, start_time_obj.time(), appt_date, request)
+        except ValidationError as e:
+            transaction.set_rollback(True)
+            return json_response(e.message, status=400, success=False)
+    appointment_json = convert_appointment_to_json(request, [appt])[0]
+    return json_response(appt_updated_successfully, custom_data={'appt': appointment_json})
+
+
+BULK_ERROR_RESPONSES = {
+    'invalid': (400, ErrorCode.INVALID_DATA),
+    'not_authorized': (403, ErrorCode.NOT_AUTHORIZED),
+    'not_found': (404, ErrorCode.APPOINTMENT_NOT_FOUND),
+    'conflict': (409, ErrorCode.APPOINTMENT_CONFLICT),
+}
+
+
+@require_user_authenticated
+@require_staff_or_superuser
+@require_ajax
+@require_POST
+def bulk_appointment_operations(request):
+    """Apply a batch of deletions, moves, reassignments and payment updates, all or nothing.
+
+    The body holds `operations`, the list described in `services.apply_bulk_operations`, and optionally
+    `notify_clients` (true by default).
+    """
+    try:
+        data = json.loads(request.body)
+        operations, notify_clients = data["operations"], bool(data.get("notify_clients", True))
+    except (KeyError, TypeError, ValueError, AttributeError) as e:
+        return json_response(str(e), status=400, success=False, error_code=ErrorCode.INVALID_DATA)
+    try:
+        summary = apply_bulk_operations(operations, request.user, request, notify_clients=notify_clients)
+    except ValidationError as e:
+        status, error_code = BULK_ERROR_RESPONSES.get(getattr(e, 'code', None), (400, ErrorCode.INVALID_DATA))
+        return json_response(" ".join(e.messages), status=status, success=False, error_code=error_code)
+    return json_response(_("Appointments updated successfully."), custom_data=summary)
+
+
 @require_user_authenticated
 @require_staff_or_superuser
 def update_personal_info(request, staff_user_id=None):
@@ -544,6 +642,34 @@ def get_service_list(request, response_type='html'):
     return render(request, template, context=context)
 
 
+@require_user_authenticated
+@require_superuser
+def get_profiler_report(request, response_type='html'):
+    """List the requests recorded by `AppointmentProfilerMiddleware` in this process, newest first."""
+    profiles = get_profiles()
+    if response_type == 'json':
+        return json_response("Successfully fetched profiles.", custom_data={
+            'enabled': get_profiler_enabled(), 'profiles': profiles}, safe=False)
+    context = get_generic_context_with_extra(request=request, extra={
+        'profiler_enabled': get_profiler_enabled(), 'profiles': profiles})
+    return render(request, 'administration/profiler.html', context=context)
+
+
+def get_metrics(request):
+    """Serve the booking metrics in the Prometheus text exposition format.
+
+    Scrapers authenticate with an `Authorization: Bearer <APPOINTMENT_METRICS_TOKEN>` header; superusers can also
+    read the metrics from their browser session.
+    """
+    token = get_metrics_token()
+    authorized = bool(token) and constant_time_compare(request.headers.get('Authorization', ''), f"Bearer {token}")
+    if not authorized and not request.user.is_superuser:
+        return json_response("Not authorized.", status=403, success=False, error_code=ErrorCode.NOT_AUTHORIZED)
+    if not get_metrics_enabled():
+        return json_response(_("Metrics are disabled."), status=404, success=False)
+    return HttpResponse(render_metrics(), content_type=CONTENT_TYPE)
+
+
 @require_user_authenticated
 @require_staff_or_superuser
 def delete_appointment(request, appointment_id):
@@ -581,3 +707,125 @@ def is_user_staff_admin(request):
         if not user.is_superuser:
             return json_response(_("User is not a staff member."), custom_data={'is_staff_admin': False})
         return json_response(_("User is a superuser."), custom_data={'is_staff_admin': True})
+
+
+@require_user_authenticated
+@require_superuser
+def get_availability_report(request):
+    """Return free slots, booked minutes and utilization per staff member and per day as JSON.
+
+    Query parameters: `start_date` (YYYY-MM-DD, defaults to today), `days` (1 to 92, defaults to 28),
+    `staff_member` (repeatable, defaults to all staff members), `service_id` and `engine` (auto, numpy or python).
+    """
+    try:
+        start_date = convert_str_to_date(request.GET['start_date']) if request.GET.get('start_date') \
+            else datetime.date.today()
+        days = int(request.GET.get('days', 28))
+        staff_ids = [int(staff_id) for staff_id in request.GET.getlist('staff_member')]
+        service_id = int(request.GET['service_id']) if request.GET.get('service_id') else None
+    except ValueError as e:
+        return json_response(str(e), status=400, success=False, error_code=ErrorCode.INVALID_DATA)
+    if not 1 <= days <= AVAILABILITY_REPORT_MAX_DAYS:
+        message = _("The number of days must be between 1 and {max_days}.").format(
+                max_days=AVAILABILITY_REPORT_MAX_DAYS)
+        return json_response(message, status=400, success=False, error_code=ErrorCode.INVALID_DATA)
+    engine = request.GET.get('engine', 'auto')
+    if engine not in ENGINES:
+        return json_response(_("Unknown engine."), status=400, success=False, error_code=ErrorCode.INVALID_DATA)
+
+    service = None
+    if service_id:
+        service = Service.objects.filter(id=service_id).first()
+        if service is None:
+            return json_response(_("Service not found."), status=404, success=False,
+                                 error_code=ErrorCode.SERVICE_NOT_FOUND)
+    staff_members = StaffMember.objects.select_related('user').order_by('id')
+    if staff_ids:
+        staff_members = staff_members.filter(id__in=staff_ids)
+
+    try:
+        report = build_availability_report(start_date, start_date + datetime.timedelta(days=days - 1),
+                                           staff_members=list(staff_members), service=service, engine=engine)
+    except ImproperlyConfigured as e:
+        return json_response(str(e), status=400, success=False, error_code=ErrorCode.INVALID_DATA)
+    return json_response(_("Successfully computed availability report."), custom_data={'report': report})
+
+
+@require_user_authenticated
+@require_staff_or_superuser
+def fetch_availability_heatmap(request):
+    """Return per-day free-slot and booked-minute counts, used to colour the calendar's day cells.
+
+    Query parameters: `start` and `end` (ISO dates or datetimes, `end` excluded as in FullCalendar's event sources)
+    and `staff_member`. Superusers get all staff members when `staff_member` is omitted; staff members only ever
+    get their own counts.
+    """
+    try:
+        start_date = datetime.date.fromisoformat(request.GET['start'][:10]) if request.GET.get('start') \
+            else datetime.date.today()
+        end_date = datetime.date.fromisoformat(request.GET['end'][:10]) - datetime.timedelta(days=1) \
+            if request.GET.get('end') else start_date + datetime.timedelta(days=41)
+        staff_id = int(request.GET['staff_member']) if request.GET.get('staff_member') else None
+    except ValueError as e:
+        return json_response(str(e), status=400, success=False, error_code=ErrorCode.INVALID_DATA)
+    if not 0 <= (end_date - start_date).days < AVAILABILITY_REPORT_MAX_DAYS:
+        message = _("The number of days must be between 1 and {max_days}.").format(
+                max_days=AVAILABILITY_REPORT_MAX_DAYS)
+        return json_response(message, status=400, success=False, error_code=ErrorCode.INVALID_DATA)
+
+    staff_members = StaffMember.objects.select_related('user').order_by('id')
+    if not request.user.is_superuser:
+        own_staff_member = get_staff_member_by_user_id(request.user.id)
+        if own_staff_member is None or (staff_id is not None and staff_id != own_staff_member.id):
+            return json_response(_("Not authorized."), status=403, success=False,
+                                 error_code=ErrorCode.NOT_AUTHORIZED)
+        staff_id = own_staff_member.id
+    if staff_id is not None:
+        staff_members = staff_members.filter(id=staff_id)
+
+    heatmap = get_availability_heatmap(staff_members, start_date, end_date)
+    return json_response(_("Successfully computed availability heatmap."), custom_data={
+        'start_date': start_date.isoformat(),
+        'end_date': end_date.isoformat(),
+        'staff_member_ids': list(heatmap),
+        'days': aggregate_heatmap(heatmap),
+    })
+
+
+@require_user_authenticated
+@require_staff_or_superuser
+def fetch_appointment_history(request):
+    """Return the most recent appointments of a staff member and/or a client, most recent first.
+
+    Query parameters: `staff_member`, `client` (user ID), at least one of which is required from superusers,
+    `include_archived` (`true` to also read the archive tables) and `limit` (at most HISTORY_LIMIT, the default).
+    Staff members only ever get their own appointments. `truncated` tells whether older appointments were left out.
+    """
+    try:
+        staff_id = int(request.GET['staff_member']) if request.GET.get('staff_member') else None
+        client_id = int(request.GET['client']) if request.GET.get('client') else None
+        limit = min(int(request.GET.get('limit') or HISTORY_LIMIT), HISTORY_LIMIT)
+    except ValueError as e:
+        return json_response(str(e), status=400, success=False, error_code=ErrorCode.INVALID_DATA)
+    if limit < 1:
+        return json_response(_("The limit must be a positive integer."), status=400, success=False,
+                             error_code=ErrorCode.INVALID_DATA)
+    include_archived = request.GET.get('include_archived', '').lower() in ('1', 'true', 'yes')
+
+    if request.user.is_superuser:
+        if staff_id is None and client_id is None:
+            return json_response(_("A staff member or a client is required."), status=400, success=False,
+                                 error_code=ErrorCode.INVALID_DATA)
+    else:
+        own_staff_member = get_staff_member_by_user_id(request.user.id)
+        if own_staff_member is None or (staff_id is not None and staff_id != own_staff_member.id):
+            return json_response(_("Not authorized."), status=403, success=False,
+                                 error_code=ErrorCode.NOT_AUTHORIZED)
+        staff_id = own_staff_member.id
+
+    # One more row than the limit tells whether the history is truncated.
+    history = get_appointment_history(client=client_id, staff_member=staff_id, include_archived=include_archived,
+                                      limit=limit + 1)
+    return json_response(_("Successfully fetched appointment history."), custom_data={
+        'include_archived': include_archived, 'appointments': history[:limit], 'truncated': len(history) > limit})
+